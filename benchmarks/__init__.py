@@ -0,0 +1,8 @@
+"""
+Microbenchmarks for the service's hot paths. Run from the repository root:
+
+    python -m benchmarks run                 # all benchmarks, results in benchmarks/results/latest.json
+    python -m benchmarks run --quick         # smallest size of each, for a fast check
+    python -m benchmarks run --save-baseline # store the run as the baseline to compare against
+    python -m benchmarks compare             # flag significant regressions of latest against baseline
+"""
@@ -0,0 +1,68 @@
+import argparse
+import sys
+from pathlib import Path
+from benchmarks import harness
+from benchmarks import bench_cost_tracker, bench_research, bench_responses, bench_routing  # noqa: F401 - registers the benchmarks
+
+RESULTS_DIR = Path(__file__).parent / "results"
+LATEST = RESULTS_DIR / "latest.json"
+BASELINE = RESULTS_DIR / "baseline.json"
+
+def run(args) -> int:
+    result = harness.run(args.filter, quick=args.quick, rounds=args.rounds)
+    for name, exponent in result["scaling"].items():
+        print(f"{name:<45} grows as n^{exponent}")
+    output = Path(args.output)
+    harness.save(result, output)
+    print(f"Results written to {output}")
+    if args.save_baseline:
+        harness.save(result, BASELINE)
+        print(f"Baseline written to {BASELINE}")
+    return 0
+
+def compare(args) -> int:
+    rows = harness.compare(harness.load(Path(args.baseline)), harness.load(Path(args.current)),
+                           threshold=args.threshold, alpha=args.alpha)
+    for row in rows:
+        if "ratio" in row:
+            detail = (f"{harness.format_seconds(row['baseline'])} -> {harness.format_seconds(row['current'])} "
+                      f"(x{row['ratio']}, p={row['p_value']})")
+        elif "baseline" in row:
+            detail = f"n^{row['baseline']} -> n^{row['current']}"
+        else:
+            detail = ""
+        print(f"{row['verdict'].upper():<12} {row['benchmark']:<45} {detail}")
+    regressions = [row for row in rows if row["verdict"] == "regression"]
+    print(f"{len(regressions)} regression(s)")
+    return 1 if regressions else 0
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Microbenchmarks for the service's hot paths")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run benchmarks and save the results as JSON")
+    run_parser.add_argument("filter", nargs="*", help="Only run benchmarks whose name contains one of these")
+    run_parser.add_argument("--quick", action="store_true", help="Only run each benchmark at its smallest size")
+    run_parser.add_argument("--rounds", type=int, default=10, help="Timed rounds per benchmark")
+    run_parser.add_argument("--output", default=str(LATEST), help="Results file")
+    run_parser.add_argument("--save-baseline", action="store_true", help="Also store the results as the baseline")
+    run_parser.set_defaults(handler=run)
+
+    compare_parser = commands.add_parser("compare", help="Flag significant regressions against a baseline; exits 1 if any")
+    compare_parser.add_argument("current", nargs="?", default=str(LATEST), help="Results to check")
+    compare_parser.add_argument("--baseline", default=str(BASELINE), help="Baseline results")
+    compare_parser.add_argument("--threshold", type=float, default=0.10, help="Slowdown ignored as noise, e.g. 0.10 for 10%%")
+    compare_parser.add_argument("--alpha", type=float, default=0.05, help="Significance level of the Mann-Whitney test")
+    compare_parser.set_defaults(handler=compare)
+
+    commands.add_parser("list", help="List benchmarks and their sizes").set_defaults(
+        handler=lambda args: print("\n".join(
+            f"{bench.name} {list(bench.params) if bench.params != (None,) else ''}" for bench in harness.BENCHMARKS.values()
+        )) or 0
+    )
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
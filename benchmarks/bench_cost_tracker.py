@@ -0,0 +1,81 @@
+import atexit
+import json
+import shutil
+import tempfile
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from benchmarks.harness import Case, benchmark
+from src.services.cost_tracker import CostTracker
+
+# Ledger sizes, so a change that makes an operation grow faster than the ledger shows up in the scaling
+LEDGER_SIZES = (1000, 100000, 1000000)
+
+_root = Path(tempfile.mkdtemp(prefix="cost-bench-"))
+atexit.register(shutil.rmtree, _root, ignore_errors=True)
+
+@lru_cache(maxsize=None)
+def _ledger_file(size: int) -> Path:
+    """A costs.json with size records, written once per run and copied for each benchmark."""
+    path = _root / f"costs-{size}.json"
+    timestamp = datetime.now().isoformat()
+    records = [
+        {"id": str(uuid.UUID(int=index)), "timestamp": timestamp, "type": "image", "cost": 1e-6, "prompt": "a cat"}
+        for index in range(size)
+    ]
+    with open(path, "w") as f:
+        json.dump(records, f)
+    return path
+
+@contextmanager
+def ledger(size: int):
+    """Yield a write-behind tracker loaded with size records, its flusher parked so only the in-memory path is timed."""
+    data_dir = Path(tempfile.mkdtemp(dir=_root))
+    shutil.copy(_ledger_file(size), data_dir / "costs.json")
+    tracker = CostTracker(str(data_dir), write_mode="write_behind", flush_interval_ms=10 ** 9, flush_max_records=10 ** 9)
+    try:
+        yield tracker
+    finally:
+        tracker.close(flush=False)
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+@benchmark("cost_tracker.track_cost", LEDGER_SIZES)
+def track_cost(size: int):
+    with ledger(size) as tracker:
+        yield lambda: tracker.track_cost("image", 0.0, "a cat")
+
+@benchmark("cost_tracker.get_costs", LEDGER_SIZES)
+def get_costs(size: int):
+    with ledger(size) as tracker:
+        yield tracker.get_costs
+
+@benchmark("cost_tracker.get_record_by_id", LEDGER_SIZES)
+def get_record_by_id(size: int):
+    # A record in the middle of the ledger
+    record_id = str(uuid.UUID(int=size // 2))
+    with ledger(size) as tracker:
+        yield lambda: tracker.get_record_by_id(record_id)
+
+@benchmark("cost_tracker.delete_record", LEDGER_SIZES)
+def delete_record(size: int):
+    with ledger(size) as tracker:
+        pending = []
+
+        def prepare(number: int):
+            # Untimed: add the records the round deletes, so the ledger keeps its size
+            pending.extend(tracker.track_cost("image", 0.0, "a cat") for _ in range(number))
+
+        yield Case(lambda: tracker.delete_record(pending.pop()), prepare)
+
+@benchmark("cost_tracker.flush", LEDGER_SIZES)
+def flush(size: int):
+    # A flush appends its batch to the journal, so it should not grow with the ledger
+    with ledger(size) as tracker:
+        def op():
+            # Each flush needs a change to write
+            tracker.track_cost("image", 0.0, "a cat")
+            tracker.flush()
+
+        yield op
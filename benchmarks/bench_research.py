@@ -0,0 +1,26 @@
+from benchmarks.harness import benchmark
+from src.services.latency import FixedLatency
+from src.services.research.mock_research_generator import MockResearchGenerator
+import src.config as Config
+
+# Simulated provider latency per call; single-stream papers wait it before each of their 7 parts,
+# sectioned papers once for the outline and once per section, RESEARCH_SECTION_PARALLELISM at a time
+CALL_LATENCY = 0.005
+
+def _paper(mode: str, sections: int = None):
+    previous = Config.RESEARCH_MODE, Config.RESEARCH_SECTIONS
+    Config.RESEARCH_MODE = mode
+    Config.RESEARCH_SECTIONS = sections or Config.RESEARCH_SECTIONS
+    latency = FixedLatency(CALL_LATENCY)
+    try:
+        yield lambda: "".join(MockResearchGenerator(latency=latency).generate_content("the history of bees"))
+    finally:
+        Config.RESEARCH_MODE, Config.RESEARCH_SECTIONS = previous
+
+@benchmark("research.single_stream")
+def single_stream():
+    yield from _paper("single")
+
+@benchmark("research.sectioned", (6, 12))
+def sectioned(sections: int):
+    yield from _paper("sectioned", sections)
@@ -0,0 +1,23 @@
+from fastapi.responses import JSONResponse
+from benchmarks.harness import benchmark
+from src.services.events import decode, encode, sse_frame
+
+CHUNK = "This section contains mock content about the moon and its influence on the tides.\n\n"
+AUDIO_URL = "https://cdn1.suno.ai/db9539de-b621-42f5-9188-f83302a511b8.mp3"
+
+@benchmark("sse.chunk_frame")
+def chunk_frame():
+    # Per streamed chunk: encoded by the producer, framed with its resumable id for each reader
+    seq = iter(range(10 ** 9))
+    yield lambda: sse_frame("0123456789abcdef0123456789abcdef", next(seq), encode("chunk", type="text", content=CHUNK))
+
+@benchmark("response.json_result")
+def json_result():
+    # Legacy clients: the result event is decoded and rendered as the JSON response body
+    frame = encode("result", type="song", content=AUDIO_URL)
+
+    def op():
+        event, data = decode(frame)
+        return JSONResponse({"type": data["type"], "content": data["content"]}).body
+
+    yield op
@@ -0,0 +1,70 @@
+import itertools
+import random
+from benchmarks.harness import benchmark
+from src.services import registry
+from src.services.base import ContentType
+from src.services.router.mock_router import MockRouter
+
+PROMPTS = [
+    "make me an image of a sunset over the sea",
+    "I want a song about the rain",
+    "write me a research paper about the moon",
+    "draw a cat wearing a hat"
+]
+
+WORDS = (
+    "moon", "mars", "ocean", "climate", "history", "rome", "quantum", "graphene", "bees", "volcanoes",
+    "jazz", "glaciers", "markets", "vaccines", "roads", "printing", "satellites", "coral", "language", "sleep"
+)
+
+CACHE_SIZES = (1000, 100000)
+
+def _research_prompts(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    return [f"research about {' '.join(rng.sample(WORDS, 3))} {index}" for index in range(count)]
+
+def _clustered_prompts(count: int, seed: int = 0):
+    # Real traffic repeats a few phrasings, so most prompts share words and land in the same buckets
+    rng = random.Random(seed)
+    return [f"write a research paper on the {rng.choice(WORDS[:5])} of {rng.choice(WORDS[5:10])} in {index % 997} {index}"
+            for index in range(count)]
+
+@benchmark("router.mock_route")
+def mock_route():
+    router = MockRouter()
+    prompts = itertools.cycle(PROMPTS)
+    yield lambda: router.route(next(prompts))
+
+@benchmark("router.mock_classify_batch")
+def mock_classify_batch():
+    router = MockRouter()
+    batch = PROMPTS * 4
+    yield lambda: router.classify_batch(batch)
+
+@benchmark("registry.generator_lookup")
+def generator_lookup():
+    # Routers create generators through lazily imported classes, cached after the first call
+    generators = registry.generators("dev")
+    generators[ContentType.IMAGE].load()
+    yield lambda: generators[ContentType.IMAGE].load()
+
+@benchmark("research_cache.lookup", CACHE_SIZES)
+def research_cache_lookup(size: int):
+    # The semantic cache is the only prompt-keyed cache on the routing path; half the lookups hit
+    from src.services.research.semantic_cache import SemanticResearchCache
+    cache = SemanticResearchCache(max_entries=size)
+    stored = _research_prompts(size)
+    for prompt in stored:
+        cache.store(prompt, "paper")
+    queries = itertools.cycle(stored[:500] + _research_prompts(500, seed=1))
+    yield lambda: cache.lookup(next(queries))
+
+@benchmark("research_cache.lookup_clustered", CACHE_SIZES)
+def research_cache_lookup_clustered(size: int):
+    from src.services.research.semantic_cache import SemanticResearchCache
+    cache = SemanticResearchCache(max_entries=size)
+    stored = _clustered_prompts(size)
+    for prompt in stored:
+        cache.store(prompt, "paper")
+    queries = itertools.cycle(stored[:500] + _clustered_prompts(500, seed=1))
+    yield lambda: cache.lookup(next(queries))
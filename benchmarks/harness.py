@@ -0,0 +1,249 @@
+import gc
+import json
+import math
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+MIN_ROUNDS = 5  # Fewer samples cannot show a significant difference
+
+class Case:
+    """Operation to time, with optional untimed preparation before each round."""
+
+    def __init__(self, op: Callable[[], object], prepare: Callable[[int], object] = None):
+        """
+        Args:
+            op (Callable[[], object]): Operation timed, called `number` times per round
+            prepare (Callable[[int], object]): Called with `number` before each round, outside the timing
+        """
+        self.op = op
+        self.prepare = prepare
+
+class Benchmark:
+    """
+    A hot path measured at one or more sizes. The function is a generator taking the size:
+    it sets up, yields the operation (or a Case), and tears down after the yield.
+    """
+
+    def __init__(self, name: str, func: Callable[..., Iterator[Union[Case, Callable]]], params: Sequence = (None,)):
+        self.name = name
+        self.func = func
+        self.params = tuple(params)
+
+    def key(self, param) -> str:
+        return self.name if param is None else f"{self.name}[{param}]"
+
+BENCHMARKS: Dict[str, Benchmark] = {}
+
+def benchmark(name: str, params: Sequence = (None,)):
+    """Register a benchmark generator function under a name, run once per param."""
+    def register(func):
+        BENCHMARKS[name] = Benchmark(name, func, params)
+        return func
+    return register
+
+def _timed(op: Callable[[], object], number: int) -> float:
+    start = time.perf_counter()
+    for _ in range(number):
+        op()
+    return time.perf_counter() - start
+
+def measure(case: Case, rounds: int = 10, min_time: float = 0.05, max_time: float = 5.0) -> Tuple[int, List[float]]:
+    """
+    Time an operation: calibrate how many calls make a round last min_time, then run rounds
+    with the garbage collector paused, as timeit does, stopping early after max_time.
+
+    Returns:
+        Tuple[int, List[float]]: Calls per round, and seconds per call of each round
+    """
+    prepare = case.prepare or (lambda number: None)
+    number = 1
+    while True:
+        prepare(number)
+        elapsed = _timed(case.op, number)
+        if elapsed >= min_time or number >= 10 ** 7:
+            break
+        number = min(10 ** 7, max(number * 2, int(number * min_time * 1.2 / max(elapsed, 1e-9))))
+
+    samples = []
+    deadline = time.perf_counter() + max_time
+    gc_enabled = gc.isenabled()
+    for index in range(max(rounds, MIN_ROUNDS)):
+        prepare(number)
+        gc.collect()
+        gc.disable()
+        try:
+            samples.append(_timed(case.op, number) / number)
+        finally:
+            if gc_enabled:
+                gc.enable()
+        if index + 1 >= MIN_ROUNDS and time.perf_counter() > deadline:
+            break
+    return number, samples
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def run(names: Sequence[str] = None, quick: bool = False, rounds: int = 10,
+        report: Callable[[str], None] = print) -> Dict:
+    """
+    Run benchmarks and collect their results.
+
+    Args:
+        names (Sequence[str]): Substrings selecting benchmarks by name, all when empty
+        quick (bool): Only run each benchmark at its smallest size
+        rounds (int): Timed rounds per benchmark
+        report (Callable[[str], None]): Receives a line per finished benchmark
+
+    Returns:
+        Dict: Run metadata, results keyed by "name[size]", and the scaling exponent per benchmark
+    """
+    results = {}
+    for bench in BENCHMARKS.values():
+        if names and not any(name in bench.name for name in names):
+            continue
+        for param in bench.params[:1] if quick else bench.params:
+            steps = bench.func() if param is None else bench.func(param)
+            case = next(steps)
+            if not isinstance(case, Case):
+                case = Case(case)
+            try:
+                number, samples = measure(case, rounds)
+            finally:
+                steps.close()
+            result = summarize(samples)
+            result.update(name=bench.name, param=param, number=number)
+            results[bench.key(param)] = result
+            report(f"{bench.key(param):<45} {format_seconds(result['median']):>10} ± {format_seconds(result['stdev'])}")
+
+    return {
+        "created": datetime.now().isoformat(),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+        "scaling": scaling(results)
+    }
+
+def summarize(samples: List[float]) -> Dict:
+    return {
+        "samples": samples,
+        "median": statistics.median(samples),
+        "mean": statistics.fmean(samples),
+        "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "min": min(samples)
+    }
+
+def scaling(results: Dict[str, Dict]) -> Dict[str, float]:
+    """
+    Growth exponent of each benchmark run at several sizes: about 0 for constant time,
+    1 for linear and 2 for quadratic, fitted between the smallest and largest size.
+    """
+    by_name: Dict[str, List[Tuple[float, float]]] = {}
+    for result in results.values():
+        if isinstance(result["param"], (int, float)) and result["param"] > 0:
+            by_name.setdefault(result["name"], []).append((result["param"], result["median"]))
+    exponents = {}
+    for name, points in by_name.items():
+        if len(points) < 2:
+            continue
+        (small, small_time), (large, large_time) = min(points), max(points)
+        exponents[name] = round(math.log(large_time / small_time) / math.log(large / small), 2)
+    return exponents
+
+def mann_whitney(first: Sequence[float], second: Sequence[float]) -> float:
+    """
+    Two-sided p-value of the Mann-Whitney U test that two samples come from the same
+    distribution, by the normal approximation with tie and continuity corrections.
+    Rank-based, so a few noisy rounds do not decide the outcome the way they sway a mean.
+    """
+    n1, n2 = len(first), len(second)
+    combined = sorted([(value, 0) for value in first] + [(value, 1) for value in second])
+    ranks = [0.0] * len(combined)
+    ties = 0.0
+    index = 0
+    while index < len(combined):
+        end = index
+        while end + 1 < len(combined) and combined[end + 1][0] == combined[index][0]:
+            end += 1
+        for position in range(index, end + 1):
+            ranks[position] = (index + end) / 2 + 1
+        count = end - index + 1
+        ties += count ** 3 - count
+        index = end + 1
+
+    rank_sum = sum(rank for rank, (_, group) in zip(ranks, combined) if group == 0)
+    u = rank_sum - n1 * (n1 + 1) / 2
+    mean = n1 * n2 / 2
+    n = n1 + n2
+    variance = n1 * n2 / 12 * ((n + 1) - ties / (n * (n - 1)))
+    if variance <= 0:
+        return 1.0
+    z = (abs(u - mean) - 0.5) / math.sqrt(variance)
+    return min(1.0, math.erfc(max(z, 0.0) / math.sqrt(2)))
+
+def compare(baseline: Dict, current: Dict, threshold: float = 0.10, alpha: float = 0.05,
+            scaling_tolerance: float = 0.3) -> List[Dict]:
+    """
+    Compare a run against a baseline run.
+    A benchmark regressed if its median slowed down by more than threshold and the
+    Mann-Whitney test finds the difference significant at alpha; a benchmark whose
+    growth exponent rose by more than scaling_tolerance regressed in complexity.
+
+    Returns:
+        List[Dict]: One row per benchmark with "verdict" of "regression", "improvement",
+        "unchanged", "new" or "missing"
+    """
+    rows = []
+    base_results, results = baseline["results"], current["results"]
+    for key in sorted(set(base_results) | set(results)):
+        row = {"benchmark": key}
+        if key not in results or key not in base_results:
+            row["verdict"] = "missing" if key not in results else "new"
+            rows.append(row)
+            continue
+        before, after = base_results[key], results[key]
+        ratio = after["median"] / before["median"] if before["median"] else float("inf")
+        p_value = mann_whitney(before["samples"], after["samples"])
+        verdict = "unchanged"
+        if p_value < alpha and ratio > 1 + threshold:
+            verdict = "regression"
+        elif p_value < alpha and ratio < 1 / (1 + threshold):
+            verdict = "improvement"
+        row.update(baseline=before["median"], current=after["median"], ratio=round(ratio, 3),
+                   p_value=round(p_value, 5), verdict=verdict)
+        rows.append(row)
+
+    for name, exponent in current.get("scaling", {}).items():
+        before = baseline.get("scaling", {}).get(name)
+        if before is None:
+            continue
+        rows.append({
+            "benchmark": f"{name} (scaling)",
+            "baseline": before,
+            "current": exponent,
+            "verdict": "regression" if exponent > before + scaling_tolerance else "unchanged"
+        })
+    return rows
+
+def format_seconds(seconds: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.3g} {unit}"
+    return f"{seconds / 1e-9:.3g} ns"
+
+def save(result: Dict, path: Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2)
+
+def load(path: Path) -> Dict:
+    with open(path) as f:
+        return json.load(f)
@@ -7,34 +7,285 @@ def get_api_key(name: str) -> str:
         raise ValueError(f"Missing API key in environment variables: {name}")
     return value
 
+# API keys are read and validated on first use, so a provider that is never used needs no key
+_API_KEYS = {
+    "IMAGE_API_KEY": "BFL_API_KEY",
+    "SONG_GENERATION_TOKEN": "UDIO_API_KEY",
+    "RESEARCH_API_KEY": "OPENAI_API_KEY",
+    "ROUTER_API_KEY": "OPENAI_API_KEY"  # Reusing OpenAI key
+}
+
+def __getattr__(name: str):
+    """Resolve API key settings lazily and cache them on the module."""
+    if name in _API_KEYS:
+        value = get_api_key(_API_KEYS[name])
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 # System
 MODE = 'PRODUCTION'
 BUDGET = 20
 
+# Provider registry. Import paths are only imported when first used, so unused or
+# disabled providers cost nothing; remove a content type to disable it.
+ROUTERS = {
+    "production": "src.services.router.openai_router:OpenAIRouter",
+    "dev": "src.services.router.mock_router:MockRouter"
+}
+GENERATORS = {
+    "production": {
+        "text": "src.services.research.openai_research_generator:OpenAIResearchGenerator",
+        "song": "src.services.song.suno_song_generator:SunoSongGenerator",
+        "image": "src.services.image.flux_image_generator:FluxImageGenerator"
+    },
+    "dev": {
+        "text": "src.services.research.mock_research_generator:MockResearchGenerator",
+        "song": "src.services.song.mock_song_generator:MockSongGenerator",
+        "image": "src.services.image.mock_image_generator:MockImageGenerator"
+    }
+}
+PRELOAD_PROVIDERS = False  # Import all providers at startup, e.g. before gunicorn --preload forks workers
+
+# Mock generator latency per content type: "fixed" (seconds), "uniform" (min, max), "lognormal"
+# (median, sigma) or "trace" (samples, or a file of them), each with an optional max_seconds cap.
+# Text latency is the delay before each streamed section.
+MOCK_LATENCY = {
+    "image": {"model": "uniform", "min": 3, "max": 20},
+    "song": {"model": "uniform", "min": 3, "max": 20},
+    "text": {"model": "uniform", "min": 0.5, "max": 1.5}
+}
+MOCK_LATENCY_SEED = None  # Set for the same latencies on every run
+
 # Image
-IMAGE_API_KEY = get_api_key("BFL_API_KEY")
 IMAGE_GENERATION_MODEL = "flux.1.1-pro"
 IMAGE_WIDTH = 512
 IMAGE_HEIGHT = 512
 IMAGE_COST = 0.04
 
 # Song
-SONG_GENERATION_TOKEN = get_api_key("UDIO_API_KEY")
 SONG_GENERATION_URL = "https://udioapi.pro/api/generate"
 SONG_GENERATION_MODEL = "chirp-v3.0"
 SONG_COST = 0.05
 SONG_FEED_URL = "https://udioapi.pro/api/feed?workId="
 SONG_TEMPERATURE = 0.9
 
+# Song completion callbacks: jobs ask Suno to POST their status to SONG_CALLBACK_URL (this service's
+# /callbacks/suno, as reachable by Suno), signed with HMAC-SHA256 of the body in SONG_CALLBACK_SIGNATURE_HEADER.
+# Without a URL and secret the feed is polled every second instead.
+SONG_CALLBACK_URL = os.environ.get("SONG_CALLBACK_URL")  # e.g. "https://api.example.com/callbacks/suno"
+SONG_CALLBACK_SECRET = os.environ.get("SONG_CALLBACK_SECRET")
+SONG_CALLBACK_SIGNATURE_HEADER = "X-Suno-Signature"
+SONG_CALLBACK_TIMEOUT_SECONDS = 180  # A callback is overdue after this long, and the job falls back to polling
+SONG_FALLBACK_POLL_SECONDS = 10  # Poll interval for jobs whose callback is overdue
+SONG_SUBMIT_TIMEOUT_SECONDS = 30  # Longest a single Suno request may take, less if the deadline is sooner
+SONG_POLL_TIMEOUT_SECONDS = 10
+
 # Research
-RESEARCH_API_KEY = get_api_key("OPENAI_API_KEY")
 RESEARCH_MODEL_NAME = "gpt-4o-mini"
 RESEARCH_COST = 0.01
 RESEARCH_MAX_TOKENS = 4000
 RESEARCH_SYSTEM_MESSAGE = "You are an expert researcher. Produce a research paper on the following topic: "
 
+# Research mode: "single" writes the paper in one stream; "sectioned" asks for an outline in one quick call,
+# then writes its sections concurrently and streams them in order. Sectioned papers cost one call per
+# section plus the outline, refunded for sections the outline leaves out, and share RESEARCH_MAX_TOKENS
+# between all of them. Each section call takes its own admission slot if one is free, and otherwise waits
+# its turn in the request's own slot.
+RESEARCH_MODE = "single"
+RESEARCH_SECTIONS = 6
+RESEARCH_SECTION_PARALLELISM = 4  # Sections written at once per paper
+RESEARCH_SECTION_WORKERS = 16  # Section calls running at once across all papers, on one shared pool
+RESEARCH_OUTLINE_MAX_TOKENS = 300
+RESEARCH_OUTLINE_SYSTEM_MESSAGE = "You are an expert researcher. Outline a research paper on the topic you are given as exactly {sections} section titles, one per line, with no other text."
+RESEARCH_SECTION_SYSTEM_MESSAGE = "You are an expert researcher writing one section of a research paper. Write only the requested section, consistent with the outline, without repeating its title."
+
 # Router
 ROUTER_MODEL_NAME = "gpt-4o-mini"
-ROUTER_API_KEY = RESEARCH_API_KEY  # Reusing OpenAI key
 ROUTER_COST = 0.01
 ROUTER_SYSTEM_MESSAGE = "You are an expert at user message intent classification. Classify the following user message into one of these categories: image, song, research. Example user messages include: 'make me a image of a sunset', 'I want a song about the rain', 'write me research paper about the moon'."
+
+ROUTER_BATCH_SYSTEM_MESSAGE = "You will receive a numbered list of independent user messages. Return exactly one category per message, in the same order."
+
+# Router micro-batching
+ROUTER_BATCHING_ENABLED = False
+ROUTER_BATCH_WINDOW_MS = 10  # How long the first prompt in a batch waits for company
+ROUTER_BATCH_MAX_SIZE = 16  # Dispatch immediately once this many prompts are waiting
+
+# Admission control, keyed by router/generator class name. Unlisted providers are unlimited.
+#   max_concurrency: calls in flight at once
+#   rate_per_second/burst: token bucket for call starts
+#   max_queue/queue_timeout: callers allowed to wait, and for how many seconds, before a 429
+#   adaptive: tune the concurrency limit from call latencies, starting at "initial", with max_concurrency as its ceiling
+PROVIDER_LIMITS = {
+    "OpenAIRouter": {"max_concurrency": 64, "rate_per_second": 50, "burst": 100, "max_queue": 200, "queue_timeout": 2,
+                     "adaptive": {"initial": 32}},
+    "OpenAIResearchGenerator": {"max_concurrency": 48, "rate_per_second": 10, "burst": 20, "max_queue": 50, "queue_timeout": 5,
+                                "adaptive": {"initial": 16}},
+    "FluxImageGenerator": {"max_concurrency": 24, "rate_per_second": 4, "burst": 8, "max_queue": 30, "queue_timeout": 10,
+                           "adaptive": {"initial": 8}},
+    "SunoSongGenerator": {"max_concurrency": 12, "rate_per_second": 1, "burst": 4, "max_queue": 20, "queue_timeout": 10,
+                          "adaptive": {"initial": 4}}
+}
+
+# Adaptive concurrency: the limit grows while latency stays within tolerance of its baseline,
+# and is multiplied by decrease when latency exceeds that or the provider rate-limits or times out
+ADAPTIVE_CONCURRENCY = {
+    "min_limit": 1,
+    "tolerance": 2.0,  # Recent latency may reach this multiple of the baseline
+    "decrease": 0.7,
+    "smoothing": 0.2,  # Weight of each call in the recent latency
+    "baseline_drift": 0.002  # Weight of each slower call in the baseline, so lasting slowdowns become normal
+}
+
+# Scheduler bulkheads. Each lane (router, or a ContentType value) has reserved worker threads;
+# shared workers take overflow from any lane, lowest priority value first, then by weight.
+SCHEDULER_LANES = {
+    "router": {"workers": 16, "priority": 0, "weight": 4},
+    "text": {"workers": 8, "priority": 1, "weight": 3},
+    "image": {"workers": 8, "priority": 2, "weight": 2},
+    "song": {"workers": 4, "priority": 2, "weight": 1}
+}
+SCHEDULER_SHARED_WORKERS = 8
+
+# Circuit breakers, keyed by router/generator class name. Unlisted providers have none.
+#   failure_rate: share of failed or slow calls among the last `window` calls that opens the breaker
+#   min_calls: calls needed in the window before the failure rate is acted on
+#   slow_call_seconds: calls (or time to first chunk, for streams) slower than this count as failures
+#   open_seconds/half_open_probes: fail fast for this long, then close after this many good probes
+CIRCUIT_BREAKERS = {
+    "OpenAIRouter": {"failure_rate": 0.5, "window": 20, "min_calls": 5, "slow_call_seconds": 10, "open_seconds": 15, "half_open_probes": 2},
+    "OpenAIResearchGenerator": {"failure_rate": 0.5, "window": 20, "min_calls": 5, "slow_call_seconds": 15, "open_seconds": 30, "half_open_probes": 2},
+    "FluxImageGenerator": {"failure_rate": 0.5, "window": 10, "min_calls": 3, "slow_call_seconds": 60, "open_seconds": 60, "half_open_probes": 1},
+    "SunoSongGenerator": {"failure_rate": 0.5, "window": 10, "min_calls": 3, "slow_call_seconds": 120, "open_seconds": 60, "half_open_probes": 1}
+}
+
+# Retries with full-jitter exponential backoff for idempotent calls (routing, song status polls)
+RETRY_ATTEMPTS = 3
+RETRY_BASE_DELAY = 0.2  # Seconds, backoff ceiling for the first retry
+RETRY_MAX_DELAY = 2.0  # Seconds, largest backoff ceiling
+
+# Generator pools: several backends per content type (ContentType value), chosen per request by
+# live latency, error rate and load, with failover to the next best backend. Types not listed
+# use their single default generator. Each backend is admitted and broken under its own name, with the
+# PROVIDER_LIMITS and CIRCUIT_BREAKERS entries of its provider (its generator class name, or "provider")
+# unless it has entries of its own; startup fails if neither is configured. Example:
+#   "text": [
+#       {"name": "research-primary", "generator": "src.services.research.openai_research_generator:OpenAIResearchGenerator", "capacity": 16},
+#       {"name": "research-secondary", "generator": "src.services.research.openai_research_generator:OpenAIResearchGenerator",
+#        "kwargs": {"api_key": "...", "model": "gpt-4o"}, "cost": 0.03, "capacity": 4}
+#   ]
+GENERATOR_BACKENDS = {}
+GENERATOR_POOL_EWMA_ALPHA = 0.2  # Weight of the newest observation in latency and error averages
+
+# Semantic research cache: replays a stored paper when a new prompt is a near-duplicate
+# of an earlier one (cosine similarity of hashed word and character n-grams)
+RESEARCH_CACHE_ENABLED = False
+RESEARCH_CACHE_MAX_ENTRIES = 100000
+RESEARCH_CACHE_THRESHOLD = 0.8
+RESEARCH_CACHE_EVICTION = "lru"  # "lru" or "fifo"
+RESEARCH_CACHE_TTL_SECONDS = None  # Ignore papers older than this, None to keep them until evicted
+RESEARCH_CACHE_DIM = 256
+RESEARCH_CACHE_LSH_TABLES = 32  # More tables find more near-duplicates
+RESEARCH_CACHE_LSH_BITS = 16  # More bits mean fewer candidates to score per lookup
+RESEARCH_CACHE_LSH_PROBES = 3  # Neighbouring buckets probed per table
+RESEARCH_CACHE_LSH_BUCKET_SIZE = 8  # Newest entries kept per bucket, bounding the candidates scored per lookup
+RESEARCH_CACHE_REPLAY_CHUNK = 64  # Characters per replayed chunk
+RESEARCH_CACHE_STOPWORDS = (
+    "a", "an", "the", "on", "of", "about", "for", "in", "me", "please", "i", "want", "write", "make",
+    "give", "generate", "produce", "create", "research", "paper", "papers", "study", "article"
+)
+
+# Resumable streams: recent SSE streams are buffered so clients can reconnect with Last-Event-ID
+STREAM_BUFFER_MAX_STREAMS = 1000
+STREAM_BUFFER_MEMORY_EVENTS = 2000  # Events per stream kept in memory, older ones spill to disk
+STREAM_BUFFER_SPILL_DIR = "data/streams"
+STREAM_BUFFER_TTL_SECONDS = 600  # How long finished streams stay resumable
+
+# Local media store: generated images and songs are downloaded and served from /media/{sha256}.
+# Off by default: a request waits up to MEDIA_STORE_WAIT_SECONDS for the download before answering
+MEDIA_STORE_ENABLED = False
+MEDIA_STORE_DIR = "data/media"
+MEDIA_STORE_WORKERS = 4
+MEDIA_STORE_MAX_BYTES = 50 * 1024 * 1024
+MEDIA_STORE_WAIT_SECONDS = 2.0  # How long a request waits for the download before returning the provider URL
+MEDIA_CACHE_MAX_AGE = 31536000  # Assets are content-addressed, so they can be cached forever
+
+# Speculative research: start research generation alongside routing when the prompt looks like research.
+# Speculations are charged to the request's budgets before they start, and skipped when a budget cannot pay.
+# Confirmed ones stream sooner and their charge is the request's; misses are cancelled and stay charged.
+SPECULATION_ENABLED = False
+SPECULATION_KEYWORDS = (
+    "research", "paper", "study", "essay", "article", "report", "analysis", "analyze", "explain", "history"
+)
+SPECULATION_EXCLUDE_KEYWORDS = (
+    "image", "picture", "photo", "draw", "drawing", "paint", "painting", "illustration", "logo",
+    "song", "music", "lyrics", "melody", "tune", "sing"
+)
+
+# Cancellation when clients disconnect
+CANCEL_REFUND_POLICY = "unstarted"  # "always", "unstarted" (provider never reached) or "never"
+CANCEL_GRACE_SECONDS = 5  # How long an abandoned stream waits for the client to resume before it is cancelled
+DISCONNECT_POLL_SECONDS = 0.5  # How often non-streaming requests check whether the client is still there
+
+# Request tracing: sampled requests record stage timings, shown as waterfalls at /debug/traces
+TRACE_SAMPLE_RATE = 0.1  # Share of requests traced, 0 turns tracing off
+TRACE_BUFFER_SIZE = 500  # Recent traces kept in memory
+TRACE_EXPORT_FILE = "logs/traces.jsonl"  # None to keep traces in memory only
+
+# Profiling: requests flagged with the admin token (X-Profile header or ?profile=) or sampled at
+# PROFILE_SAMPLE_RATE write a stack profile to PROFILE_DIR/{request_id}
+PROFILE_ADMIN_TOKEN = os.environ.get("PROFILE_ADMIN_TOKEN")  # On-demand profiling is disabled without a token
+PROFILE_SAMPLE_RATE = 0.0
+PROFILE_INTERVAL_SECONDS = 0.005
+PROFILE_DIR = "logs/profiles"
+PROFILE_FORMAT = "collapsed"  # "collapsed" (flamegraph.pl, speedscope) or "speedscope" JSON
+PROFILE_MAX_SECONDS = 60  # Longest whole-process profile /debug/profile will run
+
+# Cost ledger persistence: changes are appended to a journal; "write_behind" group-commits them every
+# COST_FLUSH_INTERVAL_MS or every COST_FLUSH_MAX_RECORDS records, so a crash loses at most that window;
+# "sync" fsyncs every record
+COST_WRITE_MODE = "write_behind"
+COST_FLUSH_INTERVAL_MS = 50
+COST_FLUSH_MAX_RECORDS = 100
+COST_COMPACT_MIN_RECORDS = 10000  # Journal entries before costs.json is rewritten; later, once the journal is as long as the ledger
+
+# Per-user and per-tenant budgets, for requests that name a user_id or tenant_id.
+# Windows are "daily" or "monthly" and reset on their own; a limit of None means unlimited.
+PRINCIPAL_BUDGETS = {
+    "user": {"limit": None, "window": "daily"},
+    "tenant": {"limit": None, "window": "monthly"}
+}
+PRINCIPAL_BUDGET_OVERRIDES = {}  # Limits for individual principals, e.g. {"user:alice": 2.0, "tenant:acme": 100.0}
+BUDGET_STRIPES = 64  # Lock stripes for the per-principal spend counters
+
+# Shared state for running several API nodes behind a load balancer: budget counters, the routing cache,
+# job state and single-flight locks. "local" keeps it in this process; "redis" shares it between nodes
+SHARED_STATE = os.environ.get("SHARED_STATE", "local")
+SHARED_STATE_BACKENDS = {
+    "local": "src.services.state.local_state:LocalState",
+    "redis": "src.services.state.redis_state:RedisState"
+}
+SHARED_STATE_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+SHARED_STATE_PREFIX = "mschat:"  # Keeps several deployments apart on one server
+JOB_STATE_TTL_SECONDS = 3600  # How long /jobs/{request_id} answers after a job's last update
+
+# Routing cache: identical prompts reuse the content type routed before instead of calling the router again
+ROUTE_CACHE_ENABLED = False
+ROUTE_CACHE_TTL_SECONDS = 86400
+ROUTE_CACHE_LOCK_SECONDS = 5  # How long other requests for a prompt wait for the one routing it
+ROUTE_CACHE_POLL_SECONDS = 0.05
+
+# Request deadlines: clients send seconds in the X-Request-Timeout header or the timeout_seconds field.
+# Requests without one get the default for their content type, and none may take longer than the maximum
+DEADLINE_HEADER = "X-Request-Timeout"
+DEADLINE_DEFAULT_SECONDS = {"default": 60, "text": 180, "image": 120, "song": 600}
+DEADLINE_MAX_SECONDS = {"default": 120, "text": 600, "image": 300, "song": 900}
+
+# Event streams: idle streams send an SSE comment this often so proxies keep the connection open
+SSE_HEARTBEAT_SECONDS = 15
+
+# WebSocket transport: one connection carries many generation streams, each with its own credit
+WS_MAX_STREAMS = 8  # Streams running at once per connection
+WS_STREAM_WINDOW = 64  # Events sent per stream before the client must grant more
+WS_SEND_QUEUE = 256  # Messages waiting to be sent before streams wait for the connection
@@ -0,0 +1,427 @@
+import math
+import threading
+import time
+from typing import Dict, Optional
+from src.services.base import GenerationCancelled
+from src.services.deadline import DeadlineExceeded, current_deadline
+from src.services.generator_pool import backend_settings
+import src.config as Config
+
+class AdmissionRejected(Exception):
+    """Raised when a provider cannot accept more work right now."""
+
+    def __init__(self, provider: str, reason: str, retry_after: int):
+        super().__init__(f"{provider} is overloaded ({reason}), retry after {retry_after}s")
+        self.provider = provider
+        self.reason = reason
+        self.retry_after = retry_after
+
+# Errors that say a provider is overloaded, by class name so their libraries need not be imported:
+# OpenAI rate limits and timeouts, and requests timeouts
+OVERLOAD_ERRORS = ("RateLimitError", "APITimeoutError", "Timeout", "ReadTimeout", "ConnectTimeout")
+
+def is_overload(error: BaseException) -> bool:
+    """
+    Whether an error, or one it was raised from, says the provider is overloaded:
+    a 429 status, a rate-limit error or a timeout. Generators wrap provider errors
+    in GenerationError, so the chain of causes is searched. Running out of the request's
+    own time or being cancelled says nothing about the provider, whatever caused it.
+    """
+    if isinstance(error, (DeadlineExceeded, GenerationCancelled)):
+        return False
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+        if status == 429 or isinstance(error, TimeoutError) or type(error).__name__ in OVERLOAD_ERRORS:
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+class TokenBucket:
+    """
+    Token bucket rate limiter.
+    Not thread safe on its own - callers must hold their own lock.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        """
+        Args:
+            rate (float): Tokens added per second
+            burst (float): Maximum number of tokens the bucket can hold
+        """
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        """Add the tokens accumulated since the last refill."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self) -> float:
+        """
+        Take one token if available.
+
+        Returns:
+            float: 0 if a token was taken, otherwise seconds until one is available
+        """
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+class AdaptiveLimit:
+    """
+    Concurrency limit that tunes itself from call latencies, AIMD style.
+    While the recent latency stays within tolerance of the baseline and the limit is in use,
+    it grows by one slot per limit's worth of calls; when latency rises past tolerance, or the
+    provider rate-limits or times out, it is cut by a factor. After a cut, further cuts wait
+    until a limit's worth of calls has been recorded, successful or not, so one slow burst
+    counts once while a sustained storm of overloads keeps cutting.
+    Not thread safe on its own - callers must hold their own lock.
+    """
+
+    def __init__(self, initial: float, min_limit: int = 1, max_limit: Optional[int] = None, tolerance: float = 2.0,
+                 decrease: float = 0.7, smoothing: float = 0.2, baseline_drift: float = 0.002):
+        """
+        Args:
+            initial (float): Starting limit
+            min_limit (int): Lowest limit, so a provider is never shut off completely
+            max_limit (int): Highest limit, None for no ceiling
+            tolerance (float): Ratio of recent to baseline latency above which the limit is cut
+            decrease (float): Factor the limit is multiplied by when cut
+            smoothing (float): Weight of each new latency in the recent average
+            baseline_drift (float): Weight of each new latency in the baseline when above it,
+                so a provider that became slower for good is eventually seen as normal
+        """
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(self._clamp(initial))
+        self.tolerance = tolerance
+        self.decrease = decrease
+        self.smoothing = smoothing
+        self.baseline_drift = baseline_drift
+        self.baseline: Optional[float] = None  # Latency under light load: the lowest recent latency, drifting up slowly
+        self.recent: Optional[float] = None  # Smoothed latency of the latest calls
+        self._cooldown = 0  # Calls to record before the limit may be cut again
+        self._stats = {"samples": 0, "increases": 0, "decreases": 0, "overloads": 0}
+
+    def _clamp(self, limit: float) -> float:
+        limit = max(limit, self.min_limit)
+        return limit if self.max_limit is None else min(limit, self.max_limit)
+
+    @property
+    def current(self) -> int:
+        """Calls allowed in flight right now."""
+        return int(self.limit)
+
+    def on_success(self, latency: float, in_flight: int) -> bool:
+        """
+        Learn from a call that completed.
+
+        Args:
+            latency (float): Seconds the call took
+            in_flight (int): Calls in flight when it was admitted, itself included
+
+        Returns:
+            bool: True if the limit grew
+        """
+        self._stats["samples"] += 1
+        self.recent = latency if self.recent is None else self.recent + (latency - self.recent) * self.smoothing
+        if self.baseline is None or self.recent < self.baseline:
+            self.baseline = self.recent
+        else:
+            self.baseline += (self.recent - self.baseline) * self.baseline_drift
+        self._count_down()
+
+        if self.recent > self.baseline * self.tolerance:
+            self._cut()
+            return False
+        # A limit that is mostly unused says nothing about whether the provider could take more
+        if in_flight >= self.limit / 2:
+            previous = self.current
+            self.limit = self._clamp(self.limit + 1 / self.limit)
+            if self.current > previous:
+                self._stats["increases"] += 1
+                return True
+        return False
+
+    def on_overload(self):
+        """Learn from a call the provider refused or timed out."""
+        self._stats["overloads"] += 1
+        self._count_down()
+        self._cut()
+
+    def _count_down(self):
+        if self._cooldown:
+            self._cooldown -= 1
+
+    def _cut(self):
+        if self._cooldown:
+            return
+        self.limit = self._clamp(self.limit * self.decrease)
+        self._cooldown = self.current
+        self._stats["decreases"] += 1
+
+    def get_stats(self) -> Dict:
+        """Get the limit and the latency estimates it is based on."""
+        return {
+            "limit": self.current,
+            "min_limit": self.min_limit,
+            "baseline_ms": None if self.baseline is None else round(self.baseline * 1000, 1),
+            "recent_ms": None if self.recent is None else round(self.recent * 1000, 1),
+            **self._stats
+        }
+
+class Slot:
+    """
+    An admitted unit of work. Releasing it more than once is harmless.
+    Recording how the call went lets an adaptive limiter learn from it; calls that are
+    cancelled, or never reach the provider, are simply released without a record.
+    Latency is measured from start(), or from admission if the call never marks its start.
+    """
+
+    def __init__(self, limiter: Optional["ProviderLimiter"] = None, in_flight: int = 0):
+        self._limiter = limiter
+        self._released = False
+        self._recorded = False
+        self.started = time.monotonic()
+        self.in_flight = in_flight
+
+    def start(self):
+        """Mark that the provider call begins now, after any queueing and bookkeeping."""
+        self.started = time.monotonic()
+
+    def record(self, error: Optional[BaseException] = None):
+        """
+        Report that the call completed, or failed with an error, once. Streaming calls
+        report when their first chunk arrives, which is the wait the limit should bound.
+
+        Args:
+            error (Optional[BaseException]): Error the call failed with, None if it succeeded
+        """
+        if not self._recorded and self._limiter:
+            self._recorded = True
+            self._limiter._record(self, error)
+
+    def release(self):
+        """Give the concurrency slot back to the limiter."""
+        if not self._released and self._limiter:
+            self._released = True
+            self._limiter._release()
+
+class ProviderLimiter:
+    """
+    Admission control for a single provider.
+    Combines a concurrency cap, a token bucket and a bounded wait queue with a deadline.
+    Callers with a request deadline wait no longer than it allows. With adaptive settings
+    the cap is an AdaptiveLimit tuned from call latencies, and max_concurrency its ceiling.
+    """
+
+    def __init__(self, name: str, max_concurrency: Optional[int] = None, rate_per_second: Optional[float] = None,
+                 burst: Optional[float] = None, max_queue: int = 0, queue_timeout: float = 0,
+                 adaptive: Optional[Dict] = None):
+        """
+        Args:
+            name (str): Provider name used in errors and stats
+            max_concurrency (int): Maximum calls in flight, None for unlimited
+            rate_per_second (float): Sustained call rate, None for unlimited
+            burst (float): Token bucket size, defaults to one second of rate
+            max_queue (int): Maximum number of callers waiting for admission
+            queue_timeout (float): Maximum seconds a caller waits in the queue
+            adaptive (Dict): AdaptiveLimit settings over Config.ADAPTIVE_CONCURRENCY, with an "initial"
+                limit defaulting to the ceiling; None for a fixed max_concurrency
+        """
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.bucket = TokenBucket(rate_per_second, burst or max(rate_per_second, 1)) if rate_per_second else None
+        self.adaptive = None
+        if adaptive is not None:
+            settings = {**Config.ADAPTIVE_CONCURRENCY, **adaptive}
+            settings.setdefault("initial", max_concurrency or settings["min_limit"])
+            self.adaptive = AdaptiveLimit(max_limit=max_concurrency, **settings)
+
+        self._condition = threading.Condition()
+        self.in_flight = 0
+        self.queued = 0
+        self._stats = {"admitted": 0, "rejected_queue_full": 0, "rejected_timeout": 0, "rejected_deadline": 0}
+
+    def _try_admit(self) -> Optional[float]:
+        """
+        Admit the caller if a slot and a token are free. Must hold the lock.
+
+        Returns:
+            Optional[float]: 0 if admitted, seconds until a token frees up, or None if no slot is free
+        """
+        limit = self.adaptive.current if self.adaptive else self.max_concurrency
+        if limit is not None and self.in_flight >= limit:
+            return None
+
+        wait = self.bucket.try_take() if self.bucket else 0.0
+        if wait == 0:
+            self.in_flight += 1
+            self._stats["admitted"] += 1
+        return wait
+
+    def _retry_after(self) -> int:
+        """Estimate how many seconds a rejected caller should wait. Must hold the lock."""
+        estimate = self.queue_timeout
+        if self.bucket:
+            estimate = max(estimate, (self.queued + 1) / self.bucket.rate)
+        return max(1, math.ceil(estimate))
+
+    def acquire(self) -> Slot:
+        """
+        Wait for admission, blocking the calling thread while queued.
+
+        Returns:
+            Slot: Admitted slot, to be released when the call finishes
+
+        Raises:
+            AdmissionRejected: If the queue is full or the queue deadline passes
+            DeadlineExceeded: If the request's deadline passes first, or would pass before a token frees up
+        """
+        request_deadline = current_deadline()
+        with self._condition:
+            if self._try_admit() == 0:
+                return Slot(self, self.in_flight)
+
+            if self.queued >= self.max_queue:
+                self._stats["rejected_queue_full"] += 1
+                raise AdmissionRejected(self.name, "queue full", self._retry_after())
+
+            timeout = self.queue_timeout
+            if request_deadline:
+                left = request_deadline.remaining()
+                # Callers ahead take the tokens that free up first, so waiting could not end in time
+                if left <= 0 or (self.bucket and (self.queued + 1) / self.bucket.rate > left):
+                    self._stats["rejected_deadline"] += 1
+                    raise request_deadline.exceeded("queueing")
+                timeout = min(timeout, left)
+
+            deadline = time.monotonic() + timeout
+            self.queued += 1
+            try:
+                while True:
+                    wait = self._try_admit()
+                    if wait == 0:
+                        return Slot(self, self.in_flight)
+
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        if timeout < self.queue_timeout:
+                            self._stats["rejected_deadline"] += 1
+                            raise request_deadline.exceeded("queueing")
+                        self._stats["rejected_timeout"] += 1
+                        raise AdmissionRejected(self.name, "queue timeout", self._retry_after())
+
+                    self._condition.wait(remaining if wait is None else min(wait, remaining))
+            finally:
+                self.queued -= 1
+
+    def try_acquire(self) -> Optional[Slot]:
+        """
+        Admit the caller only if a slot and a token are free right now, without queueing.
+
+        Returns:
+            Optional[Slot]: Admitted slot, or None if the caller would have to wait
+        """
+        with self._condition:
+            # Queued callers go first, so optional work never overtakes them
+            if self.queued or self._try_admit() != 0:
+                return None
+            return Slot(self, self.in_flight)
+
+    def _release(self):
+        """Free a concurrency slot and wake a waiting caller."""
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+    def _record(self, slot: Slot, error: Optional[BaseException]):
+        """Let the adaptive limit learn from a call's latency, or from an overload error."""
+        if not self.adaptive:
+            return
+        with self._condition:
+            if error is None:
+                if self.adaptive.on_success(time.monotonic() - slot.started, slot.in_flight):
+                    # A grown limit has room for a waiting caller that no release will wake
+                    self._condition.notify()
+            elif is_overload(error):
+                self.adaptive.on_overload()
+
+    def get_stats(self) -> Dict:
+        """
+        Get current limiter state.
+
+        Returns:
+            Dict containing limits, in-flight calls, queue depth and admission counters,
+            and the adaptive limit with its latency estimates if enabled
+        """
+        with self._condition:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "concurrency_limit": self.adaptive.current if self.adaptive else self.max_concurrency,
+                "adaptive": self.adaptive.get_stats() if self.adaptive else None,
+                "rate_per_second": self.bucket.rate if self.bucket else None,
+                "max_queue": self.max_queue,
+                "in_flight": self.in_flight,
+                "queued": self.queued,
+                **self._stats
+            }
+
+class AdmissionController:
+    """
+    Holds one limiter per provider, configured from Config.PROVIDER_LIMITS.
+    Providers are keyed by generator or router class name, and pool backends by their own name
+    (see backend_settings); unlisted providers are not limited.
+    """
+
+    def __init__(self, limits: Dict[str, Dict] = None):
+        self.limits = backend_settings(Config.PROVIDER_LIMITS) if limits is None else limits
+        self._limiters: Dict[str, ProviderLimiter] = {
+            name: ProviderLimiter(name, **settings) for name, settings in self.limits.items()
+        }
+
+    def limiter(self, provider: str) -> Optional[ProviderLimiter]:
+        """Get the limiter for a provider, or None if it is unlimited."""
+        return self._limiters.get(provider)
+
+    def acquire(self, provider: str) -> Slot:
+        """
+        Wait for admission to a provider.
+
+        Args:
+            provider (str): Provider class name
+
+        Returns:
+            Slot: Admitted slot (a no-op slot if the provider is unlimited)
+
+        Raises:
+            AdmissionRejected: If the provider cannot accept more work
+        """
+        limiter = self._limiters.get(provider)
+        return limiter.acquire() if limiter else Slot()
+
+    def try_acquire(self, provider: str) -> Optional[Slot]:
+        """
+        Admit optional work to a provider only if it has spare capacity right now.
+
+        Args:
+            provider (str): Provider class name
+
+        Returns:
+            Optional[Slot]: Admitted slot (a no-op slot if the provider is unlimited), or None
+        """
+        limiter = self._limiters.get(provider)
+        return limiter.try_acquire() if limiter else Slot()
+
+    def get_stats(self) -> Dict:
+        """Get limiter state for every configured provider."""
+        return {name: limiter.get_stats() for name, limiter in self._limiters.items()}
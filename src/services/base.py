@@ -1,6 +1,8 @@
 from abc import ABC, abstractmethod
-from typing import Any, Dict, Tuple
+from typing import Any, Callable, Dict, List, Tuple
 from enum import Enum
+import threading
+from src.services.clock import get_clock
 
 class ContentType(Enum):
     """
@@ -15,16 +17,109 @@ class GenerationError(Exception):
     """Custom exception for content generation errors."""
     pass
 
+class GenerationCancelled(GenerationError):
+    """Raised by a generator that stopped early because its request was cancelled."""
+    pass
+
+class CancelToken:
+    """
+    Cooperative cancellation flag shared by a request and the thread generating for it.
+    Generators wait on the token instead of sleeping, and register callbacks that abort
+    their upstream calls.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], Any]] = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self):
+        """Cancel and run the registered callbacks, once."""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass  # Aborting upstream work is best effort
+
+    def on_cancel(self, callback: Callable[[], Any]):
+        """Run a callback on cancellation, straight away if already cancelled."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def raise_if_cancelled(self):
+        """
+        Raises:
+            GenerationCancelled: If the token has been cancelled
+        """
+        if self._event.is_set():
+            raise GenerationCancelled("Generation cancelled")
+
+    def sleep(self, seconds: float):
+        """
+        Sleep on the current clock, waking up as soon as the token is cancelled.
+
+        Raises:
+            GenerationCancelled: If the token is cancelled before or during the sleep
+        """
+        if get_clock().wait(self._event, seconds):
+            raise GenerationCancelled("Generation cancelled")
+
 class ContentGeneratorBase(ABC):
     """
     Abstract base class for all content generators.
-    Any class that inherits from this must implement generate_content and get_price.
+    Any class that inherits from this must implement generate_content and get_price,
+    and should set content_type to the kind of content it produces.
     """
 
+    # Kind of content this generator produces, known before generation starts
+    content_type: ContentType = None
+
+    @property
+    def provider(self) -> str:
+        """Provider name used for cost records, admission control and circuit breakers."""
+        return self.__class__.__name__
+
+    @property
+    def cancel_token(self) -> CancelToken:
+        """Token cancelling this generator's work. Generators are created per request, so it is per request too."""
+        token = self.__dict__.get("_cancel_token")
+        if token is None:
+            token = self.__dict__.setdefault("_cancel_token", CancelToken())
+        return token
+
+    def cancel(self):
+        """Ask a running generation to stop: close upstream streams, stop polling and abort pending requests."""
+        self.cancel_token.cancel()
+
     def supports_streaming(self) -> bool:
         """Whether this generator supports streaming. Default is False."""
         return False
 
+    def fail_over(self, error: Exception) -> bool:
+        """
+        Switch to another backend after a failure that produced no output, so the caller can
+        admit, charge and run the request again under the new provider. Default is False.
+
+        Args:
+            error (Exception): Error the current backend failed with
+
+        Returns:
+            bool: True if another backend is ready to be tried
+        """
+        return False
+
     @abstractmethod
     def generate_content(self, prompt: str) -> Tuple[ContentType, str]:
         """
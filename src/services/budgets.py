@@ -0,0 +1,301 @@
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from src.services.state.base import Counter, SharedStateBase
+import src.config as Config
+
+# A principal is a (kind, id) pair, e.g. ("user", "alice") or ("tenant", "acme")
+Principal = Tuple[str, str]
+
+class BudgetExceeded(ValueError):
+    """Raised when a charge would take a user or tenant over its budget for the current window."""
+    pass
+
+def window_key(window: str, now: datetime) -> str:
+    """Key of the budget window containing now: the day for "daily", the month for "monthly"."""
+    if window == "daily":
+        return now.strftime("%Y-%m-%d")
+    if window == "monthly":
+        return now.strftime("%Y-%m")
+    raise ValueError(f"Unknown budget window: {window}")
+
+def window_end(window: str, now: datetime) -> datetime:
+    """Start of the window after the one containing now, when its counters reset."""
+    if window == "daily":
+        return datetime(now.year, now.month, now.day) + timedelta(days=1)
+    return datetime(now.year + now.month // 12, now.month % 12 + 1, 1)
+
+class _Usage:
+    """Spend of one principal in its current window."""
+    __slots__ = ("window", "spent", "requests")
+
+    def __init__(self, window: str):
+        self.window = window
+        self.spent = 0.0
+        self.requests = 0
+
+class PrincipalBudgets:
+    """
+    Per-user and per-tenant budgets over daily or monthly windows.
+    Spend is kept in in-memory counters, so a check costs the same however long the
+    cost history is. Counters are striped by key over separately locked shards, so
+    charges for different principals rarely contend. A counter resets itself when
+    it is first touched in a new window.
+    """
+
+    # Whether spend is shared with other nodes, including the overall budget
+    shared = False
+
+    def __init__(self, budgets: Dict[str, Dict] = None, overrides: Dict[str, float] = None, stripes: int = None):
+        """
+        Args:
+            budgets (Dict[str, Dict]): Default limit and window per kind, defaults to Config.PRINCIPAL_BUDGETS
+            overrides (Dict[str, float]): Limits for individual "kind:id" principals, defaults to Config.PRINCIPAL_BUDGET_OVERRIDES
+            stripes (int): Number of lock stripes, defaults to Config.BUDGET_STRIPES
+        """
+        self.budgets = Config.PRINCIPAL_BUDGETS if budgets is None else budgets
+        self.overrides = Config.PRINCIPAL_BUDGET_OVERRIDES if overrides is None else overrides
+        self._stripes: List[Tuple[threading.Lock, Dict[Principal, _Usage]]] = [
+            (threading.Lock(), {}) for _ in range(stripes or Config.BUDGET_STRIPES)
+        ]
+
+    def limit(self, principal: Principal) -> Optional[float]:
+        """Budget of a principal per window, None if unlimited."""
+        kind, principal_id = principal
+        override = self.overrides.get(f"{kind}:{principal_id}")
+        if override is not None:
+            return override
+        return self.budgets.get(kind, {}).get("limit")
+
+    def _window(self, kind: str) -> str:
+        return self.budgets.get(kind, {}).get("window", "monthly")
+
+    def _stripe(self, principal: Principal) -> int:
+        return hash(principal) % len(self._stripes)
+
+    def _usage(self, principal: Principal, now: datetime) -> _Usage:
+        """Current-window counter of a principal; the caller holds its stripe lock."""
+        counters = self._stripes[self._stripe(principal)][1]
+        key = window_key(self._window(principal[0]), now)
+        usage = counters.get(principal)
+        if usage is None or usage.window != key:
+            usage = counters[principal] = _Usage(key)
+        return usage
+
+    def _locks(self, principals: List[Principal]) -> List[threading.Lock]:
+        # Taken in stripe order, so charges for overlapping principals cannot deadlock
+        return [self._stripes[index][0] for index in sorted({self._stripe(p) for p in principals})]
+
+    def charge(self, principals: Iterable[Optional[Principal]], cost: float, now: datetime = None):
+        """
+        Charge a cost to every principal, or to none if any of them would go over budget.
+
+        Args:
+            principals (Iterable[Optional[Principal]]): Principals to charge; None entries are skipped
+            cost (float): Amount to charge
+            now (datetime): Time of the charge, defaults to now
+
+        Raises:
+            BudgetExceeded: If the cost would exceed a principal's budget for its window
+        """
+        principals = [principal for principal in principals if principal and principal[1]]
+        if not principals:
+            return
+        now = now or datetime.now()
+        locks = self._locks(principals)
+        for lock in locks:
+            lock.acquire()
+        try:
+            counters = [self._usage(principal, now) for principal in principals]
+            for principal, usage in zip(principals, counters):
+                limit = self.limit(principal)
+                if limit is not None and usage.spent + cost > limit:
+                    kind, principal_id = principal
+                    raise BudgetExceeded(
+                        f"Cost {cost} would exceed the {self._window(kind)} budget of {limit} for {kind} {principal_id}"
+                    )
+            for usage in counters:
+                usage.spent += cost
+                usage.requests += 1
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    def credit(self, principals: Iterable[Optional[Principal]], cost: float, charged_at: datetime, now: datetime = None):
+        """Give back a cost charged at a given time, if its window is still the current one."""
+        now = now or datetime.now()
+        for principal in principals:
+            if not principal or not principal[1]:
+                continue
+            window = self._window(principal[0])
+            if window_key(window, charged_at) != window_key(window, now):
+                continue
+            lock, _ = self._stripes[self._stripe(principal)]
+            with lock:
+                usage = self._usage(principal, now)
+                usage.spent = max(0.0, usage.spent - cost)
+
+    def rebuild(self, records: Iterable[Dict], now: datetime = None):
+        """Restore current-window spend from cost records that carry user or tenant fields."""
+        now = now or datetime.now()
+        for record in records:
+            charged_at = datetime.fromisoformat(record["timestamp"])
+            for principal in record_principals(record):
+                window = self._window(principal[0])
+                if window_key(window, charged_at) != window_key(window, now):
+                    continue
+                lock, _ = self._stripes[self._stripe(principal)]
+                with lock:
+                    usage = self._usage(principal, now)
+                    usage.spent += record["cost"]
+                    if record["cost"] > 0:
+                        usage.requests += 1
+
+    def usage(self, principal: Principal, now: datetime = None) -> Dict:
+        """Spend, limit and reset time of a principal in its current window, zero for one not charged in it."""
+        now = now or datetime.now()
+        window = self._window(principal[0])
+        lock, counters = self._stripes[self._stripe(principal)]
+        with lock:
+            # Read without creating a counter, so looking up unknown principals costs no memory
+            usage = counters.get(principal)
+            if usage is not None and usage.window == window_key(window, now):
+                spent, requests = usage.spent, usage.requests
+            else:
+                spent, requests = 0.0, 0
+        limit = self.limit(principal)
+        return {
+            "kind": principal[0],
+            "id": principal[1],
+            "window": window,
+            "spent": round(spent, 6),
+            "requests": requests,
+            "limit": limit,
+            "remaining": None if limit is None else round(limit - spent, 6),
+            "resets_at": window_end(window, now).isoformat()
+        }
+
+    def get_usage(self, kind: str = None) -> List[Dict]:
+        """Current-window usage of every principal seen, optionally of one kind, biggest spenders first."""
+        principals = []
+        for lock, counters in self._stripes:
+            with lock:
+                principals.extend(principal for principal in counters if kind is None or principal[0] == kind)
+        now = datetime.now()
+        return sorted((self.usage(principal, now) for principal in principals), key=lambda item: -item["spent"])
+
+class SharedBudgets(PrincipalBudgets):
+    """
+    Per-user and per-tenant budgets kept in shared state, so every node behind a load balancer
+    enforces the same spend. Each charge is one atomic operation on the backend covering the
+    principals' window counters and the overall Config.BUDGET total. Counters are keyed by
+    window, so a new window starts from zero, and expire a day after their window ends.
+    """
+
+    shared = True
+
+    TOTAL_KEY = "{budget}:total"
+
+    def __init__(self, state: SharedStateBase, budgets: Dict[str, Dict] = None, overrides: Dict[str, float] = None):
+        """
+        Args:
+            state (SharedStateBase): Backend holding the counters
+            budgets (Dict[str, Dict]): Default limit and window per kind, defaults to Config.PRINCIPAL_BUDGETS
+            overrides (Dict[str, float]): Limits for individual "kind:id" principals, defaults to Config.PRINCIPAL_BUDGET_OVERRIDES
+        """
+        super().__init__(budgets, overrides, stripes=1)
+        self.state = state
+
+    def _keys(self, principal: Principal, now: datetime) -> Tuple[str, str]:
+        """Spend and request counter keys of a principal's current window; the id goes last as it may hold colons."""
+        kind, principal_id = principal
+        window = window_key(self._window(kind), now)
+        # The {budget} hash tag keeps every budget key of a charge on one Redis Cluster slot
+        return f"{{budget}}:spent:{kind}:{window}:{principal_id}", f"{{budget}}:requests:{kind}:{window}:{principal_id}"
+
+    def _ttl(self, kind: str, now: datetime) -> int:
+        return int((window_end(self._window(kind), now) - now).total_seconds()) + 86400
+
+    def charge(self, principals: Iterable[Optional[Principal]], cost: float, now: datetime = None):
+        """
+        Charge a cost to every principal and to the overall budget, or to none of them if any would go over.
+
+        Raises:
+            BudgetExceeded: If the cost would exceed a principal's budget for its window
+            ValueError: If it would exceed the overall budget
+        """
+        principals = [principal for principal in principals if principal and principal[1]]
+        now = now or datetime.now()
+        counters = [Counter(self.TOTAL_KEY, cost, Config.BUDGET)]
+        for principal in principals:
+            spent, requests = self._keys(principal, now)
+            ttl = self._ttl(principal[0], now)
+            counters.append(Counter(spent, cost, self.limit(principal), ttl))
+            counters.append(Counter(requests, 1, None, ttl))
+        refused = self.state.charge(counters)
+        if refused == 0:
+            raise ValueError(f"Cost {cost} would exceed budget of {Config.BUDGET}")
+        if refused is not None:
+            kind, principal_id = principals[(refused - 1) // 2]
+            raise BudgetExceeded(
+                f"Cost {cost} would exceed the {self._window(kind)} budget of {counters[refused].limit} for {kind} {principal_id}"
+            )
+
+    def credit(self, principals: Iterable[Optional[Principal]], cost: float, charged_at: datetime, now: datetime = None):
+        """Give back a cost to the overall budget, and to principals whose window is still the one it was charged in."""
+        now = now or datetime.now()
+        keys = [self.TOTAL_KEY]
+        for principal in principals:
+            if not principal or not principal[1]:
+                continue
+            window = self._window(principal[0])
+            if window_key(window, charged_at) == window_key(window, now):
+                keys.append(self._keys(principal, now)[0])
+        self.state.credit(keys, cost)
+
+    def rebuild(self, records: Iterable[Dict], now: datetime = None):
+        """Nothing to restore: the counters outlive this process in the shared state."""
+        pass
+
+    def total(self) -> float:
+        """Spend counted against the overall budget by every node."""
+        return self.state.get_counters([self.TOTAL_KEY])[0]
+
+    def usage(self, principal: Principal, now: datetime = None) -> Dict:
+        """Spend, limit and reset time of a principal in its current window, across all nodes."""
+        return self._usages([principal], now or datetime.now())[0]
+
+    def _usages(self, principals: List[Principal], now: datetime) -> List[Dict]:
+        """Usage of several principals, read in one round trip."""
+        keys = [key for principal in principals for key in self._keys(principal, now)]
+        values = self.state.get_counters(keys)
+        usages = []
+        for index, (kind, principal_id) in enumerate(principals):
+            spent, requests = values[index * 2], values[index * 2 + 1]
+            limit = self.limit((kind, principal_id))
+            window = self._window(kind)
+            usages.append({
+                "kind": kind,
+                "id": principal_id,
+                "window": window,
+                "spent": round(spent, 6),
+                "requests": int(requests),
+                "limit": limit,
+                "remaining": None if limit is None else round(limit - spent, 6),
+                "resets_at": window_end(window, now).isoformat()
+            })
+        return usages
+
+    def get_usage(self, kind: str = None) -> List[Dict]:
+        """Current-window usage of every principal charged on any node, optionally of one kind, biggest spenders first."""
+        now = datetime.now()
+        principals = []
+        for key in self.state.scan_counters("{budget}:spent:" + (f"{kind}:" if kind else "")):
+            _, _, principal_kind, window, principal_id = key.split(":", 4)
+            if window == window_key(self._window(principal_kind), now):
+                principals.append((principal_kind, principal_id))
+        return sorted(self._usages(principals, now), key=lambda item: -item["spent"])
+
+def record_principals(record: Dict) -> List[Principal]:
+    """Principals a cost record was charged to."""
+    return [(kind, record[kind]) for kind in ("user", "tenant") if record.get(kind)]
@@ -0,0 +1,275 @@
+import random
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Iterator, Tuple, Type
+from src.services.base import GenerationError, GenerationCancelled
+from src.services.clock import get_clock
+from src.services.deadline import DeadlineExceeded, current_deadline
+from src.services.generator_pool import backend_settings
+import src.config as Config
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitOpenError(GenerationError):
+    """Raised instead of calling a provider whose circuit breaker is open."""
+
+    def __init__(self, provider: str, retry_after: int):
+        super().__init__(f"{provider} is unavailable, circuit open for another {retry_after}s")
+        self.provider = provider
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """
+    Circuit breaker for a single provider.
+    Tracks the outcome of the last calls; when too many of them failed or were too slow,
+    the breaker opens and calls fail immediately. After a cool-down a limited number of
+    half-open probes are let through, and the breaker closes again once they succeed.
+    """
+
+    def __init__(self, name: str, failure_rate: float = 0.5, window: int = 20, min_calls: int = 5,
+                 slow_call_seconds: float = None, open_seconds: float = 30, half_open_probes: int = 2):
+        """
+        Args:
+            name (str): Provider name used in errors and stats
+            failure_rate (float): Share of failed or slow calls in the window that opens the breaker
+            window (int): Number of recent calls considered
+            min_calls (int): Calls needed in the window before the failure rate is acted on
+            slow_call_seconds (float): Calls slower than this count as failures, None to disable
+            open_seconds (float): How long to fail fast before probing again
+            half_open_probes (int): Successful probes needed to close the breaker
+        """
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=window)
+        self.state = CLOSED
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._stats = {"calls": 0, "failures": 0, "slow_calls": 0, "rejected": 0, "times_opened": 0}
+
+    def _retry_after(self) -> int:
+        """Seconds left until the breaker lets probes through. Must hold the lock."""
+        return max(1, int(self._opened_at + self.open_seconds - time.monotonic() + 0.999))
+
+    def _open(self):
+        """Trip the breaker. Must hold the lock."""
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._stats["times_opened"] += 1
+
+    def raise_if_open(self):
+        """
+        Fail fast without reserving a probe, so callers can reject before doing any work.
+
+        Raises:
+            CircuitOpenError: If the breaker is open and still cooling down
+        """
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self._opened_at < self.open_seconds:
+                self._stats["rejected"] += 1
+                raise CircuitOpenError(self.name, self._retry_after())
+
+    def _before_call(self) -> bool:
+        """
+        Admit a call or reject it.
+
+        Returns:
+            bool: True if the call is a half-open probe
+
+        Raises:
+            CircuitOpenError: If the breaker is open or all probes are in flight
+        """
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    self._stats["rejected"] += 1
+                    raise CircuitOpenError(self.name, self._retry_after())
+                self.state = HALF_OPEN
+                self._probes_in_flight = 0
+                self._probe_successes = 0
+
+            if self.state == HALF_OPEN:
+                if self._probes_in_flight >= self.half_open_probes:
+                    self._stats["rejected"] += 1
+                    raise CircuitOpenError(self.name, 1)
+                self._probes_in_flight += 1
+                return True
+
+            return False
+
+    def _after_call(self, probe: bool, failed: bool, duration: float):
+        """Record the outcome of an admitted call and update the state."""
+        slow = self.slow_call_seconds is not None and duration > self.slow_call_seconds
+        bad = failed or slow
+
+        with self._lock:
+            self._stats["calls"] += 1
+            self._stats["failures"] += failed
+            self._stats["slow_calls"] += slow
+
+            if probe:
+                self._probes_in_flight -= 1
+                if self.state != HALF_OPEN:
+                    return
+                if bad:
+                    self._open()
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_probes:
+                    self.state = CLOSED
+                    self._outcomes.clear()
+                return
+
+            self._outcomes.append(bad)
+            if (self.state == CLOSED and len(self._outcomes) >= self.min_calls
+                    and sum(self._outcomes) / len(self._outcomes) >= self.failure_rate):
+                self._open()
+
+    def _cancel_call(self, probe: bool):
+        """Forget an admitted call that ended without a verdict, e.g. an abandoned stream."""
+        if probe:
+            with self._lock:
+                self._probes_in_flight -= 1
+
+    def call(self, func: Callable, *args):
+        """
+        Call a provider through the breaker.
+
+        Raises:
+            CircuitOpenError: If the breaker rejects the call
+        """
+        probe = self._before_call()
+        start = time.monotonic()
+        try:
+            result = func(*args)
+        except (GenerationCancelled, DeadlineExceeded):
+            # A request that ran out of its own time says nothing about the provider's health
+            self._cancel_call(probe)
+            raise
+        except Exception:
+            self._after_call(probe, True, time.monotonic() - start)
+            raise
+        self._after_call(probe, False, time.monotonic() - start)
+        return result
+
+    def stream(self, iterator_factory: Callable, *args) -> Iterator:
+        """
+        Consume a provider stream through the breaker.
+        Time to the first item is what counts towards slow calls.
+
+        Raises:
+            CircuitOpenError: If the breaker rejects the call
+        """
+        probe = self._before_call()
+        start = time.monotonic()
+        first_item_after = None
+        try:
+            for item in iterator_factory(*args):
+                if first_item_after is None:
+                    first_item_after = time.monotonic() - start
+                yield item
+        except (GeneratorExit, GenerationCancelled, DeadlineExceeded):
+            self._cancel_call(probe)
+            raise
+        except Exception:
+            self._after_call(probe, True, time.monotonic() - start)
+            raise
+        self._after_call(probe, False, first_item_after or time.monotonic() - start)
+
+    def get_stats(self) -> Dict:
+        """
+        Get current breaker state.
+
+        Returns:
+            Dict containing state, recent failure rate and call counters
+        """
+        with self._lock:
+            state = self.state
+            if state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                state = HALF_OPEN
+            recent = len(self._outcomes)
+            return {
+                "state": state,
+                "recent_calls": recent,
+                "recent_failure_rate": sum(self._outcomes) / recent if recent else 0.0,
+                **self._stats
+            }
+
+class CircuitBreakerRegistry:
+    """
+    Holds one breaker per provider, configured from Config.CIRCUIT_BREAKERS.
+    Providers are keyed by generator or router class name, and pool backends by their own name
+    (see backend_settings); unlisted providers are called directly.
+    """
+
+    def __init__(self, settings: Dict[str, Dict] = None):
+        self.settings = backend_settings(Config.CIRCUIT_BREAKERS) if settings is None else settings
+        self._breakers: Dict[str, CircuitBreaker] = {
+            name: CircuitBreaker(name, **options) for name, options in self.settings.items()
+        }
+
+    def raise_if_open(self, provider: str):
+        """Fail fast if the provider's breaker is open."""
+        breaker = self._breakers.get(provider)
+        if breaker:
+            breaker.raise_if_open()
+
+    def call(self, provider: str, func: Callable, *args):
+        """Call a provider through its breaker, if it has one."""
+        breaker = self._breakers.get(provider)
+        return breaker.call(func, *args) if breaker else func(*args)
+
+    def stream(self, provider: str, iterator_factory: Callable, *args) -> Iterator:
+        """Consume a provider stream through its breaker, if it has one."""
+        breaker = self._breakers.get(provider)
+        return breaker.stream(iterator_factory, *args) if breaker else iterator_factory(*args)
+
+    def get_stats(self) -> Dict:
+        """Get breaker state for every configured provider."""
+        return {name: breaker.get_stats() for name, breaker in self._breakers.items()}
+
+def retry_with_jitter(func: Callable, *args, retry_on: Tuple[Type[BaseException], ...] = (Exception,),
+                      attempts: int = None, base_delay: float = None, max_delay: float = None):
+    """
+    Call an idempotent function, retrying transient errors with full-jitter exponential backoff.
+
+    Args:
+        func (Callable): Function to call
+        *args: Arguments for func
+        retry_on (Tuple[Type[BaseException], ...]): Exception types worth retrying
+        attempts (int): Maximum number of calls, defaults to Config.RETRY_ATTEMPTS
+        base_delay (float): First backoff ceiling in seconds, defaults to Config.RETRY_BASE_DELAY
+        max_delay (float): Largest backoff ceiling in seconds, defaults to Config.RETRY_MAX_DELAY
+
+    Returns:
+        The function's result
+
+    Raises:
+        The last error once attempts are exhausted, or any error not in retry_on
+        DeadlineExceeded: If the backoff would outlast the current request's deadline
+    """
+    attempts = attempts or Config.RETRY_ATTEMPTS
+    base_delay = Config.RETRY_BASE_DELAY if base_delay is None else base_delay
+    max_delay = Config.RETRY_MAX_DELAY if max_delay is None else max_delay
+
+    for attempt in range(attempts):
+        try:
+            return func(*args)
+        except retry_on as e:
+            if attempt == attempts - 1:
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            # A retry that could only start after the deadline is not worth waiting for
+            deadline = current_deadline()
+            if deadline and deadline.remaining() <= delay:
+                raise deadline.exceeded() from e
+            get_clock().sleep(delay)
@@ -0,0 +1,99 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+class Clock:
+    """
+    Real-time clock. Generators and pollers sleep and wait through the current clock
+    instead of the time module, so tests and benchmarks can swap in a VirtualClock.
+    """
+
+    def now(self) -> float:
+        """Monotonic time in seconds."""
+        return time.monotonic()
+
+    def sleep(self, seconds: float):
+        """Block for a number of seconds."""
+        time.sleep(max(seconds, 0))
+
+    def wait(self, event: threading.Event, timeout: Optional[float]) -> bool:
+        """
+        Wait for an event for up to timeout seconds.
+
+        Args:
+            event (threading.Event): Event to wait for
+            timeout (Optional[float]): Longest wait in seconds, None to wait forever
+
+        Returns:
+            bool: True if the event was set
+        """
+        return event.wait(timeout)
+
+class VirtualClock(Clock):
+    """
+    Clock whose time only moves when someone sleeps or waits, and then jumps forward
+    instantly. A wait for an event that is not yet set times out straight away.
+    Time is shared by all threads, so concurrent sleeps add up; it suits single-threaded
+    tests and sequential benchmarks.
+    """
+
+    def __init__(self, start: float = 0.0):
+        """
+        Args:
+            start (float): Initial time in seconds
+        """
+        self._now = start
+        self._lock = threading.Lock()
+        self.sleeps = 0
+
+    def now(self) -> float:
+        with self._lock:
+            return self._now
+
+    def advance(self, seconds: float):
+        """Move time forward by a number of seconds."""
+        with self._lock:
+            self._now += max(seconds, 0)
+            self.sleeps += 1
+
+    def sleep(self, seconds: float):
+        self.advance(seconds)
+
+    def wait(self, event: threading.Event, timeout: Optional[float]) -> bool:
+        if event.is_set():
+            return True
+        if timeout is None:
+            # Nothing to jump to: only another thread can set the event
+            return event.wait()
+        self.advance(timeout)
+        return event.is_set()
+
+_clock = Clock()
+
+def get_clock() -> Clock:
+    """Clock currently used by generators and pollers."""
+    return _clock
+
+def set_clock(clock: Clock) -> Clock:
+    """
+    Replace the clock used by generators and pollers.
+
+    Args:
+        clock (Clock): New clock
+
+    Returns:
+        Clock: The previous clock
+    """
+    global _clock
+    previous, _clock = _clock, clock
+    return previous
+
+@contextmanager
+def use_clock(clock: Clock):
+    """Use a clock while the block runs, e.g. a VirtualClock in a test."""
+    previous = set_clock(clock)
+    try:
+        yield clock
+    finally:
+        set_clock(previous)
@@ -1,23 +1,86 @@
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, List, Optional
 import json
+import os
+import threading
+import time
 from pathlib import Path
 import uuid
+from src.services.budgets import PrincipalBudgets, record_principals
+from src.services.tracing import span
 import src.config as Config
 
+def load_records(costs_file: Path, journal_files: List[Path]) -> List[Dict]:
+    """
+    Rebuild a ledger from its last compacted snapshot and the journals written since.
+    Journal lines are replayed in order: a record is added unless the snapshot already
+    holds it, and {"deleted": id} removes one, so replaying a journal twice is harmless.
+    A torn line at the end of a journal, left by a crash mid-append, is skipped.
+
+    Args:
+        costs_file (Path): JSON array of records as of the last compaction
+        journal_files (List[Path]): Journals to replay, oldest first; missing ones are skipped
+
+    Returns:
+        List[Dict]: Cost records in the order they were added
+    """
+    with open(costs_file, 'r') as f:
+        records: Dict[str, Dict] = {record['id']: record for record in json.load(f)}
+    for journal_file in journal_files:
+        if not journal_file.exists():
+            continue
+        with open(journal_file, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if "deleted" in entry:
+                    records.pop(entry["deleted"], None)
+                else:
+                    records.setdefault(entry['id'], entry)
+    return list(records.values())
+
 class CostTracker:
     """
     Cost tracker using a simple list of cost records in a JSON file.
     Implements budget tracking and cost management for content generation services.
+
+    Records are committed to an in-memory ledger straight away, so budget checks are exact.
+    Changes are made durable by appending them to costs.journal and fsync-ing it, so a write
+    costs the batch rather than the ledger. In write-behind mode a background flusher
+    group-commits them every flush_interval_ms or every flush_max_records records, so a crash
+    loses at most that window; in sync mode every change is written before the call returns.
+    Once the journal holds as many entries as the ledger, a background compaction rewrites
+    costs.json and starts the journal afresh, so the rewrite is rare and paid off over the batches.
+    The ledger is per process, so processes sharing a costs file do not see each other's records;
+    with SharedBudgets the ledger stays this node's audit log while budgets are enforced across nodes.
+    Costs charged to a user or tenant also count against its budget in PrincipalBudgets.
     """
 
-    def __init__(self):
+    def __init__(self, data_dir: str = "data/costs", write_mode: str = None,
+                 flush_interval_ms: int = None, flush_max_records: int = None, budgets: PrincipalBudgets = None,
+                 compact_min_records: int = None):
+        """
+        Args:
+            data_dir (str): Directory holding costs.json and its journal
+            write_mode (str): "write_behind" or "sync", defaults to Config.COST_WRITE_MODE
+            flush_interval_ms (int): Longest time a record waits to be written, defaults to Config.COST_FLUSH_INTERVAL_MS
+            flush_max_records (int): Unwritten records that trigger a flush, defaults to Config.COST_FLUSH_MAX_RECORDS
+            budgets (PrincipalBudgets): Per-user and per-tenant budgets, defaults to the configured ones
+            compact_min_records (int): Journal entries below which it is never compacted,
+                defaults to Config.COST_COMPACT_MIN_RECORDS
+        """
         # Base data directory for cost records - stores all cost-related data
-        self.data_dir = Path("data/costs")
+        self.data_dir = Path(data_dir)
 
-        # Central costs file path - single JSON file storing all cost records
+        # Central costs file path - single JSON file storing all cost records as of the last compaction
         self.costs_file = self.data_dir / "costs.json"
 
+        # Changes since then, one JSON line each; a compaction in progress replays the previous journal
+        self.journal_file = self.data_dir / "costs.journal"
+        self.compacting_file = self.data_dir / "costs.journal.compacting"
+
         # Create directory if it doesn't exist - ensures data storage is available
         self.data_dir.mkdir(parents=True, exist_ok=True)
 
@@ -25,6 +88,48 @@ class CostTracker:
         if not self.costs_file.exists():
             self._initialize_costs_file()
 
+        self.write_mode = write_mode or Config.COST_WRITE_MODE
+        if self.write_mode not in ("write_behind", "sync"):
+            raise ValueError(f"Unknown cost write mode: {self.write_mode}")
+        self.flush_interval = (flush_interval_ms or Config.COST_FLUSH_INTERVAL_MS) / 1000
+        self.flush_max_records = flush_max_records or Config.COST_FLUSH_MAX_RECORDS
+        self.compact_min_records = compact_min_records or Config.COST_COMPACT_MIN_RECORDS
+
+        # In-memory ledger - the source of truth for budget checks and reads
+        self._costs: List[Dict] = load_records(self.costs_file, [self.compacting_file, self.journal_file])
+        self._total = sum(record['cost'] for record in self._costs)
+
+        # Per-principal spend in the current windows, restored from the ledger
+        self.budgets = budgets or PrincipalBudgets()
+        self.budgets.rebuild(self._costs)
+
+        # Journal entries not yet written, guarded by the condition the flusher waits on
+        self._condition = threading.Condition()
+        self._pending: List[Dict] = []
+        self._oldest_unflushed = 0.0
+        self._write_lock = threading.Lock()  # Only one batch is appended at a time, in order
+        self._closed = False
+        self._stats = {"flushes": 0, "records_flushed": 0, "largest_flush": 0, "compactions": 0}
+        # Entries written since the last compaction started, including by earlier runs
+        with open(self.journal_file, 'a+b') as f:
+            f.seek(0)
+            self._journal_entries = sum(1 for _ in f)
+            if f.tell():
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    # End a line torn by a crash, so the next batch does not run into it
+                    f.write(b"\n")
+        self._journal = open(self.journal_file, 'a')
+        self._compactor: Optional[threading.Thread] = None
+        # A compaction interrupted by a crash is finished before new entries pile up behind it
+        if self.compacting_file.exists():
+            self._start_compaction()
+
+        self._flusher = None
+        if self.write_mode == "write_behind":
+            self._flusher = threading.Thread(target=self._flush_loop, name="cost-flusher", daemon=True)
+            self._flusher.start()
+
     def _initialize_costs_file(self):
         """
         Create initial empty costs file.
@@ -33,56 +138,228 @@ class CostTracker:
         with open(self.costs_file, 'w') as f:
             json.dump([], f)
 
-    def track_cost(self, content_type: str, cost: float, prompt: str) -> str:
+    def _log(self, entry: Dict):
+        """
+        Queue a ledger change for the journal, waking the flusher when the batch starts or is full.
+        Called with the condition held, so entries are queued in the order the ledger changed.
         """
-        Track a new cost and save to the JSON file.
+        if not self._pending:
+            self._oldest_unflushed = time.monotonic()
+        self._pending.append(entry)
+        # The idle flusher starts its interval timer on the first record and flushes early on a full batch
+        if len(self._pending) == 1 or len(self._pending) >= self.flush_max_records:
+            self._condition.notify()
+
+    def _changed(self):
+        """Persist queued ledger changes now in sync mode; the flusher writes them otherwise."""
+        if self.write_mode == "sync":
+            self.flush()
+
+    def _flush_loop(self):
+        """Flusher thread: group-commit unwritten records once the oldest is flush_interval old."""
+        while True:
+            with self._condition:
+                while not self._closed:
+                    if len(self._pending) >= self.flush_max_records:
+                        break
+                    if self._pending:
+                        remaining = self._oldest_unflushed + self.flush_interval - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._condition.wait(remaining)
+                    else:
+                        self._condition.wait()
+                if self._closed:
+                    return
+            self.flush()
+
+    def flush(self):
+        """
+        Append the queued changes to the journal and fsync it.
+        A crash mid-append leaves at most a torn last line, which loading skips.
+        """
+        with self._write_lock:
+            with self._condition:
+                # Nothing to do if an earlier flush already wrote these changes
+                if not self._pending:
+                    return
+                batch, self._pending = self._pending, []
+
+            with span("cost_tracker.write", records=len(batch)):
+                self._journal.write("".join(json.dumps(entry) + "\n" for entry in batch))
+                self._journal.flush()
+                os.fsync(self._journal.fileno())
+            self._journal_entries += len(batch)
+
+            with self._condition:
+                self._stats["flushes"] += 1
+                self._stats["records_flushed"] += len(batch)
+                self._stats["largest_flush"] = max(self._stats["largest_flush"], len(batch))
+                # Compacting once the journal is as long as the ledger keeps rewrites rare and their cost amortized
+                compact = self._journal_entries >= max(self.compact_min_records, len(self._costs)) \
+                    and not (self._compactor and self._compactor.is_alive())
+            if compact:
+                self._start_compaction()
+
+    def _start_compaction(self):
+        """
+        Set the journal aside and rewrite costs.json from the ledger in the background.
+        Called with the write lock held, or before the tracker is in use, so no batch is appended meanwhile.
+        """
+        if not self.compacting_file.exists():
+            self._journal.close()
+            os.replace(self.journal_file, self.compacting_file)
+            self._journal = open(self.journal_file, 'a')
+        self._journal_entries = 0
+        with self._condition:
+            # Changes still queued are in the snapshot and later in the new journal, which replays harmlessly
+            snapshot = list(self._costs)
+        self._compactor = threading.Thread(target=self._compact, args=(snapshot,), name="cost-compactor", daemon=True)
+        self._compactor.start()
+
+    def _compact(self, snapshot: List[Dict]):
+        """Compactor thread: replace costs.json atomically, then drop the journal it now holds."""
+        temp_file = self.costs_file.with_suffix(".json.tmp")
+        with span("cost_tracker.compact", records=len(snapshot)), open(temp_file, 'w') as f:
+            json.dump(snapshot, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, self.costs_file)
+        # A crash before this point replays the set-aside journal over the new snapshot, which is harmless
+        os.remove(self.compacting_file)
+        with self._condition:
+            self._stats["compactions"] += 1
+
+    def close(self, flush: bool = True):
+        """
+        Stop the flusher and write any records still in memory. Call on graceful shutdown.
+
+        Args:
+            flush (bool): False to drop unwritten records instead, e.g. for a throwaway ledger
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._flusher:
+            self._flusher.join()
+        if flush:
+            self.flush()
+        with self._write_lock:
+            if self._compactor:
+                self._compactor.join()
+            self._journal.close()
+
+    def track_cost(self, content_type: str, cost: float, prompt: str,
+                   user_id: str = None, tenant_id: str = None) -> str:
+        """
+        Track a new cost in the ledger and save it to the costs journal.
 
         Args:
             content_type (str): Type of content generated (image/song/research)
             cost (float): Cost of the generation operation
             prompt (str): User prompt that triggered the generation
+            user_id (str): User charged, if known
+            tenant_id (str): Tenant charged, if known
 
         Returns:
             str: Unique identifier for the cost record
 
         Raises:
             ValueError: If adding the cost would exceed the configured budget
+            BudgetExceeded: If it would exceed the user's or tenant's budget (a ValueError too)
         """
-        # Read existing costs from file
-        with open(self.costs_file, 'r') as f:
-            costs = json.load(f)
+        # Per-principal budgets are checked first, on their own striped locks
+        now = datetime.now()
+        principals = [("user", user_id), ("tenant", tenant_id)]
+        self.budgets.charge(principals, cost, now)
+
+        with self._condition:
+            # Check if new cost would exceed budget limit
+            new_total = self._total + cost
+            if new_total > Config.BUDGET:
+                self.budgets.credit(principals, cost, now, now)
+                raise ValueError(f"Cost {cost} would exceed budget of {Config.BUDGET}")
+
+            # Generate unique identifier for the record using UUID4
+            record_id = str(uuid.uuid4())
+
+            # Create detailed cost record with metadata
+            record = {
+                "id": record_id,
+                "timestamp": now.isoformat(),
+                "type": content_type,
+                "cost": cost,
+                "prompt": prompt
+            }
+            if user_id:
+                record["user"] = user_id
+            if tenant_id:
+                record["tenant"] = tenant_id
 
-        # Calculate total existing costs to check against budget
-        total_existing_cost = sum(record['cost'] for record in costs)
+            # Commit to the ledger; the budget check and the append are atomic
+            self._costs.append(record)
+            self._total = new_total
+            self._log(record)
 
-        # Check if new cost would exceed budget limit
-        new_total = total_existing_cost + cost
-        if new_total > Config.BUDGET:
-            raise ValueError(f"Cost {cost} would exceed budget of {Config.BUDGET}")
+        self._changed()
+        return record_id
 
-        # Generate unique identifier for the record using UUID4
-        record_id = str(uuid.uuid4())
+    def refund(self, record_id: str, reason: str = "cancelled", amount: Optional[float] = None) -> str:
+        """
+        Refund a cost by adding an offsetting negative record; the original stays for auditing.
+        A record can be refunded in parts, but never for more than it cost.
 
-        # Create detailed cost record with metadata
-        record = {
-            "id": record_id,
-            "timestamp": datetime.now().isoformat(),
-            "type": content_type,
-            "cost": cost,
-            "prompt": prompt
-        }
+        Args:
+            record_id (str): UUID of the cost record to refund
+            reason (str): Why the cost is refunded
+            amount (Optional[float]): Part of the cost to refund, None for all that is not yet refunded
 
-        # Add record to list and save back to file
-        costs.append(record)
+        Returns:
+            str: Unique identifier for the refund record
 
-        with open(self.costs_file, 'w') as f:
-            json.dump(costs, f, indent=2)
+        Raises:
+            FileNotFoundError: If no record matches the provided ID
+        """
+        with self._condition:
+            original = next((record for record in self._costs if record['id'] == record_id), None)
+            if original is None:
+                raise FileNotFoundError(f"No record found with ID {record_id}")
+
+            # Refunding more than the cost would credit the budget twice
+            refunds = [record for record in self._costs if record.get('refund_of') == record_id]
+            remaining = original['cost'] + sum(record['cost'] for record in refunds)
+            if refunds and remaining <= 1e-12:
+                return refunds[-1]['id']
+            amount = remaining if amount is None else min(amount, remaining)
+
+            refund_id = str(uuid.uuid4())
+            refund = {
+                "id": refund_id,
+                "timestamp": datetime.now().isoformat(),
+                "type": original['type'],
+                "cost": -amount,
+                "prompt": original['prompt'],
+                "refund_of": record_id,
+                "reason": reason
+            }
+            for kind, principal_id in record_principals(original):
+                refund[kind] = principal_id
+            self._costs.append(refund)
+            self._total -= amount
+            self._log(refund)
 
-        return record_id
+        self._credit(original, amount)
+
+        self._changed()
+        return refund_id
+
+    def _credit(self, record: Dict, cost: float):
+        """Give a cost back to the budgets of the principals a record was charged to."""
+        self.budgets.credit(record_principals(record), cost, datetime.fromisoformat(record['timestamp']))
 
     def get_costs(self) -> Dict:
         """
-        Retrieve cost information from the file.
+        Retrieve cost information from the ledger.
 
         Returns:
             Dict containing:
@@ -91,38 +368,34 @@ class CostTracker:
             - costs_by_type: Costs grouped by content type
             - record_count: Total number of records
             - recent_costs: Last 10 cost records
-
-        Note: Returns default values if file read fails
+            - unflushed_records: Records not yet written to the costs file
+            - shared_total_cost: Spend of every node, with shared budgets only
         """
-        try:
-            with open(self.costs_file, 'r') as f:
-                costs = json.load(f)
-
-            # Calculate total costs across all records
-            total_cost = sum(record['cost'] for record in costs)
+        with self._condition:
+            costs = list(self._costs)
+            total_cost = self._total
+            unflushed = len(self._pending)
 
-            # Group costs by content type for analysis
-            costs_by_type = {}
-            for record in costs:
-                content_type = record['type']
-                costs_by_type[content_type] = costs_by_type.get(content_type, 0) + record['cost']
-
-            return {
-                "total_cost": total_cost,
-                "remaining_budget": Config.BUDGET - total_cost,
-                "costs_by_type": costs_by_type,
-                "record_count": len(costs),
-                "recent_costs": costs[-10:]  # Last 10 records for quick reference
-            }
-        except Exception:
-            # Return safe default values if file access fails
-            return {
-                "total_cost": 0.0,
-                "remaining_budget": Config.BUDGET,
-                "costs_by_type": {},
-                "record_count": 0,
-                "recent_costs": []
-            }
+        # Group costs by content type for analysis
+        costs_by_type = {}
+        for record in costs:
+            content_type = record['type']
+            costs_by_type[content_type] = costs_by_type.get(content_type, 0) + record['cost']
+
+        # With shared budgets the remaining budget is what every node has left, not just this one
+        shared_cost = self.budgets.total() if self.budgets.shared else total_cost
+
+        result = {
+            "total_cost": total_cost,
+            "remaining_budget": Config.BUDGET - shared_cost,
+            "costs_by_type": costs_by_type,
+            "record_count": len(costs),
+            "recent_costs": costs[-10:],  # Last 10 records for quick reference
+            "unflushed_records": unflushed
+        }
+        if self.budgets.shared:
+            result["shared_total_cost"] = shared_cost
+        return result
 
     def get_record_by_id(self, record_id: str) -> Dict:
         """
@@ -137,13 +410,11 @@ class CostTracker:
         Raises:
             FileNotFoundError: If no record matches the provided ID
         """
-        with open(self.costs_file, 'r') as f:
-            costs = json.load(f)
-
-        # Search for record with matching ID
-        for record in costs:
-            if record['id'] == record_id:
-                return record
+        with self._condition:
+            # Search for record with matching ID
+            for record in self._costs:
+                if record['id'] == record_id:
+                    return record
 
         raise FileNotFoundError(f"No record found with ID {record_id}")
 
@@ -157,18 +428,26 @@ class CostTracker:
         Returns:
             bool: True if record was found and deleted, False otherwise
         """
-        # Read existing costs from file
-        with open(self.costs_file, 'r') as f:
-            costs = json.load(f)
+        with self._condition:
+            # Remove the record if found
+            removed = next((record for record in self._costs if record['id'] == record_id), None)
+            if removed is None:
+                return False
+            self._costs = [record for record in self._costs if record['id'] != record_id]
+            self._total = sum(record['cost'] for record in self._costs)
+            self._log({"deleted": record_id})
 
-        # Remove the record if found
-        original_length = len(costs)
-        costs = [record for record in costs if record['id'] != record_id]
+        self._credit(removed, removed['cost'])
 
         # Save only if a record was actually removed
-        if len(costs) < original_length:
-            with open(self.costs_file, 'w') as f:
-                json.dump(costs, f, indent=2)
-            return True
-
-        return False
\ No newline at end of file
+        self._changed()
+        return True
+
+    def get_stats(self) -> Dict:
+        """Get the write mode, unwritten records and group-commit sizes."""
+        with self._condition:
+            stats = dict(self._stats)
+            stats["unflushed_records"] = len(self._pending)
+        stats["write_mode"] = self.write_mode
+        stats["average_flush"] = stats["records_flushed"] / stats["flushes"] if stats["flushes"] else 0.0
+        return stats
\ No newline at end of file
@@ -0,0 +1,130 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+from src.services.base import GenerationError
+from src.services.clock import get_clock
+import src.config as Config
+
+class DeadlineExceeded(GenerationError):
+    """Raised when a request's deadline passes, or cannot be met, during one of its stages."""
+
+    def __init__(self, stage: str, seconds: float):
+        super().__init__(f"Deadline of {seconds:g}s exceeded during {stage}")
+        self.stage = stage
+        self.seconds = seconds
+
+def deadline_seconds(requested: Optional[float], content_type: Optional[str] = None) -> float:
+    """
+    Seconds a request may take: what the client asked for, or the default for its content type,
+    capped at that type's maximum. Before routing the type is unknown, so the largest default
+    and maximum apply.
+
+    Args:
+        requested (Optional[float]): Seconds the client asked for, None for the default
+        content_type (Optional[str]): Lane of the request, e.g. "song", None before routing
+
+    Returns:
+        float: Seconds allowed from the start of the request
+    """
+    defaults, maximums = Config.DEADLINE_DEFAULT_SECONDS, Config.DEADLINE_MAX_SECONDS
+    default = defaults.get(content_type, defaults["default"]) if content_type else max(defaults.values())
+    maximum = maximums.get(content_type, maximums["default"]) if content_type else max(maximums.values())
+    return min(default if requested is None else requested, maximum)
+
+class Deadline:
+    """
+    Point in time by which a request must finish, shared by every stage working on it.
+    Stages name themselves as the request moves through them, so an expired deadline
+    reports where the time ran out. Time is read from the current clock.
+    """
+
+    def __init__(self, requested: Optional[float] = None):
+        """
+        Args:
+            requested (Optional[float]): Seconds the client asked for, None for the default
+        """
+        self.requested = requested
+        self.started = get_clock().now()
+        self.seconds = deadline_seconds(requested)
+        self.stage = "routing"
+
+    def resolve(self, content_type: str):
+        """Apply the default and maximum of the content type the request was routed to."""
+        self.seconds = deadline_seconds(self.requested, content_type)
+
+    def enter(self, stage: str):
+        """Record the stage the request is in, e.g. "queueing" or "generation"."""
+        self.stage = stage
+
+    def remaining(self) -> float:
+        """Seconds left, negative once the deadline passed."""
+        return self.started + self.seconds - get_clock().now()
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def exceeded(self, stage: str = None) -> DeadlineExceeded:
+        """Error for giving up on this deadline, during a given stage or the current one."""
+        return DeadlineExceeded(stage or self.stage, self.seconds)
+
+    def check(self, stage: str = None):
+        """
+        Raises:
+            DeadlineExceeded: If the deadline passed
+        """
+        if self.expired:
+            raise self.exceeded(stage)
+
+    def timeout(self, cap: Optional[float] = None, stage: str = None) -> float:
+        """
+        Timeout for a blocking call: the time left, or cap if that is sooner.
+
+        Args:
+            cap (Optional[float]): The call's own timeout, None for no limit of its own
+            stage (str): Stage reported if the deadline passed, defaults to the current one
+
+        Returns:
+            float: Seconds the call may take
+
+        Raises:
+            DeadlineExceeded: If the deadline passed
+        """
+        self.check(stage)
+        remaining = self.remaining()
+        return remaining if cap is None else min(cap, remaining)
+
+# Deadline of the current request, inherited by scheduler workers running its tasks
+_deadline: ContextVar[Optional[Deadline]] = ContextVar("deadline", default=None)
+
+@contextmanager
+def within(deadline: Deadline):
+    """Make a deadline the current request's while the block runs."""
+    token = _deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _deadline.reset(token)
+
+def current_deadline() -> Optional[Deadline]:
+    """Deadline of the current request, None outside a request."""
+    return _deadline.get()
+
+def time_left(cap: Optional[float] = None, stage: str = None) -> Optional[float]:
+    """
+    Timeout for a blocking call made for the current request; just cap outside a request.
+
+    Raises:
+        DeadlineExceeded: If the request's deadline passed
+    """
+    deadline = _deadline.get()
+    return cap if deadline is None else deadline.timeout(cap, stage)
+
+def check_deadline(stage: str = None):
+    """
+    Raises:
+        DeadlineExceeded: If the current request's deadline passed
+    """
+    deadline = _deadline.get()
+    if deadline is not None:
+        deadline.check(stage)
@@ -0,0 +1,81 @@
+import json
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional, Tuple
+
+# Events of the /generate_content stream, in the order a request produces them:
+#   routed   - the content type and provider were chosen: {"content_type", "provider", "streaming"}
+#   queued   - waiting for a provider slot: {"provider", "ahead"}
+#   progress - provider status while generating: {"stage", "status", ...}, e.g. each Suno poll
+#   chunk    - a piece of streamed text: {"type": "text", "content"}
+#   result   - the finished image or song: {"type", "content"}
+#   error    - the request failed: {"status", "detail", "retry_after"?, "stage"?}, status as the HTTP equivalent;
+#              a 504 names the stage that ran out of time: "routing", "queueing", "generation" or "polling"
+#   done     - the stream ended successfully: {}
+EVENTS = ("routed", "queued", "progress", "chunk", "result", "error", "done")
+
+def encode(event: str, **data) -> str:
+    """
+    Encode an event as the body of an SSE frame, without its id.
+
+    Args:
+        event (str): One of EVENTS
+        **data: JSON payload
+
+    Returns:
+        str: "event: <name>" and "data: <json>" lines
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}"
+
+def decode(frame: str) -> Tuple[str, Dict]:
+    """Split an encoded event back into its name and payload."""
+    head, _, body = frame.partition("\ndata: ")
+    return head[len("event: "):], json.loads(body)
+
+# SSE comment sent while a stream is idle; clients ignore it
+HEARTBEAT = ": heartbeat\n\n"
+
+def sse_frame(stream_id: str, seq: int, frame: str) -> str:
+    """
+    Frame an encoded event for the wire, with the id a client resumes from.
+
+    Args:
+        stream_id (str): Stream the event belongs to
+        seq (int): Sequence number of the event in its stream
+        frame (str): Event encoded by encode()
+
+    Returns:
+        str: Complete SSE frame, ending in a blank line
+    """
+    return f"id: {stream_id}:{seq}\n{frame}\n\n"
+
+# Listener for progress reports of the current request, None when nobody listens
+_listener: ContextVar[Optional[Callable[[str, Dict], None]]] = ContextVar("progress_listener", default=None)
+
+@contextmanager
+def listen_progress(callback: Callable[[str, Dict], None]):
+    """
+    Receive progress reports made while the block runs, including from scheduler
+    workers running its tasks, which inherit the request's context.
+
+    Args:
+        callback (Callable[[str, Dict], None]): Called with the stage and fields, on the reporting thread
+    """
+    token = _listener.set(callback)
+    try:
+        yield
+    finally:
+        _listener.reset(token)
+
+def report_progress(stage: str, **fields):
+    """
+    Report provider progress, e.g. a poll status, to the request's listener.
+    Only looks up a context variable when nobody listens.
+
+    Args:
+        stage (str): Where the progress comes from, e.g. "suno.poll"
+        **fields: Details such as status or attempt
+    """
+    callback = _listener.get()
+    if callback is not None:
+        callback(stage, fields)
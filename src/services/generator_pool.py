@@ -0,0 +1,293 @@
+import itertools
+import logging
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from src.services.base import ContentType, ContentGeneratorBase, GenerationError, GenerationCancelled
+from src.services.deadline import DeadlineExceeded
+from src.services.registry import import_string
+import src.config as Config
+
+logger = logging.getLogger(__name__)
+
+def backend_settings(settings: Dict[str, Dict], pools: Dict[str, List[Dict]] = None) -> Dict[str, Dict]:
+    """
+    Extend per-provider settings with an entry for every pool backend. Admission limits and
+    circuit breakers are keyed by backend name, so a backend not listed under its own name
+    takes its provider's settings: the entry's "provider", or else its generator class name.
+    Each backend still gets its own limiter and breaker, so failover can leave a struggling one.
+
+    Args:
+        settings (Dict[str, Dict]): Settings keyed by provider, e.g. Config.PROVIDER_LIMITS
+        pools (Dict[str, List[Dict]]): Pool entries by content type, defaults to Config.GENERATOR_BACKENDS
+
+    Returns:
+        Dict[str, Dict]: The settings with one entry added per unlisted backend
+
+    Raises:
+        ValueError: If neither a backend's name nor its provider has settings
+    """
+    pools = Config.GENERATOR_BACKENDS if pools is None else pools
+    extended = dict(settings)
+    for entries in pools.values():
+        for entry in entries:
+            provider = entry.get("provider", entry["generator"].rpartition(":")[2])
+            name = entry.get("name", provider)
+            if name in settings:
+                continue
+            if provider not in settings:
+                raise ValueError(f"Generator backend {name} has no settings under its own name or its provider {provider}")
+            extended[name] = settings[provider]
+    return extended
+
+class Backend:
+    """
+    One generator backend in a pool, with live latency, error and load estimates.
+    Statistics are plain attributes updated without locks; readers may see slightly
+    stale values, which is fine for load balancing.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], ContentGeneratorBase], cost: float = None,
+                 capacity: int = 8, alpha: float = None):
+        """
+        Args:
+            name (str): Backend name, used for logging, cost records and admission control
+            factory (Callable): Creates a generator instance for this backend
+            cost (float): Price per generation, defaults to the generator's own price
+            capacity (int): In-flight calls the backend handles comfortably
+            alpha (float): EWMA smoothing factor, defaults to Config.GENERATOR_POOL_EWMA_ALPHA
+        """
+        self.name = name
+        self.factory = factory
+        self.cost = cost
+        self.capacity = capacity
+        self.alpha = Config.GENERATOR_POOL_EWMA_ALPHA if alpha is None else alpha
+
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        # itertools.count hands out increments atomically under the GIL, so load is tracked
+        # without a lock; the stored totals may briefly lag by a call, which is fine for balancing
+        self._started = itertools.count()
+        self._finished = itertools.count()
+        self._started_total = 0
+        self._finished_total = 0
+
+    @property
+    def in_flight(self) -> int:
+        """Calls started but not yet finished."""
+        return self._started_total - self._finished_total
+
+    def begin(self) -> float:
+        """Record the start of a call and return its start time."""
+        self._started_total = next(self._started) + 1
+        return time.monotonic()
+
+    def end(self, start: float, failed: bool):
+        """Record the end of a call and update the latency and error estimates."""
+        self._finished_total = next(self._finished) + 1
+        if not failed:
+            elapsed = time.monotonic() - start
+            self.latency = elapsed if self.latency is None else self.alpha * elapsed + (1 - self.alpha) * self.latency
+        self.error_rate = self.alpha * failed + (1 - self.alpha) * self.error_rate
+
+    def abandon(self):
+        """Record the end of a cancelled call, which says nothing about the backend's health."""
+        self._finished_total = next(self._finished) + 1
+
+    def score(self) -> float:
+        """Expected cost of sending one more call here; lower is better."""
+        latency = self.latency or 0.0
+        load = 1 + self.in_flight / self.capacity
+        return (latency + 0.001) * load / max(1 - self.error_rate, 0.05)
+
+    def get_stats(self) -> Dict:
+        """Get the backend's current estimates."""
+        return {
+            "latency": self.latency,
+            "error_rate": self.error_rate,
+            "in_flight": self.in_flight,
+            "capacity": self.capacity,
+            "score": self.score()
+        }
+
+class GeneratorPool:
+    """
+    Several interchangeable backends for one content type.
+    Calling the pool creates a PooledGenerator, so a pool can stand in for a generator
+    class in a router's generators mapping.
+    """
+
+    def __init__(self, content_type: ContentType, backends: List[Backend]):
+        if not backends:
+            raise ValueError(f"Generator pool for {content_type.value} needs at least one backend")
+        self.content_type = content_type
+        self.backends = tuple(backends)
+
+    @classmethod
+    def from_config(cls, content_type: ContentType, settings: List[Dict]) -> "GeneratorPool":
+        """
+        Build a pool from Config.GENERATOR_BACKENDS entries.
+
+        Args:
+            content_type (ContentType): Content type the pool serves
+            settings (List[Dict]): Backend entries with generator path, kwargs, cost and capacity
+
+        Returns:
+            GeneratorPool: Pool with one backend per entry
+        """
+        backends = []
+        for entry in settings:
+            generator_class = import_string(entry["generator"])
+            kwargs = entry.get("kwargs", {})
+            backends.append(Backend(
+                entry.get("name", generator_class.__name__),
+                lambda generator_class=generator_class, kwargs=kwargs: generator_class(**kwargs),
+                cost=entry.get("cost"),
+                capacity=entry.get("capacity", 8)
+            ))
+        return cls(content_type, backends)
+
+    def select(self, exclude: Tuple[Backend, ...] = ()) -> Tuple[Backend, str]:
+        """
+        Pick the backend with the lowest score. Reads statistics only, without locking.
+
+        Args:
+            exclude (Tuple[Backend, ...]): Backends already tried for this request
+
+        Returns:
+            Tuple[Backend, str]: The chosen backend and why it was chosen
+
+        Raises:
+            GenerationError: If every backend has been excluded
+        """
+        candidates = [backend for backend in self.backends if backend not in exclude]
+        if not candidates:
+            raise GenerationError(f"All {self.content_type.value} backends failed")
+
+        untried = [backend for backend in candidates if backend.latency is None]
+        if untried:
+            backend = min(untried, key=lambda backend: backend.in_flight)
+            return backend, "no latency data yet"
+
+        backend = min(candidates, key=lambda backend: backend.score())
+        reason = (f"lowest score {backend.score():.3f} (latency {backend.latency:.2f}s, "
+                  f"errors {backend.error_rate:.0%}, load {backend.in_flight}/{backend.capacity})")
+        return backend, reason
+
+    def __call__(self) -> "PooledGenerator":
+        """Create a generator that picks a backend for one request."""
+        return PooledGenerator(self)
+
+    def get_stats(self) -> Dict:
+        """Get estimates for every backend in the pool."""
+        return {backend.name: backend.get_stats() for backend in self.backends}
+
+class PooledGenerator(ContentGeneratorBase):
+    """
+    Generator that runs a request on the best backend of a pool. A failed attempt is
+    recorded against its backend and raised; the caller then asks fail_over() for the
+    next best backend and admits, charges and runs the request again under its name,
+    so each backend's admission limit, circuit breaker and price apply to its own calls.
+    Streams only fail over before their first chunk.
+    """
+
+    def __init__(self, pool: GeneratorPool):
+        self.pool = pool
+        self.content_type = pool.content_type
+        self.backend, reason = pool.select()
+        self.generator = self.backend.factory()
+        self.tried: Tuple[Backend, ...] = ()
+        logger.info(f"Selected {self.content_type.value} backend {self.backend.name}: {reason}")
+
+    @property
+    def provider(self) -> str:
+        """Name of the backend the current attempt runs on."""
+        return self.backend.name
+
+    def supports_streaming(self) -> bool:
+        """Whether the selected backend streams."""
+        return self.generator.supports_streaming()
+
+    def cancel(self):
+        """Cancel the current backend's generation, and stop failing over."""
+        super().cancel()
+        self.generator.cancel()
+
+    def fail_over(self, error: Exception) -> bool:
+        """
+        Switch to the next best backend after the current one failed without output.
+
+        Args:
+            error (Exception): Error the current backend failed with
+
+        Returns:
+            bool: True if another backend is ready, False once every backend has been tried
+        """
+        self.cancel_token.raise_if_cancelled()
+        if isinstance(error, (GenerationCancelled, DeadlineExceeded)):
+            return False
+        failed = self.backend
+        self.tried += (failed,)
+        try:
+            self.backend, _ = self.pool.select(exclude=self.tried)
+        except GenerationError:
+            return False
+        self.generator = self.backend.factory()
+        logger.warning(f"Failing over {self.content_type.value} to {self.backend.name} after {failed.name} failed: {error}")
+        return True
+
+    def generate_content(self, prompt: str):
+        """
+        Generate content on the selected backend.
+
+        Args:
+            prompt (str): The user's input prompt
+
+        Returns:
+            The backend's result, or an iterator of chunks for streaming backends
+
+        Raises:
+            GenerationError: If the backend fails; fail_over() may then offer another one
+            DeadlineExceeded: If the request runs out of time, which is not held against the backend
+        """
+        if self.supports_streaming():
+            return self._stream(prompt)
+
+        backend = self.backend
+        start = backend.begin()
+        try:
+            result = self.generator.generate_content(prompt)
+        except (GenerationCancelled, DeadlineExceeded):
+            # Running out of time says nothing about the backend, and leaves none for another one
+            backend.abandon()
+            raise
+        except Exception:
+            backend.end(start, failed=True)
+            raise
+        backend.end(start, failed=False)
+        return result
+
+    def _stream(self, prompt: str) -> Iterator[str]:
+        """Stream from the selected backend, recording its latency to the first chunk."""
+        backend = self.backend
+        start = backend.begin()
+        try:
+            chunks = iter(self.generator.generate_content(prompt))
+            first = next(chunks)
+        except StopIteration:
+            backend.end(start, failed=False)
+            return
+        except (GenerationCancelled, DeadlineExceeded):
+            backend.abandon()
+            raise
+        except Exception:
+            backend.end(start, failed=True)
+            raise
+
+        # Latency is measured to the first chunk, which is what users wait for
+        backend.end(start, failed=False)
+        yield first
+        yield from chunks
+
+    def get_price(self) -> float:
+        """Price of the selected backend."""
+        return self.backend.cost if self.backend.cost is not None else self.generator.get_price()
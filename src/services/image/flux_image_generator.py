@@ -1,10 +1,13 @@
-from typing import Tuple
+from typing import Callable, Tuple
 import requests
 import ssl
+import threading
 from requests.adapters import HTTPAdapter
-from src.services.base import ContentType, ContentGeneratorBase, GenerationError
+from src.services.base import ContentType, ContentGeneratorBase, GenerationError, GenerationCancelled
+from src.services.deadline import DeadlineExceeded, check_deadline, time_left
+from src.services.events import report_progress
+from src.services.tracing import span
 import src.config  as Config
-from flux.api import ImageRequest
 
 class CustomSSLAdapter(HTTPAdapter):
     """
@@ -23,6 +26,8 @@ class FluxImageGenerator(ContentGeneratorBase):
     Image generator using the Flux API service.
     Inherits from ContentGeneratorBase to implement image generation functionality.
     """
+    content_type = ContentType.IMAGE
+
     def __init__(self):
         self.session = self._create_session()
 
@@ -42,10 +47,42 @@ class FluxImageGenerator(ContentGeneratorBase):
         Monkey patches the requests module with our custom session.
         Warning: This affects all requests globally - use with caution.
         """
-        requests.get = self.session.get
-        requests.post = self.session.post
-        requests.put = self.session.put
-        requests.delete = self.session.delete
+        requests.get = self._cancellable(self.session.get)
+        requests.post = self._cancellable(self.session.post)
+        requests.put = self._cancellable(self.session.put)
+        requests.delete = self._cancellable(self.session.delete)
+
+    def _cancellable(self, method: Callable) -> Callable:
+        """
+        Wrap a session method so the Flux SDK's requests from this generation's thread
+        fail once it is cancelled, which stops the SDK polling for the result, so each
+        request only takes the time left before the deadline, and so each task state
+        the SDK polls is reported as progress.
+        """
+        thread_id = threading.get_ident()
+
+        def request(*args, **kwargs):
+            if threading.get_ident() != thread_id:
+                return method(*args, **kwargs)
+            self.cancel_token.raise_if_cancelled()
+            timeout = time_left(kwargs.get("timeout"), "generation")
+            if timeout is not None:
+                kwargs["timeout"] = timeout
+            response = method(*args, **kwargs)
+            self._report_state(response)
+            return response
+
+        return request
+
+    @staticmethod
+    def _report_state(response: requests.Response):
+        """Report the task state from a Flux API response, if it carries one."""
+        try:
+            state = response.json().get("status")
+        except (ValueError, AttributeError):
+            return
+        if state:
+            report_progress("flux.poll", status=state)
 
     def generate_content(self, prompt: str) -> Tuple[ContentType, str]:
         """
@@ -59,26 +96,38 @@ class FluxImageGenerator(ContentGeneratorBase):
 
         Raises:
             GenerationError: If image generation fails
+            GenerationCancelled: If the generation is cancelled
         """
         try:
+            # The Flux SDK is only imported once an image is actually requested
+            from flux.api import ImageRequest
+
             # Apply request patches
             self._patch_requests()
 
-            # Create image request
-            result = ImageRequest(
-                prompt=prompt,
-                name=Config.IMAGE_GENERATION_MODEL,
-                api_key=Config.IMAGE_API_KEY,
-                width=Config.IMAGE_WIDTH,
-                height=Config.IMAGE_HEIGHT
-            )
+            # Closing the session drops pending requests when the generation is cancelled
+            self.cancel_token.on_cancel(self.session.close)
+
+            # Create image request; the SDK submits and polls until the image is ready
+            with span("flux.request", model=Config.IMAGE_GENERATION_MODEL):
+                result = ImageRequest(
+                    prompt=prompt,
+                    name=Config.IMAGE_GENERATION_MODEL,
+                    api_key=Config.IMAGE_API_KEY,
+                    width=Config.IMAGE_WIDTH,
+                    height=Config.IMAGE_HEIGHT
+                )
 
             if not result.url:
                 raise GenerationError("No image URL returned from API")
 
             return ContentType.IMAGE, result.url
 
+        except (GenerationCancelled, DeadlineExceeded):
+            raise
         except Exception as e:
+            self.cancel_token.raise_if_cancelled()
+            check_deadline("generation")
             raise GenerationError(f"Failed to generate image: {str(e)}")
 
     def get_price(self) -> float:
@@ -1,33 +1,37 @@
 import random
-import time
 from typing import Tuple, List
 from src.services.base import ContentType, ContentGeneratorBase
+from src.services.events import report_progress
+from src.services.latency import LatencyModel, UniformLatency, mock_latency
 
 class MockImageGenerator(ContentGeneratorBase):
     """
     Mock image generator for testing purposes.
-    Simulates API behavior with random delays and sample images.
+    Simulates API behavior with delays drawn from a latency model and sample images.
     """
+    content_type = ContentType.IMAGE
 
     # Sample image URLs for testing different scenarios
     SAMPLE_IMAGES = [
         "https://raw.githubusercontent.com/CompVis/stable-diffusion/main/assets/stable-samples/img2img/sketch-mountains-input.jpg"
     ]
 
-    def __init__(self, min_delay: int = 3, max_delay: int = 20):
+    def __init__(self, min_delay: float = None, max_delay: float = None, latency: LatencyModel = None):
         """
         Initialize mock generator with configurable delays.
 
         Args:
-            min_delay (int): Minimum processing delay in seconds
-            max_delay (int): Maximum processing delay in seconds
+            min_delay (float): Minimum processing delay in seconds, overrides the configured latency model
+            max_delay (float): Maximum processing delay in seconds, defaults to min_delay
+            latency (LatencyModel): Processing time model, defaults to the shared one for Config.MOCK_LATENCY['image']
         """
-        self.min_delay = min_delay
-        self.max_delay = max_delay
+        if latency is None and min_delay is not None:
+            latency = UniformLatency(min_delay, min_delay if max_delay is None else max_delay)
+        self.latency = latency or mock_latency(self.content_type.value)
 
     def _simulate_processing_time(self):
-        """Simulate API processing time with random delay."""
-        time.sleep(random.randint(self.min_delay, self.max_delay))
+        """Simulate API processing time with a delay from the latency model."""
+        self.cancel_token.sleep(self.latency.sample())
 
     def generate_content(self, prompt: str) -> Tuple[ContentType, str]:
         """
@@ -40,6 +44,7 @@ class MockImageGenerator(ContentGeneratorBase):
             Tuple[ContentType, str]: Content type and random sample image URL
         """
         # Simulate processing time
+        report_progress("mock.image", status="processing")
         self._simulate_processing_time()
 
         # Return random sample image
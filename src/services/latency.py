@@ -0,0 +1,149 @@
+import json
+import math
+import random
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+import src.config as Config
+
+class LatencyModel(ABC):
+    """
+    Seedable distribution of simulated provider latencies, in seconds.
+    Models are shared by all generators of a kind, so a seeded model yields the same
+    sequence of latencies on every run with the same request order.
+    """
+
+    def __init__(self, seed: Optional[int] = None, max_seconds: Optional[float] = None):
+        """
+        Args:
+            seed (Optional[int]): Random seed, None for a different sequence every run
+            max_seconds (Optional[float]): Cap on sampled latencies
+        """
+        self.random = random.Random(seed)
+        self.max_seconds = max_seconds
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def _draw(self) -> float:
+        """Draw a latency in seconds, before the cap; called under the model's lock."""
+        pass
+
+    def sample(self) -> float:
+        """Draw the next latency in seconds."""
+        with self._lock:
+            seconds = max(self._draw(), 0.0)
+        if self.max_seconds is not None:
+            seconds = min(seconds, self.max_seconds)
+        return seconds
+
+class FixedLatency(LatencyModel):
+    """Always the same latency."""
+
+    def __init__(self, seconds: float, **kwargs):
+        super().__init__(**kwargs)
+        self.seconds = seconds
+
+    def _draw(self) -> float:
+        return self.seconds
+
+class UniformLatency(LatencyModel):
+    """Latency uniformly distributed between min and max seconds."""
+
+    def __init__(self, min: float, max: float, **kwargs):
+        super().__init__(**kwargs)
+        self.min = min
+        self.max = max
+
+    def _draw(self) -> float:
+        return self.random.uniform(self.min, self.max)
+
+class LogNormalLatency(LatencyModel):
+    """
+    Right-skewed latency, typical of real providers: most calls near the median,
+    a long tail of slow ones that grows with sigma.
+    """
+
+    def __init__(self, median: float, sigma: float = 0.5, **kwargs):
+        super().__init__(**kwargs)
+        self.median = median
+        self.sigma = sigma
+
+    def _draw(self) -> float:
+        return self.random.lognormvariate(math.log(self.median), self.sigma)
+
+class TraceLatency(LatencyModel):
+    """Replays recorded latencies in order, starting over at the end."""
+
+    def __init__(self, samples: List[float] = None, file: str = None, **kwargs):
+        """
+        Args:
+            samples (List[float]): Latencies in seconds
+            file (str): JSON list of latencies, or one latency per line, used when samples is not given
+        """
+        super().__init__(**kwargs)
+        if samples is None:
+            with open(file) as f:
+                text = f.read().strip()
+            samples = json.loads(text) if text.startswith("[") else [float(line) for line in text.split()]
+        if not samples:
+            raise ValueError("Latency trace is empty")
+        self.samples = samples
+        self._next = 0
+
+    def _draw(self) -> float:
+        seconds = self.samples[self._next]
+        self._next = (self._next + 1) % len(self.samples)
+        return seconds
+
+MODELS = {
+    "fixed": FixedLatency,
+    "uniform": UniformLatency,
+    "lognormal": LogNormalLatency,
+    "trace": TraceLatency
+}
+
+def create_latency_model(spec: Dict, seed: Optional[int] = None) -> LatencyModel:
+    """
+    Build a latency model from a spec such as {"model": "lognormal", "median": 8, "sigma": 0.6}.
+
+    Args:
+        spec (Dict): "model" (fixed, uniform, lognormal or trace), its parameters, and optionally
+            "seed" and "max_seconds"
+        seed (Optional[int]): Seed used when the spec has none
+
+    Returns:
+        LatencyModel: The model
+
+    Raises:
+        ValueError: If the model is unknown
+    """
+    params = dict(spec)
+    name = params.pop("model", "fixed")
+    if name not in MODELS:
+        raise ValueError(f"Unknown latency model: {name}")
+    params.setdefault("seed", seed)
+    return MODELS[name](**params)
+
+_models: Dict[str, LatencyModel] = {}
+_models_lock = threading.Lock()
+
+def mock_latency(kind: str) -> LatencyModel:
+    """
+    Shared latency model of a mock generator, built from Config.MOCK_LATENCY on first use.
+    Each kind gets its own seed derived from Config.MOCK_LATENCY_SEED, so adding requests
+    of one kind does not change the latencies of another.
+
+    Args:
+        kind (str): Content type value, e.g. "image"
+    """
+    with _models_lock:
+        model = _models.get(kind)
+        if model is None:
+            seed = None if Config.MOCK_LATENCY_SEED is None else f"{Config.MOCK_LATENCY_SEED}:{kind}"
+            model = _models[kind] = create_latency_model(Config.MOCK_LATENCY[kind], seed)
+        return model
+
+def reset_mock_latency():
+    """Forget the shared models, so they are rebuilt, and reseeded, from the current config."""
+    with _models_lock:
+        _models.clear()
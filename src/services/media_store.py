@@ -0,0 +1,276 @@
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+import anyio
+from starlette.responses import Response
+import src.config as Config
+
+logger = logging.getLogger(__name__)
+
+DIGEST_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+class MediaStore:
+    """
+    Content-addressed store for generated images and songs.
+    Provider URLs are downloaded in the background and saved under the SHA-256 of their
+    bytes, so each asset is stored once and can be served with immutable caching headers.
+    """
+
+    def __init__(self, root: str = None, workers: int = None, max_bytes: int = None):
+        """
+        Args:
+            root (str): Storage directory, defaults to Config.MEDIA_STORE_DIR
+            workers (int): Concurrent downloads, defaults to Config.MEDIA_STORE_WORKERS
+            max_bytes (int): Largest asset stored, defaults to Config.MEDIA_STORE_MAX_BYTES
+        """
+        self.root = Path(root or Config.MEDIA_STORE_DIR)
+        self.max_bytes = max_bytes or Config.MEDIA_STORE_MAX_BYTES
+        self._executor = ThreadPoolExecutor(max_workers=workers or Config.MEDIA_STORE_WORKERS,
+                                            thread_name_prefix="media-download")
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Future] = {}
+        self._index_file = self.root / "index.json"
+        self._urls: Dict[str, str] = {}  # Provider URL -> digest
+        self._types: Dict[str, str] = {}  # Digest -> media type
+        if self._index_file.exists():
+            try:
+                index = json.loads(self._index_file.read_text())
+                self._urls, self._types = dict(index["urls"]), dict(index["types"])
+            except (ValueError, KeyError, TypeError) as e:
+                # Assets are found again as their URLs are resolved, so a damaged index only costs downloads
+                logger.warning(f"Ignoring unreadable media index {self._index_file}: {e}")
+                self._urls, self._types = {}, {}
+
+    def path(self, digest: str) -> Path:
+        """File path of a stored asset."""
+        return self.root / digest[:2] / digest
+
+    def media_type(self, digest: str) -> Optional[str]:
+        """Media type of a stored asset, None if it is not stored."""
+        return self._types.get(digest)
+
+    def local_url(self, url: str) -> Optional[str]:
+        """Local URL of a provider URL's asset, None if it is not stored yet."""
+        digest = self._urls.get(url)
+        return f"/media/{digest}" if digest else None
+
+    def download(self, url: str) -> str:
+        """
+        Download an asset into the store.
+
+        Args:
+            url (str): Provider URL
+
+        Returns:
+            str: SHA-256 digest of the asset
+
+        Raises:
+            ValueError: If the asset is larger than max_bytes
+            requests.RequestException: If the download fails
+        """
+        # Imported here so the store costs nothing until an asset is downloaded
+        import requests
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        temp_file = self.root / f".download-{threading.get_ident()}"
+        sha256 = hashlib.sha256()
+        size = 0
+
+        with requests.get(url, stream=True, timeout=30) as response:
+            response.raise_for_status()
+            media_type = (response.headers.get("Content-Type") or mimetypes.guess_type(url)[0]
+                          or "application/octet-stream")
+            try:
+                with open(temp_file, "wb") as f:
+                    for chunk in response.iter_content(chunk_size=64 * 1024):
+                        size += len(chunk)
+                        if size > self.max_bytes:
+                            raise ValueError(f"Asset larger than {self.max_bytes} bytes: {url}")
+                        sha256.update(chunk)
+                        f.write(chunk)
+
+                digest = sha256.hexdigest()
+                self.path(digest).parent.mkdir(exist_ok=True)
+                os.replace(temp_file, self.path(digest))
+            finally:
+                temp_file.unlink(missing_ok=True)
+
+        with self._lock:
+            self._urls[url] = digest
+            self._types[digest] = media_type.split(";")[0].strip()
+            self._write_index()
+        logger.info(f"Stored {url} as {digest} ({size} bytes)")
+        return digest
+
+    def _write_index(self):
+        """Replace the index file in one step, so a crash never leaves it half written. Must hold the lock."""
+        temp_file = self.root / f".index-{os.getpid()}.tmp"
+        temp_file.write_text(json.dumps({"urls": self._urls, "types": self._types}))
+        os.replace(temp_file, self._index_file)
+
+    def schedule(self, url: str) -> Future:
+        """Start downloading an asset in the background, reusing a download already in progress."""
+        with self._lock:
+            future = self._pending.get(url)
+            if future is not None:
+                return future
+            future = self._executor.submit(self.download, url)
+            self._pending[url] = future
+        # Outside the lock, since the callback runs immediately if the download already finished
+        future.add_done_callback(lambda _: self._forget(url))
+        return future
+
+    def _forget(self, url: str):
+        with self._lock:
+            self._pending.pop(url, None)
+
+    def resolve(self, url: str, wait: float = None) -> str:
+        """
+        Get the best URL for an asset, waiting briefly for it to be stored.
+
+        Args:
+            url (str): Provider URL
+            wait (float): Seconds to wait for the download, defaults to Config.MEDIA_STORE_WAIT_SECONDS
+
+        Returns:
+            str: The local URL if the asset is stored in time, otherwise the provider URL
+        """
+        local = self.local_url(url)
+        if local:
+            return local
+
+        future = self.schedule(url)
+        try:
+            future.result(timeout=Config.MEDIA_STORE_WAIT_SECONDS if wait is None else wait)
+        except TimeoutError:
+            return url
+        except Exception as e:
+            logger.warning(f"Failed to store {url}: {e}")
+            return url
+        return self.local_url(url)
+
+    def get_stats(self) -> Dict:
+        """Get the number of stored assets and downloads in progress."""
+        with self._lock:
+            return {"assets": len(self._types), "urls": len(self._urls), "downloading": len(self._pending)}
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range "bytes=" Range header.
+
+    Args:
+        header (str): Range header value
+        size (int): File size
+
+    Returns:
+        Optional[Tuple[int, int]]: Inclusive start and end byte, None to serve the whole file
+        (multiple ranges or units other than bytes)
+
+    Raises:
+        ValueError: If the range cannot be satisfied
+    """
+    unit, _, ranges = header.partition("=")
+    if unit.strip() != "bytes" or "," in ranges:
+        return None
+
+    first, _, last = ranges.strip().partition("-")
+    try:
+        if not first:
+            # Suffix range: the last N bytes
+            start, end = max(size - int(last), 0), size - 1
+        else:
+            start, end = int(first), min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        return None
+
+    if start > end or start >= size:
+        raise ValueError(f"Range {header} not satisfiable for {size} bytes")
+    return start, end
+
+class MediaFileResponse(Response):
+    """
+    Serves part or all of a file.
+    Uses the ASGI zero-copy send or path send extensions when the server offers them,
+    and falls back to chunked reads otherwise.
+    """
+    chunk_size = 64 * 1024
+
+    def __init__(self, path: Path, start: int, end: int, status_code: int, headers: Dict[str, str], media_type: str):
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+        self.path = path
+        self.start = start
+        self.count = end - start + 1
+        self.raw_headers = [(name, value) for name, value in self.raw_headers if name != b"content-length"]
+        self.raw_headers.append((b"content-length", str(self.count).encode("latin-1")))
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope.get("method") == "HEAD" or not self.count:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        extensions = scope.get("extensions") or {}
+        whole_file = self.start == 0 and self.count == self.path.stat().st_size
+        if "http.response.pathsend" in extensions and whole_file:
+            await send({"type": "http.response.pathsend", "path": str(self.path)})
+        elif "http.response.zerocopysend" in extensions:
+            with open(self.path, "rb") as f:
+                await send({"type": "http.response.zerocopysend", "file": f, "offset": self.start,
+                            "count": self.count, "more_body": False})
+        else:
+            async with await anyio.open_file(self.path, "rb") as f:
+                await f.seek(self.start)
+                remaining = self.count
+                while remaining:
+                    chunk = await f.read(min(self.chunk_size, remaining))
+                    remaining -= len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": bool(remaining)})
+
+def media_response(store: MediaStore, digest: str, range_header: str = None, if_range: str = None,
+                   if_none_match: str = None) -> Response:
+    """
+    Build the response for a stored asset, honouring conditional and range requests.
+
+    Args:
+        store (MediaStore): Media store
+        digest (str): Asset digest
+        range_header (str): Range request header
+        if_range (str): If-Range request header
+        if_none_match (str): If-None-Match request header
+
+    Returns:
+        Response: 200, 206, 304, 404 or 416 response
+    """
+    media_type = store.media_type(digest) if DIGEST_PATTERN.match(digest) else None
+    if not media_type or not store.path(digest).exists():
+        return Response(status_code=404)
+
+    etag = f'"{digest}"'
+    size = store.path(digest).stat().st_size
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={Config.MEDIA_CACHE_MAX_AGE}, immutable",
+        "Accept-Ranges": "bytes"
+    }
+
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    if range_header and (not if_range or if_range.strip() == etag):
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+        if byte_range:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            return MediaFileResponse(store.path(digest), start, end, 206, headers, media_type)
+
+    return MediaFileResponse(store.path(digest), 0, size - 1, 200, headers, media_type)
@@ -0,0 +1,180 @@
+import asyncio
+import json
+from typing import Awaitable, Callable, Dict, Optional
+from src.services.stream_buffer import StreamRecord, parse_last_event_id
+import src.config as Config
+
+# Messages a client sends over the WebSocket, each naming the stream it is about with "id":
+#   start  - start a generation: {"id", "prompt", "user_id"?, "tenant_id"?, "client_id"?, "timeout_seconds"?}
+#   cancel - cancel a running generation: {"id"}
+#   credit - allow more events of a stream to be sent: {"id", "events"}
+#            (cancel and credit for a stream that already ended are ignored)
+#   resume - follow a buffered stream after an event id, e.g. after reconnecting: {"id", "last_event_id"}
+# The server answers with one message per event of the /generate_content stream:
+#   {"id", "event_id", "event", "data"}, where event_id is the stream's "<request_id>:<seq>" as in SSE.
+# Requests the server refuses get a single error event without an event_id.
+MESSAGES = ("start", "cancel", "credit", "resume")
+
+class StreamRejected(Exception):
+    """Raised by a start callback that refuses a stream, with the HTTP equivalent of the refusal."""
+
+    def __init__(self, status: int, detail: str):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+class Channel:
+    """
+    One stream carried by a multiplexed connection. Events are sent while the stream has
+    credit; a client that falls behind stops granting it, and the stream's events wait in
+    the stream buffer instead of the connection.
+    """
+
+    def __init__(self, channel_id: str, record: StreamRecord, window: int):
+        """
+        Args:
+            channel_id (str): Id the client gave the stream
+            record (StreamRecord): Buffered events of the stream
+            window (int): Events that may be sent before the client grants more
+        """
+        self.channel_id = channel_id
+        self.record = record
+        self.credit = window
+        self.forwarder: Optional[asyncio.Task] = None
+        self._credited = asyncio.Event()
+
+    def grant(self, events: int):
+        """Allow a number of further events to be sent."""
+        self.credit += events
+        self._credited.set()
+
+    async def take(self):
+        """Wait for credit and use one event's worth of it."""
+        while self.credit <= 0:
+            self._credited.clear()
+            await self._credited.wait()
+        self.credit -= 1
+
+class Multiplexer:
+    """
+    Carries many concurrent generation streams over one WebSocket connection. Each stream is
+    forwarded from the stream buffer by its own task, with per-stream credit for flow control,
+    and every message goes out through one writer so sends never interleave. Streams outlive
+    the connection: when it closes they are abandoned like a dropped SSE connection, and can
+    be resumed within the grace period.
+    """
+
+    def __init__(self, send: Callable[[str], Awaitable[None]], start: Callable[[Dict], StreamRecord],
+                 lookup: Callable[[str], Optional[StreamRecord]], max_streams: int = None, window: int = None,
+                 send_queue: int = None):
+        """
+        Args:
+            send (Callable[[str], Awaitable[None]]): Sends a text message over the connection
+            start (Callable[[Dict], StreamRecord]): Starts a generation for a start message
+            lookup (Callable[[str], Optional[StreamRecord]]): Finds a buffered stream by its id
+            max_streams (int): Streams running at once per connection, defaults to Config.WS_MAX_STREAMS
+            window (int): Initial credit of each stream, defaults to Config.WS_STREAM_WINDOW
+            send_queue (int): Messages waiting for the writer before forwarders wait too,
+                defaults to Config.WS_SEND_QUEUE
+        """
+        self.send = send
+        self.start = start
+        self.lookup = lookup
+        self.max_streams = max_streams or Config.WS_MAX_STREAMS
+        self.window = window or Config.WS_STREAM_WINDOW
+        self.channels: Dict[str, Channel] = {}
+        self._outgoing: asyncio.Queue = asyncio.Queue(maxsize=send_queue or Config.WS_SEND_QUEUE)
+
+    async def serve(self, receive: Callable[[], Awaitable[str]]):
+        """
+        Handle the client's messages until receive raises, e.g. when the connection closes.
+
+        Args:
+            receive (Callable[[], Awaitable[str]]): Receives the next text message
+        """
+        writer = asyncio.create_task(self._write())
+        try:
+            while True:
+                self.handle(await receive())
+        finally:
+            writer.cancel()
+            for channel in list(self.channels.values()):
+                channel.forwarder.cancel()
+
+    def handle(self, message: str):
+        """Act on one client message, answering malformed or refused ones with an error event."""
+        try:
+            body = json.loads(message)
+            kind, channel_id = body["type"], str(body["id"])
+        except (ValueError, KeyError, TypeError):
+            self._reject(None, 400, "Messages must be JSON objects with a type and an id")
+            return
+        if kind not in MESSAGES:
+            self._reject(channel_id, 400, f"Unknown message type: {kind}")
+        elif kind in ("start", "resume"):
+            self._open(kind, channel_id, body)
+        elif channel_id not in self.channels:
+            # The stream may have ended while the message was on its way
+            return
+        elif kind == "cancel":
+            producer = self.channels[channel_id].record.producer
+            if producer:
+                # The stream goes on to deliver the cancellation's error event
+                producer.cancel()
+        else:
+            events = body.get("events")
+            if not isinstance(events, int) or events <= 0:
+                self._reject(channel_id, 400, "Credit must be a positive number of events")
+                return
+            self.channels[channel_id].grant(events)
+
+    def _open(self, kind: str, channel_id: str, body: Dict):
+        """Start a generation or resume a buffered stream on a new channel."""
+        if channel_id in self.channels:
+            self._reject(channel_id, 409, "A stream with this id is already running")
+            return
+        if len(self.channels) >= self.max_streams:
+            self._reject(channel_id, 429, f"At most {self.max_streams} streams can run at once per connection")
+            return
+        after = -1
+        try:
+            if kind == "start":
+                record = self.start(body)
+            else:
+                try:
+                    stream_id, after = parse_last_event_id(str(body.get("last_event_id", "")))
+                except ValueError as e:
+                    raise StreamRejected(400, str(e))
+                record = self.lookup(stream_id)
+                if record is None:
+                    raise StreamRejected(404, "Stream expired or unknown")
+        except StreamRejected as e:
+            self._reject(channel_id, e.status, e.detail)
+            return
+        channel = Channel(channel_id, record, self.window)
+        self.channels[channel_id] = channel
+        channel.forwarder = asyncio.create_task(self._forward(channel, after))
+
+    async def _forward(self, channel: Channel, after: int):
+        """Send a stream's events as credit allows, closing the channel when the stream ends."""
+        prefix = f'{{"id": {json.dumps(channel.channel_id)}, "event_id": "{channel.record.stream_id}:'
+        try:
+            async for seq, frame in channel.record.follow(after):
+                await channel.take()
+                # Events are stored encoded, so only the envelope is built here
+                head, _, data = frame.partition("\ndata: ")
+                await self._outgoing.put(f'{prefix}{seq}", "event": "{head[len("event: "):]}", "data": {data}}}')
+        finally:
+            self.channels.pop(channel.channel_id, None)
+
+    def _reject(self, channel_id: Optional[str], status: int, detail: str):
+        message = json.dumps({"id": channel_id, "event": "error", "data": {"status": status, "detail": detail}})
+        try:
+            self._outgoing.put_nowait(message)
+        except asyncio.QueueFull:
+            # A client that is this far behind misses the error, as it would miss the events
+            pass
+
+    async def _write(self):
+        while True:
+            await self.send(await self._outgoing.get())
@@ -0,0 +1,259 @@
+import asyncio
+import hmac
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+import src.config as Config
+
+class Profile:
+    """Stack samples collected by a SamplingProfiler."""
+
+    def __init__(self, name: str, interval: float, duration: float, samples: Counter):
+        """
+        Args:
+            name (str): Request id or process profile name
+            interval (float): Seconds between samples
+            duration (float): Seconds profiled
+            samples (Counter): Sample counts keyed by (thread name, root-first tuple of frames)
+        """
+        self.name = name
+        self.interval = interval
+        self.duration = duration
+        self.samples = samples
+
+    @property
+    def sample_count(self) -> int:
+        return sum(self.samples.values())
+
+    def collapsed(self) -> str:
+        """Render as collapsed stacks ("thread;outer;inner count"), as read by flamegraph.pl and speedscope."""
+        return "".join(
+            f"{';'.join((thread,) + stack)} {count}\n"
+            for (thread, stack), count in self.samples.most_common()
+        )
+
+    def speedscope(self) -> Dict:
+        """Render as a speedscope file with one sampled profile per thread."""
+        frames: List[Dict] = []
+        frame_index: Dict[str, int] = {}
+        profiles: Dict[str, Dict] = {}
+        for (thread, stack), count in self.samples.items():
+            indexes = []
+            for frame in stack:
+                if frame not in frame_index:
+                    frame_index[frame] = len(frames)
+                    frames.append({"name": frame})
+                indexes.append(frame_index[frame])
+            profile = profiles.setdefault(thread, {
+                "type": "sampled", "name": thread, "unit": "seconds",
+                "startValue": 0, "endValue": 0, "samples": [], "weights": []
+            })
+            profile["samples"].append(indexes)
+            profile["weights"].append(count * self.interval)
+            profile["endValue"] += count * self.interval
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": self.name,
+            "shared": {"frames": frames},
+            "profiles": list(profiles.values())
+        }
+
+    def write(self, directory: str = None, format: str = None) -> Path:
+        """
+        Write the profile to {directory}/{name}.txt (collapsed) or {name}.speedscope.json.
+
+        Args:
+            directory (str): Output directory, defaults to Config.PROFILE_DIR
+            format (str): "collapsed" or "speedscope", defaults to Config.PROFILE_FORMAT
+
+        Returns:
+            Path: The written file
+        """
+        format = format or Config.PROFILE_FORMAT
+        path = Path(directory or Config.PROFILE_DIR)
+        path.mkdir(parents=True, exist_ok=True)
+        if format == "speedscope":
+            path = path / f"{self.name}.speedscope.json"
+            path.write_text(json.dumps(self.speedscope()))
+        else:
+            path = path / f"{self.name}.txt"
+            path.write_text(self.collapsed())
+        return path
+
+    def top(self, limit: int = 10, thread: str = None) -> List[Dict]:
+        """Get the innermost frames that were sampled most, optionally for one thread."""
+        counts: Counter = Counter()
+        for (name, stack), count in self.samples.items():
+            if stack and (thread is None or name == thread):
+                counts[stack[-1]] += count
+        total = self.sample_count or 1
+        return [{"frame": frame, "samples": count, "share": round(count / total, 3)}
+                for frame, count in counts.most_common(limit)]
+
+# Display names of source files, cached as relpath costs a getcwd call
+_filenames: Dict[str, str] = {}
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    filename = _filenames.get(code.co_filename)
+    if filename is None:
+        try:
+            filename = os.path.relpath(code.co_filename)
+        except ValueError:
+            filename = code.co_filename  # On another drive on Windows
+        if filename.startswith(".."):
+            filename = os.path.basename(filename)
+        _filenames[code.co_filename] = filename
+    return f"{code.co_name} ({filename}:{frame.f_lineno})"
+
+class SamplingProfiler:
+    """
+    Statistical profiler: a background thread snapshots the stacks of other threads at a fixed
+    interval. Nothing is hooked into the profiled code, so it adds no per-call overhead, and
+    a thread blocked in time.sleep or a socket read shows up as much as one burning CPU.
+    """
+
+    def __init__(self, name: str, interval: float = None, threads: Optional[Set[int]] = None):
+        """
+        Args:
+            name (str): Name of the profile
+            interval (float): Seconds between samples, defaults to Config.PROFILE_INTERVAL_SECONDS
+            threads (Optional[Set[int]]): Idents of the threads to sample, None for all threads.
+                The set may grow and shrink while profiling.
+        """
+        self.name = name
+        self.interval = interval or Config.PROFILE_INTERVAL_SECONDS
+        self.threads = threads
+        self._samples: Counter = Counter()
+        self._thread_names: Dict[int, str] = {}
+        self._stopped = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self._start = 0.0
+
+    def start(self) -> "SamplingProfiler":
+        self._start = time.perf_counter()
+        self._sampler = threading.Thread(target=self._run, name=f"profiler-{self.name}", daemon=True)
+        self._sampler.start()
+        return self
+
+    def stop(self) -> Profile:
+        """Stop sampling and return the collected profile."""
+        self._stopped.set()
+        if self._sampler and self._sampler is not threading.current_thread():
+            self._sampler.join()
+        return Profile(self.name, self.interval, time.perf_counter() - self._start, self._samples)
+
+    def _thread_name(self, ident: int) -> str:
+        name = self._thread_names.get(ident)
+        if name is None:
+            self._thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            name = self._thread_names.get(ident, f"thread-{ident}")
+        return name
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            wanted = self.threads
+            for ident, frame in sys._current_frames().items():
+                if ident == own or (wanted is not None and ident not in wanted):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.reverse()
+                self._samples[(self._thread_name(ident), tuple(stack))] += 1
+
+# Profiler of the current request, None when the request is not profiled
+_active: ContextVar[Optional[SamplingProfiler]] = ContextVar("active_profiler", default=None)
+
+@contextmanager
+def thread_scope():
+    """
+    Sample the current thread while it works for a profiled request.
+    Only looks up a context variable when the request is not profiled.
+    """
+    profiler = _active.get()
+    if profiler is None or profiler.threads is None:
+        yield
+        return
+    ident = threading.get_ident()
+    added = ident not in profiler.threads
+    profiler.threads.add(ident)
+    try:
+        yield
+    finally:
+        if added:
+            profiler.threads.discard(ident)
+
+def start_request_profile(request_id: str) -> SamplingProfiler:
+    """
+    Profile the current request: its event loop thread, and scheduler workers while they run its tasks.
+    The event loop is shared, so its samples also include other requests' work on the loop.
+
+    Args:
+        request_id (str): Request id, used as the profile file name
+
+    Returns:
+        SamplingProfiler: Running profiler, stop it and write the profile when the request is done
+    """
+    profiler = SamplingProfiler(request_id, threads={threading.get_ident()}).start()
+    _active.set(profiler)
+    return profiler
+
+def is_admin_token(token: Optional[str]) -> bool:
+    """Check a token against Config.PROFILE_ADMIN_TOKEN in constant time; False when no admin token is set."""
+    if not Config.PROFILE_ADMIN_TOKEN or token is None:
+        return False
+    return hmac.compare_digest(token.encode(), Config.PROFILE_ADMIN_TOKEN.encode())
+
+def should_profile(flag: Optional[str]) -> bool:
+    """
+    Decide whether to profile a request from its profiling flag and Config.PROFILE_SAMPLE_RATE.
+
+    Raises:
+        PermissionError: If the request is flagged with a token other than Config.PROFILE_ADMIN_TOKEN
+    """
+    if flag:
+        if not is_admin_token(flag):
+            raise PermissionError("Invalid profiling token")
+        return True
+    return Config.PROFILE_SAMPLE_RATE > 0 and random.random() < Config.PROFILE_SAMPLE_RATE
+
+async def profile_process(seconds: float, interval: float = None) -> Tuple[Profile, Dict]:
+    """
+    Profile every thread for a number of seconds while measuring event loop lag.
+    A blocking call on the event loop shows up as lag and as loop-thread samples inside it.
+
+    Args:
+        seconds (float): How long to profile
+        interval (float): Seconds between samples, defaults to Config.PROFILE_INTERVAL_SECONDS
+
+    Returns:
+        Tuple[Profile, Dict]: The profile and event loop lag statistics in milliseconds
+    """
+    profiler = SamplingProfiler(f"process-{int(time.time())}", interval).start()
+    lags = []
+    deadline = time.perf_counter() + seconds
+    try:
+        while time.perf_counter() < deadline:
+            expected = time.perf_counter() + profiler.interval
+            await asyncio.sleep(profiler.interval)
+            lags.append(max(0.0, time.perf_counter() - expected) * 1000)
+    finally:
+        profile = profiler.stop()
+    lags.sort()
+    lag = {
+        "max_ms": round(lags[-1], 1) if lags else 0.0,
+        "p99_ms": round(lags[int(len(lags) * 0.99)], 1) if lags else 0.0,
+        "blocked_over_100ms": sum(1 for value in lags if value > 100)
+    }
+    return profile, lag
@@ -0,0 +1,89 @@
+import importlib
+from typing import Dict, Type
+from src.services.base import ContentType, ContentGeneratorBase, RouterBase
+import src.config as Config
+
+def import_string(path: str):
+    """
+    Import an object from a "package.module:Name" path.
+
+    Args:
+        path (str): Module path and attribute name separated by a colon
+
+    Returns:
+        The imported object
+    """
+    module_name, _, attribute = path.partition(":")
+    return getattr(importlib.import_module(module_name), attribute)
+
+def mode_key() -> str:
+    """Registry key for the configured mode: "dev", or "production" for anything else."""
+    return "dev" if Config.MODE.lower() == "dev" else "production"
+
+class LazyGenerator:
+    """
+    Reference to a generator class that imports its module on first use.
+    Calling it creates a generator instance, so it can stand in for the class
+    in a router's generators mapping.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): Import path of the generator class, "package.module:ClassName"
+        """
+        self.path = path
+        self._class: Type[ContentGeneratorBase] = None
+
+    @property
+    def __name__(self) -> str:
+        return self.path.rpartition(":")[2]
+
+    def load(self) -> Type[ContentGeneratorBase]:
+        """Import the generator class if needed and return it."""
+        if self._class is None:
+            self._class = import_string(self.path)
+        return self._class
+
+    def __call__(self, *args, **kwargs) -> ContentGeneratorBase:
+        return self.load()(*args, **kwargs)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._class else "not loaded"
+        return f"LazyGenerator({self.path!r}, {state})"
+
+def generators(mode: str = None) -> Dict[ContentType, LazyGenerator]:
+    """
+    Get lazy generator references for a mode from Config.GENERATORS.
+    Content types missing from the configuration are disabled.
+
+    Args:
+        mode (str): "dev" or "production", defaults to the configured mode
+
+    Returns:
+        Dict[ContentType, LazyGenerator]: Generator reference per content type
+    """
+    paths = Config.GENERATORS[mode or mode_key()]
+    return {ContentType(type_value): LazyGenerator(path) for type_value, path in paths.items()}
+
+def create_router(mode: str = None) -> RouterBase:
+    """
+    Import and create the router for a mode from Config.ROUTERS.
+
+    Args:
+        mode (str): "dev" or "production", defaults to the configured mode
+
+    Returns:
+        RouterBase: New router instance
+    """
+    return import_string(Config.ROUTERS[mode or mode_key()])()
+
+def preload(mode: str = None):
+    """
+    Import the router and every generator for a mode up front.
+    Useful before forking workers (e.g. gunicorn --preload) so each worker starts warm.
+    """
+    mode = mode or mode_key()
+    import_string(Config.ROUTERS[mode])
+    for generator in generators(mode).values():
+        generator.load()
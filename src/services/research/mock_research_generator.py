@@ -1,13 +1,27 @@
-import random
-import time
-from typing import Tuple, List
+from typing import Iterator, Tuple, List
 from src.services.base import ContentType, ContentGeneratorBase
+from src.services.latency import LatencyModel, mock_latency
+from src.services.research.sectioned import SectionedResearch, research_calls
+import src.config as Config
+
+# Sections of a mock paper, in order
+SECTIONS = ["Introduction", "Background", "Methodology", "Results", "Discussion", "Conclusion"]
 
 class MockResearchGenerator(ContentGeneratorBase):
     """
-    Mock research generator that simulates streaming responses.
-    Used for testing and development.
+    Mock research generator that simulates streaming responses, in one stream or in
+    sections like OpenAIResearchGenerator, with one latency sample per provider call.
+    Used for testing, development and benchmarking the two modes.
     """
+    content_type = ContentType.TEXT
+
+    def __init__(self, latency: LatencyModel = None):
+        """
+        Args:
+            latency (LatencyModel): Delay before each section or call, defaults to the shared one for Config.MOCK_LATENCY["text"]
+        """
+        self.latency = latency or mock_latency(self.content_type.value)
+
     def supports_streaming(self) -> bool:
         """Indicate that this generator supports streaming."""
         return True
@@ -22,27 +36,44 @@ class MockResearchGenerator(ContentGeneratorBase):
         Yields:
             str: Chunks of mock research text
         """
+        if Config.RESEARCH_MODE == "sectioned":
+            return SectionedResearch(self).stream(prompt)
+        return self._stream(prompt)
+
+    def _stream(self, prompt: str) -> Iterator[str]:
+        """Write the whole paper in one stream, with a delay before each section."""
         # Initial response
-        time.sleep(1)  # Initial delay
+        self.cancel_token.sleep(self.latency.sample())  # Initial delay
         yield f"Researching about {prompt}...\n\n"
 
         # Introduction
-        time.sleep(0.5)
+        self.cancel_token.sleep(self.latency.sample())
         yield "Introduction:\n"
         yield f"This research paper explores {prompt} in detail.\n\n"
 
         # Main content sections
         sections = ["Background", "Methodology", "Results", "Discussion"]
         for section in sections:
-            time.sleep(random.uniform(0.5, 1.5))
+            self.cancel_token.sleep(self.latency.sample())
             yield f"{section}:\n"
             yield f"This section contains mock content about {prompt}.\n\n"
 
         # Conclusion
-        time.sleep(0.5)
+        self.cancel_token.sleep(self.latency.sample())
         yield "Conclusion:\n"
         yield f"These findings about {prompt} suggest significant implications.\n"
 
+    def outline(self, prompt: str, sections: int, max_tokens: int) -> List[str]:
+        """Mock outline call: one delay, then up to sections titles."""
+        self.cancel_token.sleep(self.latency.sample())
+        return (SECTIONS + [f"Section {number}" for number in range(len(SECTIONS) + 1, sections + 1)])[:sections]
+
+    def write_section(self, prompt: str, titles: List[str], index: int, max_tokens: int) -> Iterator[str]:
+        """Mock section call: one delay, then the section's title and text."""
+        self.cancel_token.sleep(self.latency.sample())
+        yield f"{titles[index]}:\n"
+        yield f"This section contains mock content about {prompt}.\n\n"
+
     def get_price(self) -> float:
-        """Get mock price for research generation."""
-        return 0.001
\ No newline at end of file
+        """Get mock price for research generation: one call, or the outline and each section in sectioned mode."""
+        return 0.001 * research_calls()
\ No newline at end of file
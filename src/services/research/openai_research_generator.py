@@ -1,7 +1,10 @@
 import random
 import time
-from typing import Tuple
-from src.services.base import ContentType, ContentGeneratorBase, GenerationError
+from typing import Dict, Iterator, List, Tuple
+from src.services.base import ContentType, ContentGeneratorBase, GenerationError, GenerationCancelled
+from src.services.deadline import DeadlineExceeded, check_deadline, time_left
+from src.services.research.sectioned import SectionedResearch, parse_outline, research_calls
+from src.services.tracing import span
 import src.config  as Config
 from openai import OpenAI
 from openai.types.chat import ChatCompletion
@@ -9,10 +12,21 @@ from openai.types.chat import ChatCompletion
 class OpenAIResearchGenerator(ContentGeneratorBase):
     """
     Research content generator using OpenAI's streaming API.
+    Writes the paper in one stream, or in sections generated concurrently (see SectionedResearch).
     """
-    def __init__(self):
+    content_type = ContentType.TEXT
+
+    def __init__(self, api_key: str = None, model: str = None):
+        """
+        Initialize the OpenAI client.
+
+        Args:
+            api_key (str): OpenAI API key, defaults to Config.RESEARCH_API_KEY
+            model (str): Model name, defaults to Config.RESEARCH_MODEL_NAME
+        """
+        self.model = model or Config.RESEARCH_MODEL_NAME
         try:
-            self.client = OpenAI(api_key=Config.RESEARCH_API_KEY)
+            self.client = OpenAI(api_key=api_key or Config.RESEARCH_API_KEY)
         except Exception as e:
             raise GenerationError(f"Failed to initialize OpenAI client: {str(e)}")
 
@@ -22,7 +36,8 @@ class OpenAIResearchGenerator(ContentGeneratorBase):
 
     def generate_content(self, prompt: str) ->  Tuple[ContentType, str]:
         """
-        Generate research content using OpenAI's streaming API.
+        Generate research content using OpenAI's streaming API, as one stream or, with
+        RESEARCH_MODE "sectioned", as an outline followed by concurrently written sections.
 
         Args:
             prompt (str): Research topic/question
@@ -32,24 +47,125 @@ class OpenAIResearchGenerator(ContentGeneratorBase):
 
         Raises:
             GenerationError: If content generation fails
+            GenerationCancelled: If the generation is cancelled
+        """
+        if Config.RESEARCH_MODE == "sectioned":
+            return SectionedResearch(self).stream(prompt)
+        return self._stream([
+            {"role": "system", "content": Config.RESEARCH_SYSTEM_MESSAGE},
+            {"role": "user", "content": prompt}
+        ], Config.RESEARCH_MAX_TOKENS)
+
+    def outline(self, prompt: str, sections: int, max_tokens: int) -> List[str]:
+        """
+        Ask for the section titles of a paper in one quick, non-streamed call.
+
+        Args:
+            prompt (str): Research topic/question
+            sections (int): Number of sections to ask for
+            max_tokens (int): Token budget of the outline
+
+        Returns:
+            List[str]: Section titles, at most sections of them
+
+        Raises:
+            GenerationError: If the call fails
+            GenerationCancelled: If the generation is cancelled
         """
         try:
+            self.cancel_token.raise_if_cancelled()
+            timeout = time_left(stage="generation")
+            options = {"timeout": timeout} if timeout is not None else {}
             completion = self.client.chat.completions.create(
-                model=Config.RESEARCH_MODEL_NAME,
+                model=self.model,
                 messages=[
-                    {"role": "system", "content": Config.RESEARCH_SYSTEM_MESSAGE},
+                    {"role": "system", "content": Config.RESEARCH_OUTLINE_SYSTEM_MESSAGE.format(sections=sections)},
                     {"role": "user", "content": prompt}
                 ],
-                stream=True
+                max_tokens=max_tokens,
+                **options
             )
+            return parse_outline(completion.choices[0].message.content or "", sections)
+
+        except (GenerationCancelled, DeadlineExceeded):
+            raise
+        except Exception as e:
+            self.cancel_token.raise_if_cancelled()
+            check_deadline("generation")
+            raise GenerationError(f"Failed to outline research: {str(e)}")
+
+    def write_section(self, prompt: str, titles: List[str], index: int, max_tokens: int) -> Iterator[str]:
+        """
+        Stream one section of a paper, given the whole outline so sections do not overlap.
+
+        Args:
+            prompt (str): Research topic/question
+            titles (List[str]): Section titles of the outline
+            index (int): Section to write
+            max_tokens (int): Token budget of the section
+
+        Yields:
+            str: Chunks of the section, starting with its title
+        """
+        outline = "\n".join(f"{number}. {title}" for number, title in enumerate(titles, 1))
+        yield f"{titles[index]}\n\n"
+        yield from self._stream([
+            {"role": "system", "content": Config.RESEARCH_SECTION_SYSTEM_MESSAGE},
+            {"role": "user", "content": f"Topic: {prompt}\n\nOutline:\n{outline}\n\nWrite section {index + 1}: {titles[index]}"}
+        ], max_tokens)
+        yield "\n\n"
+
+    def _stream(self, messages: List[Dict], max_tokens: int) -> Iterator[str]:
+        """
+        Stream a chat completion.
+
+        Args:
+            messages (List[Dict]): Chat messages
+            max_tokens (int): Token budget of the completion
+
+        Yields:
+            str: Chunks of generated text
+
+        Raises:
+            GenerationError: If content generation fails
+            GenerationCancelled: If the generation is cancelled
+        """
+        completion = None
+        try:
+            self.cancel_token.raise_if_cancelled()
+            # Opening the stream and each read may only take the time left before the deadline
+            timeout = time_left(stage="generation")
+            options = {"timeout": timeout} if timeout is not None else {}
+            with span("openai.stream_open", model=self.model):
+                completion = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    stream=True,
+                    **options
+                )
+
+            # Closing the stream drops the upstream connection, so cancelling stops token generation
+            close = getattr(completion, "close", None)
+            if close:
+                self.cancel_token.on_cancel(close)
 
             for chunk in completion:
                 if chunk.choices[0].delta.content:
                     yield chunk.choices[0].delta.content
 
+        except (GenerationCancelled, DeadlineExceeded):
+            raise
         except Exception as e:
+            self.cancel_token.raise_if_cancelled()
+            check_deadline("generation")
             raise GenerationError(f"Failed to generate research: {str(e)}")
+        finally:
+            # Also runs when the consumer closes this generator early
+            close = getattr(completion, "close", None)
+            if close:
+                close()
 
     def get_price(self) -> float:
-        """Get the price for research generation."""
-        return Config.RESEARCH_COST
\ No newline at end of file
+        """Get the price for research generation: one call, or the outline and each section in sectioned mode."""
+        return Config.RESEARCH_COST * research_calls()
\ No newline at end of file
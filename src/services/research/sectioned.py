@@ -0,0 +1,206 @@
+import contextvars
+import queue
+import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator, List, Optional, Tuple
+from src.services.base import CancelToken, GenerationError
+from src.services.events import report_progress
+from src.services.tracing import span
+import src.config as Config
+
+# Marks the end of a section's chunks in its queue
+_END = object()
+
+# Put in every section queue when the request is cancelled, to wake the reader
+_CANCELLED = object()
+
+# Section calls of all papers share these workers, so papers under load cannot multiply threads
+_executor = ThreadPoolExecutor(max_workers=Config.RESEARCH_SECTION_WORKERS, thread_name_prefix="research-section")
+
+# Runs a section call in its own admission slot; returned by an admit hook that found one free
+SectionRunner = Callable[..., Iterator[str]]
+
+_calls: ContextVar[Optional[Tuple[Callable[[], Optional[SectionRunner]], Callable[[int], None]]]] = \
+    ContextVar("section_calls", default=None)
+
+@contextmanager
+def section_calls(admit: Callable[[], Optional[SectionRunner]], settle: Callable[[int], None]):
+    """
+    Admit and bill the section calls of papers written while the block runs, including
+    from workers that inherit the request's context. Without it, sections run unchecked.
+
+    Args:
+        admit (Callable[[], Optional[SectionRunner]]): Takes a slot for one section call if one is free
+            right now, and returns a runner calling func(*args) in it; None to write the section within
+            the request's own slot, one section at a time
+        settle (Callable[[int], None]): Told how many of the section calls paid for in advance the outline
+            left unused, called once per paper
+    """
+    token = _calls.set((admit, settle))
+    try:
+        yield
+    finally:
+        _calls.reset(token)
+
+def _run(func: Callable, *args) -> Iterator[str]:
+    return func(*args)
+
+def research_calls() -> int:
+    """Provider calls one paper takes in the configured mode: one stream, or an outline plus its sections."""
+    return 1 + Config.RESEARCH_SECTIONS if Config.RESEARCH_MODE == "sectioned" else 1
+
+def parse_outline(text: str, limit: int) -> List[str]:
+    """Section titles from an outline, one per line, without numbering or bullets."""
+    titles = [re.sub(r"^\s*(?:[-*#]+|\d+[.)])\s*", "", line).strip() for line in text.splitlines()]
+    return [title for title in titles if title][:limit]
+
+class SectionedResearch:
+    """
+    Writes a paper as an outline from one quick call, then its sections from concurrent calls
+    with bounded parallelism. Sections are streamed in order: the first one live, and each
+    later one, from whatever it already buffered, as soon as the sections before it are done.
+    Wall-clock time then grows with the longest sections rather than with the whole paper.
+
+    The writer is a research generator providing outline(prompt, sections, max_tokens) and
+    write_section(prompt, titles, index, max_tokens); RESEARCH_MAX_TOKENS is split between
+    the outline and the sections, so the paper as a whole stays within it.
+
+    Inside section_calls(), the outline runs in the request's own admission slot and every
+    section that can get a slot of its own runs in it; the others take turns in the request's,
+    each handing it on to the next when done. Sections run on a pool shared by all papers.
+    """
+
+    def __init__(self, writer, sections: int = None, parallelism: int = None, max_tokens: int = None):
+        """
+        Args:
+            writer: Research generator writing the outline and sections
+            sections (int): Sections asked for in the outline, defaults to Config.RESEARCH_SECTIONS
+            parallelism (int): Sections written at once, defaults to Config.RESEARCH_SECTION_PARALLELISM
+            max_tokens (int): Token budget of the whole paper, defaults to Config.RESEARCH_MAX_TOKENS
+        """
+        self.writer = writer
+        self.sections = sections or Config.RESEARCH_SECTIONS
+        self.parallelism = parallelism or Config.RESEARCH_SECTION_PARALLELISM
+        self.max_tokens = max_tokens or Config.RESEARCH_MAX_TOKENS
+
+    def token_budget(self, sections: int) -> Tuple[int, int]:
+        """
+        Split the paper's token budget.
+
+        Args:
+            sections (int): Number of sections to write
+
+        Returns:
+            Tuple[int, int]: Tokens for the outline, and for each section
+        """
+        outline = min(Config.RESEARCH_OUTLINE_MAX_TOKENS, self.max_tokens // 4)
+        return outline, (self.max_tokens - outline) // max(sections, 1)
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        """
+        Generate the paper.
+
+        Args:
+            prompt (str): Research topic/question
+
+        Yields:
+            str: Chunks of the sections, in order
+
+        Raises:
+            GenerationError: If the outline is empty or a section fails
+            GenerationCancelled: If the generation is cancelled
+        """
+        cancel_token: CancelToken = self.writer.cancel_token
+        outline_tokens, _ = self.token_budget(self.sections)
+        with span("research.outline", sections=self.sections):
+            titles = self.writer.outline(prompt, self.sections, outline_tokens)
+        if not titles:
+            raise GenerationError("Outline has no sections")
+        report_progress("research.outline", sections=len(titles))
+        # Fewer sections than asked for get a bigger share of the budget each
+        _, section_tokens = self.token_budget(len(titles))
+        admit, settle = _calls.get() or (None, None)
+        if settle and len(titles) < self.sections:
+            settle(self.sections - len(titles))
+
+        queues = [queue.Queue() for _ in titles]
+        stopped = threading.Event()
+        lock = threading.Lock()
+        launched = 0
+        in_flight = 0  # Launched and not yet done, including sections waiting for the request's slot
+        own_busy = False  # A section is running in the request's own slot
+        own_waiting = deque()  # Sections that found no slot free, in order
+
+        def submit(func: Callable, *args):
+            # Each section runs in a copy of this request's context: its deadline, trace and progress listener
+            _executor.submit(contextvars.copy_context().run, func, *args)
+
+        def launch():
+            """Start sections in order while the paper is below its parallelism. Must hold the lock."""
+            nonlocal launched, in_flight
+            while not stopped.is_set() and in_flight < self.parallelism and launched < len(titles):
+                submit(start, launched)
+                launched += 1
+                in_flight += 1
+
+        def start(index: int):
+            nonlocal own_busy
+            run = _run
+            if admit and not stopped.is_set():
+                run = admit()
+                if run is None:
+                    with lock:
+                        if own_busy:
+                            # Picked up by the section now in the request's slot once it is done
+                            own_waiting.append(index)
+                            return
+                        own_busy = True
+            write(index, run)
+
+        def write(index: int, run: Optional[SectionRunner]):
+            nonlocal own_busy, in_flight
+            try:
+                # A section given a slot of its own goes on to its first chunk, where the runner lets go of the slot
+                if stopped.is_set() and run in (None, _run):
+                    return
+                with span("research.section", index=index), \
+                        closing(iter((run or _run)(self.writer.write_section, prompt, titles, index, section_tokens))) as chunks:
+                    for chunk in chunks:
+                        if stopped.is_set():
+                            return
+                        queues[index].put(chunk)
+                queues[index].put(_END)
+            except Exception as e:
+                queues[index].put(e)
+            finally:
+                with lock:
+                    in_flight -= 1
+                    if run is None:
+                        own_busy = bool(own_waiting)
+                        if own_busy:
+                            submit(write, own_waiting.popleft(), None)
+                    launch()
+
+        cancel_token.on_cancel(lambda: [section.put(_CANCELLED) for section in queues])
+        with lock:
+            launch()
+        try:
+            for index in range(len(titles)):
+                while True:
+                    item = queues[index].get()
+                    if item is _CANCELLED:
+                        cancel_token.raise_if_cancelled()
+                        continue
+                    if item is _END:
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+                    yield item
+                report_progress("research.section", done=index + 1, of=len(titles))
+        finally:
+            # Sections not yet started are dropped, running ones stop at their next chunk
+            stopped.set()
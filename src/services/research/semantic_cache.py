@@ -0,0 +1,309 @@
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+import numpy as np
+from src.services.base import ContentType, ContentGeneratorBase
+import src.config as Config
+
+class HashedNgramEmbedder:
+    """
+    Dependency-light text embedding.
+    Word unigrams and character trigrams of the normalized prompt are hashed into a
+    fixed number of signed buckets, and the result is L2-normalized, so the dot product
+    of two embeddings is their cosine similarity.
+    """
+
+    def __init__(self, dim: int = 256, stopwords: Tuple[str, ...] = ()):
+        """
+        Args:
+            dim (int): Embedding size
+            stopwords (Tuple[str, ...]): Words ignored when comparing prompts
+        """
+        self.dim = dim
+        self.stopwords = frozenset(stopwords)
+
+    def features(self, text: str) -> List[str]:
+        """Normalize text and extract its word and character trigram features."""
+        words = [word for word in re.findall(r"\w+", text.lower()) if word not in self.stopwords]
+        joined = " ".join(words)
+        return words + [joined[i:i + 3] for i in range(len(joined) - 2)]
+
+    def embed(self, text: str) -> np.ndarray:
+        """
+        Embed text.
+
+        Args:
+            text (str): Text to embed
+
+        Returns:
+            np.ndarray: Unit-length float32 vector, all zeros for empty text
+        """
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in self.features(text):
+            h = zlib.crc32(feature.encode("utf-8"))
+            vector[h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+class SemanticResearchCache:
+    """
+    In-memory nearest-neighbour cache of generated research papers.
+    Embeddings live in a preallocated NumPy matrix. Random-hyperplane LSH tables
+    narrow a lookup to a few candidate rows, which are then scored exactly. Buckets
+    keep only their most recently stored or used entries, so clusters of similar
+    prompts cannot pile up in one bucket, and lookups stay well under a millisecond
+    at 100k entries; an entry pushed out of one bucket is still found through others.
+    """
+
+    def __init__(self, max_entries: int = None, threshold: float = None, eviction: str = None,
+                 ttl_seconds: float = None, dim: int = None, tables: int = None, bits: int = None,
+                 probes: int = None, bucket_size: int = None, seed: int = 0):
+        """
+        Args:
+            max_entries (int): Papers kept before evicting, defaults to Config.RESEARCH_CACHE_MAX_ENTRIES
+            threshold (float): Cosine similarity needed for a hit, defaults to Config.RESEARCH_CACHE_THRESHOLD
+            eviction (str): "lru" or "fifo", defaults to Config.RESEARCH_CACHE_EVICTION
+            ttl_seconds (float): Age after which papers are ignored, None to keep them until evicted
+            dim (int): Embedding size, defaults to Config.RESEARCH_CACHE_DIM
+            tables (int): Number of LSH tables, more tables find more near-duplicates
+            bits (int): Hyperplanes per table, more bits mean fewer candidates per lookup
+            probes (int): Extra buckets probed per table, by flipping the least certain bits
+            bucket_size (int): Entries kept per bucket, which bounds the candidates scored per lookup
+            seed (int): Seed for the LSH hyperplanes
+        """
+        self.max_entries = max_entries or Config.RESEARCH_CACHE_MAX_ENTRIES
+        self.threshold = Config.RESEARCH_CACHE_THRESHOLD if threshold is None else threshold
+        self.eviction = eviction or Config.RESEARCH_CACHE_EVICTION
+        self.ttl_seconds = Config.RESEARCH_CACHE_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self.embedder = HashedNgramEmbedder(dim or Config.RESEARCH_CACHE_DIM, Config.RESEARCH_CACHE_STOPWORDS)
+        self.tables = tables or Config.RESEARCH_CACHE_LSH_TABLES
+        self.bits = bits or Config.RESEARCH_CACHE_LSH_BITS
+        self.probes = Config.RESEARCH_CACHE_LSH_PROBES if probes is None else probes
+        self.bucket_size = bucket_size or Config.RESEARCH_CACHE_LSH_BUCKET_SIZE
+
+        if self.eviction not in ("lru", "fifo"):
+            raise ValueError(f"Unknown eviction policy: {self.eviction}")
+
+        rng = np.random.default_rng(seed)
+        self._planes = rng.standard_normal((self.embedder.dim, self.tables * self.bits)).astype(np.float32)
+        self._powers = (1 << np.arange(self.bits)).astype(np.int64)
+
+        self._lock = threading.Lock()
+        self._matrix = np.zeros((self.max_entries, self.embedder.dim), dtype=np.float32)
+        self._papers: List[Optional[str]] = [None] * self.max_entries
+        self._created = np.zeros(self.max_entries, dtype=np.float64)
+        self._keys: List[Optional[Tuple[int, ...]]] = [None] * self.max_entries
+        # Buckets are dicts used as insertion-ordered sets of slots, oldest first
+        self._buckets: List[Dict[int, Dict[int, None]]] = [{} for _ in range(self.tables)]
+        self._order: "OrderedDict[int, None]" = OrderedDict()  # Slots, oldest or least recently used first
+        self._free = list(range(self.max_entries - 1, -1, -1))
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def _lsh_keys(self, vector: np.ndarray) -> Tuple[int, ...]:
+        """Bucket key of a vector in every LSH table."""
+        signs = (vector @ self._planes > 0).reshape(self.tables, self.bits)
+        return tuple((signs @ self._powers).tolist())
+
+    def _probe_keys(self, vector: np.ndarray) -> List[List[int]]:
+        """
+        Bucket keys to probe in every LSH table: the vector's own key, plus the keys
+        that differ from it in one of the bits whose hyperplane it lies closest to.
+        """
+        projections = (vector @ self._planes).reshape(self.tables, self.bits)
+        keys = (projections > 0) @ self._powers
+        if not self.probes:
+            return keys[:, None].tolist()
+        uncertain = np.argsort(np.abs(projections), axis=1)[:, :self.probes]
+        flipped = keys[:, None] ^ self._powers[uncertain]
+        return np.concatenate([keys[:, None], flipped], axis=1).tolist()
+
+    def _evict(self) -> int:
+        """Free the oldest or least recently used slot and return it. Must hold the lock."""
+        slot, _ = self._order.popitem(last=False)
+        self._remove(slot)
+        self._stats["evictions"] += 1
+        return slot
+
+    def _remove(self, slot: int):
+        """Drop a slot from the LSH tables. Must hold the lock."""
+        for table, key in zip(self._buckets, self._keys[slot]):
+            bucket = table.get(key)
+            # The slot may already have been pushed out of a full bucket
+            if bucket is not None:
+                bucket.pop(slot, None)
+                if not bucket:
+                    del table[key]
+        self._papers[slot] = None
+        self._keys[slot] = None
+
+    def _add(self, bucket: Dict[int, None], slot: int):
+        """Add a slot as the newest entry of a bucket, pushing out the oldest if it is full. Must hold the lock."""
+        bucket[slot] = None
+        if len(bucket) > self.bucket_size:
+            del bucket[next(iter(bucket))]
+
+    def _touch(self, slot: int):
+        """Make a used slot the newest entry of the buckets still holding it. Must hold the lock."""
+        for table, key in zip(self._buckets, self._keys[slot]):
+            bucket = table.get(key)
+            if bucket is not None and slot in bucket:
+                del bucket[slot]
+                bucket[slot] = None
+
+    def lookup(self, prompt: str) -> Optional[Tuple[str, float]]:
+        """
+        Find a stored paper whose prompt is similar enough to this one.
+
+        Args:
+            prompt (str): Research prompt
+
+        Returns:
+            Optional[Tuple[str, float]]: The paper and its similarity, or None on a miss
+        """
+        vector = self.embedder.embed(prompt)
+        probe_keys = self._probe_keys(vector)
+
+        with self._lock:
+            buckets = [table[key] for table, keys in zip(self._buckets, probe_keys) for key in keys if key in table]
+            candidates: Set[int] = set().union(*buckets)
+
+            if candidates:
+                slots = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+                scores = self._matrix[slots] @ vector
+                if self.ttl_seconds:
+                    scores[self._created[slots] < time.time() - self.ttl_seconds] = -1.0
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    slot = int(slots[best])
+                    if self.eviction == "lru":
+                        self._order.move_to_end(slot)
+                        self._touch(slot)
+                    self._stats["hits"] += 1
+                    return self._papers[slot], float(scores[best])
+
+            self._stats["misses"] += 1
+            return None
+
+    def store(self, prompt: str, paper: str):
+        """
+        Store a generated paper under its prompt's embedding.
+
+        Args:
+            prompt (str): Research prompt
+            paper (str): Complete generated paper
+        """
+        vector = self.embedder.embed(prompt)
+        if not vector.any():
+            return
+        keys = self._lsh_keys(vector)
+
+        with self._lock:
+            slot = self._free.pop() if self._free else self._evict()
+            self._matrix[slot] = vector
+            self._papers[slot] = paper
+            self._created[slot] = time.time()
+            self._keys[slot] = keys
+            for table, key in zip(self._buckets, keys):
+                self._add(table.setdefault(key, {}), slot)
+            self._order[slot] = None
+            self._stats["stores"] += 1
+
+    def wrap(self, generator: ContentGeneratorBase, prompt: str) -> ContentGeneratorBase:
+        """
+        Serve a research request from the cache if possible.
+
+        Args:
+            generator (ContentGeneratorBase): Research generator chosen by the router
+            prompt (str): Research prompt
+
+        Returns:
+            ContentGeneratorBase: A replaying generator on a hit, otherwise the generator
+            wrapped so its paper is stored once it completes
+        """
+        hit = self.lookup(prompt)
+        if hit:
+            return CachedResearchGenerator(hit[0])
+        return RecordingResearchGenerator(generator, self)
+
+    def get_stats(self) -> Dict:
+        """Get cache size and hit/miss counters."""
+        with self._lock:
+            return {"entries": len(self._order), "max_entries": self.max_entries, "threshold": self.threshold, **self._stats}
+
+class CachedResearchGenerator(ContentGeneratorBase):
+    """Replays a cached research paper as a stream, at no cost."""
+    content_type = ContentType.TEXT
+
+    def __init__(self, paper: str, chunk_size: int = None):
+        self.paper = paper
+        self.chunk_size = chunk_size or Config.RESEARCH_CACHE_REPLAY_CHUNK
+
+    @property
+    def provider(self) -> str:
+        return "SemanticResearchCache"
+
+    def supports_streaming(self) -> bool:
+        """Indicate that this generator supports streaming."""
+        return True
+
+    def generate_content(self, prompt: str) -> Iterator[str]:
+        """
+        Replay the cached paper.
+
+        Yields:
+            str: Chunks of the cached paper
+        """
+        for i in range(0, len(self.paper), self.chunk_size):
+            self.cancel_token.raise_if_cancelled()
+            yield self.paper[i:i + self.chunk_size]
+
+    def get_price(self) -> float:
+        """Cached papers are free."""
+        return 0.0
+
+class RecordingResearchGenerator(ContentGeneratorBase):
+    """Streams from a research generator and stores the paper in the cache once it completes."""
+    content_type = ContentType.TEXT
+
+    def __init__(self, generator: ContentGeneratorBase, cache: SemanticResearchCache):
+        self.generator = generator
+        self.cache = cache
+
+    @property
+    def provider(self) -> str:
+        return self.generator.provider
+
+    def cancel(self):
+        """Cancel the wrapped generator too."""
+        super().cancel()
+        self.generator.cancel()
+
+    def supports_streaming(self) -> bool:
+        """Indicate that this generator supports streaming."""
+        return True
+
+    def fail_over(self, error: Exception) -> bool:
+        """Fail the wrapped generator over to another backend."""
+        return self.generator.fail_over(error)
+
+    def generate_content(self, prompt: str) -> Iterator[str]:
+        """
+        Stream the wrapped generator's output, keeping a copy of it.
+
+        Yields:
+            str: Chunks of generated text
+        """
+        chunks = []
+        for chunk in self.generator.generate_content(prompt):
+            chunks.append(chunk)
+            yield chunk
+
+        # Only complete papers are cached - failures and abandoned streams never get here
+        self.cache.store(prompt, "".join(chunks))
+
+    def get_price(self) -> float:
+        """Price of the wrapped generator."""
+        return self.generator.get_price()
@@ -0,0 +1,164 @@
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from contextlib import nullcontext
+from typing import Dict, List, Optional, Tuple
+from src.services.base import RouterBase, ContentGeneratorBase, ContentType, GenerationError
+from src.services.deadline import Deadline, current_deadline, time_left, within
+from src.services.tracing import span
+import src.config as Config
+
+class BatchingRouter(RouterBase):
+    """
+    Router wrapper that micro-batches concurrent classification requests.
+    Prompts arriving within a short window are classified together with a single
+    call to the wrapped router's classify_batch, and each caller's future is then
+    resolved with its own label. Callers wait no longer than their request's deadline,
+    and the batch call may only take the time left before the earliest one in it.
+    """
+
+    def __init__(self, router: RouterBase, window_ms: float = None, max_batch_size: int = None):
+        """
+        Initialize the batching wrapper.
+
+        Args:
+            router (RouterBase): Router providing classify_batch and create_generator
+            window_ms (float): Maximum time the first prompt of a batch waits for others
+            max_batch_size (int): Batch size that triggers an immediate dispatch
+        """
+        self.router = router
+        self.window = (Config.ROUTER_BATCH_WINDOW_MS if window_ms is None else window_ms) / 1000
+        self.max_batch_size = max_batch_size or Config.ROUTER_BATCH_MAX_SIZE
+
+        self._pending: List[Tuple[str, Future, Optional[Deadline]]] = []
+        self._condition = threading.Condition()
+        self._stats = {"prompts": 0, "batches": 0, "largest_batch": 0}
+
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name="router-batcher", daemon=True)
+        self._dispatcher.start()
+
+    def _dispatch_loop(self):
+        """Collect pending prompts into batches and classify them."""
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+
+                # Wait until the window closes or the batch is full
+                deadline = time.monotonic() + self.window
+                while len(self._pending) < self.max_batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+
+                batch = self._pending[:self.max_batch_size]
+                del self._pending[:self.max_batch_size]
+
+            self._classify(batch)
+
+    def _classify(self, batch: List[Tuple[str, Future, Optional[Deadline]]]):
+        """Classify one batch and resolve every caller's future."""
+        live = []
+        for prompt, future, deadline in batch:
+            # Callers that gave up have cancelled their future; expired ones are not worth a place in the call
+            if not future.set_running_or_notify_cancel():
+                continue
+            if deadline is not None and deadline.expired:
+                future.set_exception(deadline.exceeded("routing"))
+                continue
+            live.append((prompt, future, deadline))
+        if not live:
+            return
+
+        # The dispatcher has no request of its own, so the batch call runs under its most urgent one
+        deadlines = [deadline for _, _, deadline in live if deadline is not None]
+        earliest = min(deadlines, key=lambda deadline: deadline.remaining()) if deadlines else None
+        try:
+            with within(earliest) if earliest else nullcontext():
+                content_types = self.router.classify_batch([prompt for prompt, _, _ in live])
+        except Exception as e:
+            for _, future, _ in live:
+                future.set_exception(e)
+            return
+
+        with self._condition:
+            self._stats["prompts"] += len(live)
+            self._stats["batches"] += 1
+            self._stats["largest_batch"] = max(self._stats["largest_batch"], len(live))
+
+        for (_, future, _), content_type in zip(live, content_types):
+            future.set_result(content_type)
+
+    def _get_content_type(self, prompt: str) -> ContentType:
+        """
+        Queue the prompt for the next batch and wait for its label.
+
+        Args:
+            prompt (str): User's input prompt
+
+        Returns:
+            ContentType: Determined content type enum
+
+        Raises:
+            DeadlineExceeded: If the request's deadline passes before the label arrives
+        """
+        future: Future = Future()
+        deadline = current_deadline()
+        timeout = time_left(stage="routing")
+
+        with self._condition:
+            self._pending.append((prompt, future, deadline))
+            self._condition.notify()
+
+        # Includes the time spent waiting for other prompts to join the batch
+        with span("router.batch_wait"):
+            try:
+                return future.result(timeout=timeout)
+            except TimeoutError:
+                # Leaves the batch if it was not sent yet; a running call only answers nobody
+                future.cancel()
+                raise deadline.exceeded("routing")
+
+    def route(self, prompt: str) -> ContentGeneratorBase:
+        """
+        Route the prompt to appropriate content generator.
+
+        Args:
+            prompt (str): User's input prompt
+
+        Returns:
+            ContentGeneratorBase: Appropriate content generator instance
+
+        Raises:
+            GenerationError: If routing fails
+        """
+        try:
+            content_type = self._get_content_type(prompt)
+            return self.router.create_generator(content_type)
+
+        except GenerationError:
+            raise
+        except Exception as e:
+            raise GenerationError(f"Failed to route prompt: {str(e)}")
+
+    def create_generator(self, content_type: ContentType) -> ContentGeneratorBase:
+        """Create a generator for a content type through the wrapped router."""
+        return self.router.create_generator(content_type)
+
+    def get_price(self) -> float:
+        """Get the price for routing, as charged by the wrapped router."""
+        return self.router.get_price()
+
+    def get_stats(self) -> Dict:
+        """
+        Get batching statistics.
+
+        Returns:
+            Dict containing prompts routed, batches sent, average and largest batch size
+        """
+        with self._condition:
+            stats = dict(self._stats)
+            stats["pending"] = len(self._pending)
+        stats["average_batch"] = stats["prompts"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
@@ -1,8 +1,6 @@
-from typing import Dict, Type
+from typing import Dict, List, Type
 from src.services.base import RouterBase, ContentGeneratorBase, ContentType
-from src.services.research.mock_research_generator import MockResearchGenerator
-from src.services.image.mock_image_generator import MockImageGenerator
-from src.services.song.mock_song_generator import MockSongGenerator
+from src.services import registry
 
 class MockRouter(RouterBase):
     """
@@ -12,31 +10,72 @@ class MockRouter(RouterBase):
 
     def __init__(self):
         """Initialize router with generator mappings."""
-        # Store generator classes
-        self.generators = {
-            ContentType.TEXT: MockResearchGenerator,
-            ContentType.SONG: MockSongGenerator,
-            ContentType.IMAGE: MockImageGenerator
-        }
+        # Store lazily imported generator classes
+        self.generators = registry.generators("dev")
         self.default_type = ContentType.IMAGE
 
-    def route(self, prompt: str) -> ContentGeneratorBase:
+    def _get_content_type(self, prompt: str) -> ContentType:
         """
-        Route the prompt to appropriate mock generator.
+        Determine the content type from simple keywords in the prompt.
 
         Args:
             prompt (str): User's input prompt
 
         Returns:
-            ContentGeneratorBase: Appropriate mock generator instance
+            ContentType: Determined content type enum
         """
         prompt = prompt.lower()
 
-        # Return new instance of appropriate generator
         if "research" in prompt:
-            return self.generators[ContentType.TEXT]()
+            return ContentType.TEXT
         elif "song" in prompt:
-            return self.generators[ContentType.SONG]()
+            return ContentType.SONG
 
         # Default to image generator
-        return self.generators[self.default_type]()
\ No newline at end of file
+        return self.default_type
+
+    def classify_batch(self, prompts: List[str]) -> List[ContentType]:
+        """
+        Determine the content type of several prompts at once.
+
+        Args:
+            prompts (List[str]): User input prompts, in order
+
+        Returns:
+            List[ContentType]: One content type per prompt, in the same order
+        """
+        return [self._get_content_type(prompt) for prompt in prompts]
+
+    def create_generator(self, content_type: ContentType) -> ContentGeneratorBase:
+        """
+        Create the mock generator registered for a content type.
+
+        Args:
+            content_type (ContentType): Content type to generate
+
+        Returns:
+            ContentGeneratorBase: New mock generator instance
+        """
+        return self.generators[content_type]()
+
+    def route(self, prompt: str) -> ContentGeneratorBase:
+        """
+        Route the prompt to appropriate mock generator.
+
+        Args:
+            prompt (str): User's input prompt
+
+        Returns:
+            ContentGeneratorBase: Appropriate mock generator instance
+        """
+        # Return new instance of appropriate generator
+        return self.create_generator(self._get_content_type(prompt))
+
+    def get_price(self) -> float:
+        """
+        Get mock price for routing.
+
+        Returns:
+            float: Fixed mock price
+        """
+        return 0.001
\ No newline at end of file
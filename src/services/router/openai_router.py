@@ -1,16 +1,25 @@
-from typing import Dict, Type
+import json
+from typing import Callable, Dict, List
 from pydantic import BaseModel
-from openai import OpenAI
+from openai import OpenAI, APIConnectionError, APITimeoutError, RateLimitError, InternalServerError
 from src.services.base import RouterBase, ContentGeneratorBase, ContentType, GenerationError, ContentType
-from src.services.research.openai_research_generator import OpenAIResearchGenerator
-from src.services.image.flux_image_generator import FluxImageGenerator
-from src.services.song.suno_song_generator import SunoSongGenerator
+from src.services.circuit_breaker import retry_with_jitter
+from src.services.deadline import DeadlineExceeded, check_deadline, time_left
+from src.services.generator_pool import GeneratorPool
+from src.services import registry
+from src.services.tracing import span
 import src.config  as Config
 
 
 class ContentGenerationType(BaseModel):
     type: ContentType
 
+class ContentGenerationTypes(BaseModel):
+    types: List[ContentType]
+
+# OpenAI errors worth retrying - classification is idempotent
+TRANSIENT_ERRORS = (APIConnectionError, APITimeoutError, RateLimitError, InternalServerError)
+
 class OpenAIRouter(RouterBase):
     """
     Router that uses OpenAI to determine the appropriate content generator.
@@ -20,15 +29,28 @@ class OpenAIRouter(RouterBase):
         """Initialize the OpenAI client and generator mappings."""
         try:
             self.client = OpenAI(api_key=Config.ROUTER_API_KEY)
-            # Map ContentType enum to generator classes
-            self.generators: Dict[ContentType, Type[ContentGeneratorBase]] = {
-                ContentType.TEXT: OpenAIResearchGenerator,
-                ContentType.SONG: SunoSongGenerator,
-                ContentType.IMAGE: FluxImageGenerator
-            }
+            # Map ContentType enum to lazily imported generator classes, or to pools of several backends
+            self.generators: Dict[ContentType, Callable[[], ContentGeneratorBase]] = registry.generators("production")
+            for type_value, backends in Config.GENERATOR_BACKENDS.items():
+                content_type = ContentType(type_value)
+                self.generators[content_type] = GeneratorPool.from_config(content_type, backends)
         except Exception as e:
             raise GenerationError(f"Failed to initialize OpenAI router: {str(e)}")
 
+    def _parse_completion(self, **kwargs):
+        """
+        Call the structured-output completion API, retrying transient errors with jitter.
+        Each attempt may only take the time left before the request's deadline.
+        """
+        def parse():
+            timeout = time_left(stage="routing")
+            if timeout is not None:
+                return self.client.beta.chat.completions.parse(timeout=timeout, **kwargs)
+            return self.client.beta.chat.completions.parse(**kwargs)
+
+        with span("openai.classify", model=kwargs.get("model")):
+            return retry_with_jitter(parse, retry_on=TRANSIENT_ERRORS)
+
     def _get_content_type(self, prompt: str) -> ContentType:
         """
         Use OpenAI to determine the content type from the prompt.
@@ -43,7 +65,7 @@ class OpenAIRouter(RouterBase):
             GenerationError: If content type determination fails
         """
         try:
-            completion = self.client.beta.chat.completions.parse(
+            completion = self._parse_completion(
                 model=Config.ROUTER_MODEL_NAME,
                 messages=[
                     {"role": "system", "content": Config.ROUTER_SYSTEM_MESSAGE},
@@ -58,9 +80,74 @@ class OpenAIRouter(RouterBase):
 
             return completion.choices[0].message.parsed.type
 
+        except DeadlineExceeded:
+            raise
         except Exception as e:
+            check_deadline("routing")
             raise GenerationError(f"Failed to determine content type: {str(e)}")
 
+    def classify_batch(self, prompts: List[str]) -> List[ContentType]:
+        """
+        Use a single OpenAI call to determine the content type of several prompts.
+
+        Args:
+            prompts (List[str]): User input prompts, in order
+
+        Returns:
+            List[ContentType]: One content type per prompt, in the same order
+
+        Raises:
+            GenerationError: If content type determination fails
+        """
+        if len(prompts) == 1:
+            return [self._get_content_type(prompts[0])]
+
+        try:
+            numbered = "\n".join(f"{i + 1}. {json.dumps(p)}" for i, p in enumerate(prompts))
+            completion = self._parse_completion(
+                model=Config.ROUTER_MODEL_NAME,
+                messages=[
+                    {"role": "system", "content": Config.ROUTER_SYSTEM_MESSAGE + " " + Config.ROUTER_BATCH_SYSTEM_MESSAGE},
+                    {"role": "user", "content": numbered}
+                ],
+                temperature=0,
+                response_format=ContentGenerationTypes
+            )
+
+            if not completion.choices or not completion.choices[0].message.content:
+                raise GenerationError("No response received from OpenAI")
+
+            types = completion.choices[0].message.parsed.types
+            if len(types) != len(prompts):
+                raise GenerationError(f"Expected {len(prompts)} labels, got {len(types)}")
+
+            return types
+
+        except GenerationError:
+            raise
+        except Exception as e:
+            raise GenerationError(f"Failed to determine content types: {str(e)}")
+
+    def create_generator(self, content_type: ContentType) -> ContentGeneratorBase:
+        """
+        Create the generator registered for a content type.
+
+        Args:
+            content_type (ContentType): Content type to generate
+
+        Returns:
+            ContentGeneratorBase: New generator instance
+
+        Raises:
+            GenerationError: If no generator is registered for the type
+        """
+        generator_class = self.generators.get(content_type)
+
+        if not generator_class:
+            raise GenerationError(f"Unsupported content type: {content_type}")
+
+        return generator_class()
+
     def route(self, prompt: str) -> ContentGeneratorBase:
         """
         Route the prompt to appropriate content generator.
@@ -78,14 +165,8 @@ class OpenAIRouter(RouterBase):
             # Get content type from OpenAI
             content_type = self._get_content_type(prompt)
 
-            # Get appropriate generator class
-            generator_class = self.generators.get(content_type)
-
-            if not generator_class:
-                raise GenerationError(f"Unsupported content type: {content_type}")
-
-            # Return new instance of the generator
-            return generator_class()
+            # Return new instance of the appropriate generator
+            return self.create_generator(content_type)
 
         except GenerationError:
             raise
@@ -0,0 +1,97 @@
+import hashlib
+import re
+import threading
+from typing import Callable, Dict, Optional, Tuple
+from src.services.base import ContentType, ContentGeneratorBase, RouterBase
+from src.services.clock import get_clock
+from src.services.state.base import SharedStateBase
+import src.config as Config
+
+class RouteCache:
+    """
+    Remembers the content type each prompt was routed to, in shared state, so a prompt seen
+    on any node skips the router call. Concurrent requests for the same uncached prompt are
+    single-flighted: one request holds a lock and routes while the others poll the cache,
+    routing themselves only if it is still empty when the lock would have expired.
+    """
+
+    def __init__(self, state: SharedStateBase, ttl: int = None, lock_seconds: float = None, poll_seconds: float = None):
+        """
+        Args:
+            state (SharedStateBase): Backend holding the cache and locks
+            ttl (int): Seconds a routing decision is kept, defaults to Config.ROUTE_CACHE_TTL_SECONDS
+            lock_seconds (float): Longest wait for another request routing the same prompt, defaults to Config.ROUTE_CACHE_LOCK_SECONDS
+            poll_seconds (float): How often waiting requests check the cache, defaults to Config.ROUTE_CACHE_POLL_SECONDS
+        """
+        self.state = state
+        self.ttl = ttl or Config.ROUTE_CACHE_TTL_SECONDS
+        self.lock_seconds = lock_seconds or Config.ROUTE_CACHE_LOCK_SECONDS
+        self.poll_seconds = poll_seconds or Config.ROUTE_CACHE_POLL_SECONDS
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "waits": 0}
+
+    @staticmethod
+    def key(prompt: str) -> str:
+        """Cache key of a prompt; case and whitespace do not change the route."""
+        normalized = re.sub(r"\s+", " ", prompt.strip().lower())
+        return "route:" + hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt: str) -> Optional[ContentType]:
+        """Content type a prompt was routed to before, None if not cached."""
+        value = self.state.get(self.key(prompt))
+        return ContentType(value) if value else None
+
+    def store(self, prompt: str, content_type: ContentType):
+        """Remember the content type a prompt was routed to."""
+        self.state.set(self.key(prompt), content_type.value, self.ttl)
+
+    def route(self, router: RouterBase, prompt: str,
+              route_call: Callable[[str], ContentGeneratorBase]) -> Tuple[ContentGeneratorBase, bool]:
+        """
+        Create the generator for a prompt from the cache, or route it and cache the decision.
+
+        Args:
+            router (RouterBase): Router creating generators for cached content types
+            prompt (str): User prompt
+            route_call (Callable[[str], ContentGeneratorBase]): Routes the prompt on a miss, e.g. router.route
+
+        Returns:
+            Tuple[ContentGeneratorBase, bool]: The generator, and whether the route came from the cache
+        """
+        content_type = self.lookup(prompt)
+        if content_type is None:
+            with self.state.lock(self.key(prompt), self.lock_seconds) as routing:
+                if not routing:
+                    content_type = self._wait(prompt)
+                if content_type is None:
+                    self._count("misses")
+                    generator = route_call(prompt)
+                    if generator.content_type:
+                        self.store(prompt, generator.content_type)
+                    return generator, False
+        self._count("hits")
+        return router.create_generator(content_type), True
+
+    def _wait(self, prompt: str) -> Optional[ContentType]:
+        """Poll the cache while another request routes the prompt."""
+        self._count("waits")
+        clock = get_clock()
+        deadline = clock.now() + self.lock_seconds
+        while clock.now() < deadline:
+            clock.sleep(self.poll_seconds)
+            content_type = self.lookup(prompt)
+            if content_type:
+                return content_type
+        return None
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def get_stats(self) -> Dict:
+        """Get hit, miss and single-flight wait counts."""
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
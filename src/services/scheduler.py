@@ -0,0 +1,267 @@
+import asyncio
+import contextvars
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import AsyncIterator, Callable, Dict, Optional, Tuple
+from src.services.profiler import thread_scope
+import src.config as Config
+
+# Lane used for routing calls, which run before the content type is known
+ROUTER_LANE = "router"
+
+# Marker kinds passed from a streaming worker to its consumer
+_ITEM, _ERROR, _DONE = range(3)
+
+class _Task:
+    """A queued unit of work and the future that receives its result."""
+    __slots__ = ("func", "args", "future", "context")
+
+    def __init__(self, func: Callable, args: tuple):
+        self.func = func
+        self.args = args
+        self.future: Future = Future()
+        # Run in the submitter's context, so request-scoped state such as trace spans follows the work
+        self.context = contextvars.copy_context()
+
+def _run_task(task: _Task):
+    # Profiled requests sample the worker thread while it runs their task
+    with thread_scope():
+        return task.func(*task.args)
+
+class Lane:
+    """
+    Work queue for one kind of content, with its own reserved workers (a bulkhead).
+    Tasks are queued per client key and served round-robin, so one heavy client
+    cannot starve the others within the lane.
+    """
+
+    def __init__(self, name: str, workers: int = 0, priority: int = 0, weight: float = 1):
+        """
+        Args:
+            name (str): Lane name, a ContentType value or ROUTER_LANE
+            workers (int): Threads reserved for this lane
+            priority (int): Lower values are served first by shared workers
+            weight (float): Share of shared workers among lanes of equal priority
+        """
+        self.name = name
+        self.workers = workers
+        self.priority = priority
+        self.weight = weight
+
+        self.queues: "OrderedDict[Optional[str], deque]" = OrderedDict()
+        self.size = 0
+        self.virtual_time = 0.0
+        self.running = 0
+        self.completed = 0
+
+    def push(self, client_key: Optional[str], task: _Task):
+        """Queue a task behind earlier tasks from the same client."""
+        self.queues.setdefault(client_key, deque()).append(task)
+        self.size += 1
+
+    def pop(self) -> _Task:
+        """Take the next task, rotating between clients."""
+        client_key, queue = next(iter(self.queues.items()))
+        task = queue.popleft()
+        if queue:
+            self.queues.move_to_end(client_key)
+        else:
+            del self.queues[client_key]
+        self.size -= 1
+        return task
+
+class ContentScheduler:
+    """
+    Runs blocking generation work on per-lane worker threads instead of the shared threadpool.
+    Each lane has reserved workers so a slow provider only exhausts its own capacity.
+    Shared workers pick up overflow from any lane, by priority first and then by
+    weighted-fair virtual time.
+    """
+
+    def __init__(self, lanes: Dict[str, Dict] = None, shared_workers: int = None):
+        """
+        Args:
+            lanes (Dict[str, Dict]): Lane settings keyed by lane name, defaults to Config.SCHEDULER_LANES
+            shared_workers (int): Workers that serve any lane, defaults to Config.SCHEDULER_SHARED_WORKERS
+        """
+        lanes = Config.SCHEDULER_LANES if lanes is None else lanes
+        shared_workers = Config.SCHEDULER_SHARED_WORKERS if shared_workers is None else shared_workers
+
+        self._condition = threading.Condition()
+        self._virtual_clock = 0.0
+        self.lanes: Dict[str, Lane] = {name: Lane(name, **settings) for name, settings in lanes.items()}
+        self.shared_workers = shared_workers
+        self._started = False
+
+    def _start_workers(self):
+        """Start every lane's reserved workers and the shared workers. Must hold the lock."""
+        for lane in self.lanes.values():
+            for i in range(lane.workers):
+                self._start_worker(f"{lane.name}-{i}", lane)
+        for i in range(self.shared_workers):
+            self._start_worker(f"shared-{i}", None)
+        self._started = True
+
+    def _start_worker(self, name: str, lane: Optional[Lane]):
+        """Start a daemon worker bound to a lane, or a shared worker if lane is None."""
+        thread = threading.Thread(target=self._work, args=(lane,), name=f"scheduler-{name}", daemon=True)
+        thread.start()
+
+    def _lane(self, name: str) -> Lane:
+        """Get a lane by name, creating a shared-only lane for unknown names. Must hold the lock."""
+        if name not in self.lanes:
+            self.lanes[name] = Lane(name)
+        return self.lanes[name]
+
+    def _pick_lane(self) -> Optional[Lane]:
+        """Choose the lane a shared worker should serve next. Must hold the lock."""
+        waiting = [lane for lane in self.lanes.values() if lane.size]
+        if not waiting:
+            return None
+        return min(waiting, key=lambda lane: (lane.priority, lane.virtual_time))
+
+    def _next_task(self, own_lane: Optional[Lane]) -> Tuple[_Task, Lane]:
+        """Block until there is a task for this worker and take it, with the lane it came from."""
+        with self._condition:
+            while True:
+                lane = own_lane if own_lane and own_lane.size else None
+                if own_lane is None:
+                    lane = self._pick_lane()
+                if lane:
+                    break
+                self._condition.wait()
+
+            task = lane.pop()
+            lane.virtual_time += 1 / lane.weight
+            self._virtual_clock = lane.virtual_time
+            lane.running += 1
+            return task, lane
+
+    def _work(self, own_lane: Optional[Lane]):
+        """Worker loop: run tasks and resolve their futures."""
+        while True:
+            task, lane = self._next_task(own_lane)
+            try:
+                if task.future.set_running_or_notify_cancel():
+                    try:
+                        task.future.set_result(task.context.run(_run_task, task))
+                    except BaseException as e:
+                        task.future.set_exception(e)
+            finally:
+                with self._condition:
+                    lane.running -= 1
+                    lane.completed += 1
+
+    def submit(self, lane_name: str, func: Callable, *args, client_key: Optional[str] = None) -> Future:
+        """
+        Queue a blocking call on a lane.
+
+        Args:
+            lane_name (str): Lane to run on
+            func (Callable): Blocking function to call
+            *args: Arguments for func
+            client_key (Optional[str]): Fairness key, tasks without one share a queue
+
+        Returns:
+            Future: Resolves with the function's result or exception
+        """
+        task = _Task(func, args)
+        with self._condition:
+            if not self._started:
+                self._start_workers()
+            lane = self._lane(lane_name)
+            if not lane.size:
+                # Idle lanes rejoin at the current virtual time instead of banking credit
+                lane.virtual_time = max(lane.virtual_time, self._virtual_clock)
+            lane.push(client_key, task)
+            self._condition.notify_all()
+        return task.future
+
+    async def run(self, lane_name: str, func: Callable, *args, client_key: Optional[str] = None):
+        """Run a blocking call on a lane and await its result."""
+        return await asyncio.wrap_future(self.submit(lane_name, func, *args, client_key=client_key))
+
+    async def stream(self, lane_name: str, iterator_factory: Callable, *args, client_key: Optional[str] = None,
+                     max_buffer: int = 64) -> AsyncIterator:
+        """
+        Consume a blocking iterator on a lane and yield its items asynchronously.
+        The worker blocks when max_buffer items are waiting, and stops as soon as the
+        consumer goes away.
+
+        Args:
+            lane_name (str): Lane to run on
+            iterator_factory (Callable): Called on the worker with *args to create the iterator
+            *args: Arguments for iterator_factory
+            client_key (Optional[str]): Fairness key
+            max_buffer (int): Items buffered between worker and consumer
+
+        Yields:
+            Items produced by the iterator
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=max_buffer)
+        stopped = threading.Event()
+
+        def put(kind: int, value=None) -> bool:
+            """Hand an item to the consumer, giving up if it has gone away."""
+            future = asyncio.run_coroutine_threadsafe(queue.put((kind, value)), loop)
+            while True:
+                try:
+                    future.result(timeout=0.1)
+                    return True
+                except FutureTimeoutError:
+                    if stopped.is_set():
+                        future.cancel()
+                        return False
+
+        def pump():
+            iterator = None
+            try:
+                iterator = iter(iterator_factory(*args))
+                for item in iterator:
+                    if stopped.is_set() or not put(_ITEM, item):
+                        return
+                put(_DONE)
+            except Exception as e:
+                put(_ERROR, e)
+            finally:
+                close = getattr(iterator, "close", None)
+                if close:
+                    close()
+
+        self.submit(lane_name, pump, client_key=client_key)
+        try:
+            while True:
+                kind, value = await queue.get()
+                if kind == _DONE:
+                    return
+                if kind == _ERROR:
+                    raise value
+                yield value
+        finally:
+            stopped.set()
+
+    def get_stats(self) -> Dict:
+        """
+        Get current scheduler state.
+
+        Returns:
+            Dict with queued, running and completed task counts and waiting clients per lane
+        """
+        with self._condition:
+            return {
+                "shared_workers": self.shared_workers,
+                "lanes": {
+                    lane.name: {
+                        "workers": lane.workers,
+                        "priority": lane.priority,
+                        "weight": lane.weight,
+                        "queued": lane.size,
+                        "running": lane.running,
+                        "completed": lane.completed,
+                        "clients_waiting": len(lane.queues)
+                    }
+                    for lane in self.lanes.values()
+                }
+            }
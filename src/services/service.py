@@ -1,18 +1,80 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import StreamingResponse, JSONResponse
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Header, Request, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse, Response
+from pydantic import BaseModel, ValidationError
+from typing import Callable, Dict, Iterator, Optional
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import asyncio
+import contextvars
 import logging
+import socket
+import threading
+import uuid
 from pathlib import Path
-from src.services.router.mock_router import MockRouter
-from src.services.base import GenerationError
-from src.services.router.openai_router import OpenAIRouter
+from src.services.base import ContentType, ContentGeneratorBase, GenerationCancelled, GenerationError, RouterBase
+from src.services.router.batching_router import BatchingRouter
+from src.services import registry
 import src.config as Config
 import json
 import time
 from src.services.cost_tracker import CostTracker
+from src.services.budgets import SharedBudgets
+from src.services.state.base import create_state
+from src.services.router.route_cache import RouteCache
+from src.services.admission import AdmissionController, AdmissionRejected, Slot
+from src.services.scheduler import ContentScheduler, ROUTER_LANE
+from src.services.circuit_breaker import CircuitBreakerRegistry, CircuitOpenError
+from src.services.deadline import Deadline, DeadlineExceeded, check_deadline, within
+from src.services.stream_buffer import StreamBuffer, StreamRecord, parse_last_event_id
+from src.services.events import HEARTBEAT, decode, encode, listen_progress, sse_frame
+from src.services.multiplex import Multiplexer, StreamRejected
+from src.services.media_store import MediaStore, media_response
+from src.services.speculation import ResearchSpeculator, Speculation
+from src.services.research.sectioned import SectionRunner, research_calls, section_calls
+from src.services.tracing import Tracer, annotate, current_trace, span, waterfall
+from src.services.profiler import SamplingProfiler, is_admin_token, profile_process, should_profile, start_request_profile
+from src.services.song.callbacks import song_callbacks
 
-# Initialize the cost tracker
-cost_tracker = CostTracker()
+# Initialize the state shared with other nodes: in-process by default, Redis for multi-node deployments
+shared_state = create_state()
+
+# Initialize the cost tracker; with shared state, budgets are enforced across nodes
+cost_tracker = CostTracker(budgets=SharedBudgets(shared_state) if shared_state.shared else None)
+
+# Initialize the optional routing cache, which reuses routing decisions for repeated prompts
+route_cache = RouteCache(shared_state) if Config.ROUTE_CACHE_ENABLED else None
+
+# Job state is written by one thread, so updates reach the backend in order without blocking the event loop.
+# The thread runs from startup to shutdown; outside of them, job state is written directly
+job_writer: Optional[ThreadPoolExecutor] = None
+
+# Initialize per-provider admission control
+admission_controller = AdmissionController()
+
+# Initialize the scheduler that runs blocking provider calls in per-type bulkheads
+scheduler = ContentScheduler()
+
+# Initialize per-provider circuit breakers
+circuit_breakers = CircuitBreakerRegistry()
+
+# Initialize the buffer of recent SSE streams that clients can resume
+stream_buffer = StreamBuffer()
+
+# Initialize the local store that serves generated images and songs instead of provider URLs
+media_store = MediaStore() if Config.MEDIA_STORE_ENABLED else None
+
+# Initialize optional speculative research, which overlaps routing and research generation
+speculator = ResearchSpeculator() if Config.SPECULATION_ENABLED else None
+
+# Initialize the tracer that samples requests and records their stage timings
+tracer = Tracer()
+
+# Initialize the optional near-duplicate research cache (imports NumPy only when enabled)
+research_cache = (
+    registry.import_string("src.services.research.semantic_cache:SemanticResearchCache")()
+    if Config.RESEARCH_CACHE_ENABLED else None
+)
 
 # Create logs directory if it doesn't exist
 log_dir = Path("logs")
@@ -31,77 +93,744 @@ logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
+# Providers are imported on first use unless preloading is configured
+if Config.PRELOAD_PROVIDERS:
+    registry.preload()
+
+# Router shared across requests so concurrent prompts can be batched together
+_router = None
+
+def get_router() -> RouterBase:
+    """Create the router for the configured mode on first use and reuse it afterwards."""
+    global _router
+    if _router is None:
+        router = registry.create_router()
+        if Config.ROUTER_BATCHING_ENABLED:
+            router = BatchingRouter(router)
+        _router = router
+    return _router
+
 class ContentRequest(BaseModel):
     """Request model for content generation."""
     prompt: str
+    client_id: Optional[str] = None  # Optional fairness key, so one heavy client cannot starve others
+    user_id: Optional[str] = None  # Optional caller identity, charged against per-user budgets
+    tenant_id: Optional[str] = None  # Optional organization, charged against per-tenant budgets
+    timeout_seconds: Optional[float] = None  # Optional deadline, like the X-Request-Timeout header
+
+def record_job(request_id: str, **fields):
+    """Merge fields into a request's job state in the background, so any node can answer /jobs for it."""
+    def write():
+        try:
+            shared_state.update_job(request_id, fields, Config.JOB_STATE_TTL_SECONDS)
+        except Exception as e:
+            logger.warning(f"Request {request_id} - Could not update job state: {e}")
+    writer = job_writer
+    if writer is not None:
+        try:
+            writer.submit(write)
+            return
+        except RuntimeError:
+            # The writer shut down in the meantime
+            pass
+    write()
+
+def job_fields(event: str, data: Dict) -> Optional[Dict]:
+    """Job state changes of a stream event; chunks and progress are left to the stream itself."""
+    if event == "routed":
+        return {"status": "running", "content_type": data["content_type"], "provider": data["provider"]}
+    if event == "queued":
+        return {"status": "queued", "provider": data["provider"]}
+    if event == "result":
+        return {"result": {"type": data["type"], "content": data["content"]}}
+    if event == "done":
+        return {"status": "done"}
+    if event == "error":
+        return {"status": "cancelled" if data["status"] == 499 else "error", "error": data["detail"]}
+    return None
+
+def admitted_call(provider: str, func, *args):
+    """Run a provider call through its circuit breaker inside an admission slot, blocking while queued."""
+    check_deadline()
+    circuit_breakers.raise_if_open(provider)
+    slot = admission_controller.acquire(provider)
+    try:
+        slot.start()
+        result = circuit_breakers.call(provider, func, *args)
+        slot.record()
+        return result
+    except Exception as e:
+        slot.record(e)
+        raise
+    finally:
+        slot.release()
+
+def section_admission(provider: str) -> Callable[[], Optional[SectionRunner]]:
+    """
+    Admit a sectioned paper's section calls to its provider. A section gets its own slot and
+    circuit breaker call if the provider has room right now; otherwise it is written within
+    the request's own slot, so papers never wait on slots that other papers hold.
+    """
+    def admit() -> Optional[SectionRunner]:
+        try:
+            circuit_breakers.raise_if_open(provider)
+        except CircuitOpenError:
+            return None
+        slot = admission_controller.try_acquire(provider)
+        if slot is None:
+            return None
+
+        def run(func: Callable, *args) -> Iterator[str]:
+            try:
+                slot.start()
+                for chunk in circuit_breakers.stream(provider, func, *args):
+                    # The adaptive limit learns from the time to the first chunk
+                    slot.record()
+                    yield chunk
+                slot.record()
+            except Exception as e:
+                slot.record(e)
+                raise
+            finally:
+                slot.release()
+        return run
+    return admit
+
+def refund_unused_sections(record_id: str, price: float, unused: int):
+    """Refund the share of a sectioned paper's charge paid for sections its outline left out."""
+    cost_tracker.refund(record_id, "unused sections", amount=price * unused / research_calls())
+
+async def start_speculation(router: RouterBase, request: ContentRequest,
+                            settle: Callable[[int], None]) -> Optional[Speculation]:
+    """
+    Start research generation before routing finishes, if the research provider has spare capacity
+    and the request's budgets can pay for it. Its price is charged up front, so a miss stays in the
+    ledger; a hit takes the charge over as the request's own.
+    The speculation holds its own admission slot and releases it when it ends or is cancelled;
+    settle learns of sections its outline leaves out, as section_calls() describes.
+    """
+    prompt = request.prompt
+    generator = router.create_generator(ContentType.TEXT)
+    if research_cache:
+        generator = research_cache.wrap(generator, prompt)
+    provider = generator.provider
+    circuit_breakers.raise_if_open(provider)
+    with span("speculation.start", provider=provider) as current:
+        slot = admission_controller.try_acquire(provider)
+        if current:
+            current.set(started=slot is not None)
+    if slot is None:
+        return None
+    try:
+        # Shared budgets are a network round trip, kept off the event loop
+        charge = partial(charge_request, [(provider, generator.get_price())], request)
+        record_id = await run_in_threadpool(charge) if shared_state.shared else charge()
+    except ValueError:
+        # Over a budget: the request is refused or served normally once routed, never speculated for
+        slot.release()
+        return None
+
+    def call(prompt: str):
+        slot.start()
+        with section_calls(section_admission(provider), settle):
+            yield from generator.generate_content(prompt)
+
+    async def source():
+        try:
+            async for chunk in scheduler.stream(ContentType.TEXT.value, circuit_breakers.stream, provider,
+                                                call, prompt, client_key=request.client_id):
+                # The adaptive limit learns from the time to the first chunk
+                slot.record()
+                yield chunk
+            slot.record()
+        except Exception as e:
+            slot.record(e)
+            raise
+        finally:
+            slot.release()
+
+    speculator.started()
+    return Speculation(generator, source(), record_id)
+
+def started_call(generator: ContentGeneratorBase, started: threading.Event, slot: Optional[Slot] = None) -> Callable:
+    """
+    Wrap a generator's generate_content to record whether the provider was ever reached,
+    and when, so the slot's latency leaves out queueing and bookkeeping.
+    """
+    def call(prompt: str):
+        generator.cancel_token.raise_if_cancelled()
+        # The call may have waited in its lane's queue
+        check_deadline("generation")
+        started.set()
+        if slot:
+            slot.start()
+        return generator.generate_content(prompt)
+    return call
+
+def charge_request(charges, request: ContentRequest) -> str:
+    """Track (name, price) charges in order for a request; returns the id of the last record."""
+    record_id = None
+    for name, price in charges:
+        record_id = cost_tracker.track_cost(name, price, request.prompt, user_id=request.user_id, tenant_id=request.tenant_id)
+    return record_id
+
+def refund_cancelled(record_id: str, started: bool, request_id: str):
+    """Refund a cancelled request's generation charge as allowed by Config.CANCEL_REFUND_POLICY."""
+    policy = Config.CANCEL_REFUND_POLICY
+    if policy == "always" or (policy == "unstarted" and not started):
+        cost_tracker.refund(record_id)
+        logger.info(f"Request {request_id} - Generation cost refunded ({policy} policy)")
+
+async def watch_disconnect(http_request: Request, on_disconnect: Callable[[], None]):
+    """Call on_disconnect once the client of a non-streaming request goes away."""
+    while not await http_request.is_disconnected():
+        await asyncio.sleep(Config.DISCONNECT_POLL_SECONDS)
+    on_disconnect()
+
+def legacy_frame(stream_id: str, seq: int, frame: str) -> Optional[str]:
+    """
+    Frame an event the way streams looked before the event protocol: text chunks and errors
+    as bare data lines, and nothing for the other events.
+    """
+    event, data = decode(frame)
+    if event == "chunk":
+        payload = {"type": data["type"], "content": data["content"]}
+    elif event == "error" and data["status"] != 499:
+        # Nobody is left to tell about a cancellation
+        payload = {"error": data["detail"]}
+    else:
+        return None
+    return f"id: {stream_id}:{seq}\ndata: {json.dumps(payload)}\n\n"
+
+def sse_response(record: StreamRecord, after: int = -1, legacy: bool = False) -> StreamingResponse:
+    """
+    Stream a buffered stream's events from after a sequence number, each with a resumable id, plus heartbeats.
+    Legacy clients, which did not ask for events, get only the text chunks and errors, as they used to.
+    """
+    # The trace stays open until this reader has received the stream
+    trace = current_trace()
+    if trace:
+        trace.retain()
+
+    async def frames():
+        start = time.perf_counter()
+        events = 0
+        try:
+            async for seq, frame in record.follow(after, heartbeat=Config.SSE_HEARTBEAT_SECONDS):
+                if seq is None:
+                    # Comment lines keep proxies from dropping a connection that is waiting on a slow provider
+                    yield HEARTBEAT
+                    continue
+                events += 1
+                if not legacy:
+                    yield sse_frame(record.stream_id, seq, frame)
+                else:
+                    framed = legacy_frame(record.stream_id, seq, frame)
+                    if framed:
+                        yield framed
+        finally:
+            if trace:
+                trace.record("sse.deliver", start, events=events)
+                trace.release()
+
+    return StreamingResponse(frames(), media_type="text/event-stream", headers={"X-Request-ID": record.stream_id})
+
+def finish_profile(profiler: SamplingProfiler):
+    """Stop a request's profiler and write its profile under Config.PROFILE_DIR."""
+    path = profiler.stop().write()
+    logger.info(f"Request {profiler.name} - Profile written to {path}")
+
+def resume_stream(last_event_id: str, legacy: bool = False) -> StreamingResponse:
+    """
+    Resume a buffered stream after the event a client last received.
+
+    Raises:
+        HTTPException: 400 for a malformed id, 404 if the stream is no longer buffered
+    """
+    try:
+        stream_id, seq = parse_last_event_id(last_event_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    record = stream_buffer.get(stream_id)
+    if not record:
+        raise HTTPException(status_code=404, detail="Stream expired or unknown")
+    logger.info(f"Request {stream_id} resumed after event {seq}")
+    return sse_response(record, seq, legacy)
+
+def request_deadline(request: ContentRequest, header: Optional[str]) -> Deadline:
+    """
+    Start a request's deadline from the timeout header, or the request field, or the defaults.
+
+    Raises:
+        HTTPException: 400 for a timeout that is not a positive number of seconds
+    """
+    requested = request.timeout_seconds
+    if header is not None:
+        try:
+            requested = float(header)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"{Config.DEADLINE_HEADER} must be a number of seconds")
+    if requested is not None and not requested > 0:
+        raise HTTPException(status_code=400, detail="Timeout must be a positive number of seconds")
+    return Deadline(requested)
 
 @app.post("/generate_content")
-async def generate_content(request: ContentRequest):
-    request_id = int(time.time() * 1000)
+async def generate_content(request: ContentRequest, http_request: Request, last_event_id: Optional[str] = Header(None),
+                           accept: Optional[str] = Header(None), x_profile: Optional[str] = Header(None),
+                           profile: Optional[str] = None,
+                           request_timeout: Optional[str] = Header(None, alias=Config.DEADLINE_HEADER)):
+    wants_events = "text/event-stream" in (accept or "")
+    # A reconnecting client resumes its buffered stream instead of paying for a new generation
+    if last_event_id:
+        return resume_stream(last_event_id, legacy=not wants_events)
+
+    # The deadline runs from here, so time spent routing and queueing counts against it
+    deadline = request_deadline(request, request_timeout)
+
+    try:
+        profiled = should_profile(x_profile or profile)
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+
+    # The request id doubles as the trace id, so a slow trace can be matched to its logs
+    request_id = uuid.uuid4().hex
+    root = tracer.start_trace(request_id, "generate_content", force=profiled, prompt_length=len(request.prompt))
+    if profiled:
+        # The profile ends with the trace, so a stream is profiled until it has been delivered
+        profiler = start_request_profile(request_id)
+        root.trace.on_finish(lambda: finish_profile(profiler))
+        annotate(profiled=True)
+    try:
+        return await handle_generation(request_id, request, http_request, wants_events, deadline)
+    finally:
+        if root:
+            root.end = time.perf_counter()
+            root.trace.release()
+
+async def handle_generation(request_id: str, request: ContentRequest, http_request: Request, wants_events: bool,
+                            deadline: Deadline):
+    """
+    Start generating a new request into the stream buffer. Clients that accept text/event-stream get
+    the event stream straight away; others get the legacy response once the outcome is known.
+    """
+    record = start_generation(request_id, request, deadline)
+    if wants_events:
+        return sse_response(record)
+    return await legacy_response(record, http_request)
+
+def start_generation(request_id: str, request: ContentRequest, deadline: Deadline) -> StreamRecord:
+    """Open a request's stream and start generating into it, independently of whoever reads it."""
     logger.info(f"Request {request_id} received - Prompt: {request.prompt}")
+    record = stream_buffer.open(request_id)
+    # The node is recorded so clients reaching another node know where the stream can be resumed
+    record_job(request_id, status="routing", node=socket.gethostname(), created=time.time())
 
+    def cancel_if_abandoned():
+        if record.readers or record.done:
+            return
+        logger.info(f"Request {request_id} - Client did not come back, cancelling generation")
+        record.producer.cancel()
+
+    # Give a disconnected client time to resume before its generation is cancelled
+    loop = asyncio.get_running_loop()
+    record.on_abandoned = lambda: loop.call_later(Config.CANCEL_GRACE_SECONDS, cancel_if_abandoned)
+
+    # The trace stays open until the request has been generated
+    trace = current_trace()
+    if trace:
+        trace.retain()
+
+    # Generation runs independently of the connection and writes to the stream buffer,
+    # so a client that drops can reconnect and pick up where it stopped
+    # The task inherits the deadline, and so do the scheduler workers and threads it hands work to
+    with within(deadline):
+        record.producer = asyncio.create_task(run_generation(request_id, request, record, deadline))
+    return record
+
+async def legacy_response(record: StreamRecord, http_request: Request) -> Response:
+    """
+    Answer a client that did not ask for events: stream research as SSE, return images and
+    songs as JSON, and turn error events into HTTP status codes.
+    """
+    def cancel():
+        logger.info(f"Request {record.stream_id} - Client disconnected, cancelling generation")
+        record.producer.cancel()
+
+    watcher = asyncio.create_task(watch_disconnect(http_request, cancel))
+    events = record.follow()
+    try:
+        async for _, frame in events:
+            event, data = decode(frame)
+            if event == "routed" and data["streaming"]:
+                return sse_response(record, legacy=True)
+            if event == "result":
+                return JSONResponse({"type": data["type"], "content": data["content"]})
+            if event == "error":
+                headers = {"Retry-After": str(data["retry_after"])} if "retry_after" in data else None
+                raise HTTPException(status_code=data["status"], detail=data["detail"], headers=headers)
+        raise HTTPException(status_code=500, detail="Generation ended without a result")
+    finally:
+        watcher.cancel()
+        await events.aclose()
+
+async def run_generation(request_id: str, request: ContentRequest, record: StreamRecord, deadline: Deadline):
+    """
+    Route, admit, charge and generate a request, writing its events to the stream buffer.
+    The request is cancelled when its deadline passes, wherever it is waiting, and the error
+    event names the stage that ran out of time.
+    """
+    def emit(event: str, **data):
+        record.append(encode(event, **data))
+        fields = job_fields(event, data)
+        if fields:
+            record_job(request_id, **fields)
+
+    loop = asyncio.get_running_loop()
+
+    def on_progress(stage: str, fields: Dict):
+        # Reported from worker threads, while the stream buffer belongs to the event loop
+        loop.call_soon_threadsafe(lambda: record.done or emit("progress", stage=stage, **fields))
+
+    generator = None
+    speculation = None
+    slot = None
+    generation_record_id = None
+    # Charge of a confirmed speculation, which stands for the generation's own
+    reserved = None
+    started = threading.Event()
+    # A sectioned paper is charged for every section asked for, and refunded for those its outline
+    # leaves out; a speculative paper may be outlined before the request is charged
+    billing = threading.Lock()
+    unused_sections = 0
+
+    def settle_sections(unused: int):
+        nonlocal unused_sections
+        with billing:
+            record_id = generation_record_id
+            if not record_id:
+                unused_sections += unused
+        if record_id:
+            refund_unused_sections(record_id, generator.get_price(), unused)
+
+    expiry = loop.call_later(deadline.remaining(), asyncio.current_task().cancel)
     try:
-        # Initialize router based on mode
-        router = MockRouter() if Config.MODE.lower() == "dev" else OpenAIRouter()
+        # Get router based on mode
+        router = get_router()
 
-        # Get generator and track cost
-        generator = router.route(request.prompt)
+        # Start generating research early if the prompt looks like research
+        if speculator and speculator.predicts_research(request.prompt):
+            try:
+                speculation = await start_speculation(router, request, settle_sections)
+            except Exception as e:
+                logger.warning(f"Request {request_id} - Could not start speculative research: {e}")
 
+        # Get generator on the router lane so batched routing can collect other requests
+        route_call = partial(admitted_call, router.__class__.__name__, router.route)
+        cached_route = False
         try:
-            cost_tracker.track_cost(
-                router.__class__.__name__,
-                router.get_price(),
-                request.prompt
-            )
-
-            cost_tracker.track_cost(
-                generator.__class__.__name__,
-                generator.get_price(),
-                request.prompt
-            )
-        except ValueError as e:
-            raise HTTPException(status_code=402, detail=str(e))
-
-        # Generate content
-        if generator.supports_streaming():
-
-            def stream_generator():
+            with span("route", router=router.__class__.__name__) as current:
+                if route_cache:
+                    generator, cached_route = await scheduler.run(
+                        ROUTER_LANE, route_cache.route, router, request.prompt, route_call,
+                        client_key=request.client_id
+                    )
+                    if current:
+                        current.set(cached=cached_route)
+                else:
+                    generator = await scheduler.run(ROUTER_LANE, route_call, request.prompt, client_key=request.client_id)
+        except BaseException:
+            if speculation:
+                speculator.miss(speculation)
+                speculation = None
+            raise
+        lane = generator.content_type.value if generator.content_type else "default"
+        annotate(content_type=lane, provider=generator.provider)
+
+        # Now that the content type is known, its default and maximum deadline apply
+        deadline.resolve(lane)
+        expiry.cancel()
+        expiry = loop.call_later(deadline.remaining(), asyncio.current_task().cancel)
+        deadline.enter("queueing")
+
+        # A speculation that already failed without output is discarded and research is started normally
+        if speculation and generator.content_type == ContentType.TEXT and not (speculation.error and not speculation.chunks):
+            # Routing confirmed research: continue the speculative stream, which already holds a slot
+            speculator.hit(speculation)
+            logger.info(f"Request {request_id} - Speculation hit, {len(speculation.chunks)} chunks ready")
+            generator = speculation.generator
+            reserved = speculation.record_id
+            slot = Slot()
+            started.set()
+            annotate(speculation="hit")
+        else:
+            if speculation:
+                speculator.miss(speculation)
+                logger.info(f"Request {request_id} - Speculation miss, routed to {lane}")
+                speculation = None
+
+            # Replay a stored paper for near-duplicate research prompts
+            if research_cache and generator.content_type == ContentType.TEXT:
+                generator = research_cache.wrap(generator, request.prompt)
+
+        emit("routed", content_type=lane, provider=generator.provider, streaming=generator.supports_streaming())
+
+        # A pooled generator whose backend fails before any output moves on to another backend,
+        # which is then admitted, charged and guarded by its circuit breaker under its own name
+        chunk_count = 0
+        generator_attempts = 0
+        while True:
+            provider = generator.provider
+            try:
+                if slot is None:
+                    # Fail fast and wait for a generation slot before charging, so unhealthy or overloaded providers reject for free
+                    circuit_breakers.raise_if_open(provider)
+                    slot = admission_controller.try_acquire(provider)
+                    if slot is None:
+                        emit("queued", provider=provider, ahead=admission_controller.get_stats().get(provider, {}).get("queued", 0))
+                        with span("admission", provider=provider):
+                            slot = await run_in_threadpool(admission_controller.acquire, provider)
+
                 try:
-                    chunk_count = 0
-                    start_time = time.time()
+                    with span("cost_tracker.track"):
+                        charges = [] if reserved else [(generator.provider, generator.get_price())]
+                        if not cached_route and not generator_attempts:
+                            # A cached route never reached the router, so there is nothing to pay for it
+                            charges.insert(0, (router.__class__.__name__, router.get_price()))
+                        # Shared budgets are a network round trip, kept off the event loop
+                        charge = partial(charge_request, charges, request)
+                        charged = await run_in_threadpool(charge) if shared_state.shared else charge()
+                        charged, reserved = reserved or charged, None
+                    with billing:
+                        generation_record_id = charged
+                        unused, unused_sections = unused_sections, 0
+                    if unused:
+                        refund = partial(refund_unused_sections, charged, generator.get_price(), unused)
+                        await run_in_threadpool(refund) if shared_state.shared else refund()
+                except ValueError as e:
+                    raise HTTPException(status_code=402, detail=str(e))
 
-                    for chunk in generator.generate_content(request.prompt):
-                        logger.debug(f"chunk: {chunk}")
-                        chunk_count += 1
-                        if chunk_count % 100 == 0:  # Log every 100 chunks
-                            logger.debug(f"Request {request_id} - Streamed {chunk_count} chunks")
+                # Generate content, passing provider progress such as poll statuses on to the client
+                deadline.enter("generation")
+                with listen_progress(on_progress), section_calls(section_admission(provider), settle_sections):
+                    if generator.supports_streaming():
+                        start_time = time.time()
 
-                        yield f"data: {json.dumps({'type': 'text', 'content': chunk})}\n\n"
+                        chunks = speculation.follow() if speculation else scheduler.stream(
+                            lane, circuit_breakers.stream, provider, started_call(generator, started, slot), request.prompt,
+                            client_key=request.client_id
+                        )
+                        with span("generate", provider=provider, streaming=True) as current:
+                            async for chunk in chunks:
+                                logger.debug(f"chunk: {chunk}")
+                                chunk_count += 1
+                                if chunk_count == 1:
+                                    # The adaptive limit learns from the time to the first chunk
+                                    slot.record()
+                                    if current:
+                                        current.set(first_chunk_ms=round((time.time() - start_time) * 1000, 1))
+                                if chunk_count % 100 == 0:  # Log every 100 chunks
+                                    logger.debug(f"Request {request_id} - Streamed {chunk_count} chunks")
 
-                    duration = time.time() - start_time
-                    logger.info(f"Request {request_id} - Streaming completed. Total chunks: {chunk_count}, Duration: {duration:.2f}s")
+                                emit("chunk", type="text", content=chunk)
+                            if current:
+                                current.set(chunks=chunk_count)
+                        # A stream without chunks is recorded once it ends
+                        slot.record()
 
-                except Exception as e:
-                    error_msg = str(e)
-                    logger.error(f"Request {request_id} - Streaming error: {error_msg}")
-                    yield f"data: {json.dumps({'error': error_msg})}\n\n"
+                        duration = time.time() - start_time
+                        logger.info(f"Request {request_id} - Streaming completed. Total chunks: {chunk_count}, Duration: {duration:.2f}s")
+                    else:
+                        with span("generate", provider=provider, streaming=False):
+                            content_type, content = await scheduler.run(
+                                lane, circuit_breakers.call, provider, started_call(generator, started, slot), request.prompt,
+                                client_key=request.client_id
+                            )
+                        slot.record()
 
-            return StreamingResponse(
-                stream_generator(),
-                media_type="text/event-stream"
-            )
-        else:
-            content_type, content = generator.generate_content(request.prompt)
-            return JSONResponse({
-                "type": content_type.value,
-                "content": content
-            })
+                        # Provider URLs expire, so hand out the local copy if it is stored in time
+                        if media_store and content_type in (ContentType.IMAGE, ContentType.SONG):
+                            with span("media_store.resolve"):
+                                content = await run_in_threadpool(media_store.resolve, content)
+
+                        emit("result", type=content_type.value, content=content)
 
+                break
+            except (GenerationError, AdmissionRejected, CircuitOpenError) as e:
+                if chunk_count or isinstance(e, (GenerationCancelled, DeadlineExceeded)) or not generator.fail_over(e):
+                    raise
+                if slot:
+                    slot.record(e)
+                    slot.release()
+                    slot = None
+                if speculation:
+                    if not speculation.done:
+                        speculation.cancel()
+                    speculation = None
+                if generation_record_id:
+                    # The request pays for the backend that serves it, not the one that failed
+                    refund = partial(cost_tracker.refund, generation_record_id, "failover")
+                    await run_in_threadpool(refund) if shared_state.shared else refund()
+                    generation_record_id = None
+                unused_sections = 0
+                started.clear()
+                generator_attempts += 1
+                emit("progress", stage="failover", status=f"{provider} failed, trying {generator.provider}")
+                deadline.enter("queueing")
+
+        emit("done")
+
+    except (asyncio.CancelledError, GenerationCancelled, DeadlineExceeded) as e:
+        # Expiry cancels the task, or a stage gives up on its own when the deadline cannot be met
+        exceeded = e if isinstance(e, DeadlineExceeded) else deadline.exceeded() if deadline.expired else None
+        if exceeded:
+            logger.warning(f"Request {request_id} - {exceeded}")
+        else:
+            logger.info(f"Request {request_id} - Generation cancelled")
+        if generator:
+            generator.cancel()
+        if generation_record_id:
+            refund_cancelled(generation_record_id, started.is_set(), request_id)
+        elif reserved or speculation:
+            # A speculation still to be decided, or confirmed but not yet billed, counts as started
+            refund_cancelled(reserved or speculation.record_id, True, request_id)
+        if exceeded:
+            emit("error", status=504, detail=str(exceeded), stage=exceeded.stage)
+        else:
+            emit("error", status=499, detail="Request cancelled")  # Client closed request
+    except AdmissionRejected as e:
+        logger.warning(f"Request {request_id} rejected: {e}")
+        emit("error", status=429, detail=str(e), retry_after=e.retry_after)
+    except CircuitOpenError as e:
+        logger.warning(f"Request {request_id} failed fast: {e}")
+        emit("error", status=503, detail=str(e), retry_after=e.retry_after)
     except HTTPException as e:
-        raise e
+        emit("error", status=e.status_code, detail=e.detail)
     except Exception as e:
-        logger.error(f"Error generating content: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        logger.error(f"Request {request_id} - Error generating content: {e}")
+        if slot:
+            # Rate limits and timeouts cut the provider's adaptive limit
+            slot.record(e)
+        emit("error", status=500, detail=str(e))
+    finally:
+        expiry.cancel()
+        if speculation and not speculation.done:
+            speculation.cancel()
+        if slot:
+            slot.release()
+        record.finish()
+        trace = current_trace()
+        if trace:
+            trace.release()
+
+@app.get("/streams/{request_id}")
+async def get_stream(request_id: str, last_event_id: Optional[str] = Header(None)):
+    """Replay a buffered stream from the start, or after Last-Event-ID, following it live if still running."""
+    return resume_stream(last_event_id or f"{request_id}:-1")
+
+def start_websocket_stream(message: Dict) -> StreamRecord:
+    """
+    Start a generation from a WebSocket start message, traced like a POST /generate_content.
+
+    Raises:
+        StreamRejected: 400 for an invalid request or timeout
+    """
+    try:
+        request = ContentRequest(**{name: value for name, value in message.items() if name not in ("type", "id")})
+        deadline = request_deadline(request, None)
+    except ValidationError as e:
+        raise StreamRejected(400, f"Invalid request: {e.errors()[0]['msg']}")
+    except HTTPException as e:
+        raise StreamRejected(e.status_code, e.detail)
+
+    def start():
+        request_id = uuid.uuid4().hex
+        root = tracer.start_trace(request_id, "websocket_generate", prompt_length=len(request.prompt))
+        try:
+            return start_generation(request_id, request, deadline)
+        finally:
+            if root:
+                root.end = time.perf_counter()
+                root.trace.release()
+
+    # Each stream gets its own copy of the connection's context, so its trace stays its own
+    return contextvars.copy_context().run(start)
+
+@app.websocket("/ws")
+async def generate_over_websocket(websocket: WebSocket):
+    """
+    Run many generations over one connection, each with its own id, cancellation and flow control.
+    The message protocol is described in src/services/multiplex.py.
+    """
+    await websocket.accept()
+    multiplexer = Multiplexer(websocket.send_text, start_websocket_stream, stream_buffer.get)
+    try:
+        await multiplexer.serve(websocket.receive_text)
+    except WebSocketDisconnect:
+        # Running streams are abandoned and can be resumed, over /streams or a new connection, within the grace period
+        logger.info(f"WebSocket closed with {len(multiplexer.channels)} streams running")
+
+@app.post("/callbacks/suno")
+async def receive_suno_callback(http_request: Request):
+    """
+    Receive a signed Suno status callback and complete the song request waiting for it.
+    Verified callbacks are acknowledged even when no request here waits for them, so Suno stops retrying.
+    """
+    body = await http_request.body()
+    if not song_callbacks.verify(body, http_request.headers.get(Config.SONG_CALLBACK_SIGNATURE_HEADER)):
+        raise HTTPException(status_code=401, detail="Invalid callback signature")
+    try:
+        data = json.loads(body)
+        work_id = data.get("workId") or data.get("work_id")
+    except (ValueError, AttributeError):
+        raise HTTPException(status_code=400, detail="Invalid callback payload")
+    if not work_id:
+        raise HTTPException(status_code=400, detail="Callback has no work ID")
+    return {"matched": song_callbacks.deliver(work_id, data)}
+
+@app.get("/callbacks/suno")
+async def get_suno_callback_stats():
+    """Get received, matched and rejected Suno callbacks and the jobs waiting for one."""
+    return song_callbacks.get_stats()
+
+@app.api_route("/media/{digest}", methods=["GET", "HEAD"])
+async def get_media(digest: str, range_header: Optional[str] = Header(None, alias="Range"),
+                    if_range: Optional[str] = Header(None), if_none_match: Optional[str] = Header(None)):
+    """Serve a stored image or song, with Range support and immutable caching headers."""
+    if not media_store:
+        raise HTTPException(status_code=404, detail="Media store is disabled")
+    return media_response(media_store, digest, range_header, if_range, if_none_match)
+
+@app.get("/costs/ledger")
+async def get_cost_ledger_stats():
+    """Get the cost ledger write mode, unwritten records and group-commit sizes."""
+    return cost_tracker.get_stats()
+
+@app.get("/costs/usage")
+async def get_principal_usage(kind: Optional[str] = None):
+    """Get current-window spend and budget of every user and tenant seen, biggest spenders first."""
+    return await run_in_threadpool(cost_tracker.budgets.get_usage, kind)
+
+@app.get("/costs/usage/{kind}/{principal_id}")
+async def get_principal_usage_by_id(kind: str, principal_id: str):
+    """Get current-window spend and budget of one user or tenant."""
+    if kind not in ("user", "tenant"):
+        raise HTTPException(status_code=404, detail="Unknown principal kind")
+    return await run_in_threadpool(cost_tracker.budgets.usage, (kind, principal_id))
+
+@app.get("/jobs/{request_id}")
+async def get_job(request_id: str):
+    """Get a request's status, content type, provider and result from the shared state, on any node."""
+    job = await run_in_threadpool(shared_state.get_job, request_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/state")
+async def get_shared_state_stats():
+    """Get the shared-state backend and routing cache statistics."""
+    stats = await run_in_threadpool(shared_state.get_stats)
+    stats["route_cache"] = route_cache.get_stats() if route_cache else None
+    return stats
 
 @app.get("/costs/{record_id}")
 async def get_cost_record(record_id: str):
@@ -122,11 +851,82 @@ async def delete_cost_record(record_id: str):
 @app.get("/costs")
 async def get_costs():
     """Get current costs status."""
-    return cost_tracker.get_costs()
+    return await run_in_threadpool(cost_tracker.get_costs)
+
+@app.get("/admission")
+async def get_admission_stats():
+    """Get per-provider concurrency, queue depth and rejection counts."""
+    return admission_controller.get_stats()
+
+@app.get("/research_cache")
+async def get_research_cache_stats():
+    """Get research cache size and hit rate."""
+    if not research_cache:
+        raise HTTPException(status_code=404, detail="Research cache is disabled")
+    return research_cache.get_stats()
+
+@app.get("/media")
+async def get_media_stats():
+    """Get the number of stored media assets and downloads in progress."""
+    if not media_store:
+        raise HTTPException(status_code=404, detail="Media store is disabled")
+    return media_store.get_stats()
+
+@app.get("/speculation")
+async def get_speculation_stats():
+    """Get speculative research hit rate and wasted spend."""
+    if not speculator:
+        raise HTTPException(status_code=404, detail="Speculation is disabled")
+    return speculator.get_stats()
+
+@app.get("/breakers")
+async def get_breaker_stats():
+    """Get per-provider circuit breaker state."""
+    return circuit_breakers.get_stats()
+
+@app.get("/debug/traces")
+async def get_traces(limit: int = 10, format: str = "text"):
+    """Get the slowest recent sampled requests as stage-by-stage waterfalls, or as JSON with format=json."""
+    traces = [trace.to_dict() for trace in tracer.slowest(limit)]
+    if format == "json":
+        return traces
+    return PlainTextResponse("\n\n".join(waterfall(trace) for trace in traces))
+
+@app.post("/debug/profile")
+async def profile_whole_process(seconds: float = 5.0, format: Optional[str] = None, x_profile: Optional[str] = Header(None)):
+    """
+    Profile every thread for a number of seconds and report event loop lag,
+    to catch blocking calls on the event loop. Requires the admin token in X-Profile.
+    """
+    if not is_admin_token(x_profile):
+        raise HTTPException(status_code=403, detail="Invalid profiling token")
+    if not 0 < seconds <= Config.PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be between 0 and {Config.PROFILE_MAX_SECONDS}")
+
+    result, loop_lag = await profile_process(seconds)
+    path = await run_in_threadpool(result.write, None, format)
+    return {
+        "profile": str(path),
+        "samples": result.sample_count,
+        "loop_lag": loop_lag,
+        "event_loop_top": result.top(10, thread=threading.current_thread().name)
+    }
+
+@app.get("/streams")
+async def get_stream_stats():
+    """Get the number of buffered and live streams."""
+    return stream_buffer.get_stats()
+
+@app.get("/scheduler")
+async def get_scheduler_stats():
+    """Get per-lane queue depth and worker usage."""
+    return scheduler.get_stats()
 
 @app.on_event("startup")
 async def startup_event():
-    """Log when the FastAPI service starts."""
+    """Start the job state writer and log when the FastAPI service starts."""
+    global job_writer
+    job_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job-state")
     logger.info("=" * 50)
     logger.info("FastAPI service starting up")
     logger.info(f"Mode: {Config.MODE}")
@@ -135,7 +935,13 @@ async def startup_event():
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    """Log when the FastAPI service shuts down."""
+    """Write cost records and job state still in memory and log when the FastAPI service shuts down."""
+    global job_writer
     logger.info("=" * 50)
     logger.info("FastAPI service shutting down")
+    await run_in_threadpool(cost_tracker.close)
+    writer, job_writer = job_writer, None
+    if writer:
+        writer.shutdown(wait=True)
+    shared_state.close()
     logger.info("=" * 50)
\ No newline at end of file
@@ -0,0 +1,161 @@
+import hashlib
+import hmac
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Optional
+from src.services.base import CancelToken, GenerationCancelled
+from src.services.clock import get_clock
+import src.config as Config
+
+class PendingSong:
+    """A submitted Suno job waiting for its completion callback."""
+
+    def __init__(self, work_id: str):
+        self.work_id = work_id
+        self._lock = threading.Lock()
+        self._updates = deque()
+        self._ready = threading.Event()
+
+    def put(self, data: Optional[Dict]):
+        """Queue a callback payload; None only wakes the waiter, e.g. on cancellation."""
+        with self._lock:
+            if data is not None:
+                self._updates.append(data)
+            self._ready.set()
+
+    def wait(self, timeout: float, cancel_token: CancelToken) -> Optional[Dict]:
+        """
+        Wait for the next callback for this job.
+
+        Args:
+            timeout (float): Longest time to wait in seconds
+            cancel_token (CancelToken): Token that wakes the wait when the request is cancelled
+
+        Returns:
+            Optional[Dict]: Callback payload, None if none arrived in time
+
+        Raises:
+            GenerationCancelled: If the token is cancelled before or during the wait
+        """
+        cancel_token.raise_if_cancelled()
+        get_clock().wait(self._ready, max(timeout, 0))
+        if cancel_token.cancelled:
+            raise GenerationCancelled("Generation cancelled")
+        with self._lock:
+            data = self._updates.popleft() if self._updates else None
+            if not self._updates:
+                self._ready.clear()
+        return data
+
+class SongCallbacks:
+    """
+    Receiver side of Suno completion callbacks.
+    Jobs are registered by work ID when submitted; verified callbacks are matched to them
+    and wake the waiting generator. Callbacks that arrive before their job is registered
+    (the provider can finish before the submit response is read) are held briefly.
+    Jobs are tracked per process, so with several workers a callback that reaches another
+    process is acknowledged but unmatched, and the job falls back to polling.
+    """
+
+    def __init__(self, secret: str = None, early_ttl: float = 60.0, max_early: int = 1000):
+        """
+        Args:
+            secret (str): Shared HMAC key callbacks are signed with, defaults to Config.SONG_CALLBACK_SECRET
+            early_ttl (float): Seconds an unmatched callback is held for a job not registered yet
+            max_early (int): Most unmatched callbacks held at once
+        """
+        self._secret = secret
+        self.early_ttl = early_ttl
+        self.max_early = max_early
+        self._lock = threading.Lock()
+        self._pending: Dict[str, PendingSong] = {}
+        self._early: "OrderedDict[str, tuple]" = OrderedDict()
+        self._stats = {"received": 0, "matched": 0, "unmatched": 0, "rejected": 0}
+
+    @property
+    def secret(self) -> Optional[str]:
+        return self._secret if self._secret is not None else Config.SONG_CALLBACK_SECRET
+
+    @property
+    def enabled(self) -> bool:
+        """Whether jobs should ask for callbacks: needs a public callback URL and a signing secret."""
+        return bool(Config.SONG_CALLBACK_URL and self.secret)
+
+    def sign(self, body: bytes) -> str:
+        """Hex HMAC-SHA256 of a callback body."""
+        return hmac.new(self.secret.encode(), body, hashlib.sha256).hexdigest()
+
+    def verify(self, body: bytes, signature: Optional[str]) -> bool:
+        """
+        Check a callback's signature header, with or without a "sha256=" prefix.
+
+        Args:
+            body (bytes): Raw request body
+            signature (Optional[str]): Value of the signature header
+
+        Returns:
+            bool: True if the body was signed with the shared secret
+        """
+        valid = bool(self.secret and signature) and hmac.compare_digest(
+            self.sign(body), signature[len("sha256="):] if signature.startswith("sha256=") else signature
+        )
+        if not valid:
+            with self._lock:
+                self._stats["rejected"] += 1
+        return valid
+
+    def register(self, work_id: str) -> PendingSong:
+        """Start waiting for callbacks for a submitted job, picking up any that arrived early."""
+        pending = PendingSong(work_id)
+        with self._lock:
+            self._pending[work_id] = pending
+            early = self._early.pop(work_id, None)
+        if early:
+            pending.put(early[1])
+        return pending
+
+    def forget(self, work_id: str):
+        """Stop waiting for a job's callbacks, once it has finished or been abandoned."""
+        with self._lock:
+            self._pending.pop(work_id, None)
+
+    def deliver(self, work_id: str, data: Dict) -> bool:
+        """
+        Hand a verified callback to the job waiting for it.
+
+        Args:
+            work_id (str): Work ID the callback is for
+            data (Dict): Callback payload, in the same shape as a feed poll response
+
+        Returns:
+            bool: True if a job in this process was waiting for it
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._stats["received"] += 1
+            pending = self._pending.get(work_id)
+            if pending is None:
+                # Drop expired early callbacks, then hold this one in case its job registers soon
+                while self._early and next(iter(self._early.values()))[0] < now - self.early_ttl:
+                    self._early.popitem(last=False)
+                if len(self._early) >= self.max_early:
+                    self._early.popitem(last=False)
+                self._early[work_id] = (now, data)
+                self._stats["unmatched"] += 1
+                return False
+            self._stats["matched"] += 1
+        pending.put(data)
+        return True
+
+    def get_stats(self) -> Dict:
+        """Get callback counts and the number of jobs waiting."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["waiting"] = len(self._pending)
+            stats["held"] = len(self._early)
+        stats["enabled"] = self.enabled
+        return stats
+
+# Shared by the generators, which register jobs, and the service, which receives the callbacks
+song_callbacks = SongCallbacks()
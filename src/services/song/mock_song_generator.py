@@ -1,24 +1,27 @@
 from typing import Tuple
-import random
-import time
 from src.services.base import ContentType, ContentGeneratorBase
+from src.services.events import report_progress
+from src.services.latency import LatencyModel, UniformLatency, mock_latency
 
 class MockSongGenerator(ContentGeneratorBase):
     """
     Mock song generator for testing purposes.
-    Simulates API behavior with random delays.
+    Simulates API behavior with delays drawn from a latency model.
     """
+    content_type = ContentType.SONG
 
-    def __init__(self, min_delay: int = 3, max_delay: int = 20):
+    def __init__(self, min_delay: float = None, max_delay: float = None, latency: LatencyModel = None):
         """
         Initialize mock generator with configurable delays.
 
         Args:
-            min_delay (int): Minimum processing delay in seconds
-            max_delay (int): Maximum processing delay in seconds
+            min_delay (float): Minimum processing delay in seconds, overrides the configured latency model
+            max_delay (float): Maximum processing delay in seconds, defaults to min_delay
+            latency (LatencyModel): Processing time model, defaults to the shared one for Config.MOCK_LATENCY['song']
         """
-        self.min_delay = min_delay
-        self.max_delay = max_delay
+        if latency is None and min_delay is not None:
+            latency = UniformLatency(min_delay, min_delay if max_delay is None else max_delay)
+        self.latency = latency or mock_latency(self.content_type.value)
 
     def generate_content(self, prompt: str) -> Tuple[ContentType, str]:
         """
@@ -30,7 +33,8 @@ class MockSongGenerator(ContentGeneratorBase):
         Returns:
             Tuple[ContentType, str]: Content type and URL of mock song
         """
-        time.sleep(random.randint(self.min_delay, self.max_delay))
+        report_progress("mock.song", status="processing")
+        self.cancel_token.sleep(self.latency.sample())
         return ContentType.SONG, "https://cdn1.suno.ai/db9539de-b621-42f5-9188-f83302a511b8.mp3"
 
     def get_price(self) -> float:
@@ -1,19 +1,26 @@
 import json
 import requests
-import time
-from typing import Tuple, Dict
+from typing import Optional, Tuple, Dict
 from src.services.base import ContentType, ContentGeneratorBase, GenerationError
+from src.services.circuit_breaker import retry_with_jitter
+from src.services.clock import get_clock
+from src.services.deadline import check_deadline, current_deadline, time_left
+from src.services.events import report_progress
+from src.services.song.callbacks import PendingSong, song_callbacks
+from src.services.tracing import span
 import src.config  as Config
 
 class SunoSongGenerator(ContentGeneratorBase):
     """
     Song generator using the Suno API service.
-    Handles song generation requests and polling for completion.
+    Handles song generation requests and waits for completion, by callback when
+    SONG_CALLBACK_URL is configured, with polling as the fallback.
     """
+    content_type = ContentType.SONG
 
     def _generate_song_request(self, prompt: str) -> str:
         """
-        Initiate a song generation request.
+        Initiate a song generation request, asking for a completion callback if enabled.
 
         Args:
             prompt (str): Description of the song to generate
@@ -30,33 +37,110 @@ class SunoSongGenerator(ContentGeneratorBase):
                 "model": Config.SONG_GENERATION_MODEL,
                 "token": Config.SONG_GENERATION_TOKEN
             }
+            if song_callbacks.enabled:
+                payload["callback_url"] = Config.SONG_CALLBACK_URL
 
             headers = {"Content-Type": "application/json"}
 
-            response = requests.post(
-                Config.SONG_GENERATION_URL,
-                headers=headers,
-                data=json.dumps(payload),
-                verify=False,
-                timeout=30  # Add timeout to prevent hanging
-            )
+            with span("suno.submit"):
+                response = requests.post(
+                    Config.SONG_GENERATION_URL,
+                    headers=headers,
+                    data=json.dumps(payload),
+                    verify=False,
+                    timeout=time_left(Config.SONG_SUBMIT_TIMEOUT_SECONDS, "generation")
+                )
 
             response.raise_for_status()  # Raise exception for bad status codes
 
             work_id = response.json().get("workId")
             if not work_id:
                 raise GenerationError("No work ID received from API")
+            report_progress("suno.submit", status="submitted")
 
             return work_id
 
         except requests.RequestException as e:
+            check_deadline("generation")
             raise GenerationError(f"Failed to initiate song generation: {str(e)}")
         except json.JSONDecodeError as e:
             raise GenerationError(f"Invalid API response format: {str(e)}")
 
+    def _poll_status(self, url: str) -> Dict:
+        """
+        Fetch the current generation status.
+        Polling is idempotent, so connection errors and timeouts are retried with jitter.
+
+        Args:
+            url (str): Feed URL for the work ID
+
+        Returns:
+            Dict: Parsed status response
+        """
+        def poll():
+            response = requests.get(url, verify=False, timeout=time_left(Config.SONG_POLL_TIMEOUT_SECONDS, "polling"))
+            response.raise_for_status()
+            return response.json()
+
+        return retry_with_jitter(poll, retry_on=(requests.ConnectionError, requests.Timeout))
+
+    def _check_status(self, data: Dict) -> Optional[str]:
+        """
+        Interpret a feed poll response or callback payload.
+
+        Args:
+            data (Dict): Status payload from the provider
+
+        Returns:
+            Optional[str]: URL of the generated audio, None while still generating
+
+        Raises:
+            GenerationError: If the generation failed or completed without audio
+        """
+        status = data.get("type")
+        if status == "complete":
+            audio_url = data.get("response_data")[0]['audio_url']
+            if not audio_url:
+                raise GenerationError("No audio URL in complete response")
+            return audio_url
+        elif status == "failed":
+            raise GenerationError(f"Song generation failed: {data.get('error', 'Unknown error')}")
+        return None
+
+    def _wait_for_callback(self, pending: PendingSong, seconds: float) -> Optional[str]:
+        """
+        Wait for callbacks for up to a number of seconds.
+
+        Args:
+            pending (PendingSong): Registered job
+            seconds (float): Longest time to wait
+
+        Returns:
+            Optional[str]: URL of the generated audio, None if no callback completed the job in time
+
+        Raises:
+            GenerationError: If a callback reports a failure
+            GenerationCancelled: If the generation is cancelled
+        """
+        clock = get_clock()
+        deadline = clock.now() + seconds
+        while True:
+            data = pending.wait(deadline - clock.now(), self.cancel_token)
+            if data is None:
+                return None
+            report_progress("suno.callback", status=data.get("type"))
+            audio_url = self._check_status(data)
+            if audio_url:
+                return audio_url
+
     def _feed_song_generation(self, work_id: str, max_attempts: int = 60) -> str:
         """
-        Poll for song generation completion.
+        Wait for song generation completion.
+        With callbacks enabled the job completes as soon as its callback arrives, and the
+        feed is only polled, every SONG_FALLBACK_POLL_SECONDS, once the callback is overdue.
+        Otherwise the feed is polled every second. Waits and polls only use the time left
+        before the request's deadline, and polling gives up as soon as the next poll would
+        come too late.
 
         Args:
             work_id (str): Work ID to track
@@ -67,35 +151,61 @@ class SunoSongGenerator(ContentGeneratorBase):
 
         Raises:
             GenerationError: If polling fails or times out
+            GenerationCancelled: If the generation is cancelled
+            DeadlineExceeded: If the request's deadline passes or cannot be met
         """
+        deadline = current_deadline()
+        pending = song_callbacks.register(work_id) if song_callbacks.enabled else None
         try:
+            if pending:
+                # Cancelling wakes the wait straight away
+                self.cancel_token.on_cancel(lambda: pending.put(None))
+                with span("suno.callback_wait") as current:
+                    audio_url = self._wait_for_callback(pending, time_left(Config.SONG_CALLBACK_TIMEOUT_SECONDS, "polling"))
+                    if current:
+                        current.set(received=audio_url is not None)
+                if audio_url:
+                    return audio_url
+
             url = Config.SONG_FEED_URL + work_id
+            interval = Config.SONG_FALLBACK_POLL_SECONDS if pending else 1
             attempts = 0
 
             while attempts < max_attempts:
-                response = requests.get(url, verify=False, timeout=10)
-                response.raise_for_status()
-
-                data = response.json()
-                status = data.get("type")
-
-                if status == "complete":
-                    audio_url = data.get("response_data")[0]['audio_url']
-                    if not audio_url:
-                        raise GenerationError("No audio URL in complete response")
+                with span("suno.poll", attempt=attempts + 1) as current:
+                    data = self._poll_status(url)
+                    status = data.get("type")
+                    if current:
+                        current.set(status=status)
+                report_progress("suno.poll", status=status, attempt=attempts + 1)
+
+                audio_url = self._check_status(data)
+                if audio_url:
                     return audio_url
-                elif status == "failed":
-                    raise GenerationError(f"Song generation failed: {data.get('error', 'Unknown error')}")
 
                 attempts += 1
-                time.sleep(1)
-
-            raise GenerationError(f"Song generation timed out after {max_attempts} seconds")
+                if pending:
+                    # A late callback still completes the job before the next poll
+                    audio_url = self._wait_for_callback(pending, time_left(interval, "polling"))
+                    if audio_url:
+                        return audio_url
+                else:
+                    if deadline and deadline.remaining() < interval:
+                        # The next poll would come after the deadline, so nothing can complete the job in time
+                        raise deadline.exceeded("polling")
+                    # Wakes up straight away if the request is cancelled, which stops polling
+                    self.cancel_token.sleep(interval)
+
+            raise GenerationError(f"Song generation timed out after {max_attempts} polls")
 
         except requests.RequestException as e:
+            check_deadline("polling")
             raise GenerationError(f"Error while polling for song completion: {str(e)}")
         except json.JSONDecodeError as e:
             raise GenerationError(f"Invalid polling response format: {str(e)}")
+        finally:
+            if pending:
+                song_callbacks.forget(work_id)
 
     def generate_content(self, prompt: str) -> Tuple[ContentType, str]:
         """
@@ -111,6 +221,7 @@ class SunoSongGenerator(ContentGeneratorBase):
             GenerationError: If song generation fails
         """
         try:
+            self.cancel_token.raise_if_cancelled()
             work_id = self._generate_song_request(prompt)
             audio_url = self._feed_song_generation(work_id)
             return ContentType.SONG, audio_url
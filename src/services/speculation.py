@@ -0,0 +1,124 @@
+import asyncio
+import re
+import threading
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from src.services.base import ContentGeneratorBase
+import src.config as Config
+
+class Speculation:
+    """
+    Research generation started before routing has decided on the content type.
+    Output is buffered until routing confirms research, then replayed and followed live.
+    """
+
+    def __init__(self, generator: ContentGeneratorBase, source: AsyncIterator[str], record_id: Optional[str] = None):
+        """
+        Args:
+            generator (ContentGeneratorBase): Generator producing the speculative output
+            source (AsyncIterator[str]): Chunks of the speculative generation
+            record_id (Optional[str]): Cost record charged for the speculation before it started
+        """
+        self.generator = generator
+        self.record_id = record_id
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[Exception] = None
+        self._changed = asyncio.Event()
+        self.task = asyncio.create_task(self._consume(source))
+
+    async def _consume(self, source: AsyncIterator[str]):
+        try:
+            async for chunk in source:
+                self.chunks.append(chunk)
+                self._notify()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def cancel(self):
+        """Stop the speculative generation; the source releases its resources as it unwinds."""
+        self.generator.cancel()
+        self.task.cancel()
+
+    async def follow(self) -> AsyncIterator[str]:
+        """
+        Yield the buffered chunks, then new ones as they arrive.
+
+        Raises:
+            Exception: The error the speculative generation failed with, after the chunks before it
+        """
+        position = 0
+        while True:
+            changed = self._changed
+            if position < len(self.chunks):
+                position += 1
+                yield self.chunks[position - 1]
+                continue
+            if self.done:
+                if self.error:
+                    raise self.error
+                return
+            await changed.wait()
+
+class ResearchSpeculator:
+    """
+    Decides when to speculate on research and keeps hit and waste statistics.
+    Only prompts that mention research keywords and none of the other content types are
+    speculated on, since every miss is paid for.
+    """
+
+    def __init__(self, keywords: Tuple[str, ...] = None, exclude_keywords: Tuple[str, ...] = None):
+        """
+        Args:
+            keywords (Tuple[str, ...]): Words that predict research, defaults to Config.SPECULATION_KEYWORDS
+            exclude_keywords (Tuple[str, ...]): Words that rule research out, defaults to Config.SPECULATION_EXCLUDE_KEYWORDS
+        """
+        self._keywords = self._pattern(keywords or Config.SPECULATION_KEYWORDS)
+        self._exclude = self._pattern(exclude_keywords or Config.SPECULATION_EXCLUDE_KEYWORDS)
+        self._lock = threading.Lock()
+        self._stats = {"speculated": 0, "hits": 0, "misses": 0, "wasted_spend": 0.0, "chunks_ready_on_hit": 0}
+
+    @staticmethod
+    def _pattern(words: Tuple[str, ...]) -> re.Pattern:
+        return re.compile(r"\b(" + "|".join(re.escape(word) for word in words) + r")\b", re.IGNORECASE)
+
+    def predicts_research(self, prompt: str) -> bool:
+        """Cheap local guess whether the router will pick research for a prompt."""
+        return bool(self._keywords.search(prompt)) and not self._exclude.search(prompt)
+
+    def started(self):
+        """Record a speculative generation."""
+        with self._lock:
+            self._stats["speculated"] += 1
+
+    def hit(self, speculation: Speculation):
+        """Record that routing confirmed a speculation, and how far ahead it already was."""
+        with self._lock:
+            self._stats["hits"] += 1
+            self._stats["chunks_ready_on_hit"] += len(speculation.chunks)
+
+    def miss(self, speculation: Speculation):
+        """
+        Cancel a speculation routing did not confirm and count its cost as wasted.
+        Providers charge per call, so the charge made when it started stays in the ledger
+        at the generator's full price.
+        """
+        speculation.cancel()
+        with self._lock:
+            self._stats["misses"] += 1
+            self._stats["wasted_spend"] += speculation.generator.get_price()
+
+    def get_stats(self) -> Dict:
+        """Get speculation counts, hit rate and wasted spend."""
+        with self._lock:
+            stats = dict(self._stats)
+        decided = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / decided if decided else 0.0
+        stats["avg_chunks_ready_on_hit"] = stats["chunks_ready_on_hit"] / stats["hits"] if stats["hits"] else 0.0
+        return stats
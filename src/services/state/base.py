@@ -0,0 +1,130 @@
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional
+from src.services.registry import import_string
+import src.config as Config
+
+class Counter(NamedTuple):
+    """One counter of an atomic charge."""
+    key: str
+    amount: float
+    limit: Optional[float] = None  # The charge is refused if the counter would go over this
+    ttl: Optional[int] = None  # Seconds until a new counter expires, None to keep it
+
+class SharedStateBase(ABC):
+    """
+    State that several API nodes behind a load balancer need to agree on: budget counters,
+    caches, job state and single-flight locks. LocalState keeps it in this process;
+    RedisState shares it between nodes.
+    """
+
+    # Whether other nodes see the same state
+    shared: bool = False
+
+    @abstractmethod
+    def charge(self, counters: List[Counter]) -> Optional[int]:
+        """
+        Add each counter's amount, atomically: to all of them, or to none if any would exceed its limit.
+
+        Args:
+            counters (List[Counter]): Counters to charge
+
+        Returns:
+            Optional[int]: Index of the first counter over its limit, None if the charge was made
+        """
+        pass
+
+    @abstractmethod
+    def credit(self, keys: List[str], amount: float):
+        """Subtract an amount from existing counters, never going below zero."""
+        pass
+
+    @abstractmethod
+    def get_counters(self, keys: List[str]) -> List[float]:
+        """Current values of counters, 0.0 for missing ones."""
+        pass
+
+    @abstractmethod
+    def scan_counters(self, prefix: str) -> Dict[str, float]:
+        """All counters whose key starts with a prefix."""
+        pass
+
+    @abstractmethod
+    def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        """Cached values of several keys in one round trip, None for missing ones."""
+        pass
+
+    @abstractmethod
+    def set_many(self, items: Dict[str, str], ttl: Optional[int] = None):
+        """Cache several values in one round trip, expiring after ttl seconds if given."""
+        pass
+
+    def get(self, key: str) -> Optional[str]:
+        """Cached value of a key, None if missing or expired."""
+        return self.get_many([key])[0]
+
+    def set(self, key: str, value: str, ttl: Optional[int] = None):
+        """Cache a value, expiring after ttl seconds if given."""
+        self.set_many({key: value}, ttl)
+
+    @abstractmethod
+    def update_job(self, job_id: str, fields: Dict[str, Any], ttl: int):
+        """
+        Merge fields into a job's state and restart its expiry.
+
+        Args:
+            job_id (str): Job, e.g. the request id
+            fields (Dict[str, Any]): JSON-serializable fields to set
+            ttl (int): Seconds the job's state is kept after this update
+        """
+        pass
+
+    @abstractmethod
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """A job's state, None if unknown or expired."""
+        pass
+
+    @abstractmethod
+    def acquire_lock(self, name: str, ttl: float) -> Optional[str]:
+        """
+        Take a lock held by one caller across all nodes until released or ttl seconds pass.
+
+        Returns:
+            Optional[str]: Token to release the lock with, None if someone else holds it
+        """
+        pass
+
+    @abstractmethod
+    def release_lock(self, name: str, token: str) -> bool:
+        """Release a lock if the token still holds it; False if it expired and was taken over."""
+        pass
+
+    @contextmanager
+    def lock(self, name: str, ttl: float) -> Iterator[bool]:
+        """Hold a lock while the block runs if it is free; yields whether it was acquired."""
+        token = self.acquire_lock(name, ttl)
+        try:
+            yield token is not None
+        finally:
+            if token is not None:
+                self.release_lock(name, token)
+
+    def get_stats(self) -> Dict:
+        """Backend name and whether the state is shared between nodes."""
+        return {"backend": self.__class__.__name__, "shared": self.shared}
+
+    def close(self):
+        """Release connections. The default holds none."""
+        pass
+
+def create_state(backend: str = None) -> SharedStateBase:
+    """
+    Create the configured shared-state backend; its module is only imported when used.
+
+    Args:
+        backend (str): Key of Config.SHARED_STATE_BACKENDS, defaults to Config.SHARED_STATE
+
+    Returns:
+        SharedStateBase: New backend instance
+    """
+    return import_string(Config.SHARED_STATE_BACKENDS[backend or Config.SHARED_STATE])()
@@ -0,0 +1,126 @@
+import copy
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+from src.services.state.base import Counter, SharedStateBase
+
+class LocalState(SharedStateBase):
+    """
+    In-process shared state, the default for a single node. Every operation holds one lock,
+    so charges are as atomic as the Redis scripts. Expired entries are dropped when read,
+    and swept from time to time on writes.
+    """
+
+    SWEEP_INTERVAL = 60.0  # Seconds between sweeps of expired entries
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # key -> (value, expiry as time.monotonic(), or None to keep)
+        self._counters: Dict[str, Tuple[float, Optional[float]]] = {}
+        self._values: Dict[str, Tuple[str, Optional[float]]] = {}
+        self._jobs: Dict[str, Tuple[Dict[str, Any], Optional[float]]] = {}
+        self._locks: Dict[str, Tuple[str, Optional[float]]] = {}
+        self._last_sweep = time.monotonic()
+
+    @staticmethod
+    def _expiry(ttl: Optional[float]) -> Optional[float]:
+        return None if ttl is None else time.monotonic() + ttl
+
+    @staticmethod
+    def _live(store: Dict, key: str):
+        """Value of a key unless it expired; the caller holds the lock."""
+        entry = store.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires is not None and expires <= time.monotonic():
+            del store[key]
+            return None
+        return value
+
+    def _sweep(self):
+        """Drop expired entries every SWEEP_INTERVAL; the caller holds the lock."""
+        now = time.monotonic()
+        if now - self._last_sweep < self.SWEEP_INTERVAL:
+            return
+        self._last_sweep = now
+        for store in (self._counters, self._values, self._jobs, self._locks):
+            for key in [key for key, (_, expires) in store.items() if expires is not None and expires <= now]:
+                del store[key]
+
+    def charge(self, counters: List[Counter]) -> Optional[int]:
+        with self._lock:
+            self._sweep()
+            for index, counter in enumerate(counters):
+                current = self._live(self._counters, counter.key) or 0.0
+                if counter.limit is not None and current + counter.amount > counter.limit:
+                    return index
+            for counter in counters:
+                entry = self._counters.get(counter.key)
+                if entry is None:
+                    self._counters[counter.key] = (counter.amount, self._expiry(counter.ttl))
+                else:
+                    self._counters[counter.key] = (entry[0] + counter.amount, entry[1])
+            return None
+
+    def credit(self, keys: List[str], amount: float):
+        with self._lock:
+            for key in keys:
+                current = self._live(self._counters, key)
+                if current is not None:
+                    self._counters[key] = (max(0.0, current - amount), self._counters[key][1])
+
+    def get_counters(self, keys: List[str]) -> List[float]:
+        with self._lock:
+            return [self._live(self._counters, key) or 0.0 for key in keys]
+
+    def scan_counters(self, prefix: str) -> Dict[str, float]:
+        with self._lock:
+            keys = [key for key in self._counters if key.startswith(prefix)]
+            values = {key: self._live(self._counters, key) for key in keys}
+        return {key: value for key, value in values.items() if value is not None}
+
+    def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        with self._lock:
+            return [self._live(self._values, key) for key in keys]
+
+    def set_many(self, items: Dict[str, str], ttl: Optional[int] = None):
+        expires = self._expiry(ttl)
+        with self._lock:
+            self._sweep()
+            for key, value in items.items():
+                self._values[key] = (value, expires)
+
+    def update_job(self, job_id: str, fields: Dict[str, Any], ttl: int):
+        with self._lock:
+            self._sweep()
+            job = self._live(self._jobs, job_id) or {}
+            job.update(copy.deepcopy(fields))
+            self._jobs[job_id] = (job, self._expiry(ttl))
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._live(self._jobs, job_id)
+            return copy.deepcopy(job) if job is not None else None
+
+    def acquire_lock(self, name: str, ttl: float) -> Optional[str]:
+        with self._lock:
+            if self._live(self._locks, name) is not None:
+                return None
+            token = uuid.uuid4().hex
+            self._locks[name] = (token, self._expiry(ttl))
+            return token
+
+    def release_lock(self, name: str, token: str) -> bool:
+        with self._lock:
+            if self._live(self._locks, name) != token:
+                return False
+            del self._locks[name]
+            return True
+
+    def get_stats(self) -> Dict:
+        stats = super().get_stats()
+        with self._lock:
+            stats.update(counters=len(self._counters), cached=len(self._values), jobs=len(self._jobs), locks=len(self._locks))
+        return stats
@@ -0,0 +1,165 @@
+import json
+import uuid
+from typing import Any, Dict, List, Optional
+from src.services.state.base import Counter, SharedStateBase
+import src.config as Config
+
+# Checks every limit before touching any counter, so a refused charge changes nothing.
+# ARGV holds amount, limit and ttl per key, with "" for no limit or ttl.
+# Returns 0 if charged, or the 1-based position of the first counter over its limit.
+CHARGE_SCRIPT = """
+for i, key in ipairs(KEYS) do
+    local limit = ARGV[i * 3 - 1]
+    if limit ~= "" then
+        local current = tonumber(redis.call("GET", key) or "0")
+        if current + tonumber(ARGV[i * 3 - 2]) > tonumber(limit) then
+            return i
+        end
+    end
+end
+for i, key in ipairs(KEYS) do
+    redis.call("INCRBYFLOAT", key, ARGV[i * 3 - 2])
+    local ttl = ARGV[i * 3]
+    if ttl ~= "" and redis.call("TTL", key) < 0 then
+        redis.call("EXPIRE", key, ttl)
+    end
+end
+return 0
+"""
+
+# Subtracts ARGV[1] from existing counters, flooring them at zero
+CREDIT_SCRIPT = """
+for _, key in ipairs(KEYS) do
+    local current = redis.call("GET", key)
+    if current then
+        local value = tonumber(current) - tonumber(ARGV[1])
+        if value < 0 then
+            value = 0
+        end
+        redis.call("SET", key, value, "KEEPTTL")
+    end
+end
+return 0
+"""
+
+# Deletes a lock only while it still holds the caller's token
+RELEASE_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+class RedisState(SharedStateBase):
+    """
+    Shared state in Redis, or any server speaking its protocol, so every node sees the same
+    budgets, caches, jobs and locks. Budget charges run as Lua scripts, which Redis executes
+    atomically; batched reads and writes take one round trip with MGET or a pipeline.
+    Callers keep keys of one charge in the same hash tag, e.g. "{budget}:...", so they stay
+    on one slot of a cluster.
+    """
+
+    shared = True
+
+    def __init__(self, url: str = None, prefix: str = None, client=None):
+        """
+        Args:
+            url (str): Server URL, defaults to Config.SHARED_STATE_URL
+            prefix (str): Prefix of every key, defaults to Config.SHARED_STATE_PREFIX
+            client: Existing redis-py compatible client, e.g. fakeredis in tests
+        """
+        if client is None:
+            # redis-py is only needed when this backend is configured
+            import redis
+            client = redis.Redis.from_url(url or Config.SHARED_STATE_URL, decode_responses=True)
+        self.client = client
+        self.prefix = Config.SHARED_STATE_PREFIX if prefix is None else prefix
+        self._charge = client.register_script(CHARGE_SCRIPT)
+        self._credit = client.register_script(CREDIT_SCRIPT)
+        self._release = client.register_script(RELEASE_SCRIPT)
+
+    def _key(self, kind: str, key: str) -> str:
+        return f"{self.prefix}{kind}:{key}"
+
+    def charge(self, counters: List[Counter]) -> Optional[int]:
+        if not counters:
+            return None
+        args = []
+        for counter in counters:
+            args.extend([
+                repr(float(counter.amount)),
+                "" if counter.limit is None else repr(float(counter.limit)),
+                "" if counter.ttl is None else str(int(counter.ttl))
+            ])
+        refused = int(self._charge(keys=[self._key("counter", counter.key) for counter in counters], args=args))
+        return refused - 1 if refused else None
+
+    def credit(self, keys: List[str], amount: float):
+        if keys:
+            self._credit(keys=[self._key("counter", key) for key in keys], args=[repr(float(amount))])
+
+    def get_counters(self, keys: List[str]) -> List[float]:
+        if not keys:
+            return []
+        return [float(value or 0.0) for value in self.client.mget([self._key("counter", key) for key in keys])]
+
+    def scan_counters(self, prefix: str) -> Dict[str, float]:
+        stripped = len(self._key("counter", ""))
+        keys = list(self.client.scan_iter(match=self._key("counter", _escape_glob(prefix)) + "*", count=1000))
+        counters = {}
+        # Read the matches back in batches rather than one GET each
+        for start in range(0, len(keys), 1000):
+            batch = keys[start:start + 1000]
+            for key, value in zip(batch, self.client.mget(batch)):
+                if value is not None:
+                    counters[key[stripped:]] = float(value)
+        return counters
+
+    def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        if not keys:
+            return []
+        return self.client.mget([self._key("cache", key) for key in keys])
+
+    def set_many(self, items: Dict[str, str], ttl: Optional[int] = None):
+        if not items:
+            return
+        pipe = self.client.pipeline(transaction=False)
+        for key, value in items.items():
+            pipe.set(self._key("cache", key), value, ex=ttl)
+        pipe.execute()
+
+    def update_job(self, job_id: str, fields: Dict[str, Any], ttl: int):
+        key = self._key("job", job_id)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hset(key, mapping={name: json.dumps(value) for name, value in fields.items()})
+        pipe.expire(key, ttl)
+        pipe.execute()
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        fields = self.client.hgetall(self._key("job", job_id))
+        if not fields:
+            return None
+        return {name: json.loads(value) for name, value in fields.items()}
+
+    def acquire_lock(self, name: str, ttl: float) -> Optional[str]:
+        token = uuid.uuid4().hex
+        if self.client.set(self._key("lock", name), token, nx=True, px=max(1, int(ttl * 1000))):
+            return token
+        return None
+
+    def release_lock(self, name: str, token: str) -> bool:
+        return bool(self._release(keys=[self._key("lock", name)], args=[token]))
+
+    def get_stats(self) -> Dict:
+        stats = super().get_stats()
+        stats["prefix"] = self.prefix
+        return stats
+
+    def close(self):
+        self.client.close()
+
+def _escape_glob(text: str) -> str:
+    """Escape the characters SCAN MATCH treats as a pattern."""
+    for char in "\\*?[]":
+        text = text.replace(char, "\\" + char)
+    return text
@@ -0,0 +1,240 @@
+import asyncio
+import json
+import time
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+import anyio
+import src.config as Config
+
+class StreamRecord:
+    """
+    Events of one SSE stream, numbered from 0.
+    Recent events stay in memory; once a stream grows past the memory limit, older
+    events are spilled to a JSON-lines file so long streams can still be replayed.
+    The file is written and read on worker threads, never on the event loop, and the
+    byte offset of every spilled event is kept so a resume reads from where it left off.
+    """
+
+    def __init__(self, stream_id: str, spill_dir: Path, memory_events: int):
+        self.stream_id = stream_id
+        self.spill_file = spill_dir / f"{stream_id}.jsonl"
+        self.memory_events = memory_events
+        self.events: List[str] = []  # Events from first_in_memory onwards
+        self.first_in_memory = 0
+        self.done = False
+        self.updated = time.monotonic()
+        self.producer: Optional[asyncio.Task] = None  # Task generating the stream, kept alive here
+        self.readers = 0
+        self.on_abandoned: Optional[Callable[[], None]] = None  # Called when the last reader leaves a running stream
+        self._changed = asyncio.Event()
+        self._offsets = array("q")  # Byte offset of each spilled event in the spill file, by sequence number
+        self._spilled_bytes = 0
+        self._spilling: Optional[asyncio.Task] = None
+        self._discarded = False
+
+    @property
+    def next_seq(self) -> int:
+        """Sequence number the next event will get."""
+        return self.first_in_memory + len(self.events)
+
+    def append(self, data: str) -> int:
+        """
+        Add an event and wake readers.
+
+        Args:
+            data (str): SSE data payload
+
+        Returns:
+            int: Sequence number of the event
+        """
+        seq = self.next_seq
+        self.events.append(data)
+        if len(self.events) > self.memory_events and self._spilling is None:
+            # Events stay readable in memory until they are on disk
+            self._spilling = asyncio.get_running_loop().create_task(self._spill())
+        self._notify()
+        return seq
+
+    def finish(self):
+        """Mark the stream complete and wake readers."""
+        self.done = True
+        self._notify()
+
+    def _notify(self):
+        self.updated = time.monotonic()
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _spill(self):
+        """Move the older half of the in-memory events to the spill file until the stream is within its limit."""
+        try:
+            while len(self.events) > self.memory_events and not self._discarded:
+                count = len(self.events) // 2
+                sizes = await anyio.to_thread.run_sync(self._write_spill, self.first_in_memory, self.events[:count])
+                for size in sizes:
+                    self._offsets.append(self._spilled_bytes)
+                    self._spilled_bytes += size
+                del self.events[:count]
+                self.first_in_memory += count
+        finally:
+            self._spilling = None
+            if self._discarded:
+                self.spill_file.unlink(missing_ok=True)
+
+    def _write_spill(self, first: int, events: List[str]) -> List[int]:
+        """Append events numbered from first to the spill file; returns the size of each line. Runs on a worker thread."""
+        lines = [(json.dumps([first + offset, data]) + "\n").encode() for offset, data in enumerate(events)]
+        self.spill_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.spill_file, "ab") as f:
+            f.write(b"".join(lines))
+        return [len(line) for line in lines]
+
+    async def wait_spilled(self):
+        """Wait until the events beyond the memory limit are on disk."""
+        while self._spilling is not None:
+            await asyncio.shield(self._spilling)
+
+    async def _read_spilled(self, after: int) -> List[Tuple[int, str]]:
+        """Read up to memory_events spilled events with a sequence number above after."""
+        if after + 1 >= self.first_in_memory or self._discarded:
+            return []
+        stop = min(self.first_in_memory, after + 1 + self.memory_events)
+        start = self._offsets[after + 1]
+        end = self._offsets[stop] if stop < len(self._offsets) else self._spilled_bytes
+
+        def read() -> List[Tuple[int, str]]:
+            with open(self.spill_file, "rb") as f:
+                f.seek(start)
+                return [tuple(json.loads(line)) for line in f.read(end - start).splitlines()]
+
+        try:
+            return await anyio.to_thread.run_sync(read)
+        except FileNotFoundError:
+            return []
+
+    async def follow(self, after: int = -1, heartbeat: float = None) -> AsyncIterator[Tuple[Optional[int], Optional[str]]]:
+        """
+        Replay events after a sequence number, then follow the live tail until the stream ends.
+
+        Args:
+            after (int): Last sequence number the reader already has, -1 for everything
+            heartbeat (float): Seconds without events after which (None, None) is yielded, None for never
+
+        Yields:
+            Tuple[Optional[int], Optional[str]]: Sequence number and data of each event, or (None, None) as a heartbeat
+        """
+        self.readers += 1
+        try:
+            while True:
+                changed = self._changed
+                if after + 1 < self.first_in_memory:
+                    # Events may be spilled while the reader is suspended, so check again every time
+                    spilled = await self._read_spilled(after)
+                    for seq, data in spilled:
+                        yield seq, data
+                        after = seq
+                    if not spilled:
+                        after = self.first_in_memory - 1
+                    continue
+                if after + 1 < self.next_seq:
+                    after += 1
+                    yield after, self.events[after - self.first_in_memory]
+                    continue
+                if self.done:
+                    return
+                if heartbeat is None:
+                    await changed.wait()
+                    continue
+                try:
+                    await asyncio.wait_for(changed.wait(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield None, None
+        finally:
+            self.readers -= 1
+            if not self.readers and not self.done and self.on_abandoned:
+                self.on_abandoned()
+
+    def discard(self):
+        """Delete the spill file, once a spill in progress is done with it."""
+        self._discarded = True
+        if self._spilling is None:
+            self.spill_file.unlink(missing_ok=True)
+
+class StreamBuffer:
+    """
+    Bounded set of recent SSE streams keyed by stream id, so clients that lose their
+    connection can resume with Last-Event-ID instead of regenerating.
+    """
+
+    def __init__(self, max_streams: int = None, memory_events: int = None, spill_dir: str = None,
+                 ttl_seconds: float = None):
+        """
+        Args:
+            max_streams (int): Streams kept, defaults to Config.STREAM_BUFFER_MAX_STREAMS
+            memory_events (int): Events per stream kept in memory before spilling to disk
+            spill_dir (str): Directory for spilled events
+            ttl_seconds (float): How long finished streams stay resumable
+        """
+        self.max_streams = max_streams or Config.STREAM_BUFFER_MAX_STREAMS
+        self.memory_events = memory_events or Config.STREAM_BUFFER_MEMORY_EVENTS
+        self.spill_dir = Path(spill_dir or Config.STREAM_BUFFER_SPILL_DIR)
+        self.ttl_seconds = Config.STREAM_BUFFER_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self._streams: "OrderedDict[str, StreamRecord]" = OrderedDict()
+
+    def open(self, stream_id: str) -> StreamRecord:
+        """Start recording a new stream, dropping expired or excess finished streams."""
+        self._expire()
+        record = StreamRecord(stream_id, self.spill_dir, self.memory_events)
+        self._streams[stream_id] = record
+        return record
+
+    def get(self, stream_id: str) -> Optional[StreamRecord]:
+        """Get a stream that can still be resumed."""
+        self._expire()
+        return self._streams.get(stream_id)
+
+    def _expire(self):
+        """Drop finished streams past their TTL, then the oldest finished ones beyond max_streams."""
+        now = time.monotonic()
+        for stream_id, record in list(self._streams.items()):
+            if record.done and now - record.updated > self.ttl_seconds:
+                self._drop(stream_id)
+
+        excess = len(self._streams) - self.max_streams + 1
+        for stream_id, record in list(self._streams.items()):
+            if excess <= 0:
+                break
+            if record.done:
+                self._drop(stream_id)
+                excess -= 1
+
+    def _drop(self, stream_id: str):
+        self._streams.pop(stream_id).discard()
+
+    def get_stats(self) -> dict:
+        """Get the number of buffered and still-running streams."""
+        return {
+            "streams": len(self._streams),
+            "live": sum(not record.done for record in self._streams.values()),
+            "max_streams": self.max_streams
+        }
+
+def parse_last_event_id(value: str) -> Tuple[str, int]:
+    """
+    Split a Last-Event-ID header into stream id and sequence number.
+
+    Args:
+        value (str): Header value in the form "<stream_id>:<seq>"
+
+    Returns:
+        Tuple[str, int]: Stream id and last received sequence number
+
+    Raises:
+        ValueError: If the header is malformed
+    """
+    stream_id, _, seq = value.strip().rpartition(":")
+    if not stream_id:
+        raise ValueError(f"Malformed Last-Event-ID: {value}")
+    return stream_id, int(seq)
@@ -0,0 +1,265 @@
+import json
+import queue
+import random
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+import src.config as Config
+
+class Trace:
+    """
+    Spans recorded for one sampled request.
+    A trace is finished once every holder has released it, so a streaming request
+    can keep its trace open until the stream has been generated and delivered.
+    """
+
+    def __init__(self, trace_id: str, name: str, tracer: "Tracer"):
+        self.trace_id = trace_id
+        self.name = name
+        self.tracer = tracer
+        self.start = time.perf_counter()
+        self.started_at = time.time()
+        self.end: Optional[float] = None
+        self.spans: List["Span"] = []  # list.append is atomic, so worker threads add spans without a lock
+        self.attributes: Dict = {}
+        self._callbacks: List[Callable[[], None]] = []
+        self._holders = 1
+        self._lock = threading.Lock()
+
+    def retain(self):
+        """Keep the trace open for another piece of work."""
+        with self._lock:
+            self._holders += 1
+
+    def release(self):
+        """Release a hold, finishing the trace when it was the last one."""
+        with self._lock:
+            self._holders -= 1
+            if self._holders or self.end is not None:
+                return
+            self.end = time.perf_counter()
+        self.tracer.finish(self)
+        for callback in self._callbacks:
+            callback()
+
+    def on_finish(self, callback: Callable[[], None]):
+        """Run a callback once the trace is finished, e.g. to stop a profile covering the same request."""
+        self._callbacks.append(callback)
+
+    def record(self, name: str, start: float, **attributes) -> "Span":
+        """
+        Add a span that ends now under the root span, for work that outlives the code that started it,
+        such as delivering a stream, where a span cannot be held open as the current one.
+        """
+        item = Span(self, name, self.spans[0], attributes)
+        item.start = start
+        item.end = time.perf_counter()
+        self.spans.append(item)
+        return item
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+    def to_dict(self) -> Dict:
+        """Serialize the trace with span times in milliseconds from the start of the request."""
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration * 1000, 3),
+            "attributes": self.attributes,
+            "spans": [span.to_dict(self.start) for span in self.spans if span.end is not None]
+        }
+
+class Span:
+    """A timed stage of a traced request."""
+    __slots__ = ("trace", "name", "parent", "depth", "attributes", "thread", "start", "end")
+
+    def __init__(self, trace: Trace, name: str, parent: Optional["Span"], attributes: Dict):
+        self.trace = trace
+        self.name = name
+        self.parent = parent
+        self.depth = parent.depth + 1 if parent else 0
+        self.attributes = attributes
+        self.thread = threading.current_thread().name
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+
+    def set(self, **attributes):
+        """Add attributes to the span."""
+        self.attributes.update(attributes)
+
+    def to_dict(self, origin: float) -> Dict:
+        return {
+            "name": self.name,
+            "depth": self.depth,
+            "start_ms": round((self.start - origin) * 1000, 3),
+            "duration_ms": round((self.end - self.start) * 1000, 3),
+            "thread": self.thread,
+            "attributes": self.attributes
+        }
+
+# Innermost open span of the current request, None when the request is not sampled
+_current: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+class _SpanContext:
+    """Opens a span on enter and closes it on exit."""
+    __slots__ = ("parent", "name", "attributes", "span", "token")
+
+    def __init__(self, parent: Span, name: str, attributes: Dict):
+        self.parent = parent
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self) -> Span:
+        self.span = Span(self.parent.trace, self.name, self.parent, self.attributes)
+        self.parent.trace.spans.append(self.span)
+        self.token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        self.span.end = time.perf_counter()
+        if exc_type is not None:
+            self.span.attributes["error"] = exc_type.__name__
+        _current.reset(self.token)
+        return False
+
+class _NoopSpanContext:
+    """Stands in for a span when the request is not sampled."""
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NOOP = _NoopSpanContext()
+
+def span(name: str, **attributes):
+    """
+    Time a stage of the current request.
+    Costs a context variable lookup when the request is not sampled.
+
+    Args:
+        name (str): Stage name, e.g. "cost_tracker.track"
+        **attributes: Extra details shown in the waterfall
+
+    Returns:
+        Context manager yielding the Span, or None if the request is not traced
+    """
+    parent = _current.get()
+    if parent is None:
+        return _NOOP
+    return _SpanContext(parent, name, attributes)
+
+def current_trace() -> Optional[Trace]:
+    """Trace of the current request, None if it is not sampled."""
+    parent = _current.get()
+    return parent.trace if parent else None
+
+def annotate(**attributes):
+    """Add attributes to the current request's trace, if it is sampled."""
+    parent = _current.get()
+    if parent is not None:
+        parent.trace.attributes.update(attributes)
+
+class Tracer:
+    """
+    Samples requests, keeps their finished traces in a ring buffer and appends them
+    to a JSON-lines file from a background thread.
+    """
+
+    def __init__(self, sample_rate: float = None, buffer_size: int = None, export_file: str = None):
+        """
+        Args:
+            sample_rate (float): Share of requests traced, defaults to Config.TRACE_SAMPLE_RATE
+            buffer_size (int): Finished traces kept in memory, defaults to Config.TRACE_BUFFER_SIZE
+            export_file (str): JSON-lines file traces are appended to, defaults to Config.TRACE_EXPORT_FILE
+        """
+        self.sample_rate = Config.TRACE_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.traces: deque = deque(maxlen=buffer_size or Config.TRACE_BUFFER_SIZE)
+        self.export_file = Config.TRACE_EXPORT_FILE if export_file is None else export_file
+        self._export_queue: "queue.SimpleQueue[Dict]" = queue.SimpleQueue()
+        self._exporter: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start_trace(self, trace_id: str, name: str, force: bool = False, **attributes) -> Optional[Span]:
+        """
+        Start tracing a request if it is sampled, making its root span current.
+
+        Args:
+            trace_id (str): Unique id of the request
+            name (str): Root span name
+            force (bool): Trace regardless of the sample rate
+            **attributes: Attributes of the trace
+
+        Returns:
+            Optional[Span]: Root span, or None if the request is not sampled
+        """
+        if not force and (self.sample_rate <= 0 or random.random() >= self.sample_rate):
+            _current.set(None)
+            return None
+        trace = Trace(trace_id, name, self)
+        trace.attributes.update(attributes)
+        root = Span(trace, name, None, {})
+        trace.spans.append(root)
+        _current.set(root)
+        return root
+
+    def finish(self, trace: Trace):
+        """Store a finished trace and queue it for export."""
+        for item in trace.spans:
+            if item.end is None and item.parent is None:
+                item.end = trace.end
+        self.traces.append(trace)
+        if self.export_file:
+            self._ensure_exporter()
+            self._export_queue.put(trace.to_dict())
+
+    def _ensure_exporter(self):
+        with self._lock:
+            if self._exporter is None:
+                self._exporter = threading.Thread(target=self._export_loop, name="trace-exporter", daemon=True)
+                self._exporter.start()
+
+    def _export_loop(self):
+        """Append exported traces to the file, batching whatever is queued."""
+        path = Path(self.export_file)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        while True:
+            batch = [self._export_queue.get()]
+            while not self._export_queue.empty():
+                batch.append(self._export_queue.get())
+            with open(path, "a") as f:
+                f.writelines(json.dumps(item) + "\n" for item in batch)
+
+    def slowest(self, limit: int = 10) -> List[Trace]:
+        """Get the slowest recent traces, slowest first."""
+        return sorted(list(self.traces), key=lambda trace: trace.duration, reverse=True)[:limit]
+
+def waterfall(trace: Dict, width: int = 60) -> str:
+    """
+    Render a serialized trace as a text waterfall.
+
+    Args:
+        trace (Dict): Trace from Trace.to_dict
+        width (int): Characters used for the time axis
+
+    Returns:
+        str: One line per span with its offset bar and duration
+    """
+    total = max(trace["duration_ms"], 0.001)
+    label_width = max([len(item["name"]) + 2 * item["depth"] for item in trace["spans"]] + [10])
+    lines = [f"{trace['name']} {trace['trace_id']} {trace['duration_ms']:.1f}ms {json.dumps(trace['attributes'])}"]
+    for item in trace["spans"]:
+        offset = int(item["start_ms"] / total * width)
+        length = max(1, int(item["duration_ms"] / total * width))
+        bar = " " * offset + "#" * min(length, width - offset)
+        label = ("  " * item["depth"] + item["name"]).ljust(label_width)
+        details = " ".join(f"{key}={value}" for key, value in item["attributes"].items())
+        lines.append(f"{label} |{bar.ljust(width)}| {item['duration_ms']:9.1f}ms {details}".rstrip())
+    return "\n".join(lines)
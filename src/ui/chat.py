@@ -1,28 +1,164 @@
 import streamlit as st
 import requests
 import json
+import time
+from requests.adapters import HTTPAdapter
+from multiplex_client import MultiplexClient
 
 st.title("Multi Service Chat")
 
-def process_stream(response):
-    """Process streaming response and yield words"""
-    for line in response.iter_lines():
-        if line:
-            line = line.decode('utf-8')
-            if line.startswith('data: '):
-                try:
-                    data = json.loads(line[6:])
-                    content = data.get('content', '')
-                    yield content
-                except json.JSONDecodeError:
-                    continue
+API_URL = "http://localhost:8000"
+WS_URL = "ws://localhost:8000/ws"
 
-# Initialize chat history
-if "messages" not in st.session_state:
-    st.session_state.messages = []
+MAX_RESUMES = 3
+
+# Streamed text is redrawn at most this often, chunks arriving in between are drawn together
+RENDER_INTERVAL = 0.05
+
+# How often running WebSocket generations are redrawn, each on its own without rerunning the page
+LIVE_REFRESH_SECONDS = 0.25
+
+# Messages drawn on every rerun in the efficient client, older ones only on request
+HISTORY_WINDOW = 20
+
+# Typical seconds for types that arrive whole, to move the progress bar while waiting
+EXPECTED_SECONDS = {"image": 20, "song": 60}
+
+STATUS_LABELS = {
+    "routed": lambda data: f"Creating {data['content_type']} with {data['provider']}...",
+    "queued": lambda data: f"Waiting for {data['provider']} ({data['ahead']} ahead)...",
+    "progress": lambda data: f"{data['stage']}: {data.get('status', '')}",
+}
+
+def get_session():
+    """HTTP session of this browser session, kept across reruns so its connections to the API stay open between messages"""
+    # Kept per browser session rather than cached for the app: a requests.Session is not thread-safe,
+    # and Streamlit runs each user's script in its own thread
+    session = st.session_state.get("http_session")
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=10)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        st.session_state.http_session = session
+    return session
+
+def read_events(response, http=requests):
+    """Yield (event, data) pairs from the event stream, resuming from the last event id if the connection drops"""
+    last_event_id = None
+    event_id = None
+    event = None
+    for attempt in range(MAX_RESUMES + 1):
+        try:
+            for line in response.iter_lines():
+                if line:
+                    line = line.decode('utf-8')
+                    if line.startswith(':'):
+                        # Heartbeats still let the client redraw how long it has been waiting
+                        yield "heartbeat", {}
+                    elif line.startswith('id: '):
+                        event_id = line[4:]
+                    elif line.startswith('event: '):
+                        event = line[7:]
+                    elif line.startswith('data: '):
+                        try:
+                            data = json.loads(line[6:])
+                        except json.JSONDecodeError:
+                            continue
+                        yield event, data
+                        # Only count an event as received once its data has been handled
+                        last_event_id = event_id
+            return
+        except (requests.exceptions.ChunkedEncodingError, requests.exceptions.ConnectionError):
+            if not last_event_id or attempt == MAX_RESUMES:
+                raise
+            stream_id = last_event_id.rpartition(':')[0]
+            response = http.get(
+                f"{API_URL}/streams/{stream_id}",
+                headers={"Last-Event-ID": last_event_id},
+                stream=True
+            )
+            response.raise_for_status()
 
-# Display chat messages
-for message in st.session_state.messages:
+def render_events(events, status, outcome):
+    """Yield streamed text for st.write_stream, showing progress in the status box and keeping the result"""
+    for event, data in events:
+        if event == "chunk":
+            yield data['content']
+        elif event in STATUS_LABELS:
+            status.update(label=STATUS_LABELS[event](data))
+        elif event == "result":
+            outcome['result'] = data
+        elif event == "error":
+            outcome['error'] = data
+
+def render_throttled(events, outcome, interval=RENDER_INTERVAL):
+    """
+    Draw streamed text and progress in place, redrawing at most once per interval however fast
+    chunks arrive. Types that arrive whole get a progress bar that fills over their typical time.
+    Returns the streamed text, keeping the result or error in outcome.
+    """
+    progress = st.progress(0.0, text="Generating great content for you!")
+    placeholder = st.empty()
+    text = ""
+    label = None
+    expected = None
+    started = last_drawn = time.monotonic()
+    drawn_text = ""
+    for event, data in events:
+        if event == "chunk":
+            text += data['content']
+        elif event in STATUS_LABELS:
+            label = STATUS_LABELS[event](data)
+            if event == "routed":
+                expected = None if data['streaming'] else EXPECTED_SECONDS.get(data['content_type'])
+        elif event == "result":
+            outcome['result'] = data
+        elif event == "error":
+            outcome['error'] = data
+        now = time.monotonic()
+        if now - last_drawn < interval:
+            continue
+        last_drawn = now
+        if text != drawn_text:
+            placeholder.markdown(text + "▌")
+            drawn_text = text
+        if text:
+            progress.empty()
+        elif label:
+            # Never shown as done before the result is in
+            value = min((now - started) / expected, 0.95) if expected else 0.0
+            progress.progress(value, text=f"{label} ({now - started:.0f}s)")
+    progress.empty()
+    if text:
+        placeholder.markdown(text)
+    else:
+        placeholder.empty()
+    return text
+
+def get_multiplex_client():
+    """WebSocket client of this browser session, reconnecting if the connection was lost"""
+    client = st.session_state.get("multiplex_client")
+    if client is None or client.closed:
+        client = MultiplexClient(WS_URL)
+        st.session_state.multiplex_client = client
+    return client
+
+def outcome_content(outcome):
+    """Message content for a failed generation, or None if it succeeded"""
+    error = outcome.get('error')
+    if error and error['status'] == 402:
+        return ("error", f"💰 Budget exceeded! {error['detail']} Please check the Costs page for details.")
+    if error:
+        return ("error", f"Failed to generate content: {error['detail']}")
+    return None
+
+def media_url(content):
+    """Make media URLs served by the API absolute"""
+    return f"{API_URL}{content}" if content.startswith('/media/') else content
+
+def render_message(message):
+    """Draw a chat message; media is drawn from its URL, which the browser keeps cached"""
     with st.chat_message(message["role"]):
         if message["role"] == "user":
             st.markdown(message["content"])
@@ -31,55 +167,141 @@ for message in st.session_state.messages:
             if content_type == "text":
                 st.markdown(content)
             elif content_type == "song":
-                st.audio(content)
+                st.audio(media_url(content))
             elif content_type == "image":
-                st.image(content)
+                st.image(media_url(content))
+            elif content_type == "error":
+                st.error(content)
+
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+def render_live(message):
+    """Redraw a generation running over the WebSocket; once it ends it becomes a regular message"""
+    generation = message["generation"]
+    if generation.done:
+        failed = outcome_content({'error': generation.error})
+        if failed:
+            message["content"] = failed
+        elif generation.result:
+            message["content"] = (generation.result['type'], generation.result['content'])
+        else:
+            message["content"] = ("text", generation.text)
+        del message["generation"]
+        # Draw the finished message with the rest of the history
+        st.rerun()
+    with st.chat_message("assistant"):
+        elapsed = time.monotonic() - generation.started
+        label = STATUS_LABELS[generation.status[0]](generation.status[1]) if generation.status else "Starting..."
+        if generation.text:
+            st.markdown(generation.text + "▌")
+        else:
+            expected = None if generation.streaming else EXPECTED_SECONDS.get(generation.content_type)
+            value = min(elapsed / expected, 0.95) if expected else 0.0
+            st.progress(value, text=f"{label} ({elapsed:.0f}s)")
+        if st.button("Cancel", key=f"cancel-{generation.generation_id}"):
+            get_multiplex_client().cancel(generation)
+
+# Optional caller identity, charged against per-user and per-tenant budgets
+with st.sidebar:
+    user_id = st.text_input("User ID", help="Charged against your daily budget")
+    tenant_id = st.text_input("Tenant ID", help="Charged against your organization's monthly budget")
+    efficient = st.toggle(
+        "Efficient client",
+        value=True,
+        help="Reuse connections, batch text updates and only draw recent messages, for long conversations"
+    )
+    transport = st.radio(
+        "Transport",
+        ["HTTP", "WebSocket"],
+        help="WebSocket runs several generations at once over one connection, e.g. a song, an image and a paper"
+    )
+
+# Efficient mode keeps connections to the API alive, otherwise each message opens its own
+http = get_session() if efficient else requests
+
+# Initialize chat history
+if "messages" not in st.session_state:
+    st.session_state.messages = []
+
+# Display chat messages, in efficient mode only the most recent ones unless asked for all
+messages = st.session_state.messages
+hidden = len(messages) - HISTORY_WINDOW if efficient and not st.session_state.get("show_history") else 0
+if hidden > 0:
+    if st.button(f"Show {hidden} earlier messages"):
+        st.session_state.show_history = True
+        hidden = 0
+for message in messages[max(hidden, 0):]:
+    if "generation" in message:
+        render_live(message)
+    else:
+        render_message(message)
 
 # Accept user input
-if prompt := st.chat_input("Ask me to generate image, song or research content..."):
+prompt = st.chat_input("Ask me to generate image, song or research content...")
+if prompt and transport == "WebSocket":
+    # The generation runs in the background and is drawn live, so the next prompt can be sent straight away
+    st.session_state.messages.append({"role": "user", "content": prompt})
+    with st.chat_message("user"):
+        st.markdown(prompt)
+    try:
+        generation = get_multiplex_client().start(prompt, user_id=user_id, tenant_id=tenant_id)
+        message = {"role": "assistant", "generation": generation}
+        st.session_state.messages.append(message)
+        render_live(message)
+    except Exception as e:
+        st.error(f"Error: {str(e)}")
+elif prompt:
     st.session_state.messages.append({"role": "user", "content": prompt})
     with st.chat_message("user"):
         st.markdown(prompt)
 
     with st.chat_message("assistant"):
-        with st.spinner('Generating great content for you!'):
-            try:
-                response = requests.post(
-                    "http://localhost:8000/generate_content",
-                    json={"prompt": prompt},
-                    stream=True
-                )
-
-                if response.status_code == 200:
-                    content_type = response.headers.get('content-type', '')
-
-                    if 'text/event-stream' in content_type:
-                        # Handle streaming text
-                        full_response = st.write_stream(process_stream(response))
-                        result = ('text', full_response)
-                    else:
-                        # Non-streaming response
-                        data = response.json()
+        try:
+            # Every content type answers with the same event stream: routing and progress arrive
+            # within milliseconds, then streamed text or the finished image or song
+            response = http.post(
+                f"{API_URL}/generate_content",
+                json={"prompt": prompt, "user_id": user_id or None, "tenant_id": tenant_id or None},
+                headers={"Accept": "text/event-stream"},
+                stream=True
+            )
+
+            if response.status_code == 200:
+                outcome = {}
+                if efficient:
+                    full_response = render_throttled(read_events(response, http), outcome)
+                else:
+                    with st.status("Generating great content for you!") as status:
+                        full_response = st.write_stream(render_events(read_events(response), status, outcome))
+                        status.update(state="error" if 'error' in outcome else "complete")
+
+                failed = outcome_content(outcome)
+                if failed:
+                    st.error(failed[1])
+                else:
+                    if 'result' in outcome:
+                        data = outcome['result']
                         result = (data['type'], data['content'])
                         # Display media content
                         if data['type'] == 'image':
-                            st.image(data['content'])
+                            st.image(media_url(data['content']))
                         elif data['type'] == 'song':
-                            st.audio(data['content'])
+                            st.audio(media_url(data['content']))
+                    else:
+                        result = ('text', full_response)
 
                     st.session_state.messages.append({
                         "role": "assistant",
                         "content": result
                     })
-                    st.rerun()
-
-                elif response.status_code == 402:
-                    st.error("💰 Budget exceeded! Please check the Costs page for details.")
-                else:
-                    st.error("Failed to generate content")
+                    # The reply is already on screen; the efficient client leaves it there
+                    # rather than drawing the whole history again
+                    if not efficient:
+                        st.rerun()
+            else:
+                st.error("Failed to generate content")
 
-            except Exception as e:
-                st.error(f"Error: {str(e)}")
+        except Exception as e:
+            st.error(f"Error: {str(e)}")
 
 # Add some styling
 st.markdown("""
@@ -0,0 +1,101 @@
+import json
+import threading
+import time
+import uuid
+
+class Generation:
+    """Events of one generation received so far, kept up to date by the client's reader thread"""
+
+    def __init__(self, generation_id, prompt):
+        self.generation_id = generation_id
+        self.prompt = prompt
+        self.started = time.monotonic()
+        self.text = ""
+        self.status = None  # Last routed, queued or progress event, as (event, data)
+        self.content_type = None
+        self.streaming = None
+        self.result = None
+        self.error = None
+        self.done = False
+        self.received = 0
+        self.last_event_id = None
+
+    def apply(self, event, data, event_id=None):
+        """Update the generation with one event of its stream"""
+        self.received += 1
+        if event_id:
+            self.last_event_id = event_id
+        if event == "chunk":
+            self.text += data['content']
+        elif event in ("routed", "queued", "progress"):
+            self.status = (event, data)
+            if event == "routed":
+                self.content_type = data['content_type']
+                self.streaming = data['streaming']
+        elif event == "result":
+            self.result = data
+        elif event == "error":
+            self.error = data
+            self.done = True
+        elif event == "done":
+            self.done = True
+
+class MultiplexClient:
+    """
+    One WebSocket to the API carrying every generation of a chat session, so several can run
+    at once. A background thread reads the connection, updates each generation and grants the
+    server more credit as events are taken in.
+    """
+
+    def __init__(self, url, window=64):
+        # Only needed when the WebSocket transport is chosen
+        from websockets.sync.client import connect
+        self.connection = connect(url)
+        self.window = window
+        self.generations = {}
+        self._send_lock = threading.Lock()
+        self.reader = threading.Thread(target=self._read, name="chat-websocket", daemon=True)
+        self.reader.start()
+
+    @property
+    def closed(self):
+        return not self.reader.is_alive()
+
+    def start(self, prompt, **fields):
+        """Start a generation and return it; fields such as user_id are sent along when set"""
+        generation = Generation(uuid.uuid4().hex[:12], prompt)
+        self.generations[generation.generation_id] = generation
+        message = {name: value for name, value in fields.items() if value}
+        self._send(type="start", id=generation.generation_id, prompt=prompt, **message)
+        return generation
+
+    def cancel(self, generation):
+        """Ask the server to cancel a generation; it ends with a cancellation error"""
+        if not generation.done:
+            self._send(type="cancel", id=generation.generation_id)
+
+    def close(self):
+        self.connection.close()
+
+    def _send(self, **message):
+        with self._send_lock:
+            self.connection.send(json.dumps(message))
+
+    def _read(self):
+        # Credit is granted in halves of the window, so the server rarely has to wait for it
+        grant = max(self.window // 2, 1)
+        try:
+            for message in self.connection:
+                frame = json.loads(message)
+                generation = self.generations.get(frame['id'])
+                if generation is None:
+                    continue
+                generation.apply(frame['event'], frame['data'], frame.get('event_id'))
+                if not generation.done and generation.received % grant == 0:
+                    self._send(type="credit", id=generation.generation_id, events=grant)
+        except Exception:
+            pass
+        finally:
+            for generation in self.generations.values():
+                if not generation.done:
+                    generation.apply("error", {"status": 503, "detail": "Connection to the API was lost"})
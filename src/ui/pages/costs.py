@@ -73,6 +73,34 @@ try:
     else:
         st.info("No cost data available yet")
 
+    # Spend per user and tenant in their current budget windows
+    st.subheader("Usage by User and Tenant")
+
+    usage = requests.get("http://localhost:8000/costs/usage").json()
+    if usage:
+        df_usage = pd.DataFrame(usage)
+        df_usage['budget_used'] = [
+            item['spent'] / item['limit'] * 100 if item['limit'] else None
+            for item in usage
+        ]
+        st.dataframe(
+            df_usage[['kind', 'id', 'window', 'spent', 'limit', 'budget_used', 'requests', 'resets_at']],
+            column_config={
+                "kind": st.column_config.TextColumn("Kind", width="small"),
+                "id": st.column_config.TextColumn("ID", width="medium"),
+                "window": st.column_config.TextColumn("Window", width="small"),
+                "spent": st.column_config.NumberColumn("Spent", format="$%.2f", width="small"),
+                "limit": st.column_config.NumberColumn("Budget", format="$%.2f", width="small"),
+                "budget_used": st.column_config.ProgressColumn("Used", min_value=0, max_value=100, format="%.0f%%"),
+                "requests": st.column_config.NumberColumn("Charges", width="small"),
+                "resets_at": st.column_config.TextColumn("Resets", width="medium"),
+            },
+            hide_index=True,
+            use_container_width=True
+        )
+    else:
+        st.info("No usage by user or tenant recorded yet")
+
     # Recent transactions
     st.subheader("Recent Transactions")
 
@@ -0,0 +1,206 @@
+import pytest
+import threading
+import time
+import requests
+from src.services.admission import AdaptiveLimit, AdmissionController, AdmissionRejected, ProviderLimiter, is_overload
+from src.services.base import GenerationCancelled, GenerationError
+from src.services.deadline import DeadlineExceeded
+from src.services.image.mock_image_generator import MockImageGenerator
+from src.services.latency import LatencyModel
+
+class RateLimited(Exception):
+    """Provider error carrying an HTTP status, like OpenAI's."""
+    status_code = 429
+
+def wrapped(error: Exception) -> GenerationError:
+    """Wrap an error the way generators do, keeping it as the context."""
+    try:
+        raise error
+    except Exception as e:
+        try:
+            raise GenerationError(f"Failed to generate: {e}")
+        except GenerationError as wrapper:
+            return wrapper
+
+class ContendedLatency(LatencyModel):
+    """Latency of a provider that serves capacity calls at once at its normal speed, and slows down beyond that."""
+
+    def __init__(self, limiter: ProviderLimiter, seconds: float, capacity: int):
+        super().__init__()
+        self.limiter = limiter
+        self.seconds = seconds
+        self.capacity = capacity
+
+    def _draw(self) -> float:
+        return self.seconds * max(1.0, self.limiter.in_flight / self.capacity)
+
+class TestProviderLimiter:
+    def test_rejects_when_queue_full(self):
+        """Test that callers beyond the queue are rejected with a retry hint."""
+        limiter = ProviderLimiter("test", max_concurrency=1, max_queue=0)
+        slot = limiter.acquire()
+
+        with pytest.raises(AdmissionRejected) as exc_info:
+            limiter.acquire()
+
+        assert exc_info.value.retry_after >= 1
+        assert limiter.get_stats()["rejected_queue_full"] == 1
+
+        slot.release()
+        limiter.acquire().release()
+        assert limiter.get_stats()["in_flight"] == 0
+
+    def test_queued_caller_admitted_on_release(self):
+        """Test that a waiting caller gets the slot once it is released."""
+        limiter = ProviderLimiter("test", max_concurrency=1, max_queue=1, queue_timeout=5)
+        slot = limiter.acquire()
+
+        threading.Timer(0.05, slot.release).start()
+        limiter.acquire().release()
+
+        assert limiter.get_stats()["admitted"] == 2
+
+    def test_queue_timeout(self):
+        """Test that a caller gives up when the queue deadline passes."""
+        limiter = ProviderLimiter("test", max_concurrency=1, max_queue=1, queue_timeout=0.05)
+        limiter.acquire()
+
+        with pytest.raises(AdmissionRejected):
+            limiter.acquire()
+        assert limiter.get_stats()["rejected_timeout"] == 1
+
+    def test_try_acquire_never_queues(self):
+        """Test that optional work is only admitted when a slot is free right away."""
+        limiter = ProviderLimiter("test", max_concurrency=1, max_queue=1)
+        slot = limiter.try_acquire()
+
+        assert slot is not None
+        assert limiter.try_acquire() is None
+
+        slot.release()
+        assert limiter.get_stats()["in_flight"] == 0
+
+    def test_rate_limit(self):
+        """Test that the token bucket spaces out call starts."""
+        limiter = ProviderLimiter("test", rate_per_second=20, burst=1, max_queue=1, queue_timeout=1)
+
+        start = time.monotonic()
+        limiter.acquire().release()
+        limiter.acquire().release()
+
+        assert time.monotonic() - start >= 0.04
+
+class TestAdmissionController:
+    def test_unlisted_provider_is_unlimited(self):
+        """Test that providers without limits are always admitted."""
+        controller = AdmissionController(limits={})
+        controller.acquire("MockImageGenerator").release()
+        assert controller.get_stats() == {}
+
+class TestAdaptiveLimit:
+    def test_grows_while_latency_stays_at_baseline(self):
+        """Test that a fully used limit grows up to its ceiling while latency does not rise."""
+        limit = AdaptiveLimit(4, max_limit=10)
+        for _ in range(100):
+            limit.on_success(0.1, in_flight=limit.current)
+
+        assert limit.current == 10
+
+    def test_unused_limit_does_not_grow(self):
+        """Test that calls far below the limit do not raise it."""
+        limit = AdaptiveLimit(8)
+        for _ in range(100):
+            limit.on_success(0.1, in_flight=1)
+
+        assert limit.current == 8
+
+    def test_cut_once_when_latency_rises(self):
+        """Test that rising latency cuts the limit, and a burst of slow calls counts once."""
+        limit = AdaptiveLimit(10)
+        for _ in range(20):
+            limit.on_success(0.1, in_flight=1)
+        for _ in range(5):
+            limit.on_success(0.5, in_flight=1)
+
+        assert limit.current == 7
+        assert limit.get_stats()["decreases"] == 1
+        assert limit.get_stats()["baseline_ms"] == pytest.approx(100, abs=10)
+
+    def test_sustained_overloads_keep_cutting(self):
+        """Test that a storm of overloads cuts the limit again after each limit's worth of calls."""
+        limit = AdaptiveLimit(32)
+        for _ in range(60):
+            limit.on_overload()
+
+        assert limit.get_stats()["decreases"] >= 4
+        assert limit.current <= 8
+
+    def test_overload_detected_through_wrapped_errors(self):
+        """Test that 429s and timeouts are recognised inside the errors generators raise."""
+        assert is_overload(wrapped(RateLimited("slow down")))
+        assert is_overload(wrapped(requests.ReadTimeout("read timed out")))
+        assert not is_overload(wrapped(ValueError("bad prompt")))
+
+    def test_client_deadline_is_not_an_overload(self):
+        """Test that running out of the request's own time or being cancelled does not count against the provider."""
+        for error in (DeadlineExceeded("generation", 1.0), GenerationCancelled("cancelled")):
+            try:
+                try:
+                    raise requests.ReadTimeout("read timed out")
+                except requests.ReadTimeout:
+                    raise error
+            except GenerationError as e:
+                assert not is_overload(e)
+
+    def test_latency_measured_from_call_start(self):
+        """Test that time between admission and the provider call is left out of the latency."""
+        limiter = ProviderLimiter("test", max_concurrency=8, adaptive={"initial": 8})
+        slot = limiter.acquire()
+        time.sleep(0.1)
+        slot.start()
+        slot.record()
+        slot.release()
+
+        assert limiter.get_stats()["adaptive"]["recent_ms"] < 50
+
+    def test_rate_limit_cuts_provider_limit(self):
+        """Test that a rate-limited call cuts the limiter's concurrency, shown in its stats."""
+        limiter = ProviderLimiter("test", max_concurrency=8, max_queue=1, adaptive={"initial": 8})
+        slot = limiter.acquire()
+        slot.record(wrapped(RateLimited("slow down")))
+        slot.release()
+
+        stats = limiter.get_stats()
+        assert stats["concurrency_limit"] == 5
+        assert stats["adaptive"]["overloads"] == 1
+
+    def test_converges_near_provider_capacity(self):
+        """Test that a limit starting far too high settles near what a slowing mock provider can serve."""
+        limiter = ProviderLimiter("test", max_concurrency=32, max_queue=100, queue_timeout=10, adaptive={"initial": 32})
+        generator = MockImageGenerator(latency=ContendedLatency(limiter, 0.02, capacity=4))
+        limits = []
+
+        def call():
+            slot = limiter.acquire()
+            try:
+                generator.generate_content("a cat")
+                slot.record()
+                limits.append(limiter.get_stats()["concurrency_limit"])
+            finally:
+                slot.release()
+
+        # Light traffic first, so the limiter sees the provider's normal latency
+        for _ in range(3):
+            call()
+        threads = [threading.Thread(target=lambda: [call() for _ in range(15)]) for _ in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Once settled, the limit holds back the 16 callers without shutting the provider off
+        settled = sorted(limits[len(limits) // 2:])
+        assert 2 <= settled[0] and settled[len(settled) // 2] < 16
+        stats = limiter.get_stats()
+        assert stats["adaptive"]["decreases"] > 0
+        assert stats["adaptive"]["baseline_ms"] < 40
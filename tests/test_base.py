@@ -1,6 +1,8 @@
 import pytest
+import threading
+import time
 from unittest.mock import Mock, patch
-from src.services.base import ContentType, ContentGeneratorBase, GenerationError, RouterBase
+from src.services.base import CancelToken, ContentType, ContentGeneratorBase, GenerationCancelled, GenerationError, RouterBase
 
 @pytest.fixture
 def mock_generator():
@@ -27,4 +29,34 @@ def mock_router():
 TEST_PROMPT = "test prompt"
 TEST_API_KEY = "test_key_12345"
 TEST_IMAGE_URL = "https://example.com/image.jpg"
-TEST_AUDIO_URL = "https://example.com/audio.mp3"
\ No newline at end of file
+TEST_AUDIO_URL = "https://example.com/audio.mp3"
+
+class TestCancelToken:
+    def test_cancel_interrupts_sleep(self):
+        """Test that a sleeping generator wakes up as soon as it is cancelled."""
+        token = CancelToken()
+        threading.Timer(0.05, token.cancel).start()
+
+        start = time.monotonic()
+        with pytest.raises(GenerationCancelled):
+            token.sleep(10)
+        assert time.monotonic() - start < 1
+
+    def test_callbacks_run_once(self):
+        """Test that abort callbacks run once, and straight away when registered late."""
+        token = CancelToken()
+        early, late = Mock(), Mock()
+        token.on_cancel(early)
+
+        token.cancel()
+        token.cancel()
+        token.on_cancel(late)
+
+        early.assert_called_once()
+        late.assert_called_once()
+
+    def test_generator_tokens_are_per_instance(self, mock_generator):
+        """Test that cancelling one generator leaves others alone."""
+        mock_generator.cancel()
+        assert mock_generator.cancel_token.cancelled
+        assert not type(mock_generator)().cancel_token.cancelled
\ No newline at end of file
@@ -0,0 +1,54 @@
+import pytest
+from benchmarks.harness import Case, compare, mann_whitney, measure, scaling, summarize
+
+def run_result(samples_by_key, scaling_by_name=None):
+    results = {}
+    for key, (name, param, samples) in samples_by_key.items():
+        result = summarize(samples)
+        result.update(name=name, param=param, number=1)
+        results[key] = result
+    return {"results": results, "scaling": scaling_by_name or {}}
+
+class TestBenchmarkHarness:
+    def test_mann_whitney(self):
+        """Test that separated samples are significant and identical ones are not."""
+        fast = [1.0, 1.1, 0.9, 1.05, 0.95, 1.02, 0.98, 1.01, 0.99, 1.03]
+        slow = [value * 1.5 for value in fast]
+
+        assert mann_whitney(fast, slow) < 0.001
+        assert mann_whitney(fast, list(fast)) == 1.0
+
+    def test_compare_flags_significant_regressions_only(self):
+        """Test that a clear slowdown is a regression while noise within the threshold is not."""
+        base = [1.0, 1.1, 0.9, 1.05, 0.95, 1.02, 0.98, 1.01, 0.99, 1.03]
+        baseline = run_result({
+            "slow": ("slow", None, base), "noisy": ("noisy", None, base), "gone": ("gone", None, base)
+        })
+        current = run_result({
+            "slow": ("slow", None, [value * 2 for value in base]),
+            "noisy": ("noisy", None, [value * 1.03 for value in base]),
+            "added": ("added", None, base)
+        })
+
+        verdicts = {row["benchmark"]: row["verdict"] for row in compare(baseline, current)}
+
+        assert verdicts == {"slow": "regression", "noisy": "unchanged", "gone": "missing", "added": "new"}
+
+    def test_scaling_catches_quadratic_growth(self):
+        """Test that growth exponents are fitted across sizes and a jump to quadratic is a regression."""
+        linear = run_result({"op[1000]": ("op", 1000, [1e-3] * 5), "op[100000]": ("op", 100000, [1e-1] * 5)})
+        quadratic = run_result({"op[1000]": ("op", 1000, [1e-3] * 5), "op[100000]": ("op", 100000, [10.0] * 5)})
+        linear["scaling"], quadratic["scaling"] = scaling(linear["results"]), scaling(quadratic["results"])
+
+        assert linear["scaling"] == {"op": 1.0}
+        rows = [row for row in compare(linear, quadratic) if row["benchmark"] == "op (scaling)"]
+        assert rows[0]["verdict"] == "regression"
+
+    def test_measure_prepares_each_round(self):
+        """Test that measure calibrates calls per round and runs untimed preparation before every round."""
+        prepared = []
+        number, samples = measure(Case(lambda: None, prepared.append), rounds=5, min_time=0.001)
+
+        assert len(samples) == 5
+        assert prepared[-5:] == [number] * 5
+        assert all(sample > 0 for sample in samples)
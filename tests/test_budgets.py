@@ -0,0 +1,81 @@
+import pytest
+from datetime import datetime
+from src.services.budgets import BudgetExceeded, PrincipalBudgets, window_end
+from src.services.cost_tracker import CostTracker
+
+BUDGETS = {
+    "user": {"limit": 1.0, "window": "daily"},
+    "tenant": {"limit": 1.5, "window": "monthly"}
+}
+
+class TestPrincipalBudgets:
+    def test_user_budget_enforced(self):
+        """Test that a user cannot spend past their limit while others still can."""
+        budgets = PrincipalBudgets(BUDGETS, {}, stripes=4)
+
+        budgets.charge([("user", "alice")], 0.6)
+        with pytest.raises(BudgetExceeded):
+            budgets.charge([("user", "alice")], 0.6)
+        budgets.charge([("user", "bob")], 0.6)
+
+        assert budgets.usage(("user", "alice"))["spent"] == pytest.approx(0.6)
+        assert budgets.usage(("user", "alice"))["remaining"] == pytest.approx(0.4)
+
+    def test_charge_is_all_or_nothing(self):
+        """Test that a charge refused by the tenant budget is not charged to the user either."""
+        budgets = PrincipalBudgets(BUDGETS, {}, stripes=4)
+        budgets.charge([("user", "alice"), ("tenant", "acme")], 0.9)
+
+        with pytest.raises(BudgetExceeded):
+            budgets.charge([("user", "bob"), ("tenant", "acme")], 0.9)
+
+        assert budgets.usage(("user", "bob"))["spent"] == 0.0
+        assert budgets.usage(("tenant", "acme"))["spent"] == pytest.approx(0.9)
+
+    def test_windows_reset(self):
+        """Test that daily spend resets the next day and monthly spend the next month."""
+        budgets = PrincipalBudgets(BUDGETS, {}, stripes=4)
+        principals = [("user", "alice"), ("tenant", "acme")]
+        budgets.charge(principals, 0.9, datetime(2026, 1, 31, 23, 0))
+
+        budgets.charge([("user", "alice")], 0.9, datetime(2026, 2, 1, 0, 0))
+        with pytest.raises(BudgetExceeded):
+            budgets.charge([("tenant", "acme")], 0.9, datetime(2026, 1, 31, 23, 30))
+        budgets.charge([("tenant", "acme")], 0.9, datetime(2026, 2, 1, 0, 0))
+
+        assert window_end("monthly", datetime(2026, 12, 5)) == datetime(2027, 1, 1)
+        assert window_end("daily", datetime(2026, 12, 31, 8)) == datetime(2027, 1, 1)
+
+    def test_overrides_and_unlimited(self):
+        """Test that per-principal overrides apply and kinds without a limit are unlimited."""
+        budgets = PrincipalBudgets({"user": {"limit": None, "window": "daily"}}, {"user:capped": 0.5}, stripes=4)
+
+        budgets.charge([("user", "anyone")], 100.0)
+        with pytest.raises(BudgetExceeded):
+            budgets.charge([("user", "capped")], 0.6)
+
+    def test_usage_of_unknown_principal_is_not_stored(self):
+        """Test that looking up principals that were never charged returns zeros without keeping counters."""
+        budgets = PrincipalBudgets(BUDGETS, {}, stripes=4)
+        budgets.charge([("user", "alice")], 0.5, datetime(2026, 1, 1, 12, 0))
+
+        for index in range(100):
+            assert budgets.usage(("user", f"probe-{index}"))["spent"] == 0.0
+        assert budgets.usage(("user", "alice"), datetime(2026, 1, 2, 12, 0))["requests"] == 0
+        assert [usage["id"] for usage in budgets.get_usage()] == ["alice"]
+
+class TestCostTrackerBudgets:
+    def test_refund_and_restart_restore_usage(self, tmp_path):
+        """Test that refunds credit the principals and a new tracker rebuilds usage from the ledger."""
+        tracker = CostTracker(str(tmp_path), write_mode="sync", budgets=PrincipalBudgets(BUDGETS, {}, stripes=4))
+        kept = tracker.track_cost("image", 0.4, "a cat", user_id="alice", tenant_id="acme")
+        refunded = tracker.track_cost("song", 0.5, "a song", user_id="alice", tenant_id="acme")
+        tracker.refund(refunded)
+
+        assert tracker.get_record_by_id(kept)["user"] == "alice"
+        assert tracker.budgets.usage(("user", "alice"))["spent"] == pytest.approx(0.4)
+
+        reloaded = CostTracker(str(tmp_path), write_mode="sync", budgets=PrincipalBudgets(BUDGETS, {}, stripes=4))
+        assert reloaded.budgets.usage(("tenant", "acme"))["spent"] == pytest.approx(0.4)
+        with pytest.raises(ValueError):
+            reloaded.track_cost("image", 0.7, "a cat", user_id="alice")
@@ -0,0 +1,87 @@
+import pytest
+from unittest.mock import Mock
+from src.services.base import GenerationCancelled
+from src.services.circuit_breaker import CircuitBreaker, CircuitOpenError, retry_with_jitter, OPEN, CLOSED
+
+def failing():
+    raise ValueError("API Error")
+
+class TestCircuitBreaker:
+    def test_opens_after_failures(self):
+        """Test that the breaker opens and then fails fast without calling the provider."""
+        breaker = CircuitBreaker("test", failure_rate=0.5, window=4, min_calls=2, open_seconds=60)
+
+        for _ in range(2):
+            with pytest.raises(ValueError):
+                breaker.call(failing)
+
+        provider = Mock()
+        with pytest.raises(CircuitOpenError):
+            breaker.call(provider)
+        with pytest.raises(CircuitOpenError):
+            breaker.raise_if_open()
+
+        provider.assert_not_called()
+        assert breaker.get_stats()["state"] == OPEN
+
+    def test_half_open_probe_closes(self):
+        """Test that a successful probe after the cool-down closes the breaker."""
+        breaker = CircuitBreaker("test", min_calls=1, open_seconds=0, half_open_probes=1)
+
+        with pytest.raises(ValueError):
+            breaker.call(failing)
+        assert breaker.call(lambda: "ok") == "ok"
+        assert breaker.get_stats()["state"] == CLOSED
+
+    def test_slow_calls_count_as_failures(self):
+        """Test that calls over the slow threshold open the breaker."""
+        breaker = CircuitBreaker("test", min_calls=1, slow_call_seconds=-1, open_seconds=60)
+
+        breaker.call(lambda: "slow")
+        with pytest.raises(CircuitOpenError):
+            breaker.call(lambda: "ok")
+
+    def test_stream_failure(self):
+        """Test that a failing stream is recorded by the breaker."""
+        breaker = CircuitBreaker("test", min_calls=1, open_seconds=60)
+
+        def chunks():
+            yield "chunk1"
+            raise ValueError("API Error")
+
+        with pytest.raises(ValueError):
+            list(breaker.stream(chunks))
+        assert breaker.get_stats()["failures"] == 1
+
+    def test_cancellation_is_not_a_failure(self):
+        """Test that calls cancelled by their client do not count against the provider."""
+        breaker = CircuitBreaker("test", min_calls=1, open_seconds=60)
+
+        def cancelled():
+            raise GenerationCancelled("Generation cancelled")
+
+        with pytest.raises(GenerationCancelled):
+            breaker.call(cancelled)
+        assert breaker.get_stats()["state"] == CLOSED
+        assert breaker.get_stats()["failures"] == 0
+
+class TestRetryWithJitter:
+    def test_retries_transient_errors(self):
+        """Test that transient errors are retried until the call succeeds."""
+        func = Mock(side_effect=[ConnectionError(), ConnectionError(), "ok"])
+        assert retry_with_jitter(func, retry_on=(ConnectionError,), attempts=3, base_delay=0) == "ok"
+        assert func.call_count == 3
+
+    def test_gives_up_after_attempts(self):
+        """Test that the last error is raised once attempts are exhausted."""
+        func = Mock(side_effect=ConnectionError())
+        with pytest.raises(ConnectionError):
+            retry_with_jitter(func, retry_on=(ConnectionError,), attempts=2, base_delay=0)
+        assert func.call_count == 2
+
+    def test_does_not_retry_other_errors(self):
+        """Test that errors outside retry_on are raised immediately."""
+        func = Mock(side_effect=ValueError())
+        with pytest.raises(ValueError):
+            retry_with_jitter(func, retry_on=(ConnectionError,), attempts=3, base_delay=0)
+        assert func.call_count == 1
@@ -0,0 +1,107 @@
+import pytest
+import threading
+from unittest.mock import patch
+import src.config as Config
+from src.services.base import CancelToken, GenerationCancelled
+from src.services.clock import Clock, VirtualClock, get_clock, use_clock
+from src.services.latency import LatencyModel, LogNormalLatency, TraceLatency, create_latency_model, reset_mock_latency
+from src.services.image.mock_image_generator import MockImageGenerator
+from src.services.song.suno_song_generator import SunoSongGenerator
+
+class TestVirtualClock:
+    def test_sleep_jumps_forward(self):
+        """Test that sleeping on a virtual clock advances its time without waiting."""
+        clock = VirtualClock()
+        with use_clock(clock):
+            CancelToken().sleep(3600)
+            get_clock().sleep(0.5)
+
+        assert clock.now() == 3600.5
+        assert isinstance(get_clock(), Clock) and not isinstance(get_clock(), VirtualClock)
+
+    def test_wait_times_out_at_once_unless_set(self):
+        """Test that waits for unset events time out instantly and set events return straight away."""
+        clock = VirtualClock()
+        event = threading.Event()
+
+        assert clock.wait(event, 10) is False
+        event.set()
+        assert clock.wait(event, 10) is True
+        assert clock.now() == 10
+
+    def test_cancelled_sleep_raises(self):
+        """Test that a cancelled token still interrupts sleeps on a virtual clock."""
+        token = CancelToken()
+        token.cancel()
+        with use_clock(VirtualClock()), pytest.raises(GenerationCancelled):
+            token.sleep(5)
+
+    @patch('requests.post')
+    @patch('requests.get')
+    def test_suno_polls_on_the_clock(self, mock_get, mock_post):
+        """Test that the Suno poll loop waits one poll interval of clock time between polls."""
+        mock_post.return_value.json.return_value = {"workId": "test_id"}
+        statuses = iter([{"type": "pending"}] * 3 + [{"type": "complete", "response_data": [{"audio_url": "u"}]}])
+        mock_get.return_value.json.side_effect = lambda: next(statuses)
+        clock = VirtualClock()
+
+        with use_clock(clock):
+            SunoSongGenerator().generate_content("a song")
+
+        assert clock.now() == 3
+        assert mock_get.call_count == 4
+
+class TestLatencyModels:
+    def test_seeded_models_reproducible(self):
+        """Test that models with the same seed draw the same latencies."""
+        spec = {"model": "lognormal", "median": 8, "sigma": 0.6}
+        first = create_latency_model(spec, seed=42)
+        second = create_latency_model(spec, seed=42)
+
+        assert [first.sample() for _ in range(20)] == [second.sample() for _ in range(20)]
+
+    def test_lognormal_median_and_cap(self):
+        """Test that lognormal latencies centre on the median and respect max_seconds."""
+        model = LogNormalLatency(median=2.0, sigma=1.0, seed=1, max_seconds=10)
+        samples = sorted(model.sample() for _ in range(2001))
+
+        assert 1.7 < samples[1000] < 2.3
+        assert max(samples) == 10
+
+    def test_trace_replays_in_order(self, tmp_path):
+        """Test that trace models replay recorded latencies from a list or a file, starting over at the end."""
+        path = tmp_path / "latencies.txt"
+        path.write_text("0.5\n1.5\n")
+
+        from_file = TraceLatency(file=str(path))
+        assert [from_file.sample() for _ in range(3)] == [0.5, 1.5, 0.5]
+        model = create_latency_model({"model": "trace", "samples": [1, 2, 3]})
+        assert [model.sample() for _ in range(5)] == [1, 2, 3, 1, 2]
+
+    def test_unknown_model_rejected(self):
+        """Test that an unknown model name is reported."""
+        with pytest.raises(ValueError):
+            create_latency_model({"model": "pareto"})
+
+    def test_model_without_draw_rejected(self):
+        """Test that a latency model must define how it draws latencies."""
+        with pytest.raises(TypeError):
+            LatencyModel()
+
+    def test_mock_generators_use_configured_seeded_latency(self, monkeypatch):
+        """Test that mock generators share the configured model, so seeded runs take the same virtual time."""
+        monkeypatch.setattr(Config, "MOCK_LATENCY", dict(Config.MOCK_LATENCY, image={"model": "uniform", "min": 1, "max": 9}))
+        monkeypatch.setattr(Config, "MOCK_LATENCY_SEED", 7)
+        elapsed = []
+        for _ in range(2):
+            reset_mock_latency()
+            clock = VirtualClock()
+            with use_clock(clock):
+                for _ in range(5):
+                    MockImageGenerator().generate_content("a cat")
+            elapsed.append(clock.now())
+        reset_mock_latency()
+
+        assert elapsed[0] == elapsed[1]
+        assert 5 <= elapsed[0] <= 45
+        assert MockImageGenerator(min_delay=0).latency.sample() == 0
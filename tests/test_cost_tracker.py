@@ -0,0 +1,122 @@
+import pytest
+import threading
+import time
+import src.config as Config
+from src.services.cost_tracker import CostTracker, load_records
+
+def stored_ids(tracker: CostTracker):
+    records = load_records(tracker.costs_file, [tracker.compacting_file, tracker.journal_file])
+    return [record["id"] for record in records]
+
+class TestCostTracker:
+    def test_write_behind_group_commits(self, tmp_path):
+        """Test that records are visible at once and written together once the batch is full."""
+        tracker = CostTracker(str(tmp_path), write_mode="write_behind", flush_interval_ms=60000, flush_max_records=3)
+
+        first = tracker.track_cost("image", 0.04, "a cat")
+        second = tracker.track_cost("song", 0.05, "a song")
+        assert tracker.get_record_by_id(first)["cost"] == 0.04
+        assert tracker.get_costs()["unflushed_records"] == 2
+        assert stored_ids(tracker) == []
+
+        third = tracker.track_cost("research", 0.01, "the moon")
+        deadline = time.time() + 2
+        # Stats are updated once the batch is on disk
+        while time.time() < deadline and tracker.get_stats()["records_flushed"] < 3:
+            time.sleep(0.01)
+        assert stored_ids(tracker) == [first, second, third]
+        assert tracker.get_stats()["largest_flush"] == 3
+        tracker.close()
+
+    def test_write_behind_flushes_after_interval(self, tmp_path):
+        """Test that a lone record is written within the flush interval."""
+        tracker = CostTracker(str(tmp_path), write_mode="write_behind", flush_interval_ms=20, flush_max_records=100)
+
+        record_id = tracker.track_cost("image", 0.04, "a cat")
+        deadline = time.time() + 2
+        while time.time() < deadline and not stored_ids(tracker):
+            time.sleep(0.01)
+        assert stored_ids(tracker) == [record_id]
+        tracker.close()
+
+    def test_close_flushes_and_reloads(self, tmp_path):
+        """Test that closing writes pending records, which a new tracker then loads."""
+        tracker = CostTracker(str(tmp_path), write_mode="write_behind", flush_interval_ms=60000, flush_max_records=100)
+        record_id = tracker.track_cost("image", 0.04, "a cat")
+        refund_id = tracker.refund(record_id)
+        tracker.close()
+
+        reloaded = CostTracker(str(tmp_path), write_mode="sync")
+        assert stored_ids(reloaded) == [record_id, refund_id]
+        assert reloaded.get_costs()["total_cost"] == pytest.approx(0.0)
+
+    def test_partial_refunds_never_exceed_the_cost(self, tmp_path):
+        """Test that a record refunded in parts is never refunded for more than it cost."""
+        tracker = CostTracker(str(tmp_path), write_mode="sync")
+        record_id = tracker.track_cost("research", 0.007, "bees")
+
+        tracker.refund(record_id, "unused sections", amount=0.003)
+        assert tracker.get_costs()["total_cost"] == pytest.approx(0.004)
+        rest_id = tracker.refund(record_id)
+        assert tracker.get_costs()["total_cost"] == pytest.approx(0.0)
+        assert tracker.refund(record_id) == rest_id
+
+    def test_sync_mode_writes_before_returning(self, tmp_path):
+        """Test that sync mode has the record on disk when track_cost returns."""
+        tracker = CostTracker(str(tmp_path), write_mode="sync")
+
+        record_id = tracker.track_cost("image", 0.04, "a cat")
+        assert stored_ids(tracker) == [record_id]
+        assert tracker.delete_record(record_id)
+        assert stored_ids(tracker) == []
+
+    def test_budget_exact_under_concurrency(self, tmp_path, monkeypatch):
+        """Test that concurrent charges never exceed the budget, since checks use the in-memory ledger."""
+        monkeypatch.setattr(Config, "BUDGET", 1.0)
+        tracker = CostTracker(str(tmp_path), write_mode="write_behind", flush_interval_ms=10, flush_max_records=5)
+        accepted = []
+
+        def charge():
+            for _ in range(10):
+                try:
+                    accepted.append(tracker.track_cost("image", 0.1, "a cat"))
+                except ValueError:
+                    pass
+
+        threads = [threading.Thread(target=charge) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        tracker.close()
+
+        assert len(accepted) == 10
+        assert sorted(stored_ids(tracker)) == sorted(accepted)
+
+    def test_journal_compacts_and_reloads(self, tmp_path):
+        """Test that the journal is folded into costs.json once it grows, and the ledger survives a reload."""
+        tracker = CostTracker(str(tmp_path), write_mode="sync", compact_min_records=3)
+        record_ids = [tracker.track_cost("image", 0.01, f"cat {index}") for index in range(5)]
+        tracker.delete_record(record_ids[1])
+        tracker.close()
+
+        assert tracker.get_stats()["compactions"] >= 1
+        assert not tracker.compacting_file.exists()
+        with open(tracker.journal_file) as f:
+            assert len(f.readlines()) < 6
+        reloaded = CostTracker(str(tmp_path), write_mode="sync")
+        assert [record["id"] for record in reloaded.get_costs()["recent_costs"]] == record_ids[:1] + record_ids[2:]
+
+    def test_torn_journal_line_is_skipped(self, tmp_path):
+        """Test that a line torn by a crash mid-append is skipped and does not swallow later records."""
+        tracker = CostTracker(str(tmp_path), write_mode="sync")
+        first = tracker.track_cost("image", 0.01, "a cat")
+        tracker.close()
+        with open(tracker.journal_file, "a") as f:
+            f.write('{"id": "torn", "cost')
+
+        reloaded = CostTracker(str(tmp_path), write_mode="sync")
+        second = reloaded.track_cost("image", 0.01, "a dog")
+        reloaded.close()
+
+        assert stored_ids(reloaded) == [first, second]
@@ -0,0 +1,124 @@
+import pytest
+from unittest.mock import Mock, patch
+from fastapi.testclient import TestClient
+import src.config as Config
+from src.services import service
+from src.services.admission import ProviderLimiter
+from src.services.base import ContentType, ContentGeneratorBase
+from src.services.circuit_breaker import retry_with_jitter
+from src.services.clock import VirtualClock, use_clock
+from src.services.deadline import Deadline, DeadlineExceeded, deadline_seconds, time_left, within
+from src.services.song.suno_song_generator import SunoSongGenerator
+
+class SlowImageGenerator(ContentGeneratorBase):
+    """Image generator that takes longer than the test deadlines."""
+    content_type = ContentType.IMAGE
+
+    def generate_content(self, prompt: str):
+        self.cancel_token.sleep(10)
+        return ContentType.IMAGE, "url"
+
+    def get_price(self) -> float:
+        return 0.0
+
+class TestDeadline:
+    def test_defaults_and_maximums_per_content_type(self, monkeypatch):
+        """Test that requests get their type's default and cannot ask for more than its maximum."""
+        monkeypatch.setattr(Config, "DEADLINE_DEFAULT_SECONDS", {"default": 30, "image": 60, "song": 300})
+        monkeypatch.setattr(Config, "DEADLINE_MAX_SECONDS", {"default": 60, "image": 120, "song": 600})
+
+        assert deadline_seconds(None, "image") == 60
+        assert deadline_seconds(1000, "song") == 600
+        assert deadline_seconds(5, "image") == 5
+        assert deadline_seconds(None, "text") == 30
+        # Before routing the largest default and maximum apply
+        assert deadline_seconds(None) == 300
+        assert deadline_seconds(1000) == 600
+
+    def test_timeouts_use_only_the_time_left(self):
+        """Test that call timeouts shrink to the time left and fail once the deadline passes."""
+        clock = VirtualClock()
+        with use_clock(clock):
+            deadline = Deadline(10)
+            with within(deadline):
+                assert time_left(30) == 10
+                clock.advance(8)
+                assert time_left(30) == 2
+                assert time_left(1) == 1
+                clock.advance(2)
+                with pytest.raises(DeadlineExceeded, match="during polling") as exc_info:
+                    time_left(30, "polling")
+        assert exc_info.value.stage == "polling"
+        # Outside a request a call keeps its own timeout
+        assert time_left(30) == 30
+
+    def test_retries_stop_when_the_backoff_outlasts_the_deadline(self):
+        """Test that a retry that could only start after the deadline is not waited for."""
+        calls = []
+
+        def flaky():
+            calls.append(1)
+            raise ConnectionError("down")
+
+        with use_clock(VirtualClock()), within(Deadline(0.05)):
+            with pytest.raises(DeadlineExceeded):
+                retry_with_jitter(flaky, retry_on=(ConnectionError,), attempts=5, base_delay=1, max_delay=1)
+        assert len(calls) < 5
+
+    def test_admission_gives_up_when_tokens_come_too_late(self):
+        """Test that a caller is turned away at once if the queue ahead cannot clear before its deadline."""
+        limiter = ProviderLimiter("test", rate_per_second=1, burst=1, max_queue=10, queue_timeout=30)
+        limiter.acquire().release()
+
+        with within(Deadline(0.5)), pytest.raises(DeadlineExceeded, match="during queueing"):
+            limiter.acquire()
+        assert limiter.get_stats()["rejected_deadline"] == 1
+
+    @patch('requests.post')
+    @patch('requests.get')
+    def test_suno_stops_polling_when_the_next_poll_is_too_late(self, mock_get, mock_post):
+        """Test that Suno calls get the time left as timeout and polling gives up before the deadline."""
+        mock_post.return_value.json.return_value = {"workId": "test_id"}
+        mock_get.return_value.json.return_value = {"type": "pending"}
+        clock = VirtualClock()
+
+        with use_clock(clock), within(Deadline(2.5)):
+            with pytest.raises(DeadlineExceeded, match="during polling"):
+                SunoSongGenerator().generate_content("a song")
+
+        assert mock_post.call_args.kwargs["timeout"] == 2.5
+        assert mock_get.call_count == 3  # At 0, 1 and 2 seconds; a fourth would come after 2.5
+        assert clock.now() == 2
+
+class TestServiceDeadlines:
+    @pytest.fixture
+    def slow_router(self, monkeypatch):
+        router = Mock()
+        router.route.return_value = SlowImageGenerator()
+        router.get_price.return_value = 0.0
+        monkeypatch.setattr(service, "_router", router)
+        return router
+
+    def test_expired_request_names_its_stage(self, slow_router):
+        """Test that a request past its deadline is stopped with a 504 saying which stage ran out of time."""
+        response = TestClient(service.app).post(
+            "/generate_content", json={"prompt": "a cat"}, headers={Config.DEADLINE_HEADER: "0.2"}
+        )
+
+        assert response.status_code == 504
+        assert response.json()["detail"] == "Deadline of 0.2s exceeded during generation"
+
+    def test_deadline_from_request_field(self, slow_router):
+        """Test that the deadline can also be sent in the request body."""
+        response = TestClient(service.app).post("/generate_content", json={"prompt": "a cat", "timeout_seconds": 0.2})
+
+        assert response.status_code == 504
+
+    @pytest.mark.parametrize("value", ["soon", "0", "-1"])
+    def test_invalid_timeout_rejected(self, value):
+        """Test that a timeout that is not a positive number is a bad request."""
+        response = TestClient(service.app).post(
+            "/generate_content", json={"prompt": "a cat"}, headers={Config.DEADLINE_HEADER: value}
+        )
+
+        assert response.status_code == 400
@@ -0,0 +1,71 @@
+import pytest
+import contextvars
+import json
+from unittest.mock import Mock
+from fastapi.testclient import TestClient
+from src.services import service
+from src.services.base import ContentType, ContentGeneratorBase, GenerationError
+from src.services.events import decode, encode, listen_progress, report_progress
+from src.services.scheduler import ContentScheduler
+
+class FailingPaperGenerator(ContentGeneratorBase):
+    """Research generator that streams two chunks and then fails."""
+    content_type = ContentType.TEXT
+
+    def generate_content(self, prompt: str):
+        yield "Intro. "
+        yield "Body. "
+        raise GenerationError("Provider went away")
+
+    def supports_streaming(self) -> bool:
+        return True
+
+    def get_price(self) -> float:
+        return 0.0
+
+class TestEvents:
+    def test_encode_decode(self):
+        """Test that an encoded event is an SSE frame body that decodes back to its name and payload."""
+        frame = encode("routed", content_type="image", provider="FluxImageGenerator", streaming=False)
+
+        assert frame.startswith("event: routed\ndata: ")
+        assert decode(frame) == ("routed", {"content_type": "image", "provider": "FluxImageGenerator", "streaming": False})
+
+    def test_progress_reaches_listener_from_scheduled_work(self):
+        """Test that progress reported on a scheduler worker reaches the request's listener."""
+        scheduler = ContentScheduler(lanes={"song": {"workers": 1}}, shared_workers=0)
+        reports = []
+
+        def poll():
+            report_progress("suno.poll", status="streaming", attempt=1)
+
+        def handle():
+            with listen_progress(lambda stage, fields: reports.append((stage, fields))):
+                scheduler.submit("song", poll).result(timeout=1)
+            scheduler.submit("song", poll).result(timeout=1)  # No longer listening
+
+        contextvars.copy_context().run(handle)
+
+        assert reports == [("suno.poll", {"status": "streaming", "attempt": 1})]
+
+    def test_report_without_listener_is_ignored(self):
+        """Test that reporting progress outside a listened request does nothing."""
+        report_progress("flux.poll", status="Pending")
+
+class TestLegacyStream:
+    def test_clients_without_event_stream_get_bare_chunks_and_errors(self, monkeypatch):
+        """Test that clients that do not accept events get only the old chunk and error payloads."""
+        router = Mock()
+        router.route.return_value = FailingPaperGenerator()
+        router.get_price.return_value = 0.0
+        monkeypatch.setattr(service, "_router", router)
+
+        response = TestClient(service.app).post("/generate_content", json={"prompt": "a paper"})
+
+        lines = response.text.splitlines()
+        assert not [line for line in lines if line.startswith("event:")]
+        assert [json.loads(line[len("data: "):]) for line in lines if line.startswith("data: ")] == [
+            {"type": "text", "content": "Intro. "},
+            {"type": "text", "content": "Body. "},
+            {"error": "Provider went away"}
+        ]
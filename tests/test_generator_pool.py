@@ -0,0 +1,156 @@
+import pytest
+from unittest.mock import Mock
+from fastapi.testclient import TestClient
+from src.services import service
+from src.services.admission import AdmissionController
+from src.services.circuit_breaker import CircuitBreakerRegistry
+from src.services.generator_pool import Backend, GeneratorPool, backend_settings
+from src.services.research.mock_research_generator import MockResearchGenerator
+from src.services.base import ContentType, GenerationError
+from src.services.deadline import DeadlineExceeded
+import src.config as Config
+
+def image_backend(name, result=None, error=None, latency=None, capacity=8):
+    """Create a backend whose generator returns result or raises error."""
+    generator = Mock()
+    generator.supports_streaming.return_value = False
+    generator.get_price.return_value = 0.04
+    generator.generate_content.side_effect = error or (lambda prompt: (ContentType.IMAGE, result))
+    backend = Backend(name, lambda: generator, capacity=capacity)
+    backend.latency = latency
+    return backend
+
+class TestGeneratorPool:
+    def test_prefers_faster_backend(self):
+        """Test that the backend with lower latency is selected."""
+        slow = image_backend("slow", "slow.jpg", latency=5.0)
+        fast = image_backend("fast", "fast.jpg", latency=0.5)
+        pool = GeneratorPool(ContentType.IMAGE, [slow, fast])
+
+        generator = pool()
+        assert generator.provider == "fast"
+        assert generator.generate_content("test prompt") == (ContentType.IMAGE, "fast.jpg")
+
+    def test_load_shifts_selection(self):
+        """Test that a busy backend loses to an idle one with similar latency."""
+        busy = image_backend("busy", latency=1.0, capacity=1)
+        idle = image_backend("idle", latency=1.2, capacity=1)
+        pool = GeneratorPool(ContentType.IMAGE, [busy, idle])
+
+        busy.begin()
+        backend, reason = pool.select()
+        assert backend is idle
+        assert "load" in reason
+
+    def test_failover_on_error(self):
+        """Test that a failed backend is penalised and the request moves on to another one."""
+        broken = image_backend("broken", error=GenerationError("API Error"), latency=0.1)
+        healthy = image_backend("healthy", "ok.jpg", latency=1.0)
+        generator = GeneratorPool(ContentType.IMAGE, [broken, healthy])()
+
+        assert generator.provider == "broken"
+        with pytest.raises(GenerationError) as error:
+            generator.generate_content("test prompt")
+        assert generator.fail_over(error.value) is True
+        assert generator.provider == "healthy"
+        assert generator.generate_content("test prompt") == (ContentType.IMAGE, "ok.jpg")
+        assert broken.error_rate > 0
+        assert broken.in_flight == 0
+
+    def test_all_backends_fail(self):
+        """Test that the error is raised and no backend is left once every backend fails."""
+        generator = GeneratorPool(ContentType.IMAGE, [image_backend("broken", error=GenerationError("API Error"))])()
+        with pytest.raises(GenerationError) as error:
+            generator.generate_content("test prompt")
+        assert generator.fail_over(error.value) is False
+
+    def test_deadline_is_not_a_backend_failure(self):
+        """Test that running out of time abandons the backend without penalty and does not fail over."""
+        late = image_backend("late", error=DeadlineExceeded("generation", 1.0), latency=0.1)
+        spare = image_backend("spare", "ok.jpg", latency=1.0)
+        generator = GeneratorPool(ContentType.IMAGE, [late, spare])()
+
+        with pytest.raises(DeadlineExceeded) as error:
+            generator.generate_content("test prompt")
+        assert generator.fail_over(error.value) is False
+        assert generator.provider == "late"
+        assert late.error_rate == 0
+        assert late.in_flight == 0
+
+    def test_streaming_backend(self):
+        """Test that streaming backends are streamed through the pool."""
+        pool = GeneratorPool(ContentType.TEXT, [Backend("research", MockResearchGenerator, cost=0.5)])
+        generator = pool()
+
+        assert generator.supports_streaming() is True
+        assert generator.get_price() == 0.5
+
+    def test_from_config(self):
+        """Test building a pool from configuration entries."""
+        pool = GeneratorPool.from_config(ContentType.IMAGE, [
+            {"generator": "src.services.image.mock_image_generator:MockImageGenerator", "kwargs": {"min_delay": 0, "max_delay": 0}}
+        ])
+        content_type, url = pool().generate_content("test prompt")
+        assert content_type == ContentType.IMAGE
+        assert pool.get_stats()["MockImageGenerator"]["latency"] is not None
+
+class TestServiceFailover:
+    def test_fallback_is_admitted_and_charged_as_itself(self, monkeypatch):
+        """Test that a failed-over request goes through the fallback's admission and pays only for it."""
+        broken = image_backend("broken", error=GenerationError("API Error"), latency=0.1)
+        healthy = image_backend("healthy", "ok.jpg", latency=1.0)
+        pool = GeneratorPool(ContentType.IMAGE, [broken, healthy])
+        router = Mock()
+        router.route.side_effect = lambda prompt: pool()
+        router.get_price.return_value = 0.0
+        monkeypatch.setattr(service, "_router", router)
+        track_cost = Mock(side_effect=["route", "broken-charge", "healthy-charge"])
+        refund = Mock()
+        monkeypatch.setattr(service.cost_tracker, "track_cost", track_cost)
+        monkeypatch.setattr(service.cost_tracker, "refund", refund)
+        admitted = []
+        try_acquire = service.admission_controller.try_acquire
+        monkeypatch.setattr(service.admission_controller, "try_acquire", lambda provider: admitted.append(provider) or try_acquire(provider))
+
+        response = TestClient(service.app).post("/generate_content", json={"prompt": "a cat"})
+
+        assert response.status_code == 200
+        assert response.json()["content"] == "ok.jpg"
+        assert admitted == ["broken", "healthy"]
+        assert [call.args[0] for call in track_cost.call_args_list] == ["Mock", "broken", "healthy"]
+        refund.assert_called_once_with("broken-charge", "failover")
+
+RESEARCH = "src.services.research.mock_research_generator:MockResearchGenerator"
+
+class TestBackendSettings:
+    def test_backend_takes_its_providers_settings(self):
+        """Test that a backend not listed by name is configured like its generator class."""
+        settings = {"MockResearchGenerator": {"max_concurrency": 2}}
+        pools = {"text": [{"name": "research-primary", "generator": RESEARCH},
+                          {"name": "research-secondary", "generator": RESEARCH, "provider": "Secondary"}]}
+
+        with pytest.raises(ValueError, match="research-secondary"):
+            backend_settings(settings, pools)
+
+        settings["Secondary"] = {"max_concurrency": 1}
+        extended = backend_settings(settings, pools)
+        assert extended["research-primary"] == {"max_concurrency": 2}
+        assert extended["research-secondary"] == {"max_concurrency": 1}
+
+    def test_backend_keeps_its_own_settings(self):
+        """Test that a backend listed under its own name needs no provider settings."""
+        pools = {"text": [{"name": "research-primary", "generator": RESEARCH}]}
+        assert backend_settings({"research-primary": {"window": 5}}, pools) == {"research-primary": {"window": 5}}
+
+    def test_registries_limit_and_break_each_backend(self, monkeypatch):
+        """Test that every pool backend gets its own limiter and breaker from config."""
+        monkeypatch.setattr(Config, "GENERATOR_BACKENDS", {"text": [{"name": "research-primary", "generator": RESEARCH}]})
+        monkeypatch.setattr(Config, "PROVIDER_LIMITS", {"MockResearchGenerator": {"max_concurrency": 2}})
+        monkeypatch.setattr(Config, "CIRCUIT_BREAKERS", {"MockResearchGenerator": {"window": 5}})
+
+        assert AdmissionController().limiter("research-primary") is not None
+        assert "research-primary" in CircuitBreakerRegistry().get_stats()
+
+        monkeypatch.setattr(Config, "CIRCUIT_BREAKERS", {})
+        with pytest.raises(ValueError):
+            CircuitBreakerRegistry()
@@ -6,8 +6,17 @@ from src.services.research.mock_research_generator import MockResearchGenerator
 from src.services.image.flux_image_generator import FluxImageGenerator
 from src.services.song.suno_song_generator import SunoSongGenerator
 from src.services.research.openai_research_generator import OpenAIResearchGenerator
-from src.services.base import ContentType, GenerationError
+from src.services.base import ContentType, GenerationError, GenerationCancelled
+from src.services.events import listen_progress
+from src.services.clock import VirtualClock, use_clock
 
+@pytest.fixture
+def clock():
+    """Virtual clock, so simulated delays and poll intervals take no real time."""
+    with use_clock(VirtualClock()) as clock:
+        yield clock
+
+@pytest.mark.usefixtures("clock")
 class TestMockGenerators:
     def test_mock_image_generator(self):
         """Test mock image generator functionality."""
@@ -29,7 +38,7 @@ class TestMockGenerators:
         assert url.startswith("http")
         assert generator.get_price() > 0
 
-    def test_mock_research_generator(self):
+    def test_mock_research_generator(self, clock):
         """Test mock research generator functionality."""
         generator = MockResearchGenerator()
         assert generator.supports_streaming() is True
@@ -39,6 +48,15 @@ class TestMockGenerators:
         assert len(content) > 0
         assert all(isinstance(chunk, str) for chunk in content)
         assert generator.get_price() > 0
+        assert clock.sleeps == 7
+
+    def test_cancelled_mock_generator_stops(self):
+        """Test that a cancelled mock generator gives up instead of finishing its delay."""
+        generator = MockSongGenerator(min_delay=30, max_delay=30)
+        generator.cancel()
+
+        with pytest.raises(GenerationCancelled):
+            generator.generate_content("test prompt")
 
 class TestFluxImageGenerator:
     @patch('requests.Session')
@@ -50,6 +68,7 @@ class TestFluxImageGenerator:
         with pytest.raises(GenerationError):
             generator.generate_content("test prompt")
 
+@pytest.mark.usefixtures("clock")
 class TestSunoSongGenerator:
     @patch('requests.post')
     @patch('requests.get')
@@ -73,6 +92,35 @@ class TestSunoSongGenerator:
         assert content_type == ContentType.SONG
         assert url == "https://example.com/song.mp3"
 
+    @patch('requests.post')
+    @patch('requests.get')
+    def test_poll_statuses_reported_as_progress(self, mock_get, mock_post):
+        """Test that submission and every poll status are reported as progress."""
+        mock_post.return_value.json.return_value = {"workId": "test_id"}
+        statuses = iter([{"type": "streaming"}, {"type": "complete", "response_data": [{"audio_url": "u"}]}])
+        mock_get.return_value.json.side_effect = lambda: next(statuses)
+        reports = []
+
+        generator = SunoSongGenerator()
+        with listen_progress(lambda stage, fields: reports.append((stage, fields.get("status")))):
+            generator.generate_content("test prompt")
+
+        assert reports == [("suno.submit", "submitted"), ("suno.poll", "streaming"), ("suno.poll", "complete")]
+
+    @patch('requests.post')
+    @patch('requests.get')
+    def test_cancel_stops_polling(self, mock_get, mock_post):
+        """Test that cancelling a song generation stops polling right away."""
+        mock_post.return_value.json.return_value = {"workId": "test_id"}
+        mock_get.return_value.json.return_value = {"type": "pending"}
+
+        generator = SunoSongGenerator()
+        mock_get.side_effect = lambda *args, **kwargs: (generator.cancel(), mock_get.return_value)[1]
+
+        with pytest.raises(GenerationCancelled):
+            generator.generate_content("test prompt")
+        assert mock_get.call_count == 1
+
     @patch('requests.post')
     def test_song_generation_failure(self, mock_post):
         """Test song generation failure handling."""
@@ -0,0 +1,105 @@
+import pytest
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from src.services import service
+from src.services.media_store import MediaStore, media_response, parse_range
+
+ASSET = bytes(range(256)) * 40
+
+class AssetHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(ASSET)))
+        self.end_headers()
+        self.wfile.write(ASSET)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def asset_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), AssetHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/image.png"
+    server.shutdown()
+
+@pytest.fixture
+def store(tmp_path):
+    return MediaStore(root=str(tmp_path))
+
+@pytest.fixture
+def client(store):
+    app = FastAPI()
+
+    @app.get("/media/{digest}")
+    def get_media(digest: str, request: Request):
+        headers = request.headers
+        return media_response(store, digest, headers.get("range"), headers.get("if-range"), headers.get("if-none-match"))
+
+    return TestClient(app)
+
+class TestMediaStore:
+    def test_resolve_stores_content_addressed(self, store, asset_url):
+        """Test that a downloaded asset is stored under its SHA-256 and returned as a local URL."""
+        digest = hashlib.sha256(ASSET).hexdigest()
+
+        assert store.resolve(asset_url, wait=5) == f"/media/{digest}"
+        assert store.path(digest).read_bytes() == ASSET
+        assert store.media_type(digest) == "image/png"
+        assert MediaStore(root=str(store.root)).local_url(asset_url) == f"/media/{digest}"
+
+    def test_corrupt_index_is_ignored(self, tmp_path, asset_url):
+        """Test that a damaged index starts the store empty and is replaced whole by the next download."""
+        (tmp_path / "index.json").write_text('{"urls": {"http://')
+        store = MediaStore(root=str(tmp_path))
+        assert store.get_stats()["urls"] == 0
+
+        digest = store.download(asset_url)
+        assert MediaStore(root=str(tmp_path)).local_url(asset_url) == f"/media/{digest}"
+        assert [path.name for path in tmp_path.iterdir() if path.is_file()] == ["index.json"]
+
+    def test_resolve_falls_back_to_provider_url(self, store):
+        """Test that a failed download returns the provider URL."""
+        url = "http://127.0.0.1:1/missing.png"
+        assert store.resolve(url, wait=5) == url
+
+    def test_range_and_caching_headers(self, store, client, asset_url):
+        """Test full, partial and conditional requests for a stored asset."""
+        local_url = store.resolve(asset_url, wait=5)
+
+        full = client.get(local_url)
+        assert full.status_code == 200
+        assert full.content == ASSET
+        assert "immutable" in full.headers["cache-control"]
+
+        partial = client.get(local_url, headers={"Range": "bytes=100-199"})
+        assert partial.status_code == 206
+        assert partial.content == ASSET[100:200]
+        assert partial.headers["content-range"] == f"bytes 100-199/{len(ASSET)}"
+
+        assert client.get(local_url, headers={"If-None-Match": full.headers["etag"]}).status_code == 304
+        assert client.get(local_url, headers={"Range": f"bytes={len(ASSET)}-"}).status_code == 416
+        assert client.get("/media/" + "0" * 64).status_code == 404
+
+    def test_service_answers_head_requests(self, store, asset_url, monkeypatch):
+        """Test that the service's media route serves HEAD with the asset's headers and no body."""
+        monkeypatch.setattr(service, "media_store", store)
+        local_url = store.resolve(asset_url, wait=5)
+
+        head = TestClient(service.app).head(local_url)
+
+        assert head.status_code == 200
+        assert head.headers["content-length"] == str(len(ASSET))
+        assert head.content == b""
+
+    def test_parse_range(self):
+        """Test open-ended, suffix and multi-range headers."""
+        assert parse_range("bytes=10-", 100) == (10, 99)
+        assert parse_range("bytes=-10", 100) == (90, 99)
+        assert parse_range("bytes=0-4,10-14", 100) is None
+        with pytest.raises(ValueError):
+            parse_range("bytes=200-300", 100)
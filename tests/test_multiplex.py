@@ -0,0 +1,183 @@
+import pytest
+import asyncio
+import json
+from unittest.mock import Mock
+from fastapi.testclient import TestClient
+from src.services import service
+from src.services.base import ContentType, ContentGeneratorBase
+from src.services.events import encode
+from src.services.multiplex import Multiplexer, StreamRejected
+from src.services.stream_buffer import StreamBuffer
+
+class PaperGenerator(ContentGeneratorBase):
+    """Research generator streaming a fixed paper."""
+    content_type = ContentType.TEXT
+
+    def generate_content(self, prompt: str):
+        yield from ["Intro. ", "Body. ", "End."]
+
+    def supports_streaming(self) -> bool:
+        return True
+
+    def get_price(self) -> float:
+        return 0.0
+
+class PictureGenerator(ContentGeneratorBase):
+    """Image generator that takes a given time."""
+    content_type = ContentType.IMAGE
+
+    def __init__(self, seconds: float = 0.0):
+        super().__init__()
+        self.seconds = seconds
+
+    def generate_content(self, prompt: str):
+        self.cancel_token.sleep(self.seconds)
+        return ContentType.IMAGE, "https://example.com/cat.png"
+
+    def get_price(self) -> float:
+        return 0.0
+
+def receive_until_done(websocket, ids):
+    """Collect (event, data) pairs per stream id until every stream ended."""
+    events = {stream_id: [] for stream_id in ids}
+    open_ids = set(ids)
+    while open_ids:
+        message = websocket.receive_json()
+        events[message["id"]].append((message["event"], message["data"]))
+        if message["event"] in ("done", "error"):
+            open_ids.discard(message["id"])
+    return events
+
+class TestWebSocketService:
+    @pytest.fixture
+    def router(self, monkeypatch):
+        router = Mock()
+        router.get_price.return_value = 0.0
+        monkeypatch.setattr(service, "_router", router)
+        return router
+
+    def test_concurrent_streams_share_one_connection(self, router):
+        """Test that a paper and an image run together over one connection, each tagged with its id."""
+        router.route.side_effect = lambda prompt: PaperGenerator() if "paper" in prompt else PictureGenerator(0.2)
+
+        with TestClient(service.app).websocket_connect("/ws") as websocket:
+            websocket.send_json({"type": "start", "id": "image", "prompt": "a cat"})
+            websocket.send_json({"type": "start", "id": "paper", "prompt": "a paper on cats"})
+            events = receive_until_done(websocket, ["image", "paper"])
+
+        assert [event for event, _ in events["paper"]] == ["routed", "chunk", "chunk", "chunk", "done"]
+        assert "".join(data["content"] for event, data in events["paper"] if event == "chunk") == "Intro. Body. End."
+        assert ("result", {"type": "image", "content": "https://example.com/cat.png"}) in events["image"]
+
+    def test_cancel_one_stream(self, router):
+        """Test that cancelling a stream ends it with a 499 while the connection stays usable."""
+        router.route.side_effect = lambda prompt: PictureGenerator(10) if "slow" in prompt else PaperGenerator()
+
+        with TestClient(service.app).websocket_connect("/ws") as websocket:
+            websocket.send_json({"type": "start", "id": "slow", "prompt": "a slow cat"})
+            assert websocket.receive_json()["event"] == "routed"
+            websocket.send_json({"type": "cancel", "id": "slow"})
+            assert receive_until_done(websocket, ["slow"])["slow"][-1] == ("error", {"status": 499, "detail": "Request cancelled"})
+
+            websocket.send_json({"type": "start", "id": "paper", "prompt": "a paper"})
+            assert receive_until_done(websocket, ["paper"])["paper"][-1] == ("done", {})
+
+    def test_invalid_start_rejected(self, router):
+        """Test that a start message without a prompt gets a 400 error for its id."""
+        with TestClient(service.app).websocket_connect("/ws") as websocket:
+            websocket.send_json({"type": "start", "id": "bad"})
+            message = websocket.receive_json()
+
+        assert message["id"] == "bad"
+        assert message["event"] == "error"
+        assert message["data"]["status"] == 400
+
+class TestMultiplexer:
+    @pytest.fixture
+    def buffer(self, tmp_path):
+        return StreamBuffer(spill_dir=str(tmp_path))
+
+    @pytest.mark.asyncio
+    async def test_stream_waits_for_credit(self, buffer):
+        """Test that a stream stops after its window and goes on once the client grants more."""
+        record = buffer.open("req")
+        for index in range(5):
+            record.append(encode("chunk", type="text", content=str(index)))
+        record.finish()
+        sent = []
+
+        async def send(message):
+            sent.append(json.loads(message))
+
+        multiplexer = Multiplexer(send, lambda body: record, buffer.get, window=2)
+        incoming = asyncio.Queue()
+        serving = asyncio.create_task(multiplexer.serve(incoming.get))
+        await incoming.put(json.dumps({"type": "start", "id": "a", "prompt": "x"}))
+        await asyncio.sleep(0.05)
+
+        assert [message["data"]["content"] for message in sent] == ["0", "1"]
+        assert sent[0]["event_id"] == "req:0"
+
+        await incoming.put(json.dumps({"type": "credit", "id": "a", "events": 10}))
+        await asyncio.sleep(0.05)
+        serving.cancel()
+
+        assert [message["data"]["content"] for message in sent] == ["0", "1", "2", "3", "4"]
+        assert not multiplexer.channels
+
+    @pytest.mark.asyncio
+    async def test_stream_limit_and_rejections(self, buffer):
+        """Test that streams beyond the limit, duplicate ids and refused starts get error events."""
+        record = buffer.open("req")
+        sent = []
+
+        async def send(message):
+            sent.append(json.loads(message))
+
+        def start(body):
+            if body.get("prompt") == "refuse":
+                raise StreamRejected(402, "Budget exceeded")
+            return record
+
+        multiplexer = Multiplexer(send, start, buffer.get, max_streams=1)
+        incoming = asyncio.Queue()
+        serving = asyncio.create_task(multiplexer.serve(incoming.get))
+        for message in [
+            {"type": "start", "id": "a", "prompt": "x"},
+            {"type": "start", "id": "a", "prompt": "x"},
+            {"type": "start", "id": "b", "prompt": "x"},
+            {"type": "resume", "id": "c", "last_event_id": "gone:3"},
+            "not json",
+        ]:
+            await incoming.put(message if isinstance(message, str) else json.dumps(message))
+        await asyncio.sleep(0.05)
+        record.finish()
+        await asyncio.sleep(0.05)
+        await incoming.put(json.dumps({"type": "start", "id": "d", "prompt": "refuse"}))
+        await asyncio.sleep(0.05)
+        serving.cancel()
+
+        assert [(message["id"], message["data"]["status"]) for message in sent] == [
+            ("a", 409), ("b", 429), ("c", 429), (None, 400), ("d", 402)
+        ]
+
+    @pytest.mark.asyncio
+    async def test_resume_after_event_id(self, buffer):
+        """Test that a stream can be picked up on a new connection after the last event received."""
+        record = buffer.open("req")
+        for index in range(3):
+            record.append(encode("chunk", type="text", content=str(index)))
+        record.finish()
+        sent = []
+
+        async def send(message):
+            sent.append(json.loads(message))
+
+        multiplexer = Multiplexer(send, Mock(), buffer.get)
+        incoming = asyncio.Queue()
+        serving = asyncio.create_task(multiplexer.serve(incoming.get))
+        await incoming.put(json.dumps({"type": "resume", "id": "a", "last_event_id": "req:0"}))
+        await asyncio.sleep(0.05)
+        serving.cancel()
+
+        assert [message["event_id"] for message in sent] == ["req:1", "req:2"]
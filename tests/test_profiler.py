@@ -0,0 +1,74 @@
+import pytest
+import contextvars
+import json
+import threading
+import time
+import src.config as Config
+from src.services.profiler import SamplingProfiler, should_profile, start_request_profile
+from src.services.scheduler import ContentScheduler
+
+def slow_provider_call():
+    time.sleep(0.1)
+
+class TestProfiler:
+    def test_samples_blocking_call(self, tmp_path):
+        """Test that a thread blocked in time.sleep shows up in the collapsed stacks."""
+        worker = threading.Thread(target=slow_provider_call, name="provider")
+        profiler = SamplingProfiler("p", interval=0.005).start()
+        worker.start()
+        worker.join()
+        profile = profiler.stop()
+
+        path = profile.write(str(tmp_path))
+        lines = path.read_text().splitlines()
+        assert path.name == "p.txt"
+        assert any(line.startswith("provider;") and "slow_provider_call" in line for line in lines)
+        # time.sleep is C code, so the innermost sampled frame is its caller
+        assert profile.top(1, thread="provider")[0]["frame"].startswith("slow_provider_call")
+
+    def test_request_profile_follows_scheduled_work(self):
+        """Test that a request profile samples scheduler workers only while they run its tasks."""
+        scheduler = ContentScheduler(lanes={"song": {"workers": 1}}, shared_workers=0)
+        scheduler.submit("song", lambda: None).result(timeout=1)  # Start the worker before profiling
+        idle = threading.Thread(target=slow_provider_call, name="other-request")
+
+        def handle():
+            profiler = start_request_profile("req")
+            profiler.interval = 0.005
+            idle.start()
+            scheduler.submit("song", slow_provider_call).result(timeout=1)
+            idle.join()
+            return profiler.stop()
+
+        profile = contextvars.copy_context().run(handle)
+
+        threads = {thread for thread, _ in profile.samples}
+        assert any("slow_provider_call" in ";".join(stack) for _, stack in profile.samples)
+        assert "other-request" not in threads
+
+    def test_speedscope_format(self, tmp_path):
+        """Test that speedscope output has one sampled profile per thread over shared frames."""
+        profiler = SamplingProfiler("p", interval=0.005).start()
+        slow_provider_call()
+        profile = profiler.stop()
+
+        document = json.loads(profile.write(str(tmp_path), "speedscope").read_text())
+        assert document["shared"]["frames"]
+        for item in document["profiles"]:
+            assert item["type"] == "sampled"
+            assert len(item["samples"]) == len(item["weights"])
+            assert all(index < len(document["shared"]["frames"]) for stack in item["samples"] for index in stack)
+
+    def test_should_profile_requires_admin_token(self, monkeypatch):
+        """Test that flagged requests need the admin token and unflagged ones follow the sample rate."""
+        monkeypatch.setattr(Config, "PROFILE_ADMIN_TOKEN", "secret")
+        monkeypatch.setattr(Config, "PROFILE_SAMPLE_RATE", 0.0)
+
+        assert should_profile("secret")
+        assert not should_profile(None)
+        with pytest.raises(PermissionError):
+            should_profile("guess")
+
+        monkeypatch.setattr(Config, "PROFILE_ADMIN_TOKEN", None)
+        with pytest.raises(PermissionError):
+            should_profile("secret")
@@ -0,0 +1,44 @@
+import sys
+import pytest
+from unittest.mock import patch
+import src.config as Config
+from src.services import registry
+from src.services.base import ContentType
+
+class TestRegistry:
+    def test_generators_are_imported_on_first_use(self):
+        """Test that generator modules are only imported when a generator is created."""
+        module = "src.services.song.mock_song_generator"
+        with patch.dict(sys.modules):
+            sys.modules.pop(module, None)
+            generators = registry.generators("dev")
+            assert module not in sys.modules
+
+            generator = generators[ContentType.SONG](min_delay=0, max_delay=0)
+            assert module in sys.modules
+            assert generator.content_type == ContentType.SONG
+
+    def test_disabled_content_type(self):
+        """Test that content types missing from the configuration are not registered."""
+        with patch.dict(Config.GENERATORS["dev"], clear=True):
+            assert registry.generators("dev") == {}
+
+    def test_create_router_for_mode(self):
+        """Test that the router for a mode is created from its import path."""
+        router = registry.create_router("dev")
+        assert router.__class__.__name__ == "MockRouter"
+
+class TestLazyConfig:
+    def test_api_key_read_on_first_use(self, monkeypatch):
+        """Test that API keys are resolved from the environment when accessed."""
+        monkeypatch.delitem(Config.__dict__, "IMAGE_API_KEY", raising=False)
+        monkeypatch.setenv("BFL_API_KEY", "test_key_12345")
+        assert Config.IMAGE_API_KEY == "test_key_12345"
+        monkeypatch.delitem(Config.__dict__, "IMAGE_API_KEY")
+
+    def test_missing_api_key(self, monkeypatch):
+        """Test that a missing API key fails when it is needed, not at import time."""
+        monkeypatch.delitem(Config.__dict__, "SONG_GENERATION_TOKEN", raising=False)
+        monkeypatch.delenv("UDIO_API_KEY", raising=False)
+        with pytest.raises(ValueError):
+            Config.SONG_GENERATION_TOKEN
@@ -1,8 +1,12 @@
 import pytest
+import time
 from unittest.mock import Mock, patch
 from src.services.router.mock_router import MockRouter
 from src.services.router.openai_router import OpenAIRouter
+from src.services.router.batching_router import BatchingRouter
 from src.services.base import ContentType, GenerationError
+from src.services.deadline import Deadline, DeadlineExceeded, current_deadline, within
+from concurrent.futures import ThreadPoolExecutor
 
 class TestMockRouter:
     def test_route_research(self):
@@ -39,4 +43,55 @@ class TestOpenAIRouter:
 
         router = OpenAIRouter()
         generator = router.route("test prompt")
-        assert isinstance(generator.get_price(), float)
\ No newline at end of file
+        assert isinstance(generator.get_price(), float)
+
+class TestBatchingRouter:
+    def test_concurrent_prompts_share_one_call(self):
+        """Test that prompts arriving within the window are classified together."""
+        inner = MockRouter()
+        inner.classify_batch = Mock(side_effect=lambda prompts: [ContentType.SONG] * len(prompts))
+        router = BatchingRouter(inner, window_ms=200, max_batch_size=4)
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            generators = list(pool.map(router.route, ["a song"] * 4))
+
+        assert inner.classify_batch.call_count == 1
+        assert all(not generator.supports_streaming() for generator in generators)
+        assert router.get_stats()["largest_batch"] == 4
+
+    def test_batch_error_reaches_every_caller(self):
+        """Test that a failed batch call fails each waiting request."""
+        inner = MockRouter()
+        inner.classify_batch = Mock(side_effect=GenerationError("API Error"))
+        router = BatchingRouter(inner, window_ms=1)
+
+        with pytest.raises(GenerationError):
+            router.route("research about AI")
+
+    def test_caller_gives_up_at_its_deadline(self):
+        """Test that a request stops waiting for a slow batch call once its deadline passes."""
+        inner = MockRouter()
+        inner.classify_batch = Mock(side_effect=lambda prompts: time.sleep(0.5) or [ContentType.SONG] * len(prompts))
+        router = BatchingRouter(inner, window_ms=1)
+
+        start = time.monotonic()
+        with within(Deadline(0.1)), pytest.raises(DeadlineExceeded):
+            router.route("a song")
+        assert time.monotonic() - start < 0.4
+
+    def test_batch_call_runs_under_the_earliest_deadline(self):
+        """Test that the batch call sees the most urgent deadline of the requests in it."""
+        inner = MockRouter()
+        seen = []
+        inner.classify_batch = Mock(side_effect=lambda prompts: seen.append(current_deadline()) or [ContentType.SONG] * len(prompts))
+        router = BatchingRouter(inner, window_ms=100, max_batch_size=2)
+        urgent, relaxed = Deadline(5), Deadline(50)
+
+        def route(deadline):
+            with within(deadline):
+                return router.route("a song")
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            list(pool.map(route, [relaxed, urgent]))
+
+        assert seen == [urgent]
\ No newline at end of file
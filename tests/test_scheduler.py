@@ -0,0 +1,73 @@
+import pytest
+import threading
+from src.services.scheduler import ContentScheduler
+
+class TestContentScheduler:
+    def test_bulkhead_isolates_slow_lane(self):
+        """Test that a saturated lane does not delay work on another lane."""
+        scheduler = ContentScheduler(
+            lanes={"song": {"workers": 1}, "text": {"workers": 1}},
+            shared_workers=0
+        )
+        release = threading.Event()
+
+        blocked = [scheduler.submit("song", release.wait) for _ in range(3)]
+        assert scheduler.submit("text", lambda: "done").result(timeout=1) == "done"
+
+        release.set()
+        assert all(future.result(timeout=1) for future in blocked)
+
+    def test_clients_served_round_robin(self):
+        """Test that queued tasks alternate between clients within a lane."""
+        scheduler = ContentScheduler(lanes={"image": {"workers": 1}}, shared_workers=0)
+        release = threading.Event()
+        order = []
+
+        scheduler.submit("image", release.wait)
+        futures = [scheduler.submit("image", order.append, "heavy", client_key="heavy") for _ in range(3)]
+        futures.append(scheduler.submit("image", order.append, "light", client_key="light"))
+
+        release.set()
+        for future in futures:
+            future.result(timeout=1)
+
+        assert order.index("light") == 1
+
+    def test_shared_workers_prefer_higher_priority(self):
+        """Test that shared workers serve the lowest priority value first."""
+        scheduler = ContentScheduler(
+            lanes={"router": {"priority": 0}, "song": {"priority": 2}},
+            shared_workers=1
+        )
+        release = threading.Event()
+        order = []
+
+        scheduler.submit("song", release.wait)
+        futures = [scheduler.submit("song", order.append, "song"), scheduler.submit("router", order.append, "router")]
+
+        release.set()
+        for future in futures:
+            future.result(timeout=1)
+
+        assert order == ["router", "song"]
+
+    @pytest.mark.asyncio
+    async def test_stream(self):
+        """Test that a blocking iterator is streamed from its lane."""
+        scheduler = ContentScheduler(lanes={"text": {"workers": 1}}, shared_workers=0)
+
+        chunks = [chunk async for chunk in scheduler.stream("text", iter, ["a", "b", "c"])]
+        assert chunks == ["a", "b", "c"]
+
+    @pytest.mark.asyncio
+    async def test_stream_error(self):
+        """Test that iterator errors reach the consumer."""
+        scheduler = ContentScheduler(lanes={"text": {"workers": 1}}, shared_workers=0)
+
+        def failing():
+            yield "a"
+            raise ValueError("API Error")
+
+        with pytest.raises(ValueError):
+            async for _ in scheduler.stream("text", failing):
+                pass
@@ -0,0 +1,160 @@
+import gc
+import threading
+import time
+import pytest
+from unittest.mock import Mock
+from fastapi.testclient import TestClient
+import src.config as Config
+from src.services import service
+from src.services.base import CancelToken, GenerationCancelled, GenerationError
+from src.services.latency import FixedLatency
+from src.services.research.mock_research_generator import MockResearchGenerator
+from src.services.research.sectioned import SectionedResearch, parse_outline, section_calls
+
+class FakeWriter:
+    """Research writer whose sections take given times and record their token budgets."""
+
+    def __init__(self, durations, fail_index=None):
+        self.durations = durations
+        self.fail_index = fail_index
+        self.cancel_token = CancelToken()
+        self.budgets = {}
+        self.running = 0
+        self.most_running = 0
+        self._lock = threading.Lock()
+
+    def outline(self, prompt, sections, max_tokens):
+        self.budgets["outline"] = max_tokens
+        return [f"Part {index}" for index in range(len(self.durations))][:sections]
+
+    def write_section(self, prompt, titles, index, max_tokens):
+        self.budgets[index] = max_tokens
+        with self._lock:
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+        try:
+            time.sleep(self.durations[index])
+            if index == self.fail_index:
+                raise GenerationError(f"{titles[index]} failed")
+            yield f"[{titles[index]}]"
+        finally:
+            with self._lock:
+                self.running -= 1
+
+class TestSectionedResearch:
+    def test_sections_stream_in_order(self):
+        """Test that sections come out in outline order even when later ones finish first."""
+        writer = FakeWriter([0.15, 0.05, 0.0, 0.1])
+
+        chunks = list(SectionedResearch(writer, sections=4, parallelism=4, max_tokens=4000).stream("bees"))
+
+        assert chunks == ["[Part 0]", "[Part 1]", "[Part 2]", "[Part 3]"]
+
+    def test_parallelism_is_bounded(self):
+        """Test that no more sections run at once than the configured parallelism."""
+        writer = FakeWriter([0.05] * 6)
+
+        list(SectionedResearch(writer, sections=6, parallelism=2, max_tokens=4000).stream("bees"))
+
+        assert writer.most_running == 2
+
+    def test_first_section_flows_before_later_ones_finish(self):
+        """Test that the first section reaches the client while slower sections are still being written."""
+        writer = FakeWriter([0.0, 0.5])
+        chunks = SectionedResearch(writer, sections=2, parallelism=2, max_tokens=4000).stream("bees")
+        start = time.monotonic()
+
+        assert next(chunks) == "[Part 0]"
+        assert time.monotonic() - start < 0.4
+        assert list(chunks) == ["[Part 1]"]
+
+    def test_token_budget_shared_by_all_calls(self, monkeypatch):
+        """Test that the outline and sections together stay within the paper's token budget."""
+        monkeypatch.setattr(Config, "RESEARCH_OUTLINE_MAX_TOKENS", 300)
+        writer = FakeWriter([0.0] * 5)
+
+        list(SectionedResearch(writer, sections=5, parallelism=5, max_tokens=4000).stream("bees"))
+
+        assert writer.budgets["outline"] == 300
+        assert writer.budgets["outline"] + sum(writer.budgets[index] for index in range(5)) <= 4000
+        assert writer.budgets[0] == 740
+
+    def test_section_failure_fails_the_paper(self):
+        """Test that a failed section raises once the sections before it have streamed."""
+        writer = FakeWriter([0.0, 0.0, 0.0], fail_index=1)
+        chunks = SectionedResearch(writer, sections=3, parallelism=3, max_tokens=4000).stream("bees")
+
+        assert next(chunks) == "[Part 0]"
+        with pytest.raises(GenerationError, match="Part 1 failed"):
+            next(chunks)
+
+    def test_sections_without_a_slot_share_the_requests(self):
+        """Test that sections beyond the free slots take turns in the request's own, and unused ones are settled."""
+        writer = FakeWriter([0.05] * 4)
+        free_slots = [lambda func, *args: func(*args)] * 2
+        settled = []
+
+        with section_calls(lambda: free_slots.pop() if free_slots else None, settled.append):
+            chunks = list(SectionedResearch(writer, sections=6, parallelism=6, max_tokens=4000).stream("bees"))
+
+        assert len(chunks) == 4
+        assert writer.most_running == 3
+        assert settled == [2]
+
+    def test_cancellation_wakes_the_reader(self):
+        """Test that a cancelled paper stops waiting for its running sections straight away."""
+        writer = FakeWriter([0.5] * 2)
+        chunks = SectionedResearch(writer, sections=2, parallelism=2, max_tokens=4000).stream("bees")
+        threading.Timer(0.05, writer.cancel_token.cancel).start()
+
+        start = time.monotonic()
+        with pytest.raises(GenerationCancelled):
+            list(chunks)
+        assert time.monotonic() - start < 0.3
+
+    def test_parse_outline(self):
+        """Test that numbering and bullets are stripped and blank lines dropped."""
+        text = "1. Introduction\n\n2) Background\n- Methods\n## Results\nDiscussion\n"
+
+        assert parse_outline(text, 4) == ["Introduction", "Background", "Methods", "Results"]
+
+class TestSectionedMockResearch:
+    def test_sectioned_mode_is_faster_and_priced_per_call(self, monkeypatch):
+        """Test that sectioned mock papers overlap their calls and cost one call per section plus the outline."""
+        monkeypatch.setattr(Config, "RESEARCH_SECTION_PARALLELISM", 6)
+        generator = MockResearchGenerator(latency=FixedLatency(0.05))
+        single_price = generator.get_price()
+        # A full collection late in the suite takes longer than a section, so it is not left to happen while timing
+        gc.collect()
+
+        start = time.monotonic()
+        "".join(generator.generate_content("bees"))
+        single = time.monotonic() - start
+
+        monkeypatch.setattr(Config, "RESEARCH_MODE", "sectioned")
+        start = time.monotonic()
+        paper = "".join(generator.generate_content("bees"))
+        sectioned = time.monotonic() - start
+
+        assert paper.index("Introduction:") < paper.index("Background:") < paper.index("Conclusion:")
+        assert sectioned < single / 2
+        assert generator.get_price() == pytest.approx(single_price * (1 + Config.RESEARCH_SECTIONS))
+
+    def test_service_refunds_sections_left_out(self, monkeypatch):
+        """Test that a request is refunded for the sections its outline left out."""
+        monkeypatch.setattr(Config, "RESEARCH_MODE", "sectioned")
+        generator = MockResearchGenerator(latency=FixedLatency(0.0))
+        generator.outline = lambda prompt, sections, max_tokens: ["Introduction", "Results", "Conclusion"]
+        router = Mock()
+        router.route.return_value = generator
+        router.get_price.return_value = 0.0
+        monkeypatch.setattr(service, "_router", router)
+        monkeypatch.setattr(service.cost_tracker, "track_cost", Mock(side_effect=["route", "paper"]))
+        refund = Mock()
+        monkeypatch.setattr(service.cost_tracker, "refund", refund)
+
+        response = TestClient(service.app).post("/generate_content", json={"prompt": "a paper on bees"})
+
+        assert response.status_code == 200
+        unused = Config.RESEARCH_SECTIONS - 3
+        refund.assert_called_once_with("paper", "unused sections", amount=pytest.approx(0.001 * unused))
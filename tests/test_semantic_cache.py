@@ -0,0 +1,56 @@
+from src.services.research.semantic_cache import SemanticResearchCache, CachedResearchGenerator
+from src.services.research.mock_research_generator import MockResearchGenerator
+from unittest.mock import patch
+
+class TestSemanticResearchCache:
+    def test_paraphrase_hits(self):
+        """Test that a paraphrased prompt finds the stored paper."""
+        cache = SemanticResearchCache(max_entries=100)
+        cache.store("paper on the moon", "Moon paper")
+
+        paper, similarity = cache.lookup("research about the Moon")
+        assert paper == "Moon paper"
+        assert similarity >= cache.threshold
+
+    def test_unrelated_prompt_misses(self):
+        """Test that a different topic does not hit."""
+        cache = SemanticResearchCache(max_entries=100)
+        cache.store("paper on the moon", "Moon paper")
+
+        assert cache.lookup("research about protein folding") is None
+        assert cache.get_stats()["misses"] == 1
+
+    def test_lru_eviction(self):
+        """Test that the least recently used paper is evicted when full."""
+        cache = SemanticResearchCache(max_entries=2, eviction="lru")
+        cache.store("volcanoes", "Volcano paper")
+        cache.store("glaciers", "Glacier paper")
+        cache.lookup("volcanoes")
+        cache.store("deserts", "Desert paper")
+
+        assert cache.lookup("glaciers") is None
+        assert cache.lookup("volcanoes")[0] == "Volcano paper"
+        assert cache.get_stats()["evictions"] == 1
+
+    def test_buckets_are_capped_for_clustered_prompts(self):
+        """Test that similar prompts cannot pile up in one bucket, and the newest stay findable."""
+        cache = SemanticResearchCache(max_entries=500, bucket_size=4)
+        for index in range(500):
+            cache.store(f"write a research paper on the history of bees {index}", f"Paper {index}")
+
+        assert max(len(bucket) for table in cache._buckets for bucket in table.values()) <= 4
+        assert cache.lookup("write a research paper on the history of bees 499")[0] == "Paper 499"
+
+    @patch("src.services.base.CancelToken.sleep")
+    def test_wrap_records_then_replays(self, mock_sleep):
+        """Test that a completed paper is stored and replayed for free."""
+        cache = SemanticResearchCache(max_entries=100)
+
+        first = cache.wrap(MockResearchGenerator(), "research about the moon")
+        paper = "".join(first.generate_content("research about the moon"))
+        assert first.get_price() > 0
+
+        second = cache.wrap(MockResearchGenerator(), "a paper on the Moon please")
+        assert isinstance(second, CachedResearchGenerator)
+        assert second.get_price() == 0.0
+        assert "".join(second.generate_content("a paper on the Moon please")) == paper
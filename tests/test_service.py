@@ -13,6 +13,18 @@ class TestFastAPIService:
             response = client.get("/")
             assert response.status_code in [404, 200]  # Depends on if you have a root endpoint
 
+    def test_job_state_written_after_restart(self):
+        """Test that job state can still be written after the service shut down and started again."""
+        from src.services import service
+        with client:
+            pass
+        with client:
+            service.record_job("restarted", status="done")
+            service.job_writer.submit(lambda: None).result(timeout=5)
+            assert client.get("/jobs/restarted").json()["status"] == "done"
+        service.record_job("stopped", status="done")
+        assert client.get("/jobs/stopped").json()["status"] == "done"
+
     @patch('src.services.router.mock_router.MockRouter')
     def test_generate_content_streaming(self, mock_router_class):
         """Test streaming content generation."""
@@ -0,0 +1,203 @@
+import os
+import threading
+from datetime import datetime
+import pytest
+from src.services.base import ContentType
+from src.services.budgets import BudgetExceeded, SharedBudgets
+from src.services.clock import VirtualClock, use_clock
+from src.services.router.mock_router import MockRouter
+from src.services.router.route_cache import RouteCache
+from src.services.state.base import Counter, create_state
+from src.services.state.local_state import LocalState
+from src.services.state.redis_state import RedisState
+import src.config as Config
+
+BUDGETS = {
+    "user": {"limit": 1.0, "window": "daily"},
+    "tenant": {"limit": 1.5, "window": "monthly"}
+}
+
+def fake_redis_state():
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")  # fakeredis runs Lua scripts through lupa
+    return RedisState(prefix="test:", client=fakeredis.FakeRedis(decode_responses=True))
+
+def server_redis_state():
+    # Runs against a real server only when one is configured, e.g. REDIS_URL=redis://localhost:6379/15
+    if not os.environ.get("REDIS_URL"):
+        pytest.skip("REDIS_URL not set")
+    redis = pytest.importorskip("redis")
+    client = redis.Redis.from_url(os.environ["REDIS_URL"], decode_responses=True)
+    try:
+        client.ping()
+    except redis.ConnectionError:
+        pytest.skip("Redis server not reachable")
+    for key in client.scan_iter(match="test:*"):
+        client.delete(key)
+    return RedisState(prefix="test:", client=client)
+
+@pytest.fixture(params=["local", "fakeredis", "redis"])
+def state(request):
+    state = {"local": LocalState, "fakeredis": fake_redis_state, "redis": server_redis_state}[request.param]()
+    yield state
+    state.close()
+
+class TestSharedState:
+    def test_charge_is_all_or_nothing(self, state):
+        """Test that a charge refused by one counter's limit changes none of them."""
+        assert state.charge([Counter("a", 0.6, 1.0), Counter("b", 0.6)]) is None
+        assert state.charge([Counter("b", 0.6), Counter("a", 0.6, 1.0)]) == 1
+
+        assert state.get_counters(["a", "b", "missing"]) == [pytest.approx(0.6), pytest.approx(0.6), 0.0]
+
+    def test_credit_floors_at_zero(self, state):
+        """Test that credits never take a counter below zero and skip missing counters."""
+        state.charge([Counter("a", 0.5)])
+        state.credit(["a", "missing"], 2.0)
+
+        assert state.get_counters(["a", "missing"]) == [0.0, 0.0]
+
+    def test_scan_counters(self, state):
+        """Test that counters are found by prefix, even when the prefix holds pattern characters."""
+        state.charge([Counter("{budget}:spent:user:alice", 1.0), Counter("{budget}:spent:tenant:acme", 2.0), Counter("other", 3.0)])
+
+        assert state.scan_counters("{budget}:spent:user:") == {"{budget}:spent:user:alice": 1.0}
+        assert len(state.scan_counters("{budget}:")) == 2
+
+    def test_cache_round_trip(self, state):
+        """Test that batched writes and reads return values in order, None for missing keys."""
+        state.set_many({"x": "1", "y": "2"}, ttl=60)
+
+        assert state.get_many(["y", "missing", "x"]) == ["2", None, "1"]
+        assert state.get("x") == "1"
+
+    def test_job_fields_merge(self, state):
+        """Test that job updates merge JSON fields rather than replacing the job."""
+        state.update_job("job-1", {"status": "running", "provider": "mock"}, ttl=60)
+        state.update_job("job-1", {"status": "done", "result": {"type": "image", "content": "url"}}, ttl=60)
+
+        assert state.get_job("job-1") == {"status": "done", "provider": "mock", "result": {"type": "image", "content": "url"}}
+        assert state.get_job("missing") is None
+
+    def test_lock_is_exclusive_and_token_checked(self, state):
+        """Test that a held lock cannot be taken, and only its holder's token releases it."""
+        token = state.acquire_lock("work", 10)
+
+        assert token is not None
+        assert state.acquire_lock("work", 10) is None
+        assert state.release_lock("work", "someone-else") is False
+        assert state.release_lock("work", token) is True
+        with state.lock("work", 10) as acquired:
+            assert acquired
+            assert state.acquire_lock("work", 10) is None
+
+    def test_concurrent_charges_respect_limit(self, state):
+        """Test that charges racing from many threads never overspend a limit."""
+        def charge():
+            for _ in range(20):
+                state.charge([Counter("shared", 0.1, 5.0)])
+
+        threads = [threading.Thread(target=charge) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert state.get_counters(["shared"])[0] == pytest.approx(5.0)
+
+class TestSharedBudgets:
+    def test_nodes_share_budgets(self, state):
+        """Test that two nodes on the same state enforce one user budget between them."""
+        node_a, node_b = SharedBudgets(state, BUDGETS, {}), SharedBudgets(state, BUDGETS, {})
+
+        node_a.charge([("user", "alice"), ("tenant", "acme")], 0.6)
+        with pytest.raises(BudgetExceeded):
+            node_b.charge([("user", "alice"), ("tenant", "acme")], 0.6)
+        node_b.charge([("user", "bob"), ("tenant", "acme")], 0.6)
+
+        alice = node_b.usage(("user", "alice"))
+        assert alice["spent"] == pytest.approx(0.6)
+        assert alice["requests"] == 1
+        assert node_a.usage(("tenant", "acme"))["spent"] == pytest.approx(1.2)
+        assert {usage["id"] for usage in node_a.get_usage("user")} == {"alice", "bob"}
+        assert node_a.total() == pytest.approx(1.2)
+
+    def test_overall_budget_is_shared(self, state, monkeypatch):
+        """Test that the overall budget counts spend from every node and refunds give it back."""
+        monkeypatch.setattr(Config, "BUDGET", 1.0)
+        budgets = SharedBudgets(state, BUDGETS, {})
+        budgets.charge([], 0.8)
+
+        with pytest.raises(ValueError, match="budget of 1.0"):
+            SharedBudgets(state, BUDGETS, {}).charge([("user", "alice")], 0.5)
+        assert budgets.usage(("user", "alice"))["spent"] == 0.0
+
+        budgets.credit([], 0.8, charged_at=datetime.now())
+        budgets.charge([("user", "alice")], 0.5)
+
+class TestRouteCache:
+    def test_repeated_prompts_skip_the_router(self):
+        """Test that a routed prompt is served from the cache, whatever its case and spacing."""
+        cache = RouteCache(LocalState(), ttl=60, lock_seconds=1, poll_seconds=0.1)
+        router = MockRouter()
+        calls = []
+
+        def route_call(prompt):
+            calls.append(prompt)
+            return router.route(prompt)
+
+        generator, cached = cache.route(router, "Make me an image of a cat", route_call)
+        again, cached_again = cache.route(router, "  make me an IMAGE of a   cat ", route_call)
+
+        assert (cached, cached_again) == (False, True)
+        assert again.content_type == generator.content_type == ContentType.IMAGE
+        assert len(calls) == 1
+        assert cache.get_stats()["hit_rate"] == 0.5
+
+    def test_concurrent_misses_are_single_flighted(self):
+        """Test that a request finding the prompt being routed elsewhere waits for that result."""
+        state = LocalState()
+        cache = RouteCache(state, ttl=60, lock_seconds=5, poll_seconds=1)
+        router = MockRouter()
+        clock = VirtualClock()
+
+        def route_elsewhere(prompt):
+            raise AssertionError("The waiting request should not route")
+
+        # Another node holds the lock; it stores its decision after two polls
+        token = state.acquire_lock(RouteCache.key("a song about rain"), 5)
+        original_sleep = clock.sleep
+
+        def sleep(seconds):
+            original_sleep(seconds)
+            if clock.now() >= 2:
+                cache.store("a song about rain", ContentType.SONG)
+
+        clock.sleep = sleep
+        with use_clock(clock):
+            generator, cached = cache.route(router, "a song about rain", route_elsewhere)
+
+        assert cached is True
+        assert generator.content_type == ContentType.SONG
+        assert cache.get_stats()["waits"] == 1
+        state.release_lock(RouteCache.key("a song about rain"), token)
+
+    def test_routes_itself_when_the_lock_holder_never_answers(self):
+        """Test that a waiting request routes on its own once the lock would have expired."""
+        state = LocalState()
+        cache = RouteCache(state, ttl=60, lock_seconds=2, poll_seconds=0.5)
+        state.acquire_lock(RouteCache.key("draw a cat"), 2)
+
+        with use_clock(VirtualClock()):
+            generator, cached = cache.route(MockRouter(), "draw a cat", MockRouter().route)
+
+        assert cached is False
+        assert generator.content_type == ContentType.IMAGE
+        assert cache.lookup("draw a cat") == ContentType.IMAGE
+
+def test_create_state_uses_configured_backend(monkeypatch):
+    """Test that the backend is picked from Config.SHARED_STATE_BACKENDS."""
+    monkeypatch.setattr(Config, "SHARED_STATE", "local")
+
+    assert isinstance(create_state(), LocalState)
+    assert create_state().shared is False
@@ -0,0 +1,138 @@
+import pytest
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from fastapi.testclient import TestClient
+import src.config as Config
+from src.services.service import app
+from src.services.base import CancelToken, GenerationCancelled
+from src.services.song.callbacks import SongCallbacks, song_callbacks
+from src.services.song.suno_song_generator import SunoSongGenerator
+
+client = TestClient(app)
+
+COMPLETE = {"workId": "work-1", "type": "complete", "response_data": [{"audio_url": "https://example.com/song.mp3"}]}
+
+class FakeSuno:
+    """Local stand-in for Suno: accepts jobs, serves the feed and delivers signed callbacks to the service."""
+
+    def __init__(self, secret: str = "secret", send_callback: bool = True):
+        self.secret = secret
+        self.send_callback = send_callback
+        self.submitted = []
+        self.polls = 0
+        self.callbacks = []
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                fake.submitted.append(payload)
+                self._reply({"workId": "work-1"})
+                if fake.send_callback and payload.get("callback_url"):
+                    timer = threading.Timer(0.05, fake.callback)
+                    fake.callbacks.append(timer)
+                    timer.start()
+
+            def do_GET(self):
+                fake.polls += 1
+                self._reply(COMPLETE)
+
+            def _reply(self, data):
+                body = json.dumps(data).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def stop(self):
+        """Wait for callbacks in flight and stop the server."""
+        for timer in self.callbacks:
+            timer.join()
+        self.server.shutdown()
+
+    def callback(self):
+        body = json.dumps(COMPLETE).encode()
+        signature = SongCallbacks(self.secret).sign(body)
+        self.callback_response = client.post(
+            "/callbacks/suno", content=body, headers={Config.SONG_CALLBACK_SIGNATURE_HEADER: signature}
+        )
+
+@pytest.fixture
+def suno_config(monkeypatch):
+    monkeypatch.setattr(Config, "SONG_CALLBACK_URL", "http://testserver/callbacks/suno")
+    monkeypatch.setattr(Config, "SONG_CALLBACK_SECRET", "secret")
+    monkeypatch.setattr(Config, "SONG_CALLBACK_TIMEOUT_SECONDS", 5)
+    monkeypatch.setattr(Config, "SONG_FALLBACK_POLL_SECONDS", 0.05)
+    monkeypatch.setattr(Config, "SONG_GENERATION_TOKEN", "token", raising=False)
+
+    def use(fake: FakeSuno):
+        monkeypatch.setattr(Config, "SONG_GENERATION_URL", fake.url + "/api/generate")
+        monkeypatch.setattr(Config, "SONG_FEED_URL", fake.url + "/api/feed?workId=")
+        return fake
+    return use
+
+class TestSongCallbacks:
+    def test_callback_completes_without_polling(self, suno_config):
+        """Test that a signed callback completes the waiting song request and the feed is never polled."""
+        fake = suno_config(FakeSuno())
+
+        content_type, url = SunoSongGenerator().generate_content("a song")
+
+        assert url == "https://example.com/song.mp3"
+        assert fake.submitted[0]["callback_url"] == "http://testserver/callbacks/suno"
+        fake.stop()
+        assert fake.polls == 0
+        assert fake.callback_response.json() == {"matched": True}
+        assert song_callbacks.get_stats()["waiting"] == 0
+
+    def test_bad_signature_rejected_and_overdue_job_polls(self, suno_config, monkeypatch):
+        """Test that a wrongly signed callback is refused, so the job falls back to polling once overdue."""
+        monkeypatch.setattr(Config, "SONG_CALLBACK_TIMEOUT_SECONDS", 0.2)
+        fake = suno_config(FakeSuno(secret="wrong"))
+
+        content_type, url = SunoSongGenerator().generate_content("a song")
+
+        fake.stop()
+        assert url == "https://example.com/song.mp3"
+        assert fake.callback_response.status_code == 401
+        assert fake.polls == 1
+
+    def test_polls_every_second_without_callbacks(self, suno_config, monkeypatch):
+        """Test that jobs do not ask for callbacks when no callback URL is configured."""
+        monkeypatch.setattr(Config, "SONG_CALLBACK_URL", None)
+        fake = suno_config(FakeSuno())
+
+        SunoSongGenerator().generate_content("a song")
+
+        assert "callback_url" not in fake.submitted[0]
+        assert fake.polls == 1
+        fake.stop()
+
+    def test_early_callback_is_held_for_its_job(self):
+        """Test that a callback arriving before its job is registered is picked up on registration."""
+        callbacks = SongCallbacks("secret")
+
+        assert callbacks.deliver("work-1", COMPLETE) is False
+        pending = callbacks.register("work-1")
+
+        assert pending.wait(0, CancelToken()) == COMPLETE
+
+    def test_cancel_wakes_waiting_job(self, suno_config):
+        """Test that cancelling a song request stops its wait for the callback straight away."""
+        fake = suno_config(FakeSuno(send_callback=False))
+        generator = SunoSongGenerator()
+        threading.Timer(0.1, generator.cancel).start()
+
+        with pytest.raises(GenerationCancelled):
+            generator.generate_content("a song")
+        assert fake.polls == 0
+        fake.stop()
@@ -0,0 +1,110 @@
+import pytest
+import asyncio
+from unittest.mock import Mock
+from fastapi.testclient import TestClient
+from src.services import service
+from src.services.image.mock_image_generator import MockImageGenerator
+from src.services.latency import FixedLatency
+from src.services.research.mock_research_generator import MockResearchGenerator
+from src.services.speculation import ResearchSpeculator, Speculation
+
+async def chunks(items, release=None, finished=None):
+    try:
+        for item in items:
+            if release:
+                await release.wait()
+            yield item
+    finally:
+        if finished is not None:
+            finished.append(True)
+
+class TestResearchSpeculator:
+    def test_predicts_research(self):
+        """Test that only prompts that look like research and nothing else are speculated on."""
+        speculator = ResearchSpeculator()
+        assert speculator.predicts_research("Write a research paper on coral reefs")
+        assert not speculator.predicts_research("A song about my research")
+        assert not speculator.predicts_research("A picture of a cat")
+
+    @pytest.mark.asyncio
+    async def test_hit_replays_buffered_chunks(self):
+        """Test that a confirmed speculation yields its buffered output and then the rest."""
+        speculator = ResearchSpeculator()
+        speculation = Speculation(Mock(), chunks(["a", "b", "c"]))
+        speculator.started()
+        await asyncio.sleep(0.01)
+
+        speculator.hit(speculation)
+        assert [chunk async for chunk in speculation.follow()] == ["a", "b", "c"]
+        assert speculator.get_stats()["hit_rate"] == 1.0
+
+    @pytest.mark.asyncio
+    async def test_miss_cancels_and_counts_waste(self):
+        """Test that an unconfirmed speculation stops right away and its price is recorded."""
+        speculator = ResearchSpeculator()
+        generator = Mock()
+        generator.get_price.return_value = 0.05
+        finished = []
+        speculation = Speculation(generator, chunks(["a", "b"], release=asyncio.Event(), finished=finished))
+        speculator.started()
+        await asyncio.sleep(0)
+
+        speculator.miss(speculation)
+        await asyncio.sleep(0.01)
+
+        assert speculation.task.cancelled()
+        assert finished == [True]
+        stats = speculator.get_stats()
+        assert stats["misses"] == 1
+        assert stats["wasted_spend"] == 0.05
+
+class TestSpeculationBilling:
+    @pytest.fixture
+    def router(self, monkeypatch):
+        router = Mock()
+        router.create_generator.side_effect = lambda content_type: MockResearchGenerator(latency=FixedLatency(0.01))
+        router.get_price.return_value = 0.0
+        monkeypatch.setattr(service, "_router", router)
+        monkeypatch.setattr(service, "speculator", ResearchSpeculator())
+        monkeypatch.setattr(service, "research_cache", None)
+        monkeypatch.setattr(service, "media_store", None)
+        monkeypatch.setattr(service.cost_tracker, "refund", Mock())
+        return router
+
+    def charged(self):
+        return [call.args[0] for call in service.cost_tracker.track_cost.call_args_list]
+
+    def test_hit_is_charged_once(self, router, monkeypatch):
+        """Test that a confirmed speculation's up-front charge is the request's, not charged again."""
+        router.route.side_effect = lambda prompt: router.create_generator(None)
+        monkeypatch.setattr(service.cost_tracker, "track_cost", Mock(side_effect=["speculation", "route"]))
+
+        response = TestClient(service.app).post("/generate_content", json={"prompt": "a research paper on bees"})
+
+        assert response.status_code == 200
+        assert self.charged() == ["MockResearchGenerator", "Mock"]
+        assert service.speculator.get_stats()["hits"] == 1
+        service.cost_tracker.refund.assert_not_called()
+
+    def test_miss_stays_in_the_ledger(self, router, monkeypatch):
+        """Test that a speculation routing did not confirm stays charged next to the generation that ran."""
+        router.route.side_effect = lambda prompt: MockImageGenerator(latency=FixedLatency(0.0))
+        monkeypatch.setattr(service.cost_tracker, "track_cost", Mock(side_effect=["speculation", "route", "image"]))
+
+        response = TestClient(service.app).post("/generate_content", json={"prompt": "a research paper on bees"})
+
+        assert response.status_code == 200
+        assert self.charged() == ["MockResearchGenerator", "Mock", "MockImageGenerator"]
+        assert service.speculator.get_stats()["misses"] == 1
+        service.cost_tracker.refund.assert_not_called()
+
+    def test_no_speculation_over_budget(self, router, monkeypatch):
+        """Test that a request whose budget cannot pay for a speculation is not speculated for."""
+        router.route.side_effect = lambda prompt: router.create_generator(None)
+        monkeypatch.setattr(service.cost_tracker, "track_cost", Mock(side_effect=ValueError("Budget exceeded")))
+
+        response = TestClient(service.app).post("/generate_content", json={"prompt": "a research paper on bees"})
+
+        assert "Budget exceeded" in response.text
+        assert service.speculator.get_stats()["speculated"] == 0
+        assert len(self.charged()) == 2
@@ -0,0 +1,98 @@
+import pytest
+import asyncio
+from src.services.stream_buffer import StreamBuffer, parse_last_event_id
+
+async def collect(record, after=-1):
+    return [item async for item in record.follow(after)]
+
+class TestStreamBuffer:
+    @pytest.mark.asyncio
+    async def test_resume_after_last_event(self, tmp_path):
+        """Test that a reader resuming after an event gets only the later ones."""
+        buffer = StreamBuffer(spill_dir=str(tmp_path))
+        record = buffer.open("abc")
+        for chunk in ["a", "b", "c"]:
+            record.append(chunk)
+        record.finish()
+
+        assert await collect(record, after=0) == [(1, "b"), (2, "c")]
+        assert await collect(record, after=2) == []
+
+    @pytest.mark.asyncio
+    async def test_long_stream_spills_to_disk(self, tmp_path):
+        """Test that events moved to disk are still replayed in order."""
+        buffer = StreamBuffer(memory_events=4, spill_dir=str(tmp_path))
+        record = buffer.open("long")
+        for i in range(20):
+            record.append(str(i))
+        record.finish()
+        await record.wait_spilled()
+
+        assert len(record.events) <= 4
+        assert record.spill_file.exists()
+        assert await collect(record, after=2) == [(i, str(i)) for i in range(3, 20)]
+
+    @pytest.mark.asyncio
+    async def test_resume_reads_spill_from_its_offset(self, tmp_path):
+        """Test that a resume deep into the spilled events reads from there rather than the whole file."""
+        buffer = StreamBuffer(memory_events=4, spill_dir=str(tmp_path))
+        record = buffer.open("long")
+        for i in range(40):
+            record.append(str(i))
+        record.finish()
+        await record.wait_spilled()
+
+        # A read covers at most the memory limit, from the event after the resume point
+        assert await record._read_spilled(30) == [(i, str(i)) for i in range(31, 35)]
+        assert await collect(record, after=30) == [(i, str(i)) for i in range(31, 40)]
+
+    @pytest.mark.asyncio
+    async def test_reader_follows_live_tail(self, tmp_path):
+        """Test that a reader attached mid-stream receives events as they are produced."""
+        buffer = StreamBuffer(spill_dir=str(tmp_path))
+        record = buffer.open("live")
+        record.append("first")
+
+        reader = asyncio.create_task(collect(record))
+        await asyncio.sleep(0)
+        record.append("second")
+        await asyncio.sleep(0)
+        record.append("third")
+        record.finish()
+
+        assert await asyncio.wait_for(reader, 1) == [(0, "first"), (1, "second"), (2, "third")]
+
+    @pytest.mark.asyncio
+    async def test_idle_reader_gets_heartbeats(self, tmp_path):
+        """Test that a reader waiting on a quiet stream receives heartbeats until the next event."""
+        buffer = StreamBuffer(spill_dir=str(tmp_path))
+        record = buffer.open("quiet")
+
+        async def produce():
+            await asyncio.sleep(0.05)
+            record.append("result")
+            record.finish()
+
+        producer = asyncio.create_task(produce())
+        items = [item async for item in record.follow(heartbeat=0.01)]
+        await producer
+
+        assert (None, None) in items
+        assert items[-1] == (0, "result")
+
+    def test_finished_streams_evicted_beyond_limit(self, tmp_path):
+        """Test that the oldest finished streams make room, while live ones are kept."""
+        buffer = StreamBuffer(max_streams=2, spill_dir=str(tmp_path))
+        live = buffer.open("live")
+        buffer.open("old").finish()
+        buffer.open("new")
+
+        assert buffer.get("old") is None
+        assert buffer.get("live") is live
+        assert buffer.get("new") is not None
+
+    def test_parse_last_event_id(self):
+        """Test splitting Last-Event-ID into stream id and sequence number."""
+        assert parse_last_event_id("abc:12") == ("abc", 12)
+        with pytest.raises(ValueError):
+            parse_last_event_id("12")
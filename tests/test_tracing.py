@@ -0,0 +1,121 @@
+import pytest
+import contextvars
+import json
+import time
+from src.services.scheduler import ContentScheduler
+from src.services.tracing import Tracer, current_trace, span, waterfall
+
+def trace_request(tracer: Tracer, trace_id: str, work):
+    """Trace a request the way the service does, in its own context like a request task."""
+    def handle():
+        root = tracer.start_trace(trace_id, "request", force=True)
+        try:
+            work()
+        finally:
+            root.end = time.perf_counter()
+            root.trace.release()
+        return root.trace
+
+    return contextvars.copy_context().run(handle)
+
+class TestTracing:
+    def test_unsampled_requests_record_nothing(self):
+        """Test that spans are no-ops when the request is not sampled."""
+        tracer = Tracer(sample_rate=0.0, export_file="")
+
+        assert contextvars.copy_context().run(tracer.start_trace, "a", "request") is None
+        with span("route") as current:
+            assert current is None
+        assert current_trace() is None
+        assert not tracer.traces
+
+    def test_spans_nest(self):
+        """Test that spans record their depth under the root span."""
+        tracer = Tracer(sample_rate=0.0, export_file="")
+
+        def work():
+            with span("route"):
+                with span("openai.classify", model="m"):
+                    pass
+            with span("generate"):
+                pass
+
+        trace = trace_request(tracer, "a", work).to_dict()
+
+        assert [(item["name"], item["depth"]) for item in trace["spans"]] == [
+            ("request", 0), ("route", 1), ("openai.classify", 2), ("generate", 1)
+        ]
+        assert trace["spans"][2]["attributes"] == {"model": "m"}
+
+    def test_spans_follow_scheduled_work(self):
+        """Test that a provider call on a scheduler worker records its spans in the request's trace."""
+        tracer = Tracer(sample_rate=0.0, export_file="")
+        scheduler = ContentScheduler(lanes={"text": {"workers": 1}}, shared_workers=0)
+
+        def provider_call():
+            with span("suno.poll"):
+                pass
+
+        def work():
+            with span("generate"):
+                scheduler.submit("text", provider_call).result(timeout=1)
+
+        trace = trace_request(tracer, "a", work)
+
+        poll = next(item for item in trace.spans if item.name == "suno.poll")
+        assert poll.parent.name == "generate"
+        assert poll.thread != trace.spans[0].thread
+
+    def test_trace_finishes_after_last_release(self):
+        """Test that a retained trace, like a stream still being delivered, is only stored once released."""
+        tracer = Tracer(sample_rate=0.0, export_file="")
+        root = contextvars.copy_context().run(tracer.start_trace, "a", "request", force=True)
+        root.trace.retain()
+
+        root.trace.release()
+        assert not tracer.traces
+
+        start = time.perf_counter()
+        root.trace.record("sse.deliver", start, events=3)
+        root.trace.release()
+        assert list(tracer.traces) == [root.trace]
+        assert root.trace.to_dict()["spans"][-1]["attributes"] == {"events": 3}
+
+    def test_slowest_from_ring_buffer(self):
+        """Test that only the most recent traces are kept and the slowest come first."""
+        tracer = Tracer(sample_rate=0.0, buffer_size=2, export_file="")
+
+        trace_request(tracer, "a", lambda: time.sleep(0.03))
+        trace_request(tracer, "b", lambda: None)
+        trace_request(tracer, "c", lambda: time.sleep(0.01))
+
+        assert [trace.trace_id for trace in tracer.slowest()] == ["c", "b"]
+        assert [trace.trace_id for trace in tracer.slowest(limit=1)] == ["c"]
+
+    def test_waterfall(self):
+        """Test that the waterfall shows one indented line per span with its duration."""
+        tracer = Tracer(sample_rate=0.0, export_file="")
+
+        def work():
+            with span("admission", provider="Suno"):
+                time.sleep(0.01)
+
+        lines = waterfall(trace_request(tracer, "abc", work).to_dict(), width=20).splitlines()
+
+        assert lines[0].startswith("request abc")
+        assert lines[2].startswith("  admission")
+        assert "provider=Suno" in lines[2]
+        assert "#" in lines[2]
+
+    def test_exports_json_lines(self, tmp_path):
+        """Test that finished traces are appended to the export file in the background."""
+        export_file = tmp_path / "traces.jsonl"
+        tracer = Tracer(sample_rate=0.0, export_file=str(export_file))
+
+        trace_request(tracer, "a", lambda: None)
+        trace_request(tracer, "b", lambda: None)
+
+        deadline = time.time() + 2
+        while time.time() < deadline and (not export_file.exists() or len(export_file.read_text().splitlines()) < 2):
+            time.sleep(0.01)
+        assert [json.loads(line)["trace_id"] for line in export_file.read_text().splitlines()] == ["a", "b"]